@@ -0,0 +1,285 @@
+"""Control de admisión: la atención de mesón no espera detrás de los reportes.
+
+Cada ruta (endpoint de Flask) pertenece a una clase:
+- circulacion  préstamos, devoluciones, login, búsqueda por RUT, reservas
+- general      el resto
+- reportes     listados grandes, estadísticas, inventario, operaciones masivas
+
+Por clase hay:
+- un límite de requests concurrentes (ADMISION_<CLASE>) y una espera máxima
+  por un cupo (ADMISION_ESPERA_<CLASE>_MS). Sin cupo a tiempo: 503 con
+  Retry-After, en vez de encolar hasta que el pool se agote. La suma de los
+  cupos de general y reportes debe quedar bajo DB_POOL_MAX para que
+  circulación siempre encuentre conexión.
+- un statement_timeout (TIMEOUT_<CLASE>_MS) y la misma espera por conexión
+  del pool (db.py). Si el pool no entrega conexión a tiempo el 500 del
+  handler se convierte en 503 con Retry-After.
+
+Además, un token bucket por cliente (usuario del token o IP): RATE_LIMIT_RPS
+con ráfagas de RATE_LIMIT_BURST; un request de reportes cuesta 5 fichas.
+Exceder el límite da 429 con Retry-After.
+
+/api/health responde "ready" según la saturación del pool y de los cupos.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from flask import g, jsonify, request
+
+import db
+import registro
+
+log = registro.get("admision")
+
+CIRCULACION = "circulacion"
+GENERAL = "general"
+REPORTES = "reportes"
+CLASES = (CIRCULACION, GENERAL, REPORTES)
+
+RUTAS: Dict[str, str] = {
+    # circulación (mesón / tótem)
+    "crear_prestamo": CIRCULACION,
+    "registrar_devolucion": CIRCULACION,
+    "comprobante_prestamo": CIRCULACION,
+    "login": CIRCULACION,
+    "user_by_rut": CIRCULACION,
+    "users_by_rut_bulk": CIRCULACION,
+    "estado_sancion": CIRCULACION,
+    "crear_solicitud": CIRCULACION,
+    "crear_reserva": CIRCULACION,
+    "cancelar_reserva": CIRCULACION,
+    # reportes y listados
+    "list_users": REPORTES,
+    "list_prestamos": REPORTES,
+    "listar_solicitudes": REPORTES,
+    "listar_sanciones": REPORTES,
+    "stats_diario": REPORTES,
+    "stats_categorias": REPORTES,
+    "stats_tipos": REPORTES,
+    "stats_vencidos": REPORTES,
+    "stats_refresh": REPORTES,
+    "query_stats": REPORTES,
+    "transicion_masiva": REPORTES,
+    "reporte_inventario": REPORTES,
+    "cerrar_inventario": REPORTES,
+    "cola_reservas": REPORTES,
+    "matricula_masiva": REPORTES,
+}
+# Fuera de admisión: salud y archivos del frontend
+EXENTAS = {"health", "frontend_index", "frontend_archivo", "static"}
+COSTO = {CIRCULACION: 1.0, GENERAL: 1.0, REPORTES: 5.0}
+
+
+def clase_de(endpoint: Optional[str]) -> str:
+    return RUTAS.get(endpoint or "", GENERAL)
+
+
+@dataclass(frozen=True)
+class Limites:
+    cupos: int
+    espera_s: float
+    timeout_ms: int
+
+
+class Cupos:
+    """Semáforo con contadores, para informar ocupación y rechazos."""
+
+    def __init__(self, limite: int):
+        self.limite = limite
+        self._sem = threading.BoundedSemaphore(limite)
+        self._lock = threading.Lock()
+        self.en_uso = 0
+        self.esperando = 0
+        self.rechazados = 0
+
+    def tomar(self, espera_s: float) -> bool:
+        with self._lock:
+            self.esperando += 1
+        ok = False
+        try:
+            ok = self._sem.acquire(timeout=espera_s) if espera_s > 0 else self._sem.acquire(blocking=False)
+        finally:
+            with self._lock:
+                self.esperando -= 1
+                if ok:
+                    self.en_uso += 1
+                else:
+                    self.rechazados += 1
+        return ok
+
+    def soltar(self) -> None:
+        with self._lock:
+            self.en_uso -= 1
+        self._sem.release()
+
+    def describe(self) -> Dict[str, int]:
+        with self._lock:
+            return {"limite": self.limite, "en_uso": self.en_uso,
+                    "esperando": self.esperando, "rechazados": self.rechazados}
+
+
+class TokenBucket:
+    def __init__(self, tasa: float, rafaga: float):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.fichas = rafaga
+        self.t = time.monotonic()
+
+    def tomar(self, costo: float) -> float:
+        """0 si se admite; si no, segundos hasta que haya fichas suficientes."""
+        ahora = time.monotonic()
+        self.fichas = min(self.rafaga, self.fichas + (ahora - self.t) * self.tasa)
+        self.t = ahora
+        if self.fichas >= costo:
+            self.fichas -= costo
+            return 0.0
+        return (costo - self.fichas) / self.tasa
+
+
+class Limitador:
+    """Buckets por cliente, acotados a los `max_clientes` más recientes."""
+
+    def __init__(self, tasa: float, rafaga: float, max_clientes: int = 10_000):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.max_clientes = max_clientes
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.rechazados = 0
+
+    def tomar(self, cliente: str, costo: float) -> float:
+        with self._lock:
+            bucket = self._buckets.get(cliente)
+            if bucket is None:
+                bucket = self._buckets[cliente] = TokenBucket(self.tasa, self.rafaga)
+                if len(self._buckets) > self.max_clientes:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(cliente)
+            espera = bucket.tomar(min(costo, self.rafaga))
+            if espera:
+                self.rechazados += 1
+            return espera
+
+
+class Admision:
+    def __init__(self, limites: Dict[str, Limites], tasa: float, rafaga: float, espera_ready: int):
+        self.limites = limites
+        self.cupos = {c: Cupos(l.cupos) for c, l in limites.items()}
+        self.limitador = Limitador(tasa, rafaga) if tasa > 0 else None
+        self.espera_ready = espera_ready
+
+    @classmethod
+    def desde_settings(cls) -> "Admision":
+        from settings import get_settings
+
+        s = get_settings()
+        return cls(
+            {
+                CIRCULACION: Limites(s.admit_circulation, s.admit_wait_circulation_ms / 1000, s.timeout_circulation_ms),
+                GENERAL: Limites(s.admit_general, s.admit_wait_general_ms / 1000, s.timeout_general_ms),
+                REPORTES: Limites(s.admit_reports, s.admit_wait_reports_ms / 1000, s.timeout_reports_ms),
+            },
+            s.rate_limit_rps, s.rate_limit_burst, s.ready_max_waiting,
+        )
+
+    def estado(self) -> Dict[str, Any]:
+        """Saturación del pool primario y de los cupos por clase."""
+        pool = db.get_pool().get_stats()
+        clases = {c: cup.describe() for c, cup in self.cupos.items()}
+        esperando_pool = pool.get("requests_waiting", 0)
+        listo = esperando_pool <= self.espera_ready and clases[CIRCULACION]["esperando"] <= self.espera_ready
+        return {
+            "ready": listo,
+            "pool": {
+                "tamano": pool.get("pool_size", 0),
+                "disponibles": pool.get("pool_available", 0),
+                "maximo": pool.get("pool_max", 0),
+                "esperando": esperando_pool,
+                "timeouts": pool.get("requests_errors", 0),
+            },
+            "clases": clases,
+            "rate_limit_rechazados": self.limitador.rechazados if self.limitador else 0,
+        }
+
+
+ADMISION: Optional[Admision] = None
+
+
+def _rechazo(status: int, error: str, retry_s: float):
+    resp = jsonify({"ok": False, "error": error})
+    resp.status_code = status
+    resp.headers["Retry-After"] = str(max(1, math.ceil(retry_s)))
+    return resp
+
+
+def _cliente() -> str:
+    auth = getattr(g, "auth", None)
+    return f"user:{auth['sub']}" if auth else f"ip:{request.remote_addr}"
+
+
+def _soltar(tokens, cupos) -> None:
+    for var, token in reversed(tokens):
+        var.reset(token)
+    if cupos is not None:
+        cupos.soltar()
+
+
+def init_admision(app) -> None:
+    """Registra los hooks; debe ir después de init_auth (usa g.auth)."""
+    global ADMISION
+    ADMISION = Admision.desde_settings()
+    pool_max = db.get_db_config().pool_max
+    sin_circulacion = ADMISION.limites[GENERAL].cupos + ADMISION.limites[REPORTES].cupos
+    if sin_circulacion >= pool_max:
+        log.warning("ADMISION_GENERAL + ADMISION_REPORTES (%d) >= DB_POOL_MAX (%d): "
+                    "la circulación puede quedar sin conexión", sin_circulacion, pool_max)
+
+    @app.before_request
+    def _admitir():
+        if request.endpoint in EXENTAS or request.endpoint is None or request.method == "OPTIONS":
+            return None
+        adm = ADMISION
+        clase = clase_de(request.endpoint)
+        lim = adm.limites[clase]
+
+        if adm.limitador is not None:
+            espera = adm.limitador.tomar(_cliente(), COSTO[clase])
+            if espera:
+                return _rechazo(429, "Demasiadas solicitudes, intente más tarde", espera)
+
+        cupos = adm.cupos[clase]
+        if not cupos.tomar(lim.espera_s):
+            log.warning("Sin cupo para %s", clase, extra={"datos": cupos.describe()})
+            return _rechazo(503, "Servicio saturado, intente nuevamente", 1)
+        g._admision_cupos = cupos
+        g._admision_tokens = [
+            (db.statement_timeout_ms, db.statement_timeout_ms.set(lim.timeout_ms)),
+            (db.pool_wait_s, db.pool_wait_s.set(lim.espera_s or None)),
+            (db.pool_timeouts, db.pool_timeouts.set([])),
+        ]
+        return None
+
+    @app.after_request
+    def _saturacion(response):
+        marcas = db.pool_timeouts.get()
+        if marcas and response.status_code >= 500:
+            return _rechazo(503, "Base de datos saturada, intente nuevamente", 2)
+        if response.is_streamed and "_admision_cupos" in g:
+            # El cuerpo se genera después del teardown: el cupo y los timeouts
+            # siguen tomados hasta que el servidor cierra la respuesta
+            tokens, cupos = g.pop("_admision_tokens", []), g.pop("_admision_cupos")
+            response.call_on_close(lambda: _soltar(tokens, cupos))
+        return response
+
+    @app.teardown_request
+    def _liberar(exc):
+        _soltar(g.pop("_admision_tokens", []), g.pop("_admision_cupos", None))
+
+    @app.errorhandler(db.PoolTimeout)
+    def _pool_agotado(e):
+        return _rechazo(503, "Base de datos saturada, intente nuevamente", 2)
@@ -1,78 +1,99 @@
-import os
-from dataclasses import dataclass
+import signal
+import threading
 from typing import Optional, Dict, Any
 from datetime import datetime, date, timedelta
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, current_app, g, jsonify, request, stream_with_context
 from flask_cors import CORS
 import psycopg
 from psycopg.rows import dict_row
 from dotenv import load_dotenv
-from flask_mailman import Mail, EmailMessage
-from apscheduler.schedulers.background import BackgroundScheduler
-
-@dataclass
-class DBConfig:
-    host: str
-    port: int
-    dbname: str
-    user: str
-    password: str
-
-
-def get_db_config() -> DBConfig:
-    return DBConfig(
-        host=os.getenv("DB_HOST", "127.0.0.1"),
-        port=int(os.getenv("DB_PORT", "5432")),
-        dbname=os.getenv("DB_NAME", "sisbib"),
-        user=os.getenv("DB_USER", "postgres"),
-        password=os.getenv("DB_PASSWORD", ""),
-    )
-
-
-def get_connection():
-    cfg = get_db_config()
-    return psycopg.connect(
-        host=cfg.host,
-        port=cfg.port,
-        dbname=cfg.dbname,
-        user=cfg.user,
-        password=cfg.password,
-    )
 
+from auth_tokens import init_auth, issue_token, require_auth, revocations
+from compresion import init_compresion
+from db import get_connection
+from estaticos import init_frontend
+from jobs import JOBS, Job, JobAlreadyRunning
+from politicas import POLICIES
+from settings import SettingsError, get_settings, reload_settings
+from sugerencias import SUGGEST
+from replicas import init_replica_routing
+from rut import RutError, format_rut, parse_rut
+import admision
+import db
+import replicas
+import calentamiento
+import claves
+import comprobantes
+import estadisticas
+import estados_ejemplar
+import idempotencia
+import inventario
+import matricula
+import reservas
+from estados_ejemplar import TransicionInvalida
+import particiones
+import recordatorios
+import migrate
+import queries
+import registro
 
 load_dotenv()
 
-mail = Mail()
+log = registro.get("app")
+
+
+
+def get_mail():
+    """Correo de la app actual. flask_mailman se importa e inicializa en el
+    primer envío: el arranque no lo carga (la mayoría de los procesos no envía)."""
+    state = current_app.extensions.get("mailman")
+    if state is None:
+        from flask_mailman import Mail
+
+        state = Mail().init_app(current_app._get_current_object())
+    return state
+
+
+def _apply_runtime_config():
+    """Relee configuración y políticas (SIGHUP o endpoint de admin)."""
+    settings = reload_settings()
+    POLICIES.invalidate()
+    registro.configurar(settings.log_level, settings.log_json)
+    return settings
+
+def send_overdue_notifications(job: Optional[Job] = None):
+    """Send email notifications for overdue loans.
+
+    Si se ejecuta como job (ver jobs.py) informa el avance en `job` y propaga
+    los errores para que el job quede como 'failed'.
+    """
+
+    log.info("Ejecutando tarea de notificación de préstamos vencidos")
 
-def send_overdue_notifications():
-    """Send email notifications for overdue loans."""
-    
-    print("Ejecutando tarea de notificación de préstamos vencidos...")
-    
     try:
-        with get_connection() as conn:
+        # Seleccionar préstamos que están marcados como vencidos
+        # (la conexión se libera antes de enviar correos)
+        with get_connection(read_only=False) as conn:
             with conn.cursor(row_factory=dict_row) as cur:
-                # Seleccionar préstamos que están marcados como vencidos
-                cur.execute(
-                    """
-                    SELECT p.prestamo_id, u.email, u.nombre, l.titulo
-                    FROM public.prestamos p
-                    JOIN public.users u ON p.user_fk = u.user_id
-                    JOIN public.libros l ON p.libro_fk = l.id_libro
-                    WHERE p.vencido = TRUE
-                    """
-                )
+                queries.execute(cur, "overdue_select")
                 overdue_loans = cur.fetchall()
-                print(f"Se encontraron {len(overdue_loans)} préstamos vencidos para notificar.")
-
-                if not overdue_loans:
-                    return
-
-                # Enviar correos
-                for loan in overdue_loans:
-                    subject = "Aviso de Préstamo Vencido"
-                    body = f"""
+        log.info("Se encontraron %d préstamos vencidos para notificar", len(overdue_loans))
+        if job is not None:
+            job.set_total(len(overdue_loans))
+
+        if not overdue_loans:
+            return
+
+        # Enviar correos reutilizando una sola conexión SMTP
+        # (una línea por correo, con límite por minuto: LOG_CORREOS_POR_MINUTO)
+        log_correo = registro.limitar("correo", get_settings().log_email_per_min)
+        from flask_mailman import EmailMessage
+
+        with get_mail().get_connection() as smtp:
+            for loan in overdue_loans:
+                subject = "Aviso de Préstamo Vencido"
+                body = f"""
 Hola {loan['nombre']},
 
 Te informamos que tu préstamo del libro "{loan['titulo']}" ha vencido.
@@ -81,59 +102,250 @@ Por favor, acércate a la biblioteca para regularizar tu situación.
 Saludos,
 Sistema de Biblioteca
 """
-                    try:
-                        msg = EmailMessage(subject, body, to=[loan['email']])
-                        # Con Flask-Mailman, es más robusto usar msg.send()
-                        msg.send()
-                        print(f"Email enviado a {loan['email']} por préstamo {loan['prestamo_id']}.")
-                    except Exception as e:
-                        print(f"Error al enviar email a {loan['email']}: {e}")
-
-                # Marcar los préstamos como notificados (actualizar 'vencido' a TRUE)
-                overdue_ids = [loan['prestamo_id'] for loan in overdue_loans]
-                cur.execute("UPDATE public.prestamos SET vencido = TRUE WHERE prestamo_id = ANY(%s)", (overdue_ids,))
-                conn.commit()
-                print(f"Se marcaron {len(overdue_ids)} préstamos como vencidos.")
+                try:
+                    msg = EmailMessage(subject, body, to=[loan['email']], connection=smtp)
+                    msg.send()
+                    log_correo.info("Email enviado", extra={"datos": {"email": loan['email'], "prestamo_id": loan['prestamo_id']}})
+                    if job is not None:
+                        job.add(sent=1)
+                except Exception as e:
+                    log_correo.warning("Error al enviar email", extra={"datos": {"email": loan['email'], "error": str(e)}})
+                    if job is not None:
+                        job.add(failed=1)
+
+        # Marcar los préstamos como notificados (actualizar 'vencido' a TRUE)
+        overdue_ids = [loan['prestamo_id'] for loan in overdue_loans]
+        fechas = sorted({loan['fecha_reserva'] for loan in overdue_loans})
+        with get_connection(read_only=False) as conn, conn.cursor() as cur:
+            queries.execute(cur, "overdue_mark", (overdue_ids, fechas))
+            conn.commit()
+        log.info("Se marcaron %d préstamos como vencidos", len(overdue_ids))
+
+    except Exception:
+        log.exception("Error en la tarea de notificación")
+        if job is not None:
+            raise
+
+
+def enqueue_overdue_notifications(app) -> Job:
+    """Encola send_overdue_notifications (una ejecución a la vez)."""
+
+    def run(job: Job):
+        with app.app_context():
+            send_overdue_notifications(job)
+
+    return JOBS.submit("notify-overdue", run)
+
 
-    except Exception as e:
-        print(f"Error en la tarea de notificación: {e}")
+def enqueue_stats_refresh() -> Job:
+    """Encola estadisticas.refresh (una ejecución a la vez)."""
+    return JOBS.submit("stats-refresh", lambda job: estadisticas.refresh())
 
 
 def create_app():
     app = Flask(__name__)
-    CORS(app)  # Allow all origins for dev; tighten in prod
+    CORS(app, expose_headers=[replicas.PIN_HEADER])  # Allow all origins for dev; tighten in prod
+
+    # Configuración validada una sola vez (settings.py); falla al iniciar si es inválida
+    settings = get_settings()
 
     # Mail configuration
-    app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER')
-    app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
-    app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
-    app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
-    app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'True').lower() in ('true', '1', 't')
-    app.config['MAIL_USE_SSL'] = os.getenv('MAIL_USE_SSL', 'False').lower() in ('true', '1', 't')
-    app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
+    app.config['MAIL_SERVER'] = settings.mail.server
+    app.config['MAIL_PORT'] = settings.mail.port
+    app.config['MAIL_USERNAME'] = settings.mail.username
+    app.config['MAIL_PASSWORD'] = settings.mail.password
+    app.config['MAIL_USE_TLS'] = settings.mail.use_tls
+    app.config['MAIL_USE_SSL'] = settings.mail.use_ssl
+    app.config['MAIL_DEFAULT_SENDER'] = settings.mail.default_sender
     
-    # Initialize mail
-    mail.init_app(app)
+    # Mail: flask_mailman se inicializa en el primer envío (get_mail)
+    recordatorios.registrar_canal("correo", lambda: recordatorios.CanalCorreo(get_mail()))
+
+    # Registro JSON en cola (registro.py): request_id, ruta y tiempo en base por request
+    registro.configurar(settings.log_level, settings.log_json)
+    registro.init_logging(app)
+
+    # Compresión de respuestas grandes (después del registro: dur_ms la incluye)
+    init_compresion(app)
+
+    # Tokens de sesión: decodifica Authorization: Bearer en g.auth
+    init_auth(app)
+
+    # Lecturas (GET) hacia réplicas, si hay DB_REPLICA_DSNS configuradas
+    init_replica_routing(app)
+
+    # Cupos por clase de ruta, rate limit por cliente y statement_timeout (admision.py)
+    admision.init_admision(app)
+
+    # Recarga en caliente con SIGHUP (solo se puede instalar desde el hilo principal)
+    if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+        def _on_sighup(signum, frame):
+            try:
+                _apply_runtime_config()
+                log.info("Configuración recargada (SIGHUP)")
+            except SettingsError as e:
+                log.error("Configuración inválida, se mantiene la anterior: %s", e)
+
+        signal.signal(signal.SIGHUP, _on_sighup)
+
+    @app.get("/api/admin/config")
+    @require_auth("admin")
+    def ver_config():
+        """Configuración vigente (sin secretos) y políticas de préstamo en caché."""
+        return jsonify({"ok": True, "settings": get_settings().public(), "politicas": POLICIES.rows()})
+
+    @app.post("/api/admin/config/reload")
+    @require_auth("admin")
+    def recargar_config():
+        try:
+            new = _apply_runtime_config()
+        except SettingsError as e:
+            return jsonify({"ok": False, "error": str(e)}), 400
+        return jsonify({"ok": True, "settings": new.public()})
+
+    @app.put("/api/admin/politicas")
+    @require_auth("admin")
+    def upsert_politica():
+        """
+        Crea o actualiza una política de duración.
+        Body: { "tipo": "Sala"|"Domicilio", "duracion_minutos": 180, "role": "cliente"?, "categoria": "Historia"? }
+        """
+        data = request.get_json(silent=True) or {}
+        tipo = (data.get("tipo") or "").strip().title()
+        if tipo not in ("Sala", "Domicilio"):
+            return jsonify({"ok": False, "error": "Tipo inválido: use 'Sala' o 'Domicilio'"}), 400
+        try:
+            minutos = int(data.get("duracion_minutos"))
+        except (TypeError, ValueError):
+            return jsonify({"ok": False, "error": "duracion_minutos debe ser entero"}), 400
+        if minutos <= 0:
+            return jsonify({"ok": False, "error": "duracion_minutos debe ser positivo"}), 400
+        role = (data.get("role") or "").strip().lower() or None
+        categoria = (data.get("categoria") or "").strip().lower() or None
+
+        try:
+            with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+                queries.execute(cur, "politica_upsert", (role, categoria, tipo, minutos))
+                row = cur.fetchone()
+                conn.commit()
+            POLICIES.invalidate()
+            return jsonify({"ok": True, "politica": row})
+        except Exception as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
+
+    # Migraciones del esquema al iniciar (opcional; también: python migrate.py upgrade)
+    if settings.auto_migrate:
+        try:
+            migrate.upgrade()
+        except Exception:
+            log.exception("No se pudieron aplicar migraciones")
 
     @app.post("/api/notify-overdue")
     def notify_overdue_manual():
+        """Encola la notificación de vencidos y responde de inmediato con el job_id."""
         try:
-            with app.app_context():
-                send_overdue_notifications()
-            return jsonify({"ok": True, "message": "Proceso de notificación iniciado."})
+            job = enqueue_overdue_notifications(app)
+            return jsonify({"ok": True, "message": "Proceso de notificación iniciado.", "job_id": job.job_id, "job": job.to_dict()}), 202
+        except JobAlreadyRunning as e:
+            return jsonify({"ok": False, "error": str(e), "job_id": e.job.job_id, "job": e.job.to_dict()}), 409
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
 
+    def _rol_actual() -> Optional[str]:
+        auth = getattr(g, "auth", None)
+        return auth.get("role") if auth else None
+
+    @app.get("/api/jobs/<job_id>")
+    def estado_job(job_id: str):
+        """Avance de un job: estado, total, sent, failed, remaining."""
+        job = JOBS.get(job_id)
+        if not job:
+            return jsonify({"ok": False, "error": "Job no encontrado"}), 404
+        if not job.visible_para(_rol_actual()):
+            if getattr(g, "auth", None) is None:
+                return jsonify({"ok": False, "error": "Autenticación requerida"}), 401
+            return jsonify({"ok": False, "error": "No autorizado para este recurso"}), 403
+        return jsonify({"ok": True, "job": job.to_dict()})
+
+    @app.get("/api/recordatorios/estado")
+    @require_auth("admin")
+    def estado_recordatorios():
+        """Rueda de recordatorios: avisos cargados por nivel, ventana y totales enviados."""
+        return jsonify({"ok": True, "recordatorios": recordatorios.MOTOR.estado()})
+
+    @app.get("/api/jobs")
+    def listar_jobs():
+        """Jobs recientes (en memoria) visibles para el usuario. Querystring: tipo (opcional)."""
+        rol = _rol_actual()
+        jobs = [j for j in JOBS.recent(request.args.get("tipo")) if j.visible_para(rol)]
+        return jsonify({"ok": True, "count": len(jobs), "items": [j.to_dict() for j in jobs]})
+
+    # -------------------------
+    # ESTADÍSTICAS (solo tablas de resumen)
+    # -------------------------
+
+    def _rango_fechas() -> tuple[date, date]:
+        """desde/hasta (YYYY-MM-DD) del querystring; por defecto los últimos 30 días."""
+        hasta = date.fromisoformat(request.args["hasta"]) if request.args.get("hasta") else date.today()
+        desde = date.fromisoformat(request.args["desde"]) if request.args.get("desde") else hasta - timedelta(days=29)
+        if desde > hasta:
+            raise ValueError("desde debe ser anterior o igual a hasta")
+        return desde, hasta
+
+    def _stats_response(fn, *extra):
+        try:
+            desde, hasta = _rango_fechas()
+        except ValueError as e:
+            return jsonify({"ok": False, "error": f"Rango de fechas inválido: {e}"}), 400
+        try:
+            rows = fn(desde, hasta, *extra)
+        except Exception as e:
+            log.exception("stats")
+            return jsonify({"ok": False, "error": str(e)}), 500
+        return jsonify({"ok": True, "desde": desde.isoformat(), "hasta": hasta.isoformat(), "count": len(rows), "items": rows})
+
+    @app.get("/api/stats/diario")
+    def stats_diario():
+        """Préstamos, devoluciones y devoluciones tarde por día. Querystring: desde, hasta, tipo."""
+        return _stats_response(estadisticas.diario, request.args.get("tipo") or None)
+
+    @app.get("/api/stats/categorias")
+    def stats_categorias():
+        """Totales por categoría en el rango. Querystring: desde, hasta."""
+        return _stats_response(estadisticas.por_categoria)
+
+    @app.get("/api/stats/tipos")
+    def stats_tipos():
+        """Sala vs Domicilio en el rango. Querystring: desde, hasta."""
+        return _stats_response(estadisticas.por_tipo)
+
+    @app.get("/api/stats/vencidos")
+    def stats_vencidos():
+        """Activos/vencidos por día y tasa de devoluciones tarde. Querystring: desde, hasta."""
+        return _stats_response(estadisticas.vencidos)
+
+    @app.post("/api/stats/refresh")
+    @require_auth("admin")
+    def stats_refresh():
+        """Encola una pasada incremental de las tablas de resumen."""
+        try:
+            job = enqueue_stats_refresh()
+            return jsonify({"ok": True, "job_id": job.job_id, "job": job.to_dict()}), 202
+        except JobAlreadyRunning as e:
+            return jsonify({"ok": False, "error": str(e), "job_id": e.job.job_id, "job": e.job.to_dict()}), 409
+
     @app.post("/api/test-email")
     def test_email():
         data = request.get_json(silent=True) or {}
-        to = data.get("to") or os.getenv("MAIL_TEST_TO")
+        to = data.get("to") or get_settings().mail.test_to
         if not to:
             return jsonify({"ok": False, "error": "Debe proporcionar 'to' en el body o MAIL_TEST_TO en .env"}), 400
         subject = data.get("subject", "Prueba de correo - Sisbib")
         body = data.get("body", "Este es un correo de prueba desde Sisbib usando Mailtrap.")
         try:
-            msg = EmailMessage(subject, body, to=[to])
+            from flask_mailman import EmailMessage
+
+            msg = EmailMessage(subject, body, to=[to], connection=get_mail().get_connection())
             msg.send()
             return jsonify({"ok": True, "message": f"Correo de prueba enviado a {to}"})
         except Exception as e:
@@ -141,14 +353,36 @@ def create_app():
 
     @app.get("/api/health")
     def health():
+        """
+        Readiness: 503 si el pool o los cupos de circulación tienen espera
+        (el balanceador deja de enviar tráfico), sin sumar otra consulta a la cola.
+        """
         try:
-            with get_connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute("SELECT 1")
-                    cur.fetchone()
-            return jsonify({"ok": True, "status": "healthy"})
+            if not calentamiento.ESTADO.listo:
+                resp = jsonify({"ok": False, "status": "warming", "calentamiento": calentamiento.ESTADO.describe()})
+                resp.status_code = 503
+                resp.headers["Retry-After"] = "1"
+                return resp
+            result = {"ok": True, "status": "healthy", "admision": admision.ADMISION.estado()}
+            if replicas.ROUTER is not None:
+                result["replicas"] = [r.describe() for r in replicas.ROUTER.replicas]
+            if not result["admision"]["ready"]:
+                result.update(ok=False, status="saturated")
+                resp = jsonify(result)
+                resp.status_code = 503
+                resp.headers["Retry-After"] = "2"
+                return resp
+            token = db.pool_wait_s.set(1.0)
+            try:
+                with get_connection(read_only=False) as conn:
+                    with conn.cursor() as cur:
+                        queries.execute(cur, "health_ping")
+                        cur.fetchone()
+            finally:
+                db.pool_wait_s.reset(token)
+            return jsonify(result)
         except Exception as e:
-            return jsonify({"ok": False, "error": str(e)}), 500
+            return jsonify({"ok": False, "status": "unavailable", "error": str(e)}), 503
 
     @app.post("/api/login")
     def login():
@@ -165,14 +399,17 @@ def create_app():
                 with conn.cursor(row_factory=dict_row) as cur:
                     # Consulta directa usando los nombres fijos de columna
                     # Incluimos nombre y apellidos para mostrarlos en el navbar del frontend
-                    cur.execute(
-                        "SELECT user_id, email, role, nombre, apellido1, apellido2 FROM public.users WHERE email = %s AND password = %s",
-                        (email, password)
-                    )
+                    queries.execute(cur, "login", (email,))
                     user_row = cur.fetchone()
 
-                    if not user_row:
+                    if not user_row or not claves.verificar(password, user_row["password"]):
                         return jsonify({"ok": False, "error": "Credenciales inválidas o usuario no existe"}), 401
+                    if not user_row["activo"]:
+                        return jsonify({"ok": False, "error": "Usuario inactivo"}), 403
+                    if claves.necesita_rehash(user_row["password"]):
+                        queries.execute(cur, "user_password_update",
+                                        (claves.hashear(password), user_row["user_id"], user_row["password"]))
+                        conn.commit()
 
                     # Normaliza el valor del rol a minúsculas para el frontend
                     db_role = user_row.get("role")
@@ -186,11 +423,84 @@ def create_app():
                         "apellido2": user_row.get("apellido2"),
                     }
 
-                    return jsonify({"ok": True, "role": role, "user": result_user})
+                    session = issue_token(result_user["user_id"], role)
+                    return jsonify({
+                        "ok": True,
+                        "role": role,
+                        "user": result_user,
+                        "token": session["token"],
+                        "expires_at": session["expires_at"],
+                    })
 
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
 
+    @app.post("/api/logout")
+    @require_auth()
+    def logout():
+        """Revoca el token actual (queda en la lista de revocación hasta expirar)."""
+        revocations.revoke_jti(g.auth["jti"], g.auth["exp"])
+        return jsonify({"ok": True})
+
+    @app.post("/api/auth/revocar")
+    @require_auth("admin")
+    def revocar_sesiones():
+        """
+        Invalida todos los tokens emitidos a un usuario (p. ej. tras cambiar su rol).
+        Body: { "user_id": 3 }
+        """
+        data = request.get_json(silent=True) or {}
+        user_id = data.get("user_id")
+        if not user_id:
+            return jsonify({"ok": False, "error": "Debe enviar user_id"}), 400
+        revocations.revoke_user(int(user_id))
+        return jsonify({"ok": True, "user_id": int(user_id)})
+
+    @app.get("/api/admin/query-stats")
+    @require_auth("admin")
+    def query_stats():
+        """Estadísticas por sentencia registrada (llamadas, tiempos, errores)."""
+        return jsonify({"ok": True, "items": queries.REGISTRY.stats()})
+
+    @app.post("/api/users/matricula")
+    @require_auth("admin")
+    def matricula_masiva():
+        """Sincroniza usuarios con una nómina CSV (multipart "archivo" o el cuerpo).
+
+        Querystring: desactivar=1 desactiva a los clientes que no vienen en la
+        nómina; simular=1 solo calcula el informe. Responde 202 con el job_id;
+        el informe queda en job.resultado (GET /api/jobs/<job_id>). Las
+        contraseñas temporales de las cuentas nuevas se envían por correo.
+        """
+        archivo = request.files.get("archivo")
+        datos = archivo.read() if archivo is not None else request.get_data()
+        try:
+            texto = datos.decode("utf-8-sig")
+            filas, errores = matricula.leer_nomina(texto)
+        except (UnicodeDecodeError, matricula.NominaError) as e:
+            return jsonify({"ok": False, "error": f"Nómina inválida: {e}"}), 400
+        desactivar = request.args.get("desactivar") in ("1", "true")
+        simular = request.args.get("simular") in ("1", "true")
+
+        def run(job: Job):
+            def entregar(credenciales):
+                with app.app_context():
+                    return matricula.enviar_claves(credenciales, get_mail())
+
+            resumen = matricula.sincronizar(filas, desactivar, simular, job, entregar)
+            resumen["invalidas"] = len(errores)
+            resumen["detalle_invalidas"] = errores[:matricula.MAX_DETALLE]
+            if not simular and (resumen["nuevos"] or resumen["cambiados"]):
+                SUGGEST.rebuild()
+            return resumen
+
+        try:
+            job = JOBS.submit("matricula", run, roles=("admin",))
+            return jsonify({"ok": True, "job_id": job.job_id, "job": job.to_dict(),
+                            "filas": len(filas), "invalidas": len(errores)}), 202
+        except JobAlreadyRunning as e:
+            return jsonify({"ok": False, "error": str(e), "job_id": e.job.job_id, "job": e.job.to_dict()}), 409
+
     @app.get("/api/users")
     def list_users():
         """Return users with optional basic search filter.
@@ -206,10 +516,12 @@ def create_app():
             limit = 200
 
         where = []
+        shape = []
         params: list[Any] = []
         if q:
             like = f"%{q.strip()}%"
             where.append("(nombre ILIKE %s OR apellido1 ILIKE %s OR apellido2 ILIKE %s OR email ILIKE %s OR CAST(rut_numero AS TEXT) ILIKE %s)")
+            shape.append("q")
             params.extend([like, like, like, like, like])
 
         sql = "SELECT user_id, nombre, apellido1, apellido2, rut_numero, rut_dv, email, role, created_at FROM public.users"
@@ -221,12 +533,105 @@ def create_app():
         try:
             with get_connection() as conn:
                 with conn.cursor(row_factory=dict_row) as cur:
-                    cur.execute(sql, params)
+                    queries.execute_shape(cur, "list_users", shape, sql, params)
                     rows = cur.fetchall()
                     return jsonify({"ok": True, "count": len(rows), "items": rows})
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
 
+    def _users_by_rut(ruts: list[tuple[int, str]]) -> list[dict]:
+        with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            queries.execute(cur, "users_by_rut", ([n for n, _ in ruts], [dv for _, dv in ruts]))
+            return cur.fetchall()
+
+    @app.get("/api/users/by-rut")
+    def user_by_rut():
+        """
+        Identificación exacta por RUT (mesón): usuario, préstamos activos y sanción.
+        Ej: /api/users/by-rut?rut=12.345.678-5
+        """
+        try:
+            numero, dv = parse_rut(request.args.get("rut", ""))
+        except RutError as e:
+            return jsonify({"ok": False, "error": str(e)}), 400
+
+        try:
+            rows = _users_by_rut([(numero, dv)])
+        except Exception as e:
+            log.exception("user_by_rut")
+            return jsonify({"ok": False, "error": str(e)}), 500
+        if not rows:
+            return jsonify({"ok": False, "error": f"No hay usuario con RUT {format_rut(numero, dv)}"}), 404
+        return jsonify({"ok": True, "user": rows[0]})
+
+    @app.post("/api/users/by-rut")
+    def users_by_rut_bulk():
+        """
+        Forma masiva para listas escaneadas.
+        Body: { "ruts": ["12.345.678-5", "9876543-K", ...] }  (máx. 500)
+        Respuesta: { ok, items, no_encontrados, invalidos }
+        """
+        data = request.get_json(silent=True) or {}
+        ruts = data.get("ruts")
+        if not isinstance(ruts, list) or not ruts:
+            return jsonify({"ok": False, "error": "Debe enviar ruts (lista)"}), 400
+        if len(ruts) > 500:
+            return jsonify({"ok": False, "error": "Máximo 500 RUT por consulta"}), 400
+
+        validos: dict[tuple[int, str], None] = {}
+        invalidos = []
+        for texto in ruts:
+            try:
+                validos[parse_rut(texto)] = None
+            except RutError as e:
+                invalidos.append({"rut": texto, "error": str(e)})
+
+        items = []
+        if validos:
+            try:
+                items = _users_by_rut(list(validos))
+            except Exception as e:
+                log.exception("users_by_rut_bulk")
+                return jsonify({"ok": False, "error": str(e)}), 500
+        encontrados = {(u["rut_numero"], u["rut_dv"]) for u in items}
+        no_encontrados = [format_rut(n, dv) for n, dv in validos if (n, dv) not in encontrados]
+        return jsonify({
+            "ok": True,
+            "count": len(items),
+            "items": items,
+            "no_encontrados": no_encontrados,
+            "invalidos": invalidos,
+        })
+
+    @app.get("/api/suggest")
+    def suggest():
+        """Autocompletado por prefijo desde el índice en memoria (sin consultar la base).
+
+        Query params:
+        - q: prefijo (nombre, apellido, email o RUT; título o autor)
+        - tipo: 'users' (default) | 'libros'
+        - k: máximo de sugerencias (default 10, máx 50)
+        """
+        q = (request.args.get("q") or "").strip()
+        tipo = request.args.get("tipo", "users")
+        if tipo not in ("users", "libros"):
+            return jsonify({"ok": False, "error": "tipo debe ser 'users' o 'libros'"}), 400
+        try:
+            k = min(max(int(request.args.get("k", "10")), 1), 50)
+        except ValueError:
+            k = 10
+        if not q:
+            return jsonify({"ok": True, "count": 0, "items": []})
+
+        try:
+            SUGGEST.ensure_ready()
+        except Exception as e:
+            log.exception("suggest")
+            return jsonify({"ok": False, "error": str(e)}), 500
+        index = SUGGEST.users if tipo == "users" else SUGGEST.libros
+        rows = index.search(q, k)
+        return jsonify({"ok": True, "count": len(rows), "items": rows})
+
     @app.get("/api/prestamos")
     def list_prestamos():
             """Retorna préstamos unidos a usuarios y libros.
@@ -247,12 +652,14 @@ def create_app():
                 limit = 200
 
             where = []
+            shape = []
             params: list[Any] = []
 
             if tipo:
                 tipos_list = [t.strip() for t in tipo.split(",") if t.strip()]
                 if tipos_list:
                     where.append("p.tipo_prestamo = ANY(%s)")
+                    shape.append("tipo")
                     params.append(tipos_list)
 
             if q:
@@ -263,10 +670,12 @@ def create_app():
                     "OR u.apellido1 ILIKE %s OR u.apellido2 ILIKE %s "
                     "OR CAST(p.prestamo_id AS TEXT) ILIKE %s)"
                 )
+                shape.append("q")
                 params.extend([like, like, like, like, like, like, like])
 
             if solo_activos:
                 where.append("p.fecha_devolucion IS NULL")
+                shape.append("activos")
 
             sql = (
                 "SELECT p.prestamo_id, p.fecha_reserva, p.fecha_vencimiento, "
@@ -285,11 +694,11 @@ def create_app():
             try:
                 with get_connection() as conn:
                     with conn.cursor(row_factory=dict_row) as cur:
-                        cur.execute(sql, tuple(params))
+                        queries.execute_shape(cur, "list_prestamos", shape, sql, tuple(params))
                         rows = cur.fetchall()
                         return jsonify({"ok": True, "count": len(rows), "items": rows})
             except Exception as e:
-                print(f"[ERROR] list_prestamos: {e}")
+                log.exception("list_prestamos")
                 return jsonify({"ok": False, "error": str(e)}), 500
 
 
@@ -305,12 +714,9 @@ def create_app():
         try:
             with get_connection() as conn:
                 with conn.cursor(row_factory=dict_row) as cur:
-                    cur.execute(
-                        """
-                        INSERT INTO public.users (nombre, apellido1, apellido2, rut_numero, rut_dv, email, password, role)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                        RETURNING user_id, email, created_at
-                        """,
+                    queries.execute(
+                        cur,
+                        "user_insert",
                         (
                             data["nombre"],
                             data["apellido1"],
@@ -318,13 +724,22 @@ def create_app():
                             data["rut_numero"],
                             data["rut_dv"].upper(),
                             data["email"],
-                            data["password"], # In a real app, hash this password!
+                            claves.hashear(data["password"]),
                             data["role"],
                         )
                     )
                     new_user = cur.fetchone()
                     conn.commit()
-                    
+                    SUGGEST.user_changed({
+                        "user_id": new_user["user_id"],
+                        "nombre": data["nombre"],
+                        "apellido1": data["apellido1"],
+                        "apellido2": data["apellido2"],
+                        "rut_numero": data["rut_numero"],
+                        "rut_dv": data["rut_dv"].upper(),
+                        "email": data["email"],
+                    })
+
                     return jsonify({"ok": True, "user": new_user})
 
         except psycopg.errors.UniqueViolation:
@@ -342,16 +757,19 @@ def create_app():
             limit = 200
         
         where = []
+        shape = []
         params: list[Any] = []
 
         if q:
             like = f"%{q.strip()}%"
             where.append("(titulo ILIKE %s OR autor ILIKE %s)")
+            shape.append("q")
             params.extend([like, like])
             
         if categoria: 
             like_categoria = f"%{categoria.strip()}%"
             where.append("categoria ILIKE %s")
+            shape.append("categoria")
             params.append(like_categoria)
 
         sql = (
@@ -367,22 +785,50 @@ def create_app():
         try:
             with get_connection() as conn:
                 with conn.cursor(row_factory=dict_row) as cur:
-                    cur.execute(sql, tuple(params)) 
+                    queries.execute_shape(cur, "list_libros", shape, sql, tuple(params))
                     rows = cur.fetchall()
                     
                     return jsonify({"ok": True, "count": len(rows), "items": rows})
                     
         except psycopg.OperationalError as e:
-            print(f"ERROR OPERACIONAL de DB: {e}")
+            log.error("list_libros: error operacional de DB: %s", e)
             return jsonify({"ok": False, "error": "Fallo al conectar con la base de datos PostgreSQL. Verifica que el servicio esté activo."}), 500
         except Exception as e:
-            print(f"Error al listar libros: {e}") 
+            log.exception("list_libros")
             return jsonify({"ok": False, "error": f"Error interno en la API: {str(e)}"}), 500
         
     # -------------------------
     # LIBROS (bibliotecario)
     # -------------------------
 
+    @app.get("/api/libros/<int:id_libro>/relacionados")
+    def libros_relacionados(id_libro: int):
+        """
+        "Quienes pidieron este libro también pidieron" (recomendaciones.py), desde memoria.
+        Querystring: limit (default 10, máx. RECOMENDACIONES_K)
+        """
+        try:
+            limit = max(1, min(int(request.args.get("limit", "10")), get_settings().recs_top_k))
+        except ValueError:
+            limit = 10
+        import recomendaciones  # numpy/scipy: fuera del import de app.py (lo precarga calentamiento)
+
+        vecinos = recomendaciones.RELACIONADOS.vecinos(id_libro, limit)
+        if vecinos is None:
+            return jsonify({"ok": True, "disponible": False, "count": 0, "items": []})
+        try:
+            SUGGEST.ensure_ready()
+        except Exception as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
+        items = []
+        for vecino, puntaje in vecinos:
+            libro = SUGGEST.libros.get(vecino)
+            if libro:  # los libros borrados siguen en la matriz hasta reconstruirla
+                items.append({"id_libro": vecino, "titulo": libro["titulo"], "autor": libro["autor"],
+                              "puntaje": round(puntaje, 3)})
+        return jsonify({"ok": True, "disponible": True, "count": len(items), "items": items,
+                        "generado": recomendaciones.RELACIONADOS.generado})
+
     @app.post("/api/libros")
     def create_libro():
         data = request.get_json(silent=True) or {}
@@ -392,12 +838,9 @@ def create_app():
 
         try:
             with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
-                cur.execute(
-                    """
-                    INSERT INTO public.libros (titulo, autor, categoria, editorial, edicion, anio, ubicacion)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id_libro, titulo, autor, categoria, editorial, edicion, anio, ubicacion
-                    """,
+                queries.execute(
+                    cur,
+                    "libro_insert",
                     (
                         data.get("titulo"),
                         data.get("autor"),
@@ -410,6 +853,7 @@ def create_app():
                 )
                 row = cur.fetchone()
                 conn.commit()
+                SUGGEST.libro_changed({k: row[k] for k in ("id_libro", "titulo", "autor")})
                 return jsonify({"ok": True, "libro": row})
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
@@ -431,7 +875,10 @@ def create_app():
         params.append(id_libro)
         try:
             with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
-                cur.execute(
+                queries.execute_shape(
+                    cur,
+                    "update_libro",
+                    [f for f in fields if f in data],
                     f"""
                     UPDATE public.libros
                     SET {", ".join(sets)}
@@ -444,6 +891,7 @@ def create_app():
                 conn.commit()
                 if not row:
                     return jsonify({"ok": False, "error": "Libro no encontrado"}), 404
+                SUGGEST.libro_changed({k: row[k] for k in ("id_libro", "titulo", "autor")})
                 return jsonify({"ok": True, "libro": row})
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
@@ -453,11 +901,12 @@ def create_app():
     def delete_libro(id_libro: int):
         try:
             with get_connection() as conn, conn.cursor() as cur:
-                cur.execute("DELETE FROM public.libros WHERE id_libro = %s RETURNING id_libro", (id_libro,))
+                queries.execute(cur, "libro_delete", (id_libro,))
                 row = cur.fetchone()
                 conn.commit()
                 if not row:
                     return jsonify({"ok": False, "error": "Libro no encontrado"}), 404
+                SUGGEST.libro_removed(id_libro)
                 return jsonify({"ok": True})
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
@@ -476,32 +925,17 @@ def create_app():
         try:
             with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
                 # Insertar ejemplar usando la MISMA ubicación que el libro
-                cur.execute(
-                    """
-                    INSERT INTO public.ejemplares (id_libro, estado, ubicacion)
-                    SELECT
-                        l.id_libro,
-                        'disponible' AS estado,
-                        l.ubicacion   -- misma ubicación que el libro
-                    FROM public.libros l
-                    WHERE l.id_libro = %s
-                    RETURNING id_ejemplar, id_libro, estado, ubicacion, created_at
-                    """,
-                    (id_libro,)
-                )
+                queries.execute(cur, "ejemplar_insert", (id_libro,))
                 row = cur.fetchone()
                 if not row:
                     return jsonify({"ok": False, "error": "Libro no encontrado"}), 404
 
                 # Actualizar contador de ejemplares disponibles
-                cur.execute(
-                    """
-                    UPDATE public.libros
-                    SET ejemplares_disponibles = COALESCE(ejemplares_disponibles, 0) + 1
-                    WHERE id_libro = %s
-                    """,
-                    (id_libro,)
-                )
+                queries.execute(cur, "libro_inc_disponibles", (id_libro,))
+
+                # Si el libro tiene reservas en espera, el ejemplar nuevo va a la primera
+                if reservas.liberar_ejemplar(conn, row["id_ejemplar"], "alta", actor=_actor()):
+                    row["estado"] = "reservado"
 
                 conn.commit()
                 return jsonify({"ok": True, "ejemplar": row})
@@ -509,36 +943,123 @@ def create_app():
             return jsonify({"ok": False, "error": str(e)}), 500
 
 
+    def _actor() -> Optional[int]:
+        """user_id del token (para auditoría), si la petición trae uno."""
+        claims = getattr(g, "auth", None)
+        return claims.get("sub") if claims else None
+
     @app.put("/api/ejemplares/<int:id_ejemplar>")
     def update_ejemplar(id_ejemplar: int):
+        """
+        Body: { "estado"?, "ubicacion"?, "id_libro"?, "motivo"? }
+        El estado pasa por el motor de transiciones (estados_ejemplar.py):
+        una transición no permitida responde 409.
+        """
         data = request.get_json(silent=True) or {}
-        fields = ["estado", "ubicacion", "id_libro"]
+        fields = ["ubicacion", "id_libro"]
         sets, params = [], []
         for f in fields:
             if f in data:
                 sets.append(f"{f} = %s")
                 params.append(data[f])
 
-        if not sets:
+        nuevo_estado = data.get("estado")
+        if not sets and not nuevo_estado:
             return jsonify({"ok": False, "error": "No hay campos a actualizar"}), 400
+        if nuevo_estado and nuevo_estado not in estados_ejemplar.ESTADOS:
+            return jsonify({"ok": False, "error": f"Estado inválido: {nuevo_estado}"}), 400
 
         params.append(id_ejemplar)
         try:
             with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
-                cur.execute(
-                    f"""
-                    UPDATE public.ejemplares
-                    SET {", ".join(sets)}
-                    WHERE id_ejemplar = %s
-                    RETURNING id_ejemplar, id_libro, estado, ubicacion, created_at
-                    """,
-                    tuple(params)
-                )
+                if nuevo_estado:
+                    # PUT idempotente: el mismo estado no es una transición
+                    queries.execute(cur, "ejemplar_estados", ([id_ejemplar],))
+                    actual = cur.fetchone()["estado"]
+                    if actual is None:
+                        return jsonify({"ok": False, "error": "Ejemplar no encontrado"}), 404
+                    if actual == nuevo_estado:
+                        nuevo_estado = None
+                if nuevo_estado:
+                    reservas.cambiar_estado(
+                        conn, [id_ejemplar], nuevo_estado,
+                        motivo=data.get("motivo") or "edicion", actor=_actor(), estricto=True,
+                    )
+                if sets:
+                    queries.execute_shape(
+                        cur,
+                        "update_ejemplar",
+                        [f for f in fields if f in data],
+                        f"""
+                        UPDATE public.ejemplares
+                        SET {", ".join(sets)}
+                        WHERE id_ejemplar = %s
+                        RETURNING id_ejemplar, id_libro, estado, ubicacion, created_at
+                        """,
+                        tuple(params)
+                    )
+                else:
+                    queries.execute(cur, "ejemplar_get", (id_ejemplar,))
                 row = cur.fetchone()
                 conn.commit()
                 if not row:
                     return jsonify({"ok": False, "error": "Ejemplar no encontrado"}), 404
                 return jsonify({"ok": True, "ejemplar": row})
+        except TransicionInvalida as e:
+            if e.rechazados[0]["estado"] is None:
+                return jsonify({"ok": False, "error": "Ejemplar no encontrado"}), 404
+            return jsonify({"ok": False, "error": str(e)}), 409
+        except Exception as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
+
+    @app.post("/api/ejemplares/transiciones")
+    def transicion_masiva():
+        """
+        Cambia el estado de muchos ejemplares en una sola sentencia (p. ej. inventario).
+        Body: { "ids": [1, 2, ...], "estado": "en_reparacion", "motivo"?: "inventario", "estricto"?: false }
+        - estricto=false: aplica a los que admiten la transición e informa el resto en "rechazados".
+        - estricto=true: si alguno no la admite no se cambia ninguno (409).
+        """
+        data = request.get_json(silent=True) or {}
+        ids = data.get("ids")
+        nuevo = data.get("estado")
+        if not isinstance(ids, list) or not ids:
+            return jsonify({"ok": False, "error": "Debe enviar ids (lista)"}), 400
+        if nuevo not in estados_ejemplar.ESTADOS:
+            return jsonify({"ok": False, "error": f"Estado inválido: {nuevo}"}), 400
+
+        try:
+            with get_connection() as conn:
+                res = reservas.cambiar_estado(
+                    conn, ids, nuevo, motivo=data.get("motivo"), actor=_actor(),
+                    estricto=bool(data.get("estricto")),
+                )
+                conn.commit()
+        except TransicionInvalida as e:
+            return jsonify({"ok": False, "error": str(e), "rechazados": e.rechazados}), 409
+        except (ValueError, TypeError) as e:
+            return jsonify({"ok": False, "error": str(e)}), 400
+        except Exception as e:
+            log.exception("transicion_masiva")
+            return jsonify({"ok": False, "error": str(e)}), 500
+        return jsonify({
+            "ok": True,
+            "estado": nuevo,
+            "cambiados": len(res["cambiados"]),
+            "items": res["cambiados"],
+            "rechazados": res["rechazados"],
+            "reservas_reencoladas": len(res["reencoladas"]),
+            "reservas_asignadas": len(res["asignadas"]),
+        })
+
+    @app.get("/api/ejemplares/<int:id_ejemplar>/eventos")
+    def eventos_ejemplar(id_ejemplar: int):
+        """Historial de cambios de estado del ejemplar (más reciente primero). Querystring: limit."""
+        limit = min(request.args.get("limit", 50, type=int) or 50, 500)
+        try:
+            with get_connection() as conn:
+                rows = estados_ejemplar.eventos(conn, id_ejemplar, limit)
+            return jsonify({"ok": True, "count": len(rows), "items": rows})
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
 
@@ -547,7 +1068,7 @@ def create_app():
     def delete_ejemplar(id_ejemplar: int):
         try:
             with get_connection() as conn, conn.cursor() as cur:
-                cur.execute("DELETE FROM public.ejemplares WHERE id_ejemplar = %s RETURNING id_ejemplar", (id_ejemplar,))
+                queries.execute(cur, "ejemplar_delete", (id_ejemplar,))
                 row = cur.fetchone()
                 conn.commit()
                 if not row:
@@ -556,6 +1077,165 @@ def create_app():
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
 
+    # -------------------------
+    # INVENTARIO (bibliotecario)
+    # -------------------------
+
+    @app.post("/api/inventario/sesiones")
+    def abrir_inventario():
+        """Body: { "alcance"?: "Estante 1" }  (prefijo de ubicación; vacío = toda la colección)"""
+        data = request.get_json(silent=True) or {}
+        try:
+            row = inventario.abrir(data.get("alcance"), _actor())
+            return jsonify({"ok": True, "sesion": row}), 201
+        except Exception as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
+
+    @app.get("/api/inventario/sesiones/<int:sesion_id>")
+    def ver_inventario(sesion_id: int):
+        try:
+            row = inventario.sesion(sesion_id)
+        except Exception as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
+        if not row:
+            return jsonify({"ok": False, "error": "Sesión no encontrada"}), 404
+        return jsonify({"ok": True, "sesion": row})
+
+    @app.post("/api/inventario/sesiones/<int:sesion_id>/lecturas")
+    def lecturas_inventario(sesion_id: int):
+        """
+        Lote de lecturas de un escáner.
+        - JSON: { "ubicacion": "Estante 12", "ids": [101, 102, ...] }
+        - text/plain: un id_ejemplar por línea, ?ubicacion=Estante%2012 (se lee en streaming)
+        """
+        if request.mimetype == "text/plain":
+            ubicacion = request.args.get("ubicacion")
+            ids = (ln.strip() for ln in request.stream if ln.strip())
+        else:
+            data = request.get_json(silent=True) or {}
+            ubicacion = data.get("ubicacion")
+            ids = data.get("ids")
+            if not isinstance(ids, list):
+                return jsonify({"ok": False, "error": "Debe enviar ids (lista)"}), 400
+        try:
+            n = inventario.agregar_lecturas(sesion_id, ubicacion, ids)
+            return jsonify({"ok": True, "sesion_id": sesion_id, "cargadas": n})
+        except inventario.SesionNoDisponible as e:
+            return jsonify({"ok": False, "error": str(e)}), 409
+        except ValueError as e:
+            return jsonify({"ok": False, "error": f"Lote inválido: {e}"}), 400
+        except Exception as e:
+            log.exception("lecturas_inventario")
+            return jsonify({"ok": False, "error": str(e)}), 500
+
+    @app.get("/api/inventario/sesiones/<int:sesion_id>/reporte")
+    def reporte_inventario(sesion_id: int):
+        """
+        Clasificación de cada ejemplar, en streaming (application/x-ndjson: un JSON por línea).
+        La última línea es {"resumen": {clasificacion: n, ...}}.
+        Querystring: solo=faltante,mal_ubicado (opcional)
+        """
+        solo = [c for c in (request.args.get("solo") or "").split(",") if c]
+        invalidas = [c for c in solo if c not in inventario.CLASIFICACIONES]
+        if invalidas:
+            return jsonify({"ok": False, "error": f"Clasificación inválida: {', '.join(invalidas)}"}), 400
+        try:
+            info = inventario.sesion(sesion_id)
+        except Exception as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
+        if not info:
+            return jsonify({"ok": False, "error": "Sesión no encontrada"}), 404
+
+        def generar():
+            resumen: Dict[str, int] = {}
+            try:
+                for row in inventario.reporte(sesion_id, info["alcance"], solo, resumen):
+                    yield app.json.dumps(row) + "\n"
+                yield app.json.dumps({"resumen": resumen}) + "\n"
+            except Exception as e:
+                log.exception("reporte_inventario")
+                yield app.json.dumps({"error": str(e)}) + "\n"
+
+        return Response(stream_with_context(generar()), mimetype="application/x-ndjson")
+
+    @app.post("/api/inventario/sesiones/<int:sesion_id>/cerrar")
+    def cerrar_inventario(sesion_id: int):
+        """Cierra la sesión: guarda el resumen por clasificación y borra las lecturas."""
+        try:
+            row = inventario.cerrar(sesion_id)
+            return jsonify({"ok": True, "sesion": row})
+        except inventario.SesionNoDisponible as e:
+            return jsonify({"ok": False, "error": str(e)}), 409
+        except Exception as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
+
+    # -------------------------
+    # RESERVAS (cola de espera por libro)
+    # -------------------------
+
+    def _reserva_user_id(data: Dict[str, Any]) -> Optional[int]:
+        """user_id explícito (mesón) o el del token (cliente)."""
+        raw = data.get("user_id") or _actor()
+        try:
+            return int(raw) if raw is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    @app.post("/api/reservas")
+    def crear_reserva():
+        """
+        Body: { "id_libro": 5, "user_id"? }
+        Solo para libros sin ejemplares disponibles. Devuelve la posición en la cola.
+        """
+        data = request.get_json(silent=True) or {}
+        user_id = _reserva_user_id(data)
+        id_libro = data.get("id_libro")
+        if not user_id or not id_libro:
+            return jsonify({"ok": False, "error": "Faltan user_id o id_libro"}), 400
+        try:
+            row = reservas.crear(user_id, int(id_libro))
+            return jsonify({"ok": True, "reserva": row}), 201
+        except reservas.ReservaError as e:
+            return jsonify({"ok": False, "error": str(e)}), 409
+        except Exception as e:
+            log.exception("crear_reserva")
+            return jsonify({"ok": False, "error": str(e)}), 500
+
+    @app.get("/api/reservas")
+    def listar_reservas():
+        """Reservas activas del usuario (?user_id= o token), con posición en la cola."""
+        user_id = _reserva_user_id(request.args)
+        if not user_id:
+            return jsonify({"ok": False, "error": "Falta user_id"}), 400
+        try:
+            return jsonify({"ok": True, "reservas": reservas.de_usuario(user_id)})
+        except Exception as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
+
+    @app.post("/api/reservas/<int:reserva_id>/cancelar")
+    def cancelar_reserva(reserva_id: int):
+        """Body: { "user_id"? }. Si la reserva ya tenía ejemplar asignado, pasa al siguiente."""
+        data = request.get_json(silent=True) or {}
+        user_id = _reserva_user_id(data)
+        if not user_id:
+            return jsonify({"ok": False, "error": "Falta user_id"}), 400
+        try:
+            row = reservas.cancelar(reserva_id, user_id, actor=_actor())
+        except Exception as e:
+            log.exception("cancelar_reserva")
+            return jsonify({"ok": False, "error": str(e)}), 500
+        if not row:
+            return jsonify({"ok": False, "error": "Reserva no encontrada o ya cerrada"}), 404
+        return jsonify({"ok": True, "reserva": row})
+
+    @app.get("/api/libros/<int:id_libro>/reservas")
+    def cola_reservas(id_libro: int):
+        """Cola del libro: asignadas primero, luego en espera por orden de llegada."""
+        try:
+            return jsonify({"ok": True, "reservas": reservas.de_libro(id_libro)})
+        except Exception as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
+
     # -------------------------
     # SOLICITUDES (tótem / bibliotecario)
     # -------------------------
@@ -565,6 +1245,7 @@ def create_app():
         return estado in {"pending", "ready", "served", "canceled"}
 
     @app.post("/api/solicitudes")
+    @idempotencia.idempotente
     def crear_solicitud():
         """
         Body esperado:
@@ -585,49 +1266,43 @@ def create_app():
         if not user_id or not items:
             return jsonify({"ok": False, "error": "Faltan user_id o items"}), 400
 
+        # Validar los ítems antes de abrir la transacción
+        libros, ejemplares, cantidades = [], [], []
+        for it in items:
+            id_libro = it.get("id_libro")
+            id_ejemplar = it.get("id_ejemplar")
+            if not id_libro and not id_ejemplar:
+                return jsonify({"ok": False, "error": "Cada item debe incluir id_libro o id_ejemplar"}), 400
+            try:
+                libros.append(int(id_libro) if id_libro else None)
+                ejemplares.append(int(id_ejemplar) if id_ejemplar else None)
+                cantidades.append(int(it.get("cantidad", 1)))
+            except (TypeError, ValueError):
+                return jsonify({"ok": False, "error": "id_libro, id_ejemplar y cantidad deben ser enteros"}), 400
+
         try:
             with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
                 # Validar usuario existe
-                cur.execute("SELECT user_id FROM public.users WHERE user_id = %s", (user_id,))
+                queries.execute(cur, "user_exists", (user_id,))
                 if not cur.fetchone():
                     return jsonify({"ok": False, "error": "Usuario no existe"}), 404
 
                 # Crear cabecera
-                cur.execute(
-                    """
-                    INSERT INTO public.solicitudes (user_fk, estado, observaciones)
-                    VALUES (%s, 'pending', %s)
-                    RETURNING solicitud_id, created_at
-                    """,
-                    (user_id, obs)
-                )
+                queries.execute(cur, "solicitud_insert", (user_id, obs))
                 sol = cur.fetchone()
                 solicitud_id = sol["solicitud_id"]
 
-                # Insertar detalle
-                for it in items:
-                    id_libro = it.get("id_libro")
-                    id_ejemplar = it.get("id_ejemplar")
-                    cantidad = int(it.get("cantidad", 1))
-
-                    if not id_libro and not id_ejemplar:
-                        return jsonify({"ok": False, "error": "Cada item debe incluir id_libro o id_ejemplar"}), 400
-
-                    cur.execute(
-                        """
-                        INSERT INTO public.solicitudes_detalle (solicitud_fk, id_libro, id_ejemplar, cantidad)
-                        VALUES (%s, %s, %s, %s)
-                        """,
-                        (solicitud_id, id_libro, id_ejemplar, cantidad)
-                    )
+                # Insertar detalle (una sentencia; el trigger actualiza los totales de la cabecera)
+                queries.execute(cur, "solicitud_detalle_insert", (solicitud_id, libros, ejemplares, cantidades))
 
-                conn.commit()
-
-                return jsonify({"ok": True, "solicitud": {
+                resp = idempotencia.confirmar(conn, jsonify({"ok": True, "solicitud": {
                     "solicitud_id": solicitud_id,
                     "estado": "pending",
-                    "created_at": sol["created_at"]
-                }})
+                    "created_at": sol["created_at"],
+                    "total_items": sum(cantidades),
+                }}))
+                conn.commit()
+                return resp
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
 
@@ -650,45 +1325,68 @@ def create_app():
         except ValueError:
             limit = 200
 
-        where, params = [], []
-        if estados:
-            ests = [e.strip() for e in estados.split(",") if e.strip()]
-            where.append("s.estado = ANY(%s)")
-            params.append(ests)
-
+        where, shape, params = [], [], []
         if assigned:
             where.append("s.asignado_fk = %s")
+            shape.append("assigned")
             params.append(int(assigned))
 
         if desde:
             where.append("s.created_at >= %s")
+            shape.append("desde")
             params.append(desde)
         if hasta:
             where.append("s.created_at <= %s")
+            shape.append("hasta")
             params.append(hasta)
 
-        sql = """
+        # La página sale solo de idx_solicitudes_cola (index-only scan, con los
+        # totales mantenidos en la cabecera); users y observaciones se leen
+        # después, solo para las filas de la página.
+        columnas = """
+            s.solicitud_id, s.estado, s.created_at, s.user_fk, s.asignado_fk,
+            s.total_items, s.n_items, s.primer_titulo
+        """
+        orden = "ORDER BY s.created_at DESC, s.solicitud_id DESC LIMIT %s"
+        ests = list(dict.fromkeys(e.strip() for e in (estados or "").split(",") if e.strip()))
+        if ests:
+            # Un recorrido por estado (cada uno ya ordenado en el índice) y
+            # se mezclan las primeras `limit` de cada uno
+            condicion = " AND ".join(["s.estado = e.estado"] + where)
+            pagina = f"""
+                SELECT c.* FROM unnest(%s::text[]) AS e(estado)
+                CROSS JOIN LATERAL (
+                    SELECT {columnas} FROM public.solicitudes s
+                    WHERE {condicion}
+                    {orden}
+                ) c
+                ORDER BY c.created_at DESC, c.solicitud_id DESC LIMIT %s
+            """
+            shape.insert(0, "estado")
+            params = [ests] + params + [limit, limit]
+        else:
+            pagina = f"SELECT {columnas} FROM public.solicitudes s"
+            if where:
+                pagina += " WHERE " + " AND ".join(where)
+            pagina += " " + orden
+            params.append(limit)
+
+        sql = f"""
+            WITH pagina AS ({pagina})
             SELECT
-                s.solicitud_id, s.estado, s.created_at, s.observaciones,
-                s.asignado_fk,
+                p.solicitud_id, p.estado, p.created_at, s.observaciones,
+                p.asignado_fk,
                 u.user_id, u.nombre, u.apellido1, u.apellido2, u.email,
-                COALESCE(SUM(sd.cantidad), 0) AS total_items
-            FROM public.solicitudes s
-            JOIN public.users u ON u.user_id = s.user_fk
-            LEFT JOIN public.solicitudes_detalle sd ON sd.solicitud_fk = s.solicitud_id
+                p.total_items, p.n_items, p.primer_titulo
+            FROM pagina p
+            JOIN public.solicitudes s ON s.solicitud_id = p.solicitud_id
+            JOIN public.users u ON u.user_id = p.user_fk
+            ORDER BY p.created_at DESC, p.solicitud_id DESC
         """
-        if where:
-            sql += " WHERE " + " AND ".join(where)
-        sql += """
-            GROUP BY s.solicitud_id, u.user_id
-            ORDER BY s.created_at DESC, s.solicitud_id DESC
-            LIMIT %s
-        """
-        params.append(limit)
 
         try:
             with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
-                cur.execute(sql, params)
+                queries.execute_shape(cur, "listar_solicitudes", shape, sql, params)
                 rows = cur.fetchall()
                 return jsonify({"ok": True, "count": len(rows), "items": rows})
         except Exception as e:
@@ -699,31 +1397,12 @@ def create_app():
     def detalle_solicitud(solicitud_id: int):
         try:
             with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
-                cur.execute(
-                    """
-                    SELECT
-                        s.solicitud_id, s.estado, s.created_at, s.observaciones,
-                        s.asignado_fk,
-                        u.user_id, u.nombre, u.apellido1, u.apellido2, u.email
-                    FROM public.solicitudes s
-                    JOIN public.users u ON u.user_id = s.user_fk
-                    WHERE s.solicitud_id = %s
-                    """,
-                    (solicitud_id,)
-                )
+                queries.execute(cur, "solicitud_head", (solicitud_id,))
                 head = cur.fetchone()
                 if not head:
                     return jsonify({"ok": False, "error": "Solicitud no encontrada"}), 404
 
-                cur.execute(
-                    """
-                    SELECT id, id_libro, id_ejemplar, cantidad
-                    FROM public.solicitudes_detalle
-                    WHERE solicitud_fk = %s
-                    ORDER BY id ASC
-                    """,
-                    (solicitud_id,)
-                )
+                queries.execute(cur, "solicitud_items", (solicitud_id,))
                 items = cur.fetchall()
 
                 return jsonify({"ok": True, "solicitud": head, "items": items})
@@ -752,7 +1431,7 @@ def create_app():
 
         try:
             with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
-                cur.execute("SELECT estado FROM public.solicitudes WHERE solicitud_id = %s", (solicitud_id,))
+                queries.execute(cur, "solicitud_estado", (solicitud_id,))
                 row = cur.fetchone()
                 if not row:
                     return jsonify({"ok": False, "error": "Solicitud no encontrada"}), 404
@@ -771,22 +1450,28 @@ def create_app():
                     if new_estado not in valid_transitions.get(old_estado, set()):
                         return jsonify({"ok": False, "error": f"Transición no permitida: {old_estado} -> {new_estado}"}), 400
 
-                sets, params = [], []
+                sets, shape, params = [], [], []
                 if new_estado:
                     sets.append("estado = %s")
+                    shape.append("estado")
                     params.append(new_estado)
                 if asignado_fk is not None:
                     sets.append("asignado_fk = %s")
+                    shape.append("asignado_fk")
                     params.append(asignado_fk)
                 if obs is not None:
                     sets.append("observaciones = %s")
+                    shape.append("observaciones")
                     params.append(obs)
 
                 if not sets:
                     return jsonify({"ok": False, "error": "No hay cambios"}), 400
 
                 params.append(solicitud_id)
-                cur.execute(
+                queries.execute_shape(
+                    cur,
+                    "actualizar_solicitud",
+                    shape,
                     f"UPDATE public.solicitudes SET {', '.join(sets)} WHERE solicitud_id = %s RETURNING solicitud_id, estado, asignado_fk, observaciones",
                     tuple(params)
                 )
@@ -799,8 +1484,8 @@ def create_app():
     # ===========================================
     # PRESTAMOS (bibliotecario)
     # Reglas por defecto:
-    #   - Sala:    ahora + SALA_MINUTES (env, default 120 min)
-    #   - Domicilio: ahora + DOMICILIO_DAYS (env, default 7 días)
+    #   - Duración según politicas_prestamo (rol del usuario, categoría del libro);
+    #     sin fila aplicable: Sala = SALA_MINUTES (120 min), Domicilio = DOMICILIO_DAYS (7 días)
     #   - Solo presta si el ejemplar está 'disponible'
     #   - Marca ejemplar -> 'prestado'
     #   - Valida sanción vigente (si existe tabla sanciones)
@@ -811,18 +1496,14 @@ def create_app():
     def _has_active_sanction(conn, user_id: int) -> bool:
         try:
             with conn.cursor(row_factory=dict_row) as cur:
-                cur.execute("""
-                    SELECT 1
-                    FROM public.sanciones
-                    WHERE user_fk = %s AND now() < hasta
-                    LIMIT 1
-                """, (user_id,))
+                queries.execute(cur, "sancion_activa", (user_id,))
                 return cur.fetchone() is not None
         except Exception:
             # Si no existe la tabla, no bloquea (modo compatible)
             return False
 
     @app.post("/api/prestamos")
+    @idempotencia.idempotente
     def crear_prestamo():
         """
         Body:
@@ -843,54 +1524,57 @@ def create_app():
         if tipo not in ("Sala", "Domicilio"):
             return jsonify({"ok": False, "error": "Tipo inválido: use 'Sala' o 'Domicilio'"}), 400
 
-        sala_minutes = int(os.getenv("SALA_MINUTES", "120"))
-        domicilio_days = int(os.getenv("DOMICILIO_DAYS", "7"))
-
-        now = datetime.now()
-        if tipo == "Sala":
-            fecha_venc = now + timedelta(minutes=sala_minutes)
-        else:
-            fecha_venc = now + timedelta(days=domicilio_days)
-
         try:
             with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
                 # Valida usuario
-                cur.execute("SELECT user_id FROM public.users WHERE user_id = %s", (user_id,))
-                if not cur.fetchone():
+                queries.execute(cur, "user_role", (user_id,))
+                user_row = cur.fetchone()
+                if not user_row:
                     return jsonify({"ok": False, "error": "Usuario no existe"}), 404
+                if not user_row["activo"]:
+                    return jsonify({"ok": False, "error": "Usuario inactivo. No puede pedir préstamos."}), 403
 
                 # Sanción vigente (si existe tabla)
                 if _has_active_sanction(conn, user_id):
                     return jsonify({"ok": False, "error": "Usuario con sanción vigente. No puede pedir préstamos."}), 403
 
                 # Valida ejemplar disponible y obtiene libro
-                cur.execute("""
-                    SELECT e.id_ejemplar, e.id_libro, e.estado, l.titulo, l.autor
-                    FROM public.ejemplares e
-                    JOIN public.libros l ON l.id_libro = e.id_libro
-                    WHERE e.id_ejemplar = %s
-                """, (id_ejemplar,))
+                queries.execute(cur, "ejemplar_con_libro", (id_ejemplar,))
                 ej = cur.fetchone()
                 if not ej:
                     return jsonify({"ok": False, "error": "Ejemplar no existe"}), 404
-                if ej["estado"] != "disponible":
-                    return jsonify({"ok": False, "error": f"Ejemplar no disponible (estado: {ej['estado']})"}), 409
+                if ej["estado"] == "reservado":
+                    # Solo lo retira el titular de la reserva asignada
+                    if not reservas.retirar_si_reservado(conn, ej["id_ejemplar"], user_id):
+                        conn.rollback()
+                        return jsonify({"ok": False, "error": "Ejemplar reservado para otro usuario"}), 409
+                elif ej["estado"] != "disponible":
+                    return jsonify({
+                        "ok": False,
+                        "error": f"Ejemplar no disponible (estado: {ej['estado']})",
+                        "puede_reservar": True,
+                        "id_libro": ej["id_libro"],
+                    }), 409
+
+                # Duración según política en caché (sin consultas extra)
+                now = datetime.now()
+                fecha_venc = now + POLICIES.duracion(tipo, user_row["role"], ej["categoria"])
 
                 # Crea préstamo
-                cur.execute("""
-                    INSERT INTO public.prestamos
-                        (user_fk, ejemplar_fk, libro_fk, tipo_prestamo, fecha_reserva, fecha_vencimiento, vencido)
-                    VALUES (%s, %s, %s, %s, %s, %s, FALSE)
-                    RETURNING prestamo_id
-                """, (user_id, ej["id_ejemplar"], ej["id_libro"], tipo, now, fecha_venc))
+                queries.execute(cur, "prestamo_insert", (user_id, ej["id_ejemplar"], ej["id_libro"], tipo, now, fecha_venc))
                 p = cur.fetchone()
 
-                # Marca ejemplar como prestado
-                cur.execute("UPDATE public.ejemplares SET estado = 'prestado' WHERE id_ejemplar = %s", (id_ejemplar,))
-
-                conn.commit()
+                # Marca ejemplar como prestado (falla si otro préstamo lo tomó entretanto)
+                try:
+                    estados_ejemplar.transicionar(
+                        conn, [ej["id_ejemplar"]], "prestado",
+                        motivo="prestamo", actor=_actor(), prestamo=p["prestamo_id"], estricto=True,
+                    )
+                except TransicionInvalida:
+                    conn.rollback()
+                    return jsonify({"ok": False, "error": "Ejemplar no disponible"}), 409
 
-                return jsonify({
+                resp = idempotencia.confirmar(conn, jsonify({
                     "ok": True,
                     "prestamo": {
                         "prestamo_id": p["prestamo_id"],
@@ -903,45 +1587,105 @@ def create_app():
                         "fecha_reserva": now.isoformat(),
                         "fecha_vencimiento": fecha_venc.isoformat()
                     }
-                })
+                }))
+                conn.commit()
+                return resp
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
 
 
+    def _respuesta_comprobante(formato: str, lista, titulo: str, nombre: str):
+        """HTML/PDF con ETag (hash del contenido): 304 si el cliente ya lo tiene."""
+        tag = comprobantes.etag(lista, formato)
+        if request.if_none_match.contains(tag):
+            resp = Response(status=304)
+        else:
+            doc = comprobantes.renderizador().documento(formato, lista, titulo)
+            mimetype = "application/pdf" if formato == "pdf" else "text/html"
+            resp = Response(doc, mimetype=mimetype)
+            if formato == "pdf":
+                resp.headers["Content-Disposition"] = f'inline; filename="{nombre}.pdf"'
+        resp.set_etag(tag)
+        resp.headers["Cache-Control"] = "private, max-age=86400"
+        return resp
+
     @app.get("/api/prestamos/<int:prestamo_id>/comprobante")
     def comprobante_prestamo(prestamo_id: int):
         """
-        Devuelve un comprobante simple (texto/JSON).
-        (Luego podemos servir HTML o PDF si quieres.)
+        Comprobante del préstamo.
+        Querystring: formato=json (por defecto) | html | pdf
         """
+        formato = (request.args.get("formato") or "json").lower()
+        if formato != "json" and formato not in comprobantes.FORMATOS:
+            return jsonify({"ok": False, "error": "formato inválido: use json, html o pdf"}), 400
         try:
             with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
-                cur.execute("""
-                    SELECT p.prestamo_id, p.tipo_prestamo, p.fecha_reserva, p.fecha_vencimiento,
-                           u.user_id, u.nombre, u.apellido1, u.apellido2, u.email,
-                           l.id_libro, l.titulo, l.autor
-                    FROM public.prestamos p
-                    JOIN public.users u ON u.user_id = p.user_fk
-                    JOIN public.libros l ON l.id_libro = p.libro_fk
-                    WHERE p.prestamo_id = %s
-                """, (prestamo_id,))
-                row = cur.fetchone()
-                if not row:
-                    return jsonify({"ok": False, "error": "Préstamo no encontrado"}), 404
+                queries.execute(cur, "prestamo_clave", (prestamo_id,))
+                clave = cur.fetchone()
+                row = None
+                if clave:
+                    queries.execute(cur, "comprobante", (prestamo_id, clave["fecha_reserva"]))
+                    row = cur.fetchone()
+            if not row:
+                return jsonify({"ok": False, "error": "Préstamo no encontrado"}), 404
+            c = comprobantes.datos(row)
+            if formato != "json":
+                return _respuesta_comprobante(formato, [c], f"Comprobante {prestamo_id}", f"comprobante-{prestamo_id}")
+
+            return jsonify({
+                "ok": True,
+                "comprobante": {
+                    "prestamo_id": row["prestamo_id"],
+                    "codigo": c["codigo"],
+                    "usuario": {"id": row["user_id"], "nombre": c["usuario"], "email": row["email"]},
+                    "libro": {"id_libro": row["id_libro"], "titulo": row["titulo"], "autor": row["autor"]},
+                    "tipo": row["tipo_prestamo"],
+                    "fecha_prestamo": row["fecha_reserva"].isoformat() if row["fecha_reserva"] else None,
+                    "fecha_vencimiento": row["fecha_vencimiento"].isoformat() if row["fecha_vencimiento"] else None
+                }
+            })
+        except Exception as e:
+            log.exception("comprobante_prestamo")
+            return jsonify({"ok": False, "error": str(e)}), 500
 
-                full_name = " ".join(filter(None, [row["nombre"], row["apellido1"], row["apellido2"]]))
-                return jsonify({
-                    "ok": True,
-                    "comprobante": {
-                        "prestamo_id": row["prestamo_id"],
-                        "usuario": {"id": row["user_id"], "nombre": full_name, "email": row["email"]},
-                        "libro": {"id_libro": row["id_libro"], "titulo": row["titulo"], "autor": row["autor"]},
-                        "tipo": row["tipo_prestamo"],
-                        "fecha_prestamo": row["fecha_reserva"].isoformat() if row["fecha_reserva"] else None,
-                        "fecha_vencimiento": row["fecha_vencimiento"].isoformat() if row["fecha_vencimiento"] else None
-                    }
-                })
+    @app.post("/api/prestamos/comprobantes")
+    def comprobantes_lote():
+        """
+        Varios comprobantes en un solo documento (una página por préstamo).
+        Body: { "ids": [101, 102, ...], "formato": "pdf" | "html" }  (máx. 500)
+        Los ids inexistentes se informan en la cabecera X-Comprobantes-Faltantes.
+        """
+        data = request.get_json(silent=True) or {}
+        formato = (data.get("formato") or "pdf").lower()
+        ids = data.get("ids")
+        if formato not in comprobantes.FORMATOS:
+            return jsonify({"ok": False, "error": "formato inválido: use html o pdf"}), 400
+        if not isinstance(ids, list) or not ids:
+            return jsonify({"ok": False, "error": "Debe enviar ids (lista)"}), 400
+        if len(ids) > comprobantes.MAX_LOTE:
+            return jsonify({"ok": False, "error": f"Máximo {comprobantes.MAX_LOTE} comprobantes por lote"}), 400
+        try:
+            ids = list(dict.fromkeys(int(i) for i in ids))
+        except (TypeError, ValueError):
+            return jsonify({"ok": False, "error": "ids deben ser enteros"}), 400
+        try:
+            with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+                queries.execute(cur, "prestamo_claves", (ids,))
+                fechas = sorted({r["fecha_reserva"] for r in cur.fetchall()})
+                por_id = {}
+                if fechas:
+                    queries.execute(cur, "comprobante_lote", (ids, fechas))
+                    por_id = {r["prestamo_id"]: comprobantes.datos(r) for r in cur.fetchall()}
+            if not por_id:
+                return jsonify({"ok": False, "error": "Préstamos no encontrados"}), 404
+            lista = [por_id[i] for i in ids if i in por_id]
+            resp = _respuesta_comprobante(formato, lista, f"Comprobantes ({len(lista)})", f"comprobantes-{len(lista)}")
+            faltantes = [str(i) for i in ids if i not in por_id]
+            if faltantes:
+                resp.headers["X-Comprobantes-Faltantes"] = ",".join(faltantes)
+            return resp
         except Exception as e:
+            log.exception("comprobantes_lote")
             return jsonify({"ok": False, "error": str(e)}), 500
 
     # ===========================================
@@ -977,16 +1721,17 @@ def create_app():
                 misfire_grace_time=300
             )
         except Exception as e:
-            print(f"[WARN] No se pudo agendar liberación de ejemplar {ejemplar_id}: {e}")
+            log.warning("No se pudo agendar liberación de ejemplar %s: %s", ejemplar_id, e)
 
     def _make_available_job(ejemplar_id: int):
         """Job: set estado = 'disponible' para el ejemplar."""
-        try:
-            with get_connection() as conn, conn.cursor() as cur:
-                cur.execute("UPDATE public.ejemplares SET estado = 'disponible' WHERE id_ejemplar = %s", (ejemplar_id,))
-                conn.commit()
-        except Exception as e:
-            print(f"[ERROR] Liberando ejemplar {ejemplar_id}: {e}")
+        with registro.contexto_job(f"mkavail-{ejemplar_id}"):
+            try:
+                with get_connection() as conn:
+                    reservas.liberar_ejemplar(conn, ejemplar_id, "reposicion")
+                    conn.commit()
+            except Exception:
+                log.exception("Liberando ejemplar %s", ejemplar_id)
 
     def _insert_sancion(conn, user_id: int, fecha_vencimiento, fecha_devolucion):
         """
@@ -1011,24 +1756,19 @@ def create_app():
                 return
 
             days_late = ceil(atraso_seg / 86400.0)  # 86400 = segundos de un día
-            min_days = int(os.getenv("SANCTION_MIN_DAYS", "1"))
+            min_days = get_settings().sanction_min_days
             days = max(days_late, min_days)
 
             hasta = datetime.now() + timedelta(days=days)
 
             with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    INSERT INTO public.sanciones (user_fk, motivo, desde, hasta)
-                    VALUES (%s, %s, NOW(), %s)
-                    """,
-                    (user_id, f"Atraso de {days_late} día(s)", hasta),
-                )
+                queries.execute(cur, "sancion_insert", (user_id, f"Atraso de {days_late} día(s)", hasta))
         except Exception as e:
             # No rompemos el flujo si algo falla, solo lo dejamos logueado
-            print(f"[WARN] No se pudo registrar sanción: {e}")
+            log.warning("No se pudo registrar sanción: %s", e)
 
     @app.post("/api/devoluciones")
+    @idempotencia.idempotente
     def registrar_devolucion():
         """
         Body (al menos uno):
@@ -1050,31 +1790,16 @@ def create_app():
 
         try:
             with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
-                # 1) Buscar el préstamo
+                # 1) Buscar el préstamo (prestamos_clave da la partición)
                 if prestamo_id:
-                    cur.execute(
-                        """
-                        SELECT p.prestamo_id, p.user_fk, p.ejemplar_fk,
-                            p.fecha_vencimiento, p.fecha_devolucion
-                        FROM public.prestamos p
-                        WHERE p.prestamo_id = %s
-                        """,
-                        (prestamo_id,),
-                    )
+                    queries.execute(cur, "prestamo_clave", (prestamo_id,))
                 else:
-                    cur.execute(
-                        """
-                        SELECT p.prestamo_id, p.user_fk, p.ejemplar_fk,
-                            p.fecha_vencimiento, p.fecha_devolucion
-                        FROM public.prestamos p
-                        WHERE p.ejemplar_fk = %s
-                        ORDER BY p.prestamo_id DESC
-                        LIMIT 1
-                        """,
-                        (id_ejemplar,),
-                    )
-
-                p = cur.fetchone()
+                    queries.execute(cur, "prestamo_clave_ejemplar", (id_ejemplar,))
+                clave = cur.fetchone()
+                p = None
+                if clave:
+                    queries.execute(cur, "devolucion_por_prestamo", (clave["prestamo_id"], clave["fecha_reserva"]))
+                    p = cur.fetchone()
                 if not p:
                     return jsonify({"ok": False, "error": "Préstamo no encontrado"}), 404
                 if p["fecha_devolucion"]:
@@ -1096,40 +1821,31 @@ def create_app():
                     vencido = True
 
                 # 3) Marcar devolución (y vencido si corresponde)
-                cur.execute(
-                    """
-                    UPDATE public.prestamos
-                    SET fecha_devolucion = %s,
-                        vencido = %s
-                    WHERE prestamo_id = %s
-                    RETURNING prestamo_id
-                    """,
-                    (now, vencido, p["prestamo_id"]),
-                )
+                queries.execute(cur, "prestamo_marcar_devuelto", (now, vencido, p["prestamo_id"], p["fecha_reserva"]))
 
-                # 4) Dejar ejemplar disponible
-                cur.execute(
-                    "UPDATE public.ejemplares SET estado = 'disponible' WHERE id_ejemplar = %s",
-                    (p["ejemplar_fk"],),
+                # 4) Dejar ejemplar disponible (o reservado para la siguiente reserva en cola)
+                reserva = reservas.liberar_ejemplar(
+                    conn, p["ejemplar_fk"], "devolucion", actor=_actor(), prestamo=p["prestamo_id"],
                 )
 
                 # 5) Crear sanción si devolvió con atraso
                 if vencido and fv_date:
                     _insert_sancion(conn, p["user_fk"], fv_date, hoy)
 
-                conn.commit()
-
-                return jsonify(
+                resp = idempotencia.confirmar(conn, jsonify(
                     {
                         "ok": True,
                         "devolucion": {
                             "prestamo_id": p["prestamo_id"],
                             "vencido": vencido,
+                            "reserva_asignada": reserva["reserva_id"] if reserva else None,
                         },
                     }
-                )
+                ))
+                conn.commit()
+                return resp
         except Exception as e:
-            print(f"[ERROR] registrar_devolucion: {e}")
+            log.exception("registrar_devolucion")
             return jsonify({"ok": False, "error": str(e)}), 500
 
 
@@ -1155,12 +1871,14 @@ def create_app():
         except ValueError:
             limit = 200
 
-        where, params = [], []
+        where, shape, params = [], [], []
         if user_id is not None:
             where.append("s.user_fk = %s")
+            shape.append("user_id")
             params.append(user_id)
         if activas:
             where.append("NOW() < s.hasta")
+            shape.append("activas")
 
         sql = """
             SELECT s.sancion_id, s.user_fk, s.motivo, s.desde, s.hasta, u.nombre, u.apellido1, u.apellido2, u.email
@@ -1174,7 +1892,7 @@ def create_app():
 
         try:
             with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
-                cur.execute(sql, params)
+                queries.execute_shape(cur, "listar_sanciones", shape, sql, params)
                 rows = cur.fetchall()
                 return jsonify({"ok": True, "count": len(rows), "items": rows})
         except Exception as e:
@@ -1194,13 +1912,7 @@ def create_app():
 
         try:
             with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
-                cur.execute("""
-                    SELECT hasta
-                    FROM public.sanciones
-                    WHERE user_fk = %s AND NOW() < hasta
-                    ORDER BY hasta DESC
-                    LIMIT 1
-                """, (user_id,))
+                queries.execute(cur, "sancion_estado", (user_id,))
                 row = cur.fetchone()
                 if not row:
                     return jsonify({"ok": True, "user_id": user_id, "bloqueado": False, "hasta": None})
@@ -1208,23 +1920,92 @@ def create_app():
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
 
+    # Build del SPA servido por la API (al final: la ruta comodín no tapa ninguna /api/*)
+    if settings.serve_frontend and not init_frontend(app, settings.frontend_dist):
+        log.warning("SERVE_FRONTEND activo pero no existe %s/index.html", settings.frontend_dist)
 
+    # Pool, sentencias preparadas y cachés en segundo plano; /api/health da 503 hasta terminar
+    calentamiento.iniciar(app)
     return app
 
 
 if __name__ == "__main__":
+    from apscheduler.schedulers.background import BackgroundScheduler
+
     app = create_app()
     
     # Scheduler setup
     scheduler = BackgroundScheduler(daemon=True)
     
     # Schedule the notification job to run every Monday at 20:00
+    # (mismo runner que el endpoint: nunca corren dos a la vez)
     def scheduled_task():
-        with app.app_context():
-            send_overdue_notifications()
+        try:
+            enqueue_overdue_notifications(app)
+        except JobAlreadyRunning as e:
+            log.warning("%s", e)
 
     scheduler.add_job(scheduled_task, 'cron', day_of_week='mon', hour=20)
+
+    def scheduled_stats():
+        try:
+            enqueue_stats_refresh()
+        except JobAlreadyRunning as e:
+            log.warning("%s", e)
+
+    scheduler.add_job(scheduled_stats, 'interval', minutes=get_settings().stats_refresh_minutes)
+
+    # Particiones futuras (y archivado si ARCHIVE_YEARS > 0): al iniciar y cada noche
+    def scheduled_partitions():
+        try:
+            JOBS.submit("particiones", lambda job: particiones.mantenimiento())
+        except JobAlreadyRunning as e:
+            log.warning("%s", e)
+
+    scheduled_partitions()
+    scheduler.add_job(scheduled_partitions, 'cron', hour=3, minute=30)
+
+    # Reservas asignadas no retiradas: el ejemplar pasa a la siguiente de la cola
+    def scheduled_holds():
+        try:
+            JOBS.submit("reservas-expirar", lambda job: reservas.expirar())
+        except JobAlreadyRunning as e:
+            log.warning("%s", e)
+
+    scheduler.add_job(scheduled_holds, 'interval', minutes=5)
+
+    # Respuestas guardadas por Idempotency-Key ya vencidas
+    def scheduled_idempotency_purge():
+        try:
+            JOBS.submit("idempotencia-purgar", lambda job: idempotencia.purgar())
+        except JobAlreadyRunning as e:
+            log.warning("%s", e)
+
+    scheduler.add_job(scheduled_idempotency_purge, 'interval', hours=1)
+
+    # Recomendaciones: préstamos nuevos sobre la matriz de coocurrencias
+    def scheduled_recommendations():
+        import recomendaciones
+
+        try:
+            JOBS.submit("recomendaciones", lambda job: recomendaciones.actualizar())
+        except JobAlreadyRunning as e:
+            log.warning("%s", e)
+
+    scheduler.add_job(scheduled_recommendations, 'interval', minutes=get_settings().recs_refresh_minutes,
+                      next_run_time=datetime.now())
+
+    # Recordatorios antes del vencimiento: un tick por minuto sobre la rueda en
+    # memoria (no pasa por JOBS para no llenar el historial de jobs)
+    def scheduled_reminders():
+        with app.app_context(), registro.contexto_job("recordatorios"):
+            try:
+                recordatorios.MOTOR.tick()
+            except Exception:
+                log.exception("Error en la tarea de recordatorios")
+
+    scheduler.add_job(scheduled_reminders, 'interval', minutes=1, next_run_time=datetime.now())
     scheduler.start()
     
-    port = int(os.getenv("PORT", "5000"))
+    port = get_settings().port
     app.run(host="127.0.0.1", port=port, debug=True, use_reloader=False) # use_reloader=False to avoid running scheduler twice
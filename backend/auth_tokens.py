@@ -0,0 +1,202 @@
+"""Tokens de sesión firmados (JWT HS256) para la API de Sisbib.
+
+El token se emite en /api/login y lleva user_id y role, de modo que
+verificarlo no requiere consultar la tabla users. La revocación (logout o
+cambio de rol) se resuelve con una lista en memoria que se purga sola al
+expirar los tokens.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from functools import wraps
+from typing import Optional, Dict, Any
+
+from flask import g, jsonify, request
+
+import registro
+from settings import get_settings
+
+log = registro.get("auth")
+
+
+class TokenError(Exception):
+    """Token mal formado, con firma inválida, expirado o revocado."""
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    padding = "=" * (-len(data) % 4)
+    return base64.urlsafe_b64decode(data + padding)
+
+
+_HEADER = _b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode())
+
+
+_ephemeral_secret: Optional[bytes] = None
+_ephemeral_lock = threading.Lock()
+
+
+def _secreto_efimero() -> bytes:
+    """Secreto por proceso cuando falta AUTH_SECRET, creado una sola vez.
+
+    Los tokens no sobreviven a un reinicio ni se aceptan en otro worker:
+    solo sirve para desarrollo con un proceso.
+    """
+    global _ephemeral_secret
+    if _ephemeral_secret is None:
+        with _ephemeral_lock:
+            if _ephemeral_secret is None:
+                log.error("AUTH_SECRET no definido: secreto temporal del proceso; los tokens no valen "
+                          "en otros workers ni tras reiniciar. Definirlo en producción.")
+                _ephemeral_secret = secrets.token_bytes(32)
+    return _ephemeral_secret
+
+
+def _get_secret() -> bytes:
+    secret = get_settings().auth_secret
+    if secret:
+        return secret.encode("utf-8")
+    return _secreto_efimero()
+
+
+def _token_ttl_seconds() -> int:
+    return get_settings().auth_token_ttl_s
+
+
+class RevocationList:
+    """Lista de revocación en memoria.
+
+    - jti revocados (logout) hasta que el token expire por sí solo.
+    - Corte por usuario: tokens emitidos antes de ese instante quedan
+      inválidos (cambio de rol, bloqueo de cuenta).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jtis: Dict[str, float] = {}
+        self._user_cutoff: Dict[int, float] = {}
+
+    def revoke_jti(self, jti: str, exp: float) -> None:
+        with self._lock:
+            self._jtis[jti] = exp
+            self._purge(time.time())
+
+    def revoke_user(self, user_id: int) -> None:
+        with self._lock:
+            self._user_cutoff[int(user_id)] = time.time()
+            self._purge(time.time())
+
+    def is_revoked(self, claims: Dict[str, Any]) -> bool:
+        jti = claims.get("jti")
+        if jti in self._jtis:
+            return True
+        cutoff = self._user_cutoff.get(claims.get("sub"))
+        return cutoff is not None and claims.get("iat", 0) <= cutoff
+
+    def _purge(self, now: float) -> None:
+        self._jtis = {k: exp for k, exp in self._jtis.items() if exp > now}
+        ttl = _token_ttl_seconds()
+        self._user_cutoff = {u: t for u, t in self._user_cutoff.items() if t + ttl > now}
+
+
+revocations = RevocationList()
+
+
+def issue_token(user_id: int, role: str) -> Dict[str, Any]:
+    """Emite un token firmado para el usuario. Devuelve token y expiración (epoch)."""
+    now = time.time()
+    claims = {
+        "sub": int(user_id),
+        "role": role,
+        "iat": now,
+        "exp": now + _token_ttl_seconds(),
+        "jti": secrets.token_urlsafe(12),
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    signing_input = f"{_HEADER}.{payload}".encode("ascii")
+    signature = _b64encode(hmac.new(_get_secret(), signing_input, hashlib.sha256).digest())
+    return {"token": f"{_HEADER}.{payload}.{signature}", "expires_at": int(claims["exp"])}
+
+
+def verify_token(token: str) -> Dict[str, Any]:
+    """Valida firma, expiración y revocación. No toca la base de datos."""
+    try:
+        header, payload, signature = token.split(".")
+    except ValueError:
+        raise TokenError("Token mal formado")
+
+    if header != _HEADER:
+        raise TokenError("Algoritmo de token no soportado")
+
+    expected = hmac.new(_get_secret(), f"{header}.{payload}".encode("ascii"), hashlib.sha256).digest()
+    try:
+        given = _b64decode(signature)
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, json.JSONDecodeError):
+        raise TokenError("Token mal formado")
+    if not hmac.compare_digest(expected, given):
+        raise TokenError("Firma de token inválida")
+
+    if claims.get("exp", 0) <= time.time():
+        raise TokenError("Token expirado")
+    if revocations.is_revoked(claims):
+        raise TokenError("Token revocado")
+    return claims
+
+
+def _bearer_token() -> Optional[str]:
+    header = request.headers.get("Authorization", "")
+    if header.lower().startswith("bearer "):
+        return header[7:].strip() or None
+    return None
+
+
+def init_auth(app) -> None:
+    """Registra el middleware que decodifica el token en g.auth (sin DB).
+
+    Las rutas sin token siguen respondiendo igual; las que exigen sesión
+    usan @require_auth. Un token expirado, inválido o revocado deja el
+    request como anónimo (g.auth_error guarda el motivo): las rutas públicas
+    responden igual y solo @require_auth devuelve 401 con ese motivo.
+    """
+    if not get_settings().auth_secret:
+        _secreto_efimero()  # al iniciar, no en la carrera de los primeros requests
+
+    @app.before_request
+    def _load_auth():
+        g.auth = None
+        g.auth_error = None
+        token = _bearer_token()
+        if not token:
+            return None
+        try:
+            g.auth = verify_token(token)
+        except TokenError as e:
+            g.auth_error = str(e)
+        return None
+
+
+def require_auth(*roles: str):
+    """Decorador: exige token válido y, si se indican, uno de los roles."""
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            claims = getattr(g, "auth", None)
+            if not claims:
+                error = getattr(g, "auth_error", None) or "Autenticación requerida"
+                return jsonify({"ok": False, "error": error}), 401
+            if roles and claims.get("role") not in roles:
+                return jsonify({"ok": False, "error": "No autorizado para este recurso"}), 403
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
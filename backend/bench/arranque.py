@@ -0,0 +1,148 @@
+"""Tiempo de arranque: import de app.py, create_app(), calentamiento y primer request.
+
+Cada repetición corre en un intérprete nuevo (sin módulos ni conexiones en
+memoria), como un reinicio o una instancia nueva del autoscaling:
+- import_ms      import app
+- create_app_ms  create_app()
+- listo_ms       hasta que /api/health deja de responder "warming"
+- rutas          latencia del primer y del segundo request a cada ruta
+                 (test_client, sin servidor HTTP de por medio)
+Con --sin-calentar se mide igual con CALENTAR=0, para comparar el primer
+request frío contra el calentado. --importtime lista los módulos que más
+pesan en el import de app.py (python -X importtime).
+
+Uso (desde backend/, con la base del .env disponible):
+    python -m bench.arranque --repeticiones 5
+    python -m bench.arranque --sin-calentar --rutas "/api/users/by-rut?rut=12345678-5"
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bench.run import RESULTADOS_DIR, commit_actual
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTAS = "/api/health,/api/users/by-rut?rut=12345678-5,/api/libros?q=a,/api/sugerencias?q=a"
+
+# Se ejecuta en el proceso hijo; imprime una línea JSON
+_HIJO = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app as modulo
+t1 = time.perf_counter()
+aplicacion = modulo.create_app()
+t2 = time.perf_counter()
+import calentamiento
+limite = t2 + float(sys.argv[2])
+while not calentamiento.ESTADO.listo and time.perf_counter() < limite:
+    time.sleep(0.005)
+t3 = time.perf_counter()
+cliente = aplicacion.test_client()
+rutas = {}
+for ruta in [r for r in sys.argv[1].split(",") if r]:
+    medidas = []
+    for _ in range(2):
+        a = time.perf_counter()
+        resp = cliente.get(ruta)
+        resp.get_data()
+        medidas.append((time.perf_counter() - a) * 1000)
+    rutas[ruta] = {"primero_ms": medidas[0], "segundo_ms": medidas[1], "estado": resp.status_code}
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "listo_ms": (t3 - t2) * 1000 if calentamiento.ESTADO.listo else None,
+    "calentamiento": calentamiento.ESTADO.describe(),
+    "rutas": rutas,
+}))
+"""
+
+
+def una_vez(rutas: str, calentar: bool, espera_s: float) -> Dict:
+    env = dict(os.environ, CALENTAR="1" if calentar else "0", LOG_LEVEL=os.getenv("LOG_LEVEL", "ERROR"))
+    out = subprocess.run([sys.executable, "-c", _HIJO, rutas, str(espera_s)], cwd=BACKEND, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def mediana(valores: List) -> Optional[float]:
+    valores = [v for v in valores if v is not None]
+    return round(statistics.median(valores), 2) if valores else None
+
+
+def importtime(top: int) -> List[Dict]:
+    """Módulos importados directamente por app.py, por tiempo acumulado."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=BACKEND,
+                         env=dict(os.environ, LOG_LEVEL="ERROR"), capture_output=True, text=True)
+    filas = []
+    for linea in out.stderr.splitlines():
+        partes = linea[len("import time:"):].split("|")
+        if not linea.startswith("import time:") or len(partes) != 3 or not partes[1].strip().isdigit():
+            continue
+        nombre = partes[2].rstrip()
+        # Una línea por módulo, con dos espacios más de sangría por nivel: app queda en 1, lo que importa en 3
+        if len(nombre) - len(nombre.lstrip()) == 3:
+            filas.append({"modulo": nombre.strip(), "acumulado_ms": round(int(partes[1]) / 1000, 1)})
+    filas.sort(key=lambda f: f["acumulado_ms"], reverse=True)
+    return filas[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque de la API")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--rutas", default=RUTAS, help="Separadas por coma")
+    parser.add_argument("--sin-calentar", action="store_true", help="Mide también con CALENTAR=0")
+    parser.add_argument("--espera", type=float, default=30.0, help="Segundos máximos esperando el calentamiento")
+    parser.add_argument("--importtime", type=int, default=15, help="Módulos a listar (0 = no medir)")
+    parser.add_argument("--salida", default=RESULTADOS_DIR)
+    args = parser.parse_args()
+
+    modos = [("calentado", True)] + ([("frio", False)] if args.sin_calentar else [])
+    resultados = {}
+    for modo, calentar in modos:
+        corridas = [una_vez(args.rutas, calentar, args.espera) for _ in range(args.repeticiones)]
+        rutas = {}
+        for ruta in corridas[0]["rutas"]:
+            rutas[ruta] = {
+                "primero_ms": mediana([c["rutas"][ruta]["primero_ms"] for c in corridas]),
+                "segundo_ms": mediana([c["rutas"][ruta]["segundo_ms"] for c in corridas]),
+                "estados": sorted({c["rutas"][ruta]["estado"] for c in corridas}),
+            }
+        resultados[modo] = {
+            "import_ms": mediana([c["import_ms"] for c in corridas]),
+            "create_app_ms": mediana([c["create_app_ms"] for c in corridas]),
+            "listo_ms": mediana([c["listo_ms"] for c in corridas]),
+            "calentamiento": corridas[-1]["calentamiento"],
+            "rutas": rutas,
+        }
+        r = resultados[modo]
+        print(f"\n== {modo}: import {r['import_ms']} ms, create_app {r['create_app_ms']} ms, listo {r['listo_ms']} ms")
+        print(f"{'ruta':45} {'primero':>9} {'segundo':>9}  estados")
+        for ruta, f in rutas.items():
+            print(f"{ruta:45} {f['primero_ms']:>9} {f['segundo_ms']:>9}  {f['estados']}")
+
+    reporte = {
+        "commit": commit_actual(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "parametros": vars(args),
+        "modos": resultados,
+    }
+    if args.importtime:
+        reporte["importtime"] = importtime(args.importtime)
+        print(f"\n{'módulo':30} {'ms':>8}")
+        for f in reporte["importtime"]:
+            print(f"{f['modulo']:30} {f['acumulado_ms']:>8}")
+
+    os.makedirs(args.salida, exist_ok=True)
+    path = os.path.join(args.salida, f"arranque-{reporte['commit']}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+    print(f"\nReporte guardado en {path}")
+
+
+if __name__ == "__main__":
+    main()
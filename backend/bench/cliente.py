@@ -0,0 +1,60 @@
+"""Cliente HTTP mínimo (keep-alive, un socket por hilo) que mide latencias."""
+import http.client
+import json
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+
+class ClienteHTTP:
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        parts = urlsplit(base_url)
+        self._host = parts.hostname or "127.0.0.1"
+        self._port = parts.port or 80
+        self._timeout = timeout
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self.latencias: Dict[str, List[float]] = defaultdict(list)
+        self.estados: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.bytes_recibidos = 0
+
+    def _request(self, method: str, path: str, body: Optional[bytes], etiqueta: str,
+                 headers: Optional[Dict[str, str]] = None) -> Tuple[int, Any]:
+        hdrs = {"Content-Type": "application/json"} if body is not None else {}
+        hdrs.update(headers or {})
+        t0 = time.perf_counter()
+        try:
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+            self._conn.request(method, path, body=body, headers=hdrs)
+            resp = self._conn.getresponse()
+            raw = resp.read()
+            status = resp.status
+        except (OSError, http.client.HTTPException):
+            # Conexión caída: se registra como error 599 y se reabre en la próxima llamada
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+            status, raw = 599, b""
+        elapsed = time.perf_counter() - t0
+
+        self.latencias[etiqueta].append(elapsed)
+        self.estados[etiqueta][status] += 1
+        self.bytes_recibidos += len(raw)
+        try:
+            return status, json.loads(raw) if raw else {}
+        except ValueError:
+            return status, {}
+
+    def get(self, path: str, params: Optional[Dict[str, Any]] = None, etiqueta: Optional[str] = None, **kw):
+        full = f"{path}?{urlencode(params)}" if params else path
+        return self._request("GET", full, None, etiqueta or f"GET {path}", **kw)
+
+    def post(self, path: str, payload: Dict[str, Any], etiqueta: Optional[str] = None, **kw):
+        body = json.dumps(payload).encode("utf-8")
+        return self._request("POST", path, body, etiqueta or f"POST {path}", **kw)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
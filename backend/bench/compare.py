@@ -0,0 +1,50 @@
+"""Compara dos reportes de bench.run (p. ej. commit base vs. commit nuevo).
+
+Uso (desde backend/):
+    python -m bench.compare bench/resultados/abc1234-....json bench/resultados/def5678-....json
+"""
+import argparse
+import json
+
+
+def _delta(antes: float, despues: float) -> str:
+    if not antes:
+        return "   n/a"
+    pct = (despues - antes) / antes * 100
+    return f"{pct:+6.1f}%"
+
+
+def comparar(base: dict, nuevo: dict):
+    print(f"base {base['commit']} ({base['fecha']})  ->  nuevo {nuevo['commit']} ({nuevo['fecha']})")
+    for escenario, res_nuevo in nuevo["escenarios"].items():
+        res_base = base["escenarios"].get(escenario)
+        if not res_base:
+            print(f"\n== {escenario}: sin datos en el reporte base")
+            continue
+        print(f"\n== {escenario}")
+        print(f"{'endpoint':45} {'rps':>16} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18}")
+        for etiqueta, r in res_nuevo["endpoints"].items():
+            b = res_base["endpoints"].get(etiqueta)
+            if not b:
+                print(f"{etiqueta:45} (nuevo)")
+                continue
+            cols = []
+            for campo in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+                cols.append(f"{r[campo]:>9} {_delta(b[campo], r[campo])}")
+            print(f"{etiqueta:45} " + " ".join(cols))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara dos reportes de benchmark")
+    parser.add_argument("base")
+    parser.add_argument("nuevo")
+    args = parser.parse_args()
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.nuevo, encoding="utf-8") as f:
+        nuevo = json.load(f)
+    comparar(base, nuevo)
+
+
+if __name__ == "__main__":
+    main()
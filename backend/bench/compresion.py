@@ -0,0 +1,97 @@
+"""Bytes y tiempo ahorrados por la compresión de respuestas (compresion.py).
+
+Pide los mismos listados con y sin Accept-Encoding y compara bytes en el
+cable y latencia (incluida la descompresión en el cliente). Con --red-mbps
+se estima además el tiempo de transferencia en una red más lenta que
+localhost, donde el ahorro de bytes domina.
+
+Uso (desde backend/, con la API corriendo con COMPRESS_MIN_BYTES > 0):
+    python -m bench.compresion --repeticiones 50
+    python -m bench.compresion --rutas "/api/prestamos?limit=500,/api/users" --red-mbps 20
+"""
+import argparse
+import gzip
+import http.client
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+from bench.run import RESULTADOS_DIR, commit_actual, percentil
+
+RUTAS = "/api/prestamos?limit=500,/api/users,/api/libros,/api/stats/diario"
+
+
+def medir(url: str, ruta: str, codificacion: str, repeticiones: int) -> Dict[str, float]:
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname or "127.0.0.1", parts.port or 80, timeout=60)
+    headers = {"Accept-Encoding": codificacion}
+    tiempos: List[float] = []
+    bytes_resp = 0
+    try:
+        for i in range(repeticiones + 1):
+            t0 = time.perf_counter()
+            conn.request("GET", ruta, headers=headers)
+            resp = conn.getresponse()
+            raw = resp.read()
+            if resp.getheader("Content-Encoding") == "gzip":
+                gzip.decompress(raw)
+            if i:  # la primera es de calentamiento
+                tiempos.append(time.perf_counter() - t0)
+            bytes_resp = len(raw)
+    finally:
+        conn.close()
+    tiempos.sort()
+    return {
+        "bytes": bytes_resp,
+        "p50_ms": round(percentil(tiempos, 50) * 1000, 3),
+        "p95_ms": round(percentil(tiempos, 95) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de compresión de respuestas")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{os.getenv('PORT', '5000')}")
+    parser.add_argument("--rutas", default=RUTAS, help="Separadas por coma")
+    parser.add_argument("--repeticiones", type=int, default=30)
+    parser.add_argument("--red-mbps", type=float, default=10.0,
+                        help="Ancho de banda para estimar el tiempo de transferencia")
+    parser.add_argument("--salida", default=RESULTADOS_DIR)
+    args = parser.parse_args()
+
+    filas = {}
+    print(f"{'ruta':40} {'bytes':>10} {'gzip':>10} {'ahorro':>7} {'p50':>8} {'p50 gz':>8} {'red ms':>8} {'red gz':>8}")
+    for ruta in [r.strip() for r in args.rutas.split(",") if r.strip()]:
+        plano = medir(args.url, ruta, "identity", args.repeticiones)
+        comp = medir(args.url, ruta, "gzip", args.repeticiones)
+        bytes_s = args.red_mbps * 1e6 / 8
+        fila = {
+            "identity": plano,
+            "gzip": comp,
+            "ahorro_bytes": plano["bytes"] - comp["bytes"],
+            "ratio": round(comp["bytes"] / plano["bytes"], 3) if plano["bytes"] else None,
+            "red_ms": round(plano["bytes"] / bytes_s * 1000 + plano["p50_ms"], 3),
+            "red_gzip_ms": round(comp["bytes"] / bytes_s * 1000 + comp["p50_ms"], 3),
+        }
+        filas[ruta] = fila
+        ahorro = f"{(1 - fila['ratio']) * 100:.0f}%" if fila["ratio"] is not None else "-"
+        print(f"{ruta:40} {plano['bytes']:>10} {comp['bytes']:>10} {ahorro:>7} "
+              f"{plano['p50_ms']:>8} {comp['p50_ms']:>8} {fila['red_ms']:>8} {fila['red_gzip_ms']:>8}")
+
+    reporte = {
+        "commit": commit_actual(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "parametros": vars(args),
+        "rutas": filas,
+    }
+    os.makedirs(args.salida, exist_ok=True)
+    path = os.path.join(args.salida, f"compresion-{reporte['commit']}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+    print(f"\nReporte guardado en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Escenarios de carga para la API.
+
+Cada escenario es una función que recibe el cliente HTTP del hilo, el
+contexto cargado desde la base y un random.Random, y ejecuta una
+"operación" (una o más llamadas). Las latencias se registran por
+endpoint en el cliente.
+"""
+import random
+from typing import Callable, Dict, List
+
+from db import connect
+from bench.cliente import ClienteHTTP
+
+
+class Contexto:
+    """Ids válidos tomados de la base al inicio de la corrida."""
+
+    def __init__(self, clientes: List[int], ejemplares: List[int], libros: List[int], palabras: List[str]):
+        self.clientes = clientes
+        self.ejemplares = ejemplares
+        self.libros = libros
+        self.palabras = palabras
+
+    @classmethod
+    def cargar(cls, limite: int = 20_000) -> "Contexto":
+        with connect() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT u.user_id FROM public.users u
+                WHERE u.role = 'cliente'
+                  AND NOT EXISTS (SELECT 1 FROM public.sanciones s WHERE s.user_fk = u.user_id AND now() < s.hasta)
+                LIMIT %s
+                """,
+                (limite,),
+            )
+            clientes = [r[0] for r in cur.fetchall()]
+            cur.execute(
+                "SELECT id_ejemplar FROM public.ejemplares WHERE estado = 'disponible' LIMIT %s",
+                (limite,),
+            )
+            ejemplares = [r[0] for r in cur.fetchall()]
+            cur.execute("SELECT id_libro, titulo FROM public.libros LIMIT %s", (limite,))
+            rows = cur.fetchall()
+        palabras = sorted({w.lower() for _, titulo in rows for w in titulo.split() if len(w) > 3 and not w.isdigit()})
+        return cls(clientes, ejemplares, [r[0] for r in rows], palabras or ["libro"])
+
+
+def busqueda_catalogo(cli: ClienteHTTP, ctx: Contexto, rnd: random.Random):
+    """Tormenta de búsquedas: prefijos de palabras como las teclea el usuario."""
+    palabra = rnd.choice(ctx.palabras)
+    for n in range(3, min(len(palabra), 6) + 1):
+        cli.get("/api/libros", {"q": palabra[:n]}, etiqueta="GET /api/libros?q")
+
+
+def meson_prestamo_devolucion(cli: ClienteHTTP, ctx: Contexto, rnd: random.Random):
+    """Ráfaga de mesón: presta un ejemplar, emite comprobante y lo devuelve."""
+    user_id = rnd.choice(ctx.clientes)
+    id_ejemplar = rnd.choice(ctx.ejemplares)
+    status, data = cli.post(
+        "/api/prestamos",
+        {"user_id": user_id, "id_ejemplar": id_ejemplar, "tipo": rnd.choice(["Sala", "Domicilio"])},
+        etiqueta="POST /api/prestamos",
+    )
+    if status != 200 or not data.get("ok"):
+        return
+    prestamo_id = data["prestamo"]["prestamo_id"]
+    cli.get(f"/api/prestamos/{prestamo_id}/comprobante", etiqueta="GET /api/prestamos/<id>/comprobante")
+    cli.post("/api/devoluciones", {"id_ejemplar": id_ejemplar}, etiqueta="POST /api/devoluciones")
+
+
+def totem_solicitudes(cli: ClienteHTTP, ctx: Contexto, rnd: random.Random):
+    """Tótem: el usuario pide 1-3 libros y el bibliotecario refresca la cola."""
+    items = [{"id_libro": rnd.choice(ctx.libros), "cantidad": 1} for _ in range(rnd.randint(1, 3))]
+    cli.post("/api/solicitudes", {"user_id": rnd.choice(ctx.clientes), "items": items},
+             etiqueta="POST /api/solicitudes")
+    cli.get("/api/solicitudes", {"estado": "pending,ready"}, etiqueta="GET /api/solicitudes?estado")
+
+
+def reportes_admin(cli: ClienteHTTP, ctx: Contexto, rnd: random.Random):
+    """Listados de administración que compiten con el mesón."""
+    cli.get("/api/prestamos", {"tipo": "Sala,Domicilio", "solo_activos": "1"}, etiqueta="GET /api/prestamos")
+    cli.get("/api/users", {"q": rnd.choice(["ana", "soto", "gonz", "1000"])}, etiqueta="GET /api/users?q")
+    cli.get("/api/sanciones", etiqueta="GET /api/sanciones")
+
+
+ESCENARIOS: Dict[str, Callable] = {
+    "catalogo": busqueda_catalogo,
+    "meson": meson_prestamo_devolucion,
+    "totem": totem_solicitudes,
+    "reportes": reportes_admin,
+}
@@ -0,0 +1,167 @@
+"""Ejecuta escenarios de carga contra la API y genera un reporte.
+
+Uso (desde backend/, con la API corriendo en otra terminal):
+    python -m bench.run --url http://127.0.0.1:5000 --escenarios catalogo,meson,totem --duracion 30 --concurrencia 8
+    python -m bench.run --escenarios vencidos        # job de vencidos en proceso (correo en memoria)
+
+El reporte se guarda en bench/resultados/<commit>-<fecha>.json y puede
+compararse con otro usando bench.compare.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List
+
+from bench.cliente import ClienteHTTP
+from bench.escenarios import ESCENARIOS, Contexto
+
+RESULTADOS_DIR = os.path.join(os.path.dirname(__file__), "resultados")
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil por rango más cercano (valores ordenados)."""
+    if not valores:
+        return 0.0
+    k = max(0, min(len(valores) - 1, math.ceil(p / 100.0 * len(valores)) - 1))
+    return valores[k]
+
+
+def resumir(latencias: Dict[str, List[float]], estados: Dict[str, Dict[int, int]], duracion: float) -> Dict[str, dict]:
+    resumen = {}
+    for etiqueta, vals in sorted(latencias.items()):
+        vals = sorted(vals)
+        resumen[etiqueta] = {
+            "n": len(vals),
+            "rps": round(len(vals) / duracion, 2) if duracion else 0.0,
+            "p50_ms": round(percentil(vals, 50) * 1000, 2),
+            "p95_ms": round(percentil(vals, 95) * 1000, 2),
+            "p99_ms": round(percentil(vals, 99) * 1000, 2),
+            "max_ms": round(vals[-1] * 1000, 2),
+            "estados": {str(k): v for k, v in sorted(estados.get(etiqueta, {}).items())},
+        }
+    return resumen
+
+
+def correr_escenario(nombre: str, url: str, ctx: Contexto, duracion: float, concurrencia: int, semilla: int) -> dict:
+    fn = ESCENARIOS[nombre]
+    fin = time.perf_counter() + duracion
+    latencias: Dict[str, List[float]] = defaultdict(list)
+    estados: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    bytes_total = [0]
+    lock = threading.Lock()
+
+    def worker(i: int):
+        rnd = random.Random(semilla * 1000 + i)
+        cli = ClienteHTTP(url)
+        try:
+            while time.perf_counter() < fin:
+                fn(cli, ctx, rnd)
+        finally:
+            cli.close()
+        with lock:
+            for k, v in cli.latencias.items():
+                latencias[k].extend(v)
+            for k, sts in cli.estados.items():
+                for st, n in sts.items():
+                    estados[k][st] += n
+            bytes_total[0] += cli.bytes_recibidos
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(worker, range(concurrencia)))
+    real = time.perf_counter() - t0
+
+    return {
+        "duracion_s": round(real, 2),
+        "concurrencia": concurrencia,
+        "bytes_recibidos": bytes_total[0],
+        "endpoints": resumir(latencias, estados, real),
+    }
+
+
+def correr_vencidos(repeticiones: int) -> dict:
+    """Mide send_overdue_notifications en proceso, con backend de correo en memoria."""
+    from app import create_app, send_overdue_notifications
+
+    app = create_app()
+    app.config["MAIL_BACKEND"] = "locmem"  # get_mail() inicializa el correo en el primer envío
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        with app.app_context():
+            send_overdue_notifications()
+        tiempos.append(time.perf_counter() - t0)
+    total = sum(tiempos)
+    return {
+        "duracion_s": round(total, 2),
+        "concurrencia": 1,
+        "endpoints": resumir({"job send_overdue_notifications": tiempos}, {}, total),
+    }
+
+
+def commit_actual() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def imprimir(reporte: dict):
+    print(f"commit {reporte['commit']}  {reporte['fecha']}")
+    for nombre, res in reporte["escenarios"].items():
+        print(f"\n== {nombre} ({res['duracion_s']}s, concurrencia {res['concurrencia']})")
+        print(f"{'endpoint':45} {'n':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}  estados")
+        for etiqueta, r in res["endpoints"].items():
+            print(f"{etiqueta:45} {r['n']:>7} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8}  {r['estados']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la API de Sisbib")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{os.getenv('PORT', '5000')}")
+    parser.add_argument("--escenarios", default="catalogo,meson,totem,reportes,vencidos",
+                        help=f"Separados por coma: {', '.join(ESCENARIOS)}, vencidos")
+    parser.add_argument("--duracion", type=float, default=30.0, help="Segundos por escenario")
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--repeticiones-vencidos", type=int, default=3)
+    parser.add_argument("--salida", default=RESULTADOS_DIR)
+    args = parser.parse_args()
+
+    nombres = [n.strip() for n in args.escenarios.split(",") if n.strip()]
+    ctx = Contexto.cargar() if any(n in ESCENARIOS for n in nombres) else None
+
+    reporte = {
+        "commit": commit_actual(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "parametros": vars(args),
+        "escenarios": {},
+    }
+    for nombre in nombres:
+        if nombre == "vencidos":
+            reporte["escenarios"][nombre] = correr_vencidos(args.repeticiones_vencidos)
+        elif nombre in ESCENARIOS:
+            reporte["escenarios"][nombre] = correr_escenario(
+                nombre, args.url, ctx, args.duracion, args.concurrencia, args.semilla
+            )
+        else:
+            parser.error(f"Escenario desconocido: {nombre}")
+
+    imprimir(reporte)
+    os.makedirs(args.salida, exist_ok=True)
+    path = os.path.join(args.salida, f"{reporte['commit']}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+    print(f"\nReporte guardado en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Generador de datos de prueba para los benchmarks.
+
+Carga volúmenes realistas de users, libros, ejemplares, prestamos,
+sanciones y solicitudes (con su detalle) usando COPY. Es determinista: la misma semilla produce los
+mismos datos, así los resultados entre commits son comparables.
+
+Uso (desde backend/):
+    python -m bench.seed --usuarios 20000 --libros 50000 --prestamos 500000 --truncate
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import particiones
+from db import connect
+from rut import calcular_dv as rut_dv
+
+CATEGORIAS = [
+    "Matemáticas", "Física", "Química", "Informática", "Historia", "Literatura",
+    "Filosofía", "Economía", "Derecho", "Biología", "Ingeniería", "Arte",
+]
+PALABRAS = [
+    "introducción", "teoría", "fundamentos", "análisis", "historia", "manual",
+    "cálculo", "sistemas", "redes", "datos", "programación", "estructuras",
+    "álgebra", "mecánica", "ecuaciones", "química", "orgánica", "literatura",
+    "chilena", "moderna", "economía", "política", "derecho", "civil", "arte",
+    "diseño", "biología", "celular", "probabilidad", "estadística",
+]
+NOMBRES = ["Ana", "Benjamín", "Camila", "Diego", "Elena", "Felipe", "Gabriela", "Hugo",
+           "Isidora", "Joaquín", "Catalina", "Matías", "Valentina", "Tomás", "Javiera", "Vicente"]
+APELLIDOS = ["González", "Muñoz", "Rojas", "Díaz", "Pérez", "Soto", "Contreras", "Silva",
+             "Martínez", "Sepúlveda", "Morales", "Rodríguez", "López", "Fuentes", "Castro"]
+ESTADOS_NO_PRESTADOS = ["disponible"] * 18 + ["en_reparacion", "en_reposicion"]
+# Casi todas las solicitudes del historial ya están cerradas; la cola es ~3%
+ESTADOS_SOLICITUD = ["served"] * 85 + ["canceled"] * 12 + ["pending"] * 2 + ["ready"]
+
+
+def _truncate(cur):
+    cur.execute(
+        "TRUNCATE public.solicitudes_detalle, public.solicitudes, public.sanciones, "
+        "public.prestamos, public.ejemplares, public.libros, public.users RESTART IDENTITY CASCADE"
+    )
+    # TRUNCATE no dispara el trigger de prestamos_clave (migración 0015)
+    cur.execute("SELECT to_regclass('public.prestamos_clave')")
+    if cur.fetchone()[0] is not None:
+        cur.execute("TRUNCATE public.prestamos_clave")
+
+
+def _preparar_particiones(desde: datetime, hasta: datetime) -> None:
+    """Con el esquema particionado (migración 0006) crea las particiones del
+    historial antes del COPY; si no, todo caería en la partición DEFAULT."""
+    with connect(autocommit=True) as conn:
+        if conn.execute("SELECT to_regproc('public.crear_particion')").fetchone()[0] is None:
+            return
+        creadas = particiones.crear_rango(conn, desde, hasta)
+    if creadas:
+        print(f"Particiones creadas: {len(creadas)}")
+
+
+def seed(usuarios: int, libros: int, ejemplares_por_libro: int, prestamos: int,
+         sanciones: int, semilla: int, truncate: bool, anios: int = 2, solicitudes: int = 0) -> dict:
+    rnd = random.Random(semilla)
+    now = datetime.now().replace(microsecond=0)
+    t0 = time.perf_counter()
+
+    _preparar_particiones(now - timedelta(days=anios * 366), now)
+
+    with connect() as conn, conn.cursor() as cur:
+        if truncate:
+            _truncate(cur)
+
+        # Usuarios: ~95% clientes, el resto personal
+        with cur.copy(
+            "COPY public.users (nombre, apellido1, apellido2, rut_numero, rut_dv, email, password, role, created_at) FROM STDIN"
+        ) as cp:
+            for i in range(1, usuarios + 1):
+                rut = 10_000_000 + i * 7
+                role = "cliente" if rnd.random() < 0.95 else rnd.choice(["bibliotecario", "admin"])
+                cp.write_row((
+                    rnd.choice(NOMBRES), rnd.choice(APELLIDOS), rnd.choice(APELLIDOS),
+                    rut, rut_dv(rut), f"usuario{i}@bench.sisbib.cl", "bench", role,
+                    now - timedelta(days=rnd.randint(0, 1500)),
+                ))
+
+        # Libros
+        with cur.copy(
+            "COPY public.libros (titulo, autor, categoria, editorial, edicion, anio, ubicacion, ejemplares_disponibles) FROM STDIN"
+        ) as cp:
+            for i in range(1, libros + 1):
+                titulo = " ".join(rnd.sample(PALABRAS, rnd.randint(2, 4))).capitalize() + f" {i}"
+                autor = f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)}"
+                cp.write_row((
+                    titulo, autor, rnd.choice(CATEGORIAS), "Editorial Bench", f"{rnd.randint(1, 9)}a",
+                    rnd.randint(1950, 2025), f"Estante {rnd.randint(1, 400)}", ejemplares_por_libro,
+                ))
+
+        cur.execute("SELECT min(user_id), max(user_id) FROM public.users")
+        u_min, u_max = cur.fetchone()
+        cur.execute("SELECT min(id_libro), max(id_libro) FROM public.libros")
+        l_min, l_max = cur.fetchone()
+
+        # Ejemplares: el estado final se ajusta abajo según los préstamos activos
+        total_ejemplares = libros * ejemplares_por_libro
+        with cur.copy("COPY public.ejemplares (id_libro, estado, ubicacion) FROM STDIN") as cp:
+            for id_libro in range(l_min, l_max + 1):
+                for _ in range(ejemplares_por_libro):
+                    cp.write_row((id_libro, rnd.choice(ESTADOS_NO_PRESTADOS), f"Estante {rnd.randint(1, 400)}"))
+
+        cur.execute("SELECT min(id_ejemplar) FROM public.ejemplares")
+        e_min = cur.fetchone()[0]
+
+        # Préstamos: historial de `anios` años, ~3% activos al final
+        activos = set()
+        with cur.copy(
+            "COPY public.prestamos (user_fk, ejemplar_fk, libro_fk, tipo_prestamo, fecha_reserva, "
+            "fecha_vencimiento, fecha_devolucion, vencido) FROM STDIN"
+        ) as cp:
+            for _ in range(prestamos):
+                offset = rnd.randrange(total_ejemplares)
+                ejemplar = e_min + offset
+                libro = l_min + offset // ejemplares_por_libro
+                tipo = "Sala" if rnd.random() < 0.4 else "Domicilio"
+                reserva = now - timedelta(minutes=rnd.randint(0, anios * 365 * 24 * 60))
+                venc = reserva + (timedelta(minutes=120) if tipo == "Sala" else timedelta(days=7))
+                activo = rnd.random() < 0.03 and ejemplar not in activos
+                if activo:
+                    activos.add(ejemplar)
+                    devolucion = None
+                    vencido = venc < now
+                else:
+                    devolucion = venc + timedelta(hours=rnd.randint(-100, 60))
+                    devolucion = max(devolucion, reserva + timedelta(minutes=5))
+                    vencido = devolucion.date() > venc.date()
+                cp.write_row((rnd.randint(u_min, u_max), ejemplar, libro, tipo, reserva, venc, devolucion, vencido))
+
+        if activos:
+            cur.execute(
+                "UPDATE public.ejemplares SET estado = 'prestado' WHERE id_ejemplar = ANY(%s)",
+                (list(activos),),
+            )
+
+        # Sanciones: mezcla de vigentes e históricas
+        with cur.copy("COPY public.sanciones (user_fk, motivo, desde, hasta) FROM STDIN") as cp:
+            for _ in range(sanciones):
+                desde = now - timedelta(days=rnd.randint(0, max(anios * 365 - 30, 1)))
+                dias = rnd.randint(1, 15)
+                cp.write_row((rnd.randint(u_min, u_max), f"Atraso de {dias} día(s)", desde, desde + timedelta(days=dias)))
+
+        # Solicitudes del tótem con 1-3 ítems; con la migración 0010 el COPY del
+        # detalle recalcula los totales de las cabeceras en una sola pasada
+        if solicitudes:
+            cur.execute("SELECT COALESCE(max(solicitud_id), 0) FROM public.solicitudes")
+            s_base = cur.fetchone()[0]
+            with cur.copy("COPY public.solicitudes (user_fk, estado, asignado_fk, created_at) FROM STDIN") as cp:
+                for _ in range(solicitudes):
+                    estado = rnd.choice(ESTADOS_SOLICITUD)
+                    asignado = None if estado == "pending" else rnd.randint(u_min, u_max)
+                    creada = now - timedelta(minutes=rnd.randint(0, anios * 365 * 24 * 60))
+                    cp.write_row((rnd.randint(u_min, u_max), estado, asignado, creada))
+            cur.execute("SELECT solicitud_id FROM public.solicitudes WHERE solicitud_id > %s", (s_base,))
+            nuevas = [r[0] for r in cur.fetchall()]
+            with cur.copy("COPY public.solicitudes_detalle (solicitud_fk, id_libro, cantidad) FROM STDIN") as cp:
+                for solicitud_id in nuevas:
+                    for _ in range(rnd.randint(1, 3)):
+                        cp.write_row((solicitud_id, rnd.randint(l_min, l_max), 1))
+
+        cur.execute("ANALYZE")
+        conn.commit()
+
+    return {
+        "usuarios": usuarios,
+        "libros": libros,
+        "ejemplares": total_ejemplares,
+        "prestamos": prestamos,
+        "prestamos_activos": len(activos),
+        "sanciones": sanciones,
+        "solicitudes": solicitudes,
+        "segundos": round(time.perf_counter() - t0, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga datos sintéticos para benchmarks")
+    parser.add_argument("--usuarios", type=int, default=20_000)
+    parser.add_argument("--libros", type=int, default=50_000)
+    parser.add_argument("--ejemplares-por-libro", type=int, default=3)
+    parser.add_argument("--prestamos", type=int, default=500_000)
+    parser.add_argument("--sanciones", type=int, default=5_000)
+    parser.add_argument("--solicitudes", type=int, default=100_000)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--anios", type=int, default=2, help="Años de historial de préstamos y sanciones")
+    parser.add_argument("--truncate", action="store_true", help="Vacía las tablas antes de cargar")
+    args = parser.parse_args()
+
+    resumen = seed(args.usuarios, args.libros, args.ejemplares_por_libro, args.prestamos,
+                   args.sanciones, args.semilla, args.truncate, args.anios, args.solicitudes)
+    print(resumen)
+
+
+if __name__ == "__main__":
+    main()
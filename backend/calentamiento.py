@@ -0,0 +1,159 @@
+"""Calentamiento al iniciar: el primer request no paga conexiones ni cachés frías.
+
+create_app() lanza calentar() en un hilo (CALENTAR=1, por defecto) y
+/api/health responde 503 "warming" hasta que termina, así el balanceador no
+envía tráfico a una instancia recién levantada:
+
+1. Sin esperar a la base: compila el mapa de rutas de Flask y carga los
+   relacionados (importa numpy/scipy aquí y no en el import de app.py).
+2. Abre CALENTAR_CONEXIONES conexiones del pool primario (0 = DB_POOL_MIN) y
+   en cada una prepara las sentencias de CALIENTES con sus parámetros de
+   ejemplo (prepare=True, dentro de una transacción que se descarta). Así
+   quedan cargados el plan y las cachés de catálogo del backend.
+3. Carga las cachés en memoria: políticas e índice de sugerencias.
+
+Si la base no responde, reintenta cada REINTENTO_S sin marcar listo.
+"""
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import db
+import queries
+import registro
+
+log = registro.get("calentamiento")
+
+REINTENTO_S = 5.0
+# Lecturas del camino de circulación (mesón, tótem, login)
+CALIENTES = (
+    "health_ping",
+    "login",
+    "user_role",
+    "users_by_rut",
+    "sancion_activa",
+    "ejemplar_con_libro",
+    "reserva_de_ejemplar",
+    "prestamo_clave",
+    "prestamo_clave_ejemplar",
+    "devolucion_por_prestamo",
+    "solicitud_head",
+    "idempotencia_leer",
+    "politicas_all",
+)
+
+
+class Calentamiento:
+    def __init__(self):
+        self.estado = "pendiente"  # pendiente | calentando | listo | error
+        self.error: Optional[str] = None
+        self.intentos = 0
+        self.conexiones = 0
+        self.sentencias = 0
+        self.duracion_ms: Optional[float] = None
+        self._inicio = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def listo(self) -> bool:
+        return self.estado == "listo"
+
+    def describe(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"estado": self.estado, "intentos": self.intentos, "conexiones": self.conexiones,
+                    "sentencias": self.sentencias, "duracion_ms": self.duracion_ms, "error": self.error}
+
+
+ESTADO = Calentamiento()
+
+
+def _preparar(conn) -> int:
+    """Prepara las sentencias calientes en una conexión; devuelve cuántas."""
+    preparadas = 0
+    with conn.cursor() as cur:
+        for nombre in CALIENTES:
+            q = queries.REGISTRY.get(nombre)
+            try:
+                # Directo al cursor: no suma a las estadísticas de queries.py
+                cur.execute(q.sql, q.example or None, prepare=True)
+                preparadas += 1
+            except Exception as e:
+                # Tabla de una migración pendiente, p. ej.
+                log.warning("No se pudo preparar %s: %s", nombre, e)
+            finally:
+                conn.rollback()
+    return preparadas
+
+
+def _pool(n: int) -> Dict[str, int]:
+    pool = db.get_pool()
+    cfg = db.get_db_config()
+    n = min(n or cfg.pool_min, cfg.pool_max)
+    pool.wait(timeout=cfg.pool_timeout)
+    # Se toman las n a la vez para que cada una sea una conexión distinta
+    conns: List[Any] = []
+    try:
+        for _ in range(n):
+            conns.append(pool.getconn())
+        sentencias = sum(_preparar(c) for c in conns)
+    finally:
+        for c in conns:
+            pool.putconn(c)
+    return {"conexiones": len(conns), "sentencias": sentencias}
+
+
+def _modulos() -> None:
+    """Lo que no depende de la base: una vez, aunque la base aún no responda."""
+    try:
+        import recomendaciones
+
+        recomendaciones.RELACIONADOS.cargar()
+    except Exception as e:
+        log.warning("Recomendaciones no disponibles: %s", e)
+
+
+def _caches() -> None:
+    from politicas import POLICIES
+    from sugerencias import SUGGEST
+
+    POLICIES.rows()
+    SUGGEST.ensure_ready()
+
+
+def calentar(app, conexiones: int = 0) -> None:
+    """Bloquea hasta completar el calentamiento (reintenta si falla la base)."""
+    with ESTADO._lock:
+        ESTADO.estado = "calentando"
+    app.url_map.bind("localhost").match("/api/health")
+    _modulos()
+    while True:
+        with ESTADO._lock:
+            ESTADO.intentos += 1
+        try:
+            with app.app_context():
+                pool = _pool(conexiones)
+                _caches()
+        except Exception as e:
+            with ESTADO._lock:
+                ESTADO.estado, ESTADO.error = "error", str(e)
+            log.warning("Calentamiento falló (intento %d): %s", ESTADO.intentos, e)
+            time.sleep(REINTENTO_S)
+            continue
+        with ESTADO._lock:
+            ESTADO.estado, ESTADO.error = "listo", None
+            ESTADO.conexiones, ESTADO.sentencias = pool["conexiones"], pool["sentencias"]
+            ESTADO.duracion_ms = round((time.monotonic() - ESTADO._inicio) * 1000, 1)
+        log.info("Calentamiento listo", extra={"datos": ESTADO.describe()})
+        return
+
+
+def iniciar(app) -> None:
+    """Calienta en segundo plano; sin CALENTAR la instancia queda lista de inmediato."""
+    from settings import get_settings
+
+    s = get_settings()
+    if not s.warmup:
+        ESTADO.estado = "listo"
+        return
+    threading.Thread(target=calentar, args=(app, s.warmup_connections),
+                     name="sisbib-calentamiento", daemon=True).start()
@@ -0,0 +1,96 @@
+"""Hash de contraseñas con PBKDF2-SHA256 (solo biblioteca estándar).
+
+En users.password se guarda "pbkdf2_sha256$<iteraciones>$<sal>$<hash>"
+(sal y hash en base64). Las filas anteriores tienen la contraseña en texto
+plano: verificar() las acepta y el login las reemplaza por el hash en el
+primer ingreso correcto (necesita_rehash). Lo mismo si cambia
+PASSWORD_ITERACIONES.
+
+hashear_lote() reparte el hash de muchas contraseñas entre procesos
+(matrícula masiva): cada hash toma del orden de 0,1-0,5 s de CPU.
+"""
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+ALGORITMO = "pbkdf2_sha256"
+
+
+def _iteraciones() -> int:
+    from settings import get_settings
+
+    return get_settings().password_iterations
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _de_b64(texto: str) -> bytes:
+    return base64.b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def hashear(password: str, iteraciones: Optional[int] = None) -> str:
+    iteraciones = iteraciones or _iteraciones()
+    sal = os.urandom(16)
+    dk = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), sal, iteraciones)
+    return f"{ALGORITMO}${iteraciones}${_b64(sal)}${_b64(dk)}"
+
+
+def es_hash(guardado: Optional[str]) -> bool:
+    return bool(guardado) and guardado.startswith(ALGORITMO + "$")
+
+
+def verificar(password: Optional[str], guardado: Optional[str]) -> bool:
+    if password is None or not guardado:
+        return False
+    if not es_hash(guardado):
+        # Texto plano (filas anteriores al hash)
+        return hmac.compare_digest(password.encode("utf-8"), guardado.encode("utf-8"))
+    try:
+        _, iteraciones, sal, esperado = guardado.split("$")
+        dk = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), _de_b64(sal), int(iteraciones))
+    except ValueError:
+        return False
+    return hmac.compare_digest(dk, _de_b64(esperado))
+
+
+def necesita_rehash(guardado: str) -> bool:
+    if not es_hash(guardado):
+        return True
+    try:
+        return int(guardado.split("$")[1]) < _iteraciones()
+    except (IndexError, ValueError):
+        return True
+
+
+def _hashear_con(args) -> str:
+    password, iteraciones = args
+    return hashear(password, iteraciones)
+
+
+def hashear_lote(passwords: Sequence[str], procesos: int = 0,
+                 avance: Optional[Callable[[int], None]] = None) -> List[str]:
+    """Hashes en el mismo orden. procesos=0 usa todos los núcleos; 1, el proceso actual."""
+    iteraciones = _iteraciones()
+    procesos = procesos or os.cpu_count() or 1
+    args = [(p, iteraciones) for p in passwords]
+    if procesos <= 1 or len(args) < 2:
+        salida = []
+        for a in args:
+            salida.append(_hashear_con(a))
+            if avance:
+                avance(1)
+        return salida
+    salida = []
+    # spawn: no se heredan hilos ni conexiones del proceso de la API
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for h in pool.map(_hashear_con, args, chunksize=max(1, min(64, len(args) // (procesos * 4)))):
+            salida.append(h)
+            if avance:
+                avance(1)
+    return salida
@@ -0,0 +1,144 @@
+"""Compresión de respuestas y precompresión del frontend.
+
+- init_compresion(app): las respuestas JSON/texto de al menos
+  COMPRESS_MIN_BYTES se comprimen al vuelo (brotli si el cliente lo acepta y
+  el módulo está instalado, si no gzip). No se tocan las respuestas en
+  streaming (NDJSON de inventario), los archivos (send_file) ni las que ya
+  traen Content-Encoding.
+- comprimir_directorio(): genera <archivo>.gz y <archivo>.br junto a cada
+  asset del build (frontend/dist), para que estaticos.py los sirva sin
+  comprimir en cada request.
+
+Uso (desde backend/, después de "npm run build"):
+    python compresion.py ../frontend/dist
+"""
+import gzip
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Sequence
+
+try:  # opcional: pip install brotli
+    import brotli
+except ImportError:  # pragma: no cover - depende del entorno
+    brotli = None
+
+import registro
+
+log = registro.get("compresion")
+
+COMPRIMIBLES = ("application/json", "application/javascript", "image/svg+xml")
+EXTENSIONES = (".html", ".js", ".css", ".json", ".svg", ".txt", ".map")
+
+
+def codificaciones_aceptadas(accept_encoding: Optional[str]) -> List[str]:
+    """Codificaciones de Accept-Encoding con q > 0, en orden de preferencia del servidor."""
+    aceptadas = set()
+    for parte in (accept_encoding or "").split(","):
+        nombre, _, params = parte.strip().partition(";")
+        nombre = nombre.strip().lower()
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if nombre and q > 0:
+            aceptadas.add(nombre)
+    orden = (["br"] if brotli is not None else []) + ["gzip"]
+    if "*" in aceptadas:
+        return orden
+    return [c for c in orden if c in aceptadas]
+
+
+def comprimir(data: bytes, codificacion: str, nivel: int) -> bytes:
+    if codificacion == "br":
+        # Calidad de brotli 0-11; al vuelo conviene una intermedia
+        return brotli.compress(data, quality=min(nivel, 11))
+    return gzip.compress(data, compresslevel=nivel, mtime=0)
+
+
+def _comprimible(mimetype: Optional[str]) -> bool:
+    return bool(mimetype) and (mimetype.startswith("text/") or mimetype in COMPRIMIBLES)
+
+
+def init_compresion(app) -> None:
+    from flask import request
+
+    from settings import get_settings
+
+    @app.after_request
+    def _comprimir_respuesta(response):
+        minimo = get_settings().compress_min_bytes
+        if (
+            minimo <= 0
+            or response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or "Content-Encoding" in response.headers
+            or not _comprimible(response.mimetype)
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        data = response.get_data()
+        if len(data) < minimo:
+            return response
+        codificaciones = codificaciones_aceptadas(request.headers.get("Accept-Encoding"))
+        if not codificaciones:
+            return response
+        nivel = get_settings().compress_level
+        t0 = time.perf_counter()
+        comprimido = comprimir(data, codificaciones[0], nivel)
+        if len(comprimido) >= len(data):
+            return response
+        response.set_data(comprimido)
+        response.headers["Content-Encoding"] = codificaciones[0]
+        log.debug("respuesta comprimida", extra={"datos": {
+            "codificacion": codificaciones[0], "bytes": len(data), "bytes_comprimidos": len(comprimido),
+            "comprimir_ms": round((time.perf_counter() - t0) * 1000, 3),
+        }})
+        return response
+
+
+def comprimir_directorio(directorio: str, extensiones: Sequence[str] = EXTENSIONES) -> Dict[str, int]:
+    """Escribe .gz (y .br si hay brotli) junto a cada archivo comprimible. Devuelve conteos."""
+    conteo = {"archivos": 0, "bytes": 0, "gzip": 0, "br": 0}
+    for raiz, _, archivos in os.walk(directorio):
+        for nombre in archivos:
+            if not nombre.endswith(tuple(extensiones)):
+                continue
+            ruta = os.path.join(raiz, nombre)
+            with open(ruta, "rb") as f:
+                data = f.read()
+            conteo["archivos"] += 1
+            conteo["bytes"] += len(data)
+            variantes = [("gzip", ".gz", lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variantes.append(("br", ".br", lambda d: brotli.compress(d, quality=11)))
+            for clave, sufijo, fn in variantes:
+                comprimido = fn(data)
+                if len(comprimido) >= len(data):
+                    continue
+                tmp = ruta + sufijo + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(comprimido)
+                os.replace(tmp, ruta + sufijo)
+                conteo[clave] += len(comprimido)
+    return conteo
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    directorio = argv[0] if argv else os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "dist")
+    if not os.path.isdir(directorio):
+        print(f"No existe {directorio}: ejecute antes 'npm run build'")
+        return 1
+    conteo = comprimir_directorio(directorio)
+    print(f"{conteo['archivos']} archivo(s), {conteo['bytes']} bytes -> gzip {conteo['gzip']} bytes"
+          + (f", br {conteo['br']} bytes" if brotli is not None else " (brotli no instalado)"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
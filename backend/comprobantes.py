@@ -0,0 +1,263 @@
+"""Comprobantes de préstamo en HTML y PDF.
+
+- Los datos salen de la consulta "comprobante" / "comprobante_lote" y se
+  normalizan a texto; su hash (sha256) es el ETag y parte de la clave de
+  caché. Un comprobante emitido no cambia, así que lo ya renderizado se
+  reutiliza mientras el hash sea el mismo (LRU de RECEIPT_CACHE_ENTRIES).
+- HTML: plantillas Jinja en templates/ (comprobante.html por préstamo,
+  comprobantes.html arma el documento).
+- PDF: generador mínimo propio (Helvetica, una página de 80 mm por
+  comprobante), sin dependencias.
+- Lotes: las partes que faltan en caché se renderizan en un ProcessPool de
+  RECEIPT_WORKERS procesos, así el CPU del render no compite por el GIL con
+  los hilos que atienden requests. Con RECEIPT_WORKERS=0 se renderiza en el
+  mismo proceso.
+"""
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import queries
+import registro
+
+log = registro.get("comprobantes")
+
+FORMATOS = ("html", "pdf")
+MAX_LOTE = 500
+_TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+queries.register("comprobante_lote", """
+    SELECT p.prestamo_id, p.tipo_prestamo, p.fecha_reserva, p.fecha_vencimiento, p.ejemplar_fk,
+           u.user_id, u.nombre, u.apellido1, u.apellido2, u.email, u.rut_numero, u.rut_dv,
+           l.id_libro, l.titulo, l.autor
+    FROM public.prestamos p
+    JOIN public.users u ON u.user_id = p.user_fk
+    JOIN public.libros l ON l.id_libro = p.libro_fk
+    WHERE p.prestamo_id = ANY(%s) AND p.fecha_reserva = ANY(%s)
+""", ([1], [datetime(2024, 1, 15)]))
+
+
+def _fecha(valor) -> str:
+    if isinstance(valor, datetime):
+        return valor.strftime("%d-%m-%Y %H:%M")
+    return valor.strftime("%d-%m-%Y") if valor else ""
+
+
+def datos(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Fila de la consulta -> campos de texto del comprobante (con su código)."""
+    from rut import format_rut
+
+    c = {
+        "prestamo_id": row["prestamo_id"],
+        "usuario": " ".join(filter(None, [row["nombre"], row["apellido1"], row["apellido2"]])),
+        "rut": format_rut(row["rut_numero"], row["rut_dv"]) if row.get("rut_numero") else None,
+        "email": row["email"],
+        "titulo": row["titulo"],
+        "autor": row["autor"],
+        "id_ejemplar": row.get("ejemplar_fk"),
+        "tipo": row["tipo_prestamo"],
+        "fecha_prestamo": _fecha(row["fecha_reserva"]),
+        "fecha_vencimiento": _fecha(row["fecha_vencimiento"]),
+    }
+    c["codigo"] = hashlib.sha256(json.dumps(c, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return c
+
+
+# -------------------------
+# Render (se ejecuta también en los procesos del pool)
+# -------------------------
+
+_env = None
+
+
+def _jinja():
+    global _env
+    if _env is None:
+        from jinja2 import Environment, FileSystemLoader
+
+        _env = Environment(loader=FileSystemLoader(_TEMPLATES), autoescape=True)
+    return _env
+
+
+def _fragmento_html(c: Dict[str, Any]) -> bytes:
+    return _jinja().get_template("comprobante.html").render(c=c).encode("utf-8")
+
+
+def _pdf_texto(s: str) -> str:
+    s = s.encode("cp1252", "replace").decode("latin-1")
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+# Página de 80 x 120 mm (en puntos)
+_ANCHO, _ALTO = 227, 340
+
+
+def _pagina_pdf(c: Dict[str, Any]) -> bytes:
+    """Stream de contenido de una página (operadores de texto PDF)."""
+    lineas: List[Tuple[str, int, str]] = [
+        ("F2", 11, "Sistema de Biblioteca"),
+        ("F2", 9, f"Comprobante de préstamo N° {c['prestamo_id']}"),
+        ("F1", 8, ""),
+        ("F1", 8, f"Usuario: {c['usuario']}"),
+    ]
+    if c.get("rut"):
+        lineas.append(("F1", 8, f"RUT: {c['rut']}"))
+    lineas += [
+        ("F1", 8, f"Email: {c['email'] or ''}"),
+        ("F1", 8, f"Libro: {c['titulo'][:48]}"),
+        ("F1", 8, f"Autor: {(c['autor'] or '')[:48]}"),
+        ("F1", 8, f"Ejemplar: {c['id_ejemplar']}"),
+        ("F1", 8, f"Tipo: {c['tipo']}"),
+        ("F1", 8, f"Fecha de préstamo: {c['fecha_prestamo']}"),
+        ("F2", 8, f"Devolver antes de: {c['fecha_vencimiento']}"),
+        ("F1", 8, ""),
+        ("F1", 6, f"Código {c['codigo']}"),
+    ]
+    partes = ["BT", f"14 {_ALTO - 24} Td"]
+    for fuente, tam, texto in lineas:
+        partes.append(f"/{fuente} {tam} Tf ({_pdf_texto(texto)}) Tj 0 -{tam + 5} Td")
+    partes.append("ET")
+    return "\n".join(partes).encode("latin-1")
+
+
+def documento_pdf(paginas: Sequence[bytes]) -> bytes:
+    """Arma un PDF con una página por stream de contenido."""
+    objetos: List[bytes] = []
+    n_paginas = len(paginas)
+    # 1 catálogo, 2 páginas, 3-4 fuentes, luego (página, contenido) por comprobante
+    kids = " ".join(f"{5 + 2 * i} 0 R" for i in range(n_paginas))
+    objetos.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objetos.append(f"<< /Type /Pages /Kids [{kids}] /Count {n_paginas} >>".encode())
+    objetos.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    objetos.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+    for i, contenido in enumerate(paginas):
+        objetos.append((
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_ANCHO} {_ALTO}] "
+            f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {6 + 2 * i} 0 R >>"
+        ).encode())
+        objetos.append(f"<< /Length {len(contenido)} >>\nstream\n".encode() + contenido + b"\nendstream")
+
+    salida = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for num, obj in enumerate(objetos, start=1):
+        offsets.append(len(salida))
+        salida += f"{num} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(salida)
+    salida += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    salida += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    salida += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(salida)
+
+
+def documento_html(fragmentos: Sequence[bytes], titulo: str) -> bytes:
+    from markupsafe import Markup
+
+    return _jinja().get_template("comprobantes.html").render(
+        titulo=titulo, fragmentos=[Markup(f.decode("utf-8")) for f in fragmentos]
+    ).encode("utf-8")
+
+
+def _render_partes(formato: str, lote: List[Dict[str, Any]]) -> List[bytes]:
+    fn = _pagina_pdf if formato == "pdf" else _fragmento_html
+    return [fn(c) for c in lote]
+
+
+# -------------------------
+# Caché y pool
+# -------------------------
+
+class CacheLRU:
+    def __init__(self, capacidad: int):
+        self.capacidad = capacidad
+        self._datos: "OrderedDict[Tuple[int, str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def get(self, clave) -> Optional[bytes]:
+        with self._lock:
+            valor = self._datos.get(clave)
+            if valor is None:
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def put(self, clave, valor: bytes) -> None:
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+
+
+class Renderizador:
+    def __init__(self, workers: int, capacidad: int):
+        self.workers = workers
+        self.cache = CacheLRU(capacidad)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # spawn: no se heredan hilos ni conexiones del proceso de la API
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._pool
+
+    def partes(self, formato: str, comprobantes: List[Dict[str, Any]]) -> List[bytes]:
+        """Una parte por comprobante (stream de página o fragmento HTML), desde caché o renderizada."""
+        claves = [(c["prestamo_id"], formato, c["codigo"]) for c in comprobantes]
+        resultado: List[Optional[bytes]] = [self.cache.get(k) for k in claves]
+        faltan = [i for i, r in enumerate(resultado) if r is None]
+        if faltan:
+            pendientes = [comprobantes[i] for i in faltan]
+            if self.workers <= 0 or len(pendientes) == 1:
+                nuevas = _render_partes(formato, pendientes)
+            else:
+                tam = math.ceil(len(pendientes) / self.workers)
+                lotes = [pendientes[i:i + tam] for i in range(0, len(pendientes), tam)]
+                nuevas = [p for grupo in self._get_pool().map(_render_partes, [formato] * len(lotes), lotes)
+                          for p in grupo]
+            for i, parte in zip(faltan, nuevas):
+                resultado[i] = parte
+                self.cache.put(claves[i], parte)
+        return resultado  # type: ignore[return-value]
+
+    def documento(self, formato: str, comprobantes: List[Dict[str, Any]], titulo: str) -> bytes:
+        partes = self.partes(formato, comprobantes)
+        return documento_pdf(partes) if formato == "pdf" else documento_html(partes, titulo)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_RENDER: Optional[Renderizador] = None
+
+
+def renderizador() -> Renderizador:
+    global _RENDER
+    if _RENDER is None:
+        from settings import get_settings
+
+        s = get_settings()
+        _RENDER = Renderizador(s.receipt_workers, s.receipt_cache_entries)
+    return _RENDER
+
+
+def etag(comprobantes: Sequence[Dict[str, Any]], formato: str) -> str:
+    base = formato + ":" + ",".join(c["codigo"] for c in comprobantes)
+    return hashlib.sha256(base.encode()).hexdigest()[:32]
@@ -0,0 +1,163 @@
+import atexit
+import contextvars
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import ConnectionPool, PoolTimeout
+
+import registro
+import replicas
+
+log = registro.get("db")
+
+# Fijados por admision.py para el request en curso. Fuera de un request
+# (jobs, CLI) no hay statement_timeout y la espera es la del pool.
+statement_timeout_ms: contextvars.ContextVar[int] = contextvars.ContextVar("statement_timeout_ms", default=0)
+pool_wait_s: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("pool_wait_s", default=None)
+# Lista mutable por request: se agrega un elemento si getconn agotó la espera
+pool_timeouts: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("pool_timeouts", default=None)
+
+
+@dataclass
+class DBConfig:
+    host: str
+    port: int
+    dbname: str
+    user: str
+    password: str
+    pool_min: int = 1
+    pool_max: int = 10
+    pool_timeout: float = 30.0
+    # Réplicas de lectura (conninfo/URI completos)
+    replicas: List[str] = field(default_factory=list)
+    replica_timeout: float = 2.0
+    replica_max_lag_s: float = 10.0
+    replica_check_s: float = 5.0
+    replica_pin_s: float = 5.0
+
+    @property
+    def conninfo(self) -> str:
+        return make_conninfo(
+            host=self.host, port=self.port, dbname=self.dbname, user=self.user, password=self.password
+        )
+
+
+def get_db_config() -> DBConfig:
+    # Snapshot leído una vez (settings.py); no se relee el entorno por conexión
+    from settings import get_settings
+
+    return get_settings().db
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Pool de conexiones del proceso, creado en el primer uso.
+
+    Las conexiones se reutilizan entre requests, por lo que las sentencias
+    preparadas (ver queries.py) sobreviven de un request al siguiente.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                cfg = get_db_config()
+                _pool = ConnectionPool(
+                    cfg.conninfo,
+                    min_size=cfg.pool_min,
+                    max_size=cfg.pool_max,
+                    timeout=cfg.pool_timeout,
+                    name="sisbib",
+                    open=True,
+                )
+                replicas.configure(cfg)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+        if replicas.ROUTER is not None:
+            replicas.ROUTER.close()
+            replicas.ROUTER = None
+
+
+atexit.register(close_pool)
+
+
+def _aplicar_timeout(conn) -> None:
+    """SET statement_timeout solo si cambió respecto del último uso de la conexión."""
+    ms = statement_timeout_ms.get()
+    if getattr(conn, "_sisbib_timeout_ms", 0) == ms:
+        return
+    conn.execute(f"SET statement_timeout = {int(ms)}")
+    conn.commit()  # si no, un rollback posterior del request lo desharía
+    conn._sisbib_timeout_ms = ms
+
+
+def _getconn(pool: ConnectionPool, primario: bool):
+    try:
+        # Las réplicas usan su propio timeout corto (si fallan se usa el primario)
+        conn = pool.getconn(timeout=pool_wait_s.get() if primario else None)
+    except PoolTimeout:
+        marcas = pool_timeouts.get()
+        if primario and marcas is not None:
+            marcas.append(pool.name)
+        raise
+    try:
+        _aplicar_timeout(conn)
+    except Exception:
+        pool.putconn(conn)
+        raise
+    return conn
+
+
+@contextmanager
+def _pooled(pool: ConnectionPool, conn):
+    # Igual que ConnectionPool.connection(): commit/rollback al salir y devolución al pool
+    try:
+        with conn:
+            yield conn
+    finally:
+        pool.putconn(conn)
+
+
+def get_connection(read_only: Optional[bool] = None):
+    """Conexión del pool como context manager.
+
+    Al salir del bloque hace commit (o rollback si hubo excepción) y la
+    devuelve al pool, igual que el `with psycopg.connect(...)` de antes.
+
+    read_only=None deja decidir al request (ver replicas.py): los GET van a
+    una réplica sana si hay réplicas configuradas. Si la réplica no entrega
+    conexión a tiempo, se usa el primario.
+
+    La espera por una conexión y el statement_timeout dependen de la clase
+    de la ruta (admision.py).
+    """
+    primary = get_pool()
+    if read_only is None:
+        read_only = replicas.read_only_intent.get()
+    replica = replicas.ROUTER.pick() if read_only and replicas.ROUTER is not None else None
+    if replica is not None:
+        try:
+            return _pooled(replica.pool, _getconn(replica.pool, primario=False))
+        except Exception as e:
+            log.warning("Réplica %s no disponible, usando primario: %s", replica.name, e)
+            replica.mark_down(e)
+    return _pooled(primary, _getconn(primary, primario=True))
+
+
+def connect(**kwargs):
+    """Conexión directa, fuera del pool (migraciones, cargas masivas, CLI)."""
+    cfg = get_db_config()
+    return psycopg.connect(cfg.conninfo, **kwargs)
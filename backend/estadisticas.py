@@ -0,0 +1,184 @@
+"""Estadísticas de préstamos sobre tablas de resumen (migración 0005).
+
+refresh() agrega solo lo nuevo desde la última marca de agua:
+- préstamos con prestamo_id > ultimo_prestamo_id, por día de reserva;
+- devoluciones con fecha_devolucion > ultima_devolucion, por día de devolución;
+y guarda una foto de préstamos activos/vencidos del día. Las filas del último
+minuto se dejan para la siguiente pasada, así una transacción que aún no
+confirma (id o fecha menor que otra ya visible) no queda saltada.
+
+Los endpoints /api/stats/* leen solo las tablas de resumen: su costo depende
+del rango de días pedido, no del tamaño del historial.
+"""
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from psycopg.rows import dict_row
+
+import queries
+import registro
+from db import get_connection
+
+log = registro.get("stats")
+
+# Evita dos refresh simultáneos (contarían dos veces)
+_ADVISORY_LOCK_ID = 0x5354_4154  # "STAT"
+_GRACIA = timedelta(minutes=1)
+
+queries.register("stats_lock", "SELECT pg_try_advisory_xact_lock(%s) AS ok")
+queries.register("stats_watermark", """
+    SELECT ultimo_prestamo_id, ultima_devolucion
+    FROM public.stats_watermark
+    FOR UPDATE
+""")
+queries.register("stats_hasta_id", """
+    SELECT COALESCE(
+        (SELECT min(prestamo_id) - 1 FROM public.prestamos
+         WHERE prestamo_id > %(desde)s AND fecha_reserva > %(corte)s),
+        (SELECT max(prestamo_id) FROM public.prestamos),
+        %(desde)s
+    ) AS hasta_id
+""")
+queries.register("stats_add_prestamos", """
+    INSERT INTO public.stats_prestamos_diarios AS s (dia, categoria, tipo_prestamo, prestamos)
+    SELECT p.fecha_reserva::date, COALESCE(l.categoria, ''), p.tipo_prestamo, count(*)
+    FROM public.prestamos p
+    JOIN public.libros l ON l.id_libro = p.libro_fk
+    WHERE p.prestamo_id > %s AND p.prestamo_id <= %s
+    GROUP BY 1, 2, 3
+    ON CONFLICT (dia, categoria, tipo_prestamo)
+    DO UPDATE SET prestamos = s.prestamos + EXCLUDED.prestamos
+""")
+queries.register("stats_add_devoluciones", """
+    INSERT INTO public.stats_prestamos_diarios AS s
+        (dia, categoria, tipo_prestamo, devoluciones, devoluciones_tarde)
+    SELECT p.fecha_devolucion::date, COALESCE(l.categoria, ''), p.tipo_prestamo,
+           count(*),
+           count(*) FILTER (WHERE p.fecha_devolucion > p.fecha_vencimiento)
+    FROM public.prestamos p
+    JOIN public.libros l ON l.id_libro = p.libro_fk
+    WHERE p.fecha_devolucion > %s AND p.fecha_devolucion <= %s
+    GROUP BY 1, 2, 3
+    ON CONFLICT (dia, categoria, tipo_prestamo)
+    DO UPDATE SET devoluciones = s.devoluciones + EXCLUDED.devoluciones,
+                  devoluciones_tarde = s.devoluciones_tarde + EXCLUDED.devoluciones_tarde
+""")
+queries.register("stats_foto_vencidos", """
+    INSERT INTO public.stats_vencidos_diarios (dia, activos, vencidos, calculado_en)
+    SELECT %(ahora)s::date, count(*), count(*) FILTER (WHERE fecha_vencimiento < %(ahora)s), %(ahora)s
+    FROM public.prestamos
+    WHERE fecha_devolucion IS NULL
+    ON CONFLICT (dia) DO UPDATE
+    SET activos = EXCLUDED.activos, vencidos = EXCLUDED.vencidos, calculado_en = EXCLUDED.calculado_en
+""")
+queries.register("stats_set_watermark", """
+    UPDATE public.stats_watermark
+    SET ultimo_prestamo_id = %s, ultima_devolucion = %s, actualizado_en = %s
+""")
+
+queries.register("stats_diario", """
+    SELECT dia, sum(prestamos) AS prestamos, sum(devoluciones) AS devoluciones,
+           sum(devoluciones_tarde) AS devoluciones_tarde
+    FROM public.stats_prestamos_diarios
+    WHERE dia BETWEEN %s AND %s AND (%s::text IS NULL OR tipo_prestamo = %s)
+    GROUP BY dia
+    ORDER BY dia
+""", (date(2025, 1, 1), date(2025, 1, 31), None, None))
+queries.register("stats_categorias", """
+    SELECT NULLIF(categoria, '') AS categoria, sum(prestamos) AS prestamos,
+           sum(devoluciones) AS devoluciones, sum(devoluciones_tarde) AS devoluciones_tarde
+    FROM public.stats_prestamos_diarios
+    WHERE dia BETWEEN %s AND %s
+    GROUP BY categoria
+    ORDER BY prestamos DESC
+""", (date(2025, 1, 1), date(2025, 1, 31)))
+queries.register("stats_tipos", """
+    SELECT tipo_prestamo, sum(prestamos) AS prestamos, sum(devoluciones) AS devoluciones,
+           sum(devoluciones_tarde) AS devoluciones_tarde
+    FROM public.stats_prestamos_diarios
+    WHERE dia BETWEEN %s AND %s
+    GROUP BY tipo_prestamo
+    ORDER BY tipo_prestamo
+""", (date(2025, 1, 1), date(2025, 1, 31)))
+queries.register("stats_vencidos", """
+    SELECT v.dia, v.activos, v.vencidos,
+           COALESCE(d.devoluciones, 0) AS devoluciones,
+           COALESCE(d.devoluciones_tarde, 0) AS devoluciones_tarde
+    FROM public.stats_vencidos_diarios v
+    LEFT JOIN (
+        SELECT dia, sum(devoluciones) AS devoluciones, sum(devoluciones_tarde) AS devoluciones_tarde
+        FROM public.stats_prestamos_diarios
+        WHERE dia BETWEEN %s AND %s
+        GROUP BY dia
+    ) d ON d.dia = v.dia
+    WHERE v.dia BETWEEN %s AND %s
+    ORDER BY v.dia
+""", (date(2025, 1, 1), date(2025, 1, 31), date(2025, 1, 1), date(2025, 1, 31)))
+
+
+def refresh() -> Dict[str, Any]:
+    """Agrega lo nuevo desde la marca de agua. Devuelve el resumen de la pasada."""
+    ahora = datetime.now()
+    corte = ahora - _GRACIA
+    with get_connection(read_only=False) as conn, conn.cursor(row_factory=dict_row) as cur:
+        queries.execute(cur, "stats_lock", (_ADVISORY_LOCK_ID,))
+        if not cur.fetchone()["ok"]:
+            conn.rollback()
+            return {"omitido": True, "motivo": "Otro refresh en curso"}
+
+        queries.execute(cur, "stats_watermark")
+        wm = cur.fetchone()
+        desde_id, desde_dev = wm["ultimo_prestamo_id"], wm["ultima_devolucion"]
+
+        queries.execute(cur, "stats_hasta_id", {"desde": desde_id, "corte": corte})
+        hasta_id = cur.fetchone()["hasta_id"]
+        queries.execute(cur, "stats_add_prestamos", (desde_id, hasta_id))
+        filas_prestamos = cur.rowcount
+        hasta_dev = max(desde_dev, corte)
+        queries.execute(cur, "stats_add_devoluciones", (desde_dev, hasta_dev))
+        filas_devoluciones = cur.rowcount
+        queries.execute(cur, "stats_foto_vencidos", {"ahora": ahora})
+        queries.execute(cur, "stats_set_watermark", (hasta_id, hasta_dev, ahora))
+        conn.commit()
+
+    resumen = {
+        "omitido": False,
+        "prestamo_id": [desde_id, hasta_id],
+        "devolucion": [desde_dev.isoformat(), hasta_dev.isoformat()],
+        "filas_prestamos": filas_prestamos,
+        "filas_devoluciones": filas_devoluciones,
+    }
+    log.info("refresh", extra={"datos": resumen})
+    return resumen
+
+
+def _consulta(nombre: str, params) -> List[Dict[str, Any]]:
+    with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        queries.execute(cur, nombre, params)
+        rows = cur.fetchall()
+    for r in rows:
+        if "dia" in r:
+            r["dia"] = r["dia"].isoformat()
+    return rows
+
+
+def diario(desde: date, hasta: date, tipo: Optional[str] = None) -> List[Dict[str, Any]]:
+    return _consulta("stats_diario", (desde, hasta, tipo, tipo))
+
+
+def por_categoria(desde: date, hasta: date) -> List[Dict[str, Any]]:
+    return _consulta("stats_categorias", (desde, hasta))
+
+
+def por_tipo(desde: date, hasta: date) -> List[Dict[str, Any]]:
+    return _consulta("stats_tipos", (desde, hasta))
+
+
+def vencidos(desde: date, hasta: date) -> List[Dict[str, Any]]:
+    rows = _consulta("stats_vencidos", (desde, hasta, desde, hasta))
+    for r in rows:
+        r["tasa_vencidos"] = round(r["vencidos"] / r["activos"], 4) if r["activos"] else 0.0
+        r["tasa_devolucion_tarde"] = (
+            round(r["devoluciones_tarde"] / r["devoluciones"], 4) if r["devoluciones"] else 0.0
+        )
+    return rows
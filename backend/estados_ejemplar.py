@@ -0,0 +1,137 @@
+"""Motor de transiciones de estado de ejemplares.
+
+Todo cambio de ejemplares.estado pasa por transicionar(): valida la
+transición contra TRANSICIONES, actualiza el estado, agrega una fila a
+ejemplares_eventos por ejemplar y ajusta libros.ejemplares_disponibles. Todo
+en una sola sentencia (CTE), sirva para 1 o para 5.000 ejemplares.
+
+Los ejemplares cuyo estado actual no permite la transición no se tocan y se
+informan como rechazados; con estricto=True se lanza TransicionInvalida y el
+llamador debe hacer rollback.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from psycopg.rows import dict_row
+
+import queries
+
+ESTADOS = ("disponible", "prestado", "en_reposicion", "en_reparacion", "reservado")
+
+TRANSICIONES: Dict[str, Set[str]] = {
+    "disponible": {"prestado", "reservado", "en_reparacion", "en_reposicion"},
+    "prestado": {"disponible", "en_reposicion", "en_reparacion", "reservado"},   # devolución
+    "en_reposicion": {"disponible", "en_reparacion", "reservado"},
+    "en_reparacion": {"disponible", "en_reposicion", "reservado"},
+    "reservado": {"disponible", "prestado"},
+}
+
+# Máximo de ejemplares por llamada masiva
+MAX_LOTE = 5000
+
+
+class TransicionInvalida(Exception):
+    def __init__(self, nuevo: str, rechazados: List[Dict[str, Any]]):
+        detalle = ", ".join(f"{r['id_ejemplar']} ({r['estado'] or 'no existe'})" for r in rechazados[:10])
+        super().__init__(f"Transición a '{nuevo}' no permitida para: {detalle}")
+        self.nuevo = nuevo
+        self.rechazados = rechazados
+
+
+def origenes(nuevo: str) -> List[str]:
+    """Estados desde los que se puede pasar a `nuevo`."""
+    return [desde for desde, destinos in TRANSICIONES.items() if nuevo in destinos]
+
+
+queries.register("ejemplar_transicion", """
+    WITH objetivo AS (
+        SELECT e.id_ejemplar, e.id_libro, e.estado AS anterior
+        FROM public.ejemplares e
+        WHERE e.id_ejemplar = ANY(%(ids)s::int[]) AND e.estado = ANY(%(desde)s::text[])
+        FOR UPDATE
+    ),
+    cambiados AS (
+        UPDATE public.ejemplares e
+        SET estado = %(nuevo)s::text
+        FROM objetivo o
+        WHERE e.id_ejemplar = o.id_ejemplar
+        RETURNING e.id_ejemplar, e.id_libro, o.anterior
+    ),
+    eventos AS (
+        INSERT INTO public.ejemplares_eventos
+            (id_ejemplar, estado_anterior, estado_nuevo, motivo, actor_fk, prestamo_fk)
+        SELECT id_ejemplar, anterior, %(nuevo)s::text, %(motivo)s::text, %(actor)s::int, %(prestamo)s::int
+        FROM cambiados
+    ),
+    contadores AS (
+        UPDATE public.libros l
+        SET ejemplares_disponibles = GREATEST(l.ejemplares_disponibles + d.delta, 0)
+        FROM (
+            SELECT id_libro,
+                   sum(CASE WHEN %(nuevo)s::text = 'disponible' THEN 1
+                            WHEN anterior = 'disponible' THEN -1
+                            ELSE 0 END) AS delta
+            FROM cambiados
+            GROUP BY id_libro
+        ) d
+        WHERE l.id_libro = d.id_libro AND d.delta <> 0
+    )
+    SELECT id_ejemplar, id_libro, anterior FROM cambiados
+""")
+queries.register("ejemplar_estados", """
+    SELECT i AS id_ejemplar, e.estado
+    FROM unnest(%s::int[]) AS i
+    LEFT JOIN public.ejemplares e ON e.id_ejemplar = i
+""")
+queries.register("ejemplar_eventos", """
+    SELECT evento_id, id_ejemplar, estado_anterior, estado_nuevo, motivo, actor_fk, prestamo_fk, creado_en
+    FROM public.ejemplares_eventos
+    WHERE id_ejemplar = %s
+    ORDER BY evento_id DESC
+    LIMIT %s
+""", (1, 50))
+
+
+def transicionar(
+    conn,
+    ids: Sequence[int],
+    nuevo: str,
+    motivo: Optional[str] = None,
+    actor: Optional[int] = None,
+    prestamo: Optional[int] = None,
+    estricto: bool = False,
+) -> Dict[str, Any]:
+    """Aplica la transición a `nuevo` dentro de la transacción de conn (no hace commit).
+
+    Devuelve {"cambiados": [...], "rechazados": [...]}.
+    """
+    if nuevo not in TRANSICIONES:
+        raise ValueError(f"Estado inválido: {nuevo}")
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    if len(ids) > MAX_LOTE:
+        raise ValueError(f"Máximo {MAX_LOTE} ejemplares por transición")
+    if not ids:
+        return {"cambiados": [], "rechazados": []}
+
+    with conn.cursor(row_factory=dict_row) as cur:
+        queries.execute(cur, "ejemplar_transicion", {
+            "ids": ids, "desde": origenes(nuevo), "nuevo": nuevo,
+            "motivo": motivo, "actor": actor, "prestamo": prestamo,
+        })
+        cambiados = cur.fetchall()
+
+        rechazados: List[Dict[str, Any]] = []
+        if len(cambiados) < len(ids):
+            hechos = {c["id_ejemplar"] for c in cambiados}
+            pendientes = [i for i in ids if i not in hechos]
+            queries.execute(cur, "ejemplar_estados", (pendientes,))
+            rechazados = cur.fetchall()
+
+    if rechazados and estricto:
+        raise TransicionInvalida(nuevo, rechazados)
+    return {"cambiados": cambiados, "rechazados": rechazados}
+
+
+def eventos(conn, id_ejemplar: int, limit: int = 50) -> List[Dict[str, Any]]:
+    with conn.cursor(row_factory=dict_row) as cur:
+        queries.execute(cur, "ejemplar_eventos", (id_ejemplar, limit))
+        return cur.fetchall()
@@ -0,0 +1,63 @@
+"""Sirve el build del frontend (frontend/dist) desde la API (SERVE_FRONTEND=true).
+
+- Si existen <archivo>.br / <archivo>.gz (python compresion.py) se entrega la
+  variante que acepte el cliente, con Content-Encoding y Vary.
+- assets/ lleva hash en el nombre (index-C2B4hqE4.js): caché inmutable de un
+  año. index.html y el resto se revalidan (no-cache + ETag).
+- Rutas del SPA (/cliente, /admin/usuarios, ...) sin archivo: index.html.
+  Las rutas /api/* desconocidas siguen respondiendo 404 en JSON.
+"""
+import mimetypes
+import os
+
+from flask import abort, jsonify, request, send_file
+from werkzeug.security import safe_join
+
+from compresion import codificaciones_aceptadas
+
+INMUTABLE = "public, max-age=31536000, immutable"
+REVALIDAR = "no-cache"
+_SUFIJOS = {"br": ".br", "gzip": ".gz"}
+
+
+def _enviar(directorio: str, ruta_rel: str):
+    ruta = safe_join(directorio, ruta_rel)
+    if ruta is None or not os.path.isfile(ruta):
+        return None
+    mimetype = mimetypes.guess_type(ruta)[0] or "application/octet-stream"
+    archivo, codificacion = ruta, None
+    for cod in codificaciones_aceptadas(request.headers.get("Accept-Encoding")):
+        if os.path.isfile(ruta + _SUFIJOS[cod]):
+            archivo, codificacion = ruta + _SUFIJOS[cod], cod
+            break
+    resp = send_file(archivo, mimetype=mimetype, conditional=True, etag=True)
+    if codificacion:
+        resp.headers["Content-Encoding"] = codificacion
+    resp.vary.add("Accept-Encoding")
+    resp.headers["Cache-Control"] = INMUTABLE if ruta_rel.startswith("assets/") else REVALIDAR
+    return resp
+
+
+def init_frontend(app, directorio: str) -> bool:
+    """Registra / y la ruta comodín del SPA. False si el build no existe."""
+    directorio = os.path.abspath(directorio)
+    if not os.path.isfile(os.path.join(directorio, "index.html")):
+        return False
+
+    @app.get("/")
+    def frontend_index():
+        return _enviar(directorio, "index.html")
+
+    @app.get("/<path:ruta>")
+    def frontend_archivo(ruta: str):
+        if ruta.startswith("api/"):
+            return jsonify({"ok": False, "error": "Recurso no encontrado"}), 404
+        resp = _enviar(directorio, ruta)
+        if resp is not None:
+            return resp
+        # Ruta del SPA (sin extensión): la resuelve react-router en el cliente
+        if "." in ruta.rsplit("/", 1)[-1]:
+            abort(404)
+        return _enviar(directorio, "index.html")
+
+    return True
@@ -0,0 +1,242 @@
+"""Idempotency-Key para los POST de circulación.
+
+Los clientes de mesón y tótem reintentan cuando la red falla. Con el header
+Idempotency-Key (1-255 caracteres, p. ej. un UUID por operación) el
+reintento no vuelve a ejecutar la transacción:
+
+- El primer request toma la clave (INSERT ... ON CONFLICT DO NOTHING en
+  public.idempotencia), ejecuta el handler y guarda status y cuerpo de la
+  respuesta hasta IDEMPOTENCIA_HORAS. Los handlers que confirman una
+  transacción la guardan con confirmar(conn, resp) antes de su commit: el
+  efecto y la respuesta guardada quedan juntos o no queda ninguno. Las
+  respuestas sin commit (validaciones) se guardan después. Las 5xx no se
+  guardan: la clave se libera y el cliente puede reintentar.
+- Un reintento con la clave ya resuelta recibe la respuesta guardada (con
+  Idempotent-Replayed: true) sin tocar préstamos, ejemplares ni solicitudes.
+- Duplicados simultáneos: en el mismo proceso esperan al primero con un
+  Event; entre procesos consultan la fila hasta IDEMPOTENCIA_ESPERA_MS. Si
+  el primero no termina a tiempo: 409 con Retry-After.
+- La misma clave con otro cuerpo u otro usuario: 422.
+- Una ejecución que quedó a medias (proceso caído) se puede retomar pasado
+  BLOQUEO sin respuesta guardada.
+
+Las claves vencidas se borran con purgar() (scheduler, cada hora).
+"""
+import hashlib
+import threading
+import time
+import uuid
+from datetime import timedelta
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+from flask import Response, g, jsonify, make_response, request
+
+import queries
+import registro
+from db import get_connection
+
+log = registro.get("idempotencia")
+
+HEADER = "Idempotency-Key"
+MAX_CLAVE = 255
+BLOQUEO = timedelta(minutes=2)  # una ejecución sin respuesta pasado esto se da por perdida
+
+queries.register("idempotencia_tomar", """
+    INSERT INTO public.idempotencia AS i (ruta, clave, huella, dueno, expira_en)
+    VALUES (%(ruta)s, %(clave)s, %(huella)s, %(dueno)s, NOW() + %(ttl)s)
+    ON CONFLICT (ruta, clave) DO UPDATE
+        SET huella = EXCLUDED.huella, dueno = EXCLUDED.dueno, status = NULL, content_type = NULL,
+            cuerpo = NULL, creado_en = NOW(), expira_en = EXCLUDED.expira_en
+        WHERE i.expira_en < NOW() OR (i.status IS NULL AND i.creado_en < NOW() - %(bloqueo)s)
+    RETURNING dueno
+""", {"ruta": "crear_prestamo", "clave": "k", "huella": b"", "dueno": "00000000-0000-0000-0000-000000000000",
+      "ttl": timedelta(hours=24), "bloqueo": BLOQUEO})
+queries.register("idempotencia_leer", """
+    SELECT huella, status, content_type, cuerpo
+    FROM public.idempotencia
+    WHERE ruta = %s AND clave = %s
+""", ("crear_prestamo", "k"))
+queries.register("idempotencia_guardar", """
+    UPDATE public.idempotencia
+    SET status = %s, content_type = %s, cuerpo = %s
+    WHERE ruta = %s AND clave = %s AND dueno = %s
+""", (200, "application/json", b"", "crear_prestamo", "k", "00000000-0000-0000-0000-000000000000"))
+queries.register("idempotencia_soltar", """
+    DELETE FROM public.idempotencia
+    WHERE ruta = %s AND clave = %s AND dueno = %s AND status IS NULL
+""", ("crear_prestamo", "k", "00000000-0000-0000-0000-000000000000"))
+queries.register("idempotencia_purgar", "DELETE FROM public.idempotencia WHERE expira_en < NOW()")
+
+
+class Coalescedor:
+    """Un Event por clave en ejecución en este proceso; contadores para /estado."""
+
+    def __init__(self):
+        self._en_curso: Dict[Tuple[str, str], threading.Event] = {}
+        self._lock = threading.Lock()
+        self.ejecutadas = 0
+        self.repetidas = 0
+        self.esperas = 0
+        self.rechazadas = 0
+
+    def registrar(self, llave: Tuple[str, str]) -> threading.Event:
+        with self._lock:
+            ev = self._en_curso[llave] = threading.Event()
+            return ev
+
+    def terminar(self, llave: Tuple[str, str], ev: threading.Event) -> None:
+        with self._lock:
+            if self._en_curso.get(llave) is ev:
+                del self._en_curso[llave]
+        ev.set()
+
+    def evento(self, llave: Tuple[str, str]) -> Optional[threading.Event]:
+        with self._lock:
+            return self._en_curso.get(llave)
+
+    def contar(self, campo: str) -> None:
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def describe(self) -> Dict[str, int]:
+        with self._lock:
+            return {"en_curso": len(self._en_curso), "ejecutadas": self.ejecutadas, "repetidas": self.repetidas,
+                    "esperas": self.esperas, "rechazadas": self.rechazadas}
+
+
+COALESCEDOR = Coalescedor()
+
+
+def _huella() -> bytes:
+    auth = getattr(g, "auth", None)
+    h = hashlib.sha256(str(auth["sub"] if auth else "").encode())
+    h.update(b"\0")
+    h.update(request.get_data())
+    return h.digest()
+
+
+def _tomar(ruta: str, clave: str, huella: bytes, dueno: uuid.UUID, ttl: timedelta) -> bool:
+    with get_connection(read_only=False) as conn, conn.cursor() as cur:
+        queries.execute(cur, "idempotencia_tomar", {"ruta": ruta, "clave": clave, "huella": huella,
+                                                     "dueno": dueno, "ttl": ttl, "bloqueo": BLOQUEO})
+        return cur.fetchone() is not None
+
+
+def _leer(ruta: str, clave: str):
+    with get_connection(read_only=False) as conn, conn.cursor() as cur:
+        queries.execute(cur, "idempotencia_leer", (ruta, clave))
+        return cur.fetchone()
+
+
+def _repetir(fila) -> Response:
+    _, status, content_type, cuerpo = fila
+    resp = Response(bytes(cuerpo), status=status, content_type=content_type)
+    resp.headers["Idempotent-Replayed"] = "true"
+    return resp
+
+
+def confirmar(conn, resp: Response) -> Response:
+    """Guarda resp en la transacción del handler (llamar antes de conn.commit()).
+
+    Sin Idempotency-Key no hace nada. Si otra ejecución tomó la clave
+    (pasado BLOQUEO) falla, para que el handler no confirme dos veces.
+    """
+    tomada = g.pop("_idempotencia", None)
+    if tomada is None:
+        return resp
+    with conn.cursor() as cur:
+        queries.execute(cur, "idempotencia_guardar",
+                        (resp.status_code, resp.content_type, resp.get_data(), *tomada))
+        if cur.rowcount != 1:
+            raise RuntimeError(f"{HEADER} tomada por otra ejecución")
+    g._idempotencia_guardada = True
+    return resp
+
+
+def _en_proceso():
+    resp = jsonify({"ok": False, "error": "Una solicitud con esta Idempotency-Key aún está en proceso"})
+    resp.status_code = 409
+    resp.headers["Retry-After"] = "1"
+    return resp
+
+
+def idempotente(fn):
+    """Decorador para handlers POST: aplica Idempotency-Key si viene en el request."""
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        clave = request.headers.get(HEADER)
+        if clave is None:
+            return fn(*args, **kwargs)
+        clave = clave.strip()
+        if not clave or len(clave) > MAX_CLAVE:
+            return jsonify({"ok": False, "error": f"{HEADER} inválida (1 a {MAX_CLAVE} caracteres)"}), 400
+
+        from settings import get_settings
+
+        s = get_settings()
+        ruta = request.endpoint
+        llave = (ruta, clave)
+        huella = _huella()
+        dueno = uuid.uuid4()
+        limite = time.monotonic() + s.idempotency_wait_ms / 1000
+        pausa = 0.02
+        while True:
+            ev = COALESCEDOR.evento(llave)
+            if ev is None:
+                if _tomar(ruta, clave, huella, dueno, timedelta(hours=s.idempotency_ttl_hours)):
+                    break
+                fila = _leer(ruta, clave)
+                if fila is not None and bytes(fila[0]) != huella:
+                    COALESCEDOR.contar("rechazadas")
+                    return jsonify({"ok": False, "error": f"{HEADER} ya usada con otra solicitud"}), 422
+                if fila is not None and fila[1] is not None:
+                    COALESCEDOR.contar("repetidas")
+                    log.info("Respuesta repetida para %s", ruta, extra={"datos": {"clave": clave}})
+                    return _repetir(fila)
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                COALESCEDOR.contar("esperas")
+                return _en_proceso()
+            # El primero está en este proceso: esperar su Event; si no, consultar la fila
+            if ev is not None:
+                ev.wait(restante)
+            else:
+                time.sleep(min(pausa, restante))
+                pausa = min(pausa * 2, 0.25)
+
+        ev = COALESCEDOR.registrar(llave)
+        guardada = False
+        g._idempotencia = (ruta, clave, dueno)
+        try:
+            resp = make_response(fn(*args, **kwargs))
+            en_handler = g.pop("_idempotencia_guardada", False)
+            # Un 5xx tras confirmar() es un commit fallido: lo guardado se deshizo con él
+            if resp.status_code < 500 and not resp.is_streamed:
+                if not en_handler:
+                    with get_connection(read_only=False) as conn, conn.cursor() as cur:
+                        queries.execute(cur, "idempotencia_guardar",
+                                        (resp.status_code, resp.content_type, resp.get_data(), ruta, clave, dueno))
+                guardada = True
+                COALESCEDOR.contar("ejecutadas")
+            return resp
+        finally:
+            g.pop("_idempotencia", None)
+            if not guardada:
+                try:
+                    with get_connection(read_only=False) as conn, conn.cursor() as cur:
+                        queries.execute(cur, "idempotencia_soltar", (ruta, clave, dueno))
+                except Exception:
+                    log.exception("No se pudo liberar la clave de idempotencia")
+            COALESCEDOR.terminar(llave, ev)
+
+    return wrapper
+
+
+def purgar() -> int:
+    with get_connection(read_only=False) as conn, conn.cursor() as cur:
+        queries.execute(cur, "idempotencia_purgar")
+        borradas = cur.rowcount
+    log.info("Claves de idempotencia vencidas borradas: %d", borradas)
+    return borradas
@@ -0,0 +1,169 @@
+"""Conciliación de inventario físico contra ejemplares y préstamos activos.
+
+Flujo:
+1. abrir(alcance)             -> sesion_id (alcance = prefijo de ubicación o toda la colección)
+2. agregar_lecturas(...)      -> los escáneres envían lotes de id_ejemplar con la ubicación
+                                 leída; se cargan con COPY en inventario_lecturas
+3. reporte(sesion_id)         -> una sola consulta (FULL JOIN alcance × lecturas) clasifica
+                                 cada ejemplar; se recorre con un cursor del servidor y se
+                                 emite fila a fila, sin armar el reporte en memoria
+4. cerrar(sesion_id)          -> guarda el resumen y borra las lecturas
+
+Clasificaciones:
+- presente        leído en la ubicación registrada
+- mal_ubicado     leído en otra ubicación (o fuera del alcance de la sesión)
+- prestado_leido  leído en estante pero con préstamo activo
+- faltante        no leído, sin préstamo activo
+- prestado        no leído y con préstamo activo (ausencia esperada)
+- desconocido     id leído que no existe en ejemplares
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+
+import queries
+from db import get_connection
+
+CLASIFICACIONES = ("presente", "mal_ubicado", "prestado_leido", "faltante", "prestado", "desconocido")
+MAX_LOTE = 50_000
+
+
+class SesionNoDisponible(Exception):
+    """La sesión no existe o ya está cerrada."""
+
+
+queries.register("inventario_abrir", """
+    INSERT INTO public.inventario_sesiones (alcance, actor_fk)
+    VALUES (%s, %s)
+    RETURNING sesion_id, alcance, estado, creada_en
+""")
+queries.register("inventario_sesion", """
+    SELECT sesion_id, alcance, estado, actor_fk, creada_en, cerrada_en, resumen,
+           (SELECT count(*) FROM public.inventario_lecturas WHERE sesion_fk = s.sesion_id) AS lecturas
+    FROM public.inventario_sesiones s
+    WHERE sesion_id = %s
+""", (1,))
+queries.register("inventario_sesion_abierta", """
+    SELECT sesion_id FROM public.inventario_sesiones
+    WHERE sesion_id = %s AND estado = 'abierta'
+    FOR SHARE
+""")
+queries.register("inventario_diff", """
+    WITH lecturas AS (
+        SELECT DISTINCT ON (id_ejemplar) id_ejemplar, ubicacion, leido_en
+        FROM public.inventario_lecturas
+        WHERE sesion_fk = %(sesion)s
+        ORDER BY id_ejemplar, leido_en DESC
+    ),
+    alcance AS (
+        SELECT id_ejemplar
+        FROM public.ejemplares
+        WHERE %(alcance)s::text IS NULL OR ubicacion LIKE %(alcance)s::text || '%%'
+    ),
+    activos AS (
+        SELECT ejemplar_fk, prestamo_id, user_fk
+        FROM public.prestamos
+        WHERE fecha_devolucion IS NULL
+    ),
+    universo AS (
+        SELECT COALESCE(a.id_ejemplar, l.id_ejemplar) AS id_ejemplar,
+               a.id_ejemplar IS NOT NULL AS en_alcance,
+               l.id_ejemplar IS NOT NULL AS leido,
+               l.ubicacion AS ubicacion_leida,
+               l.leido_en
+        FROM alcance a
+        FULL JOIN lecturas l ON l.id_ejemplar = a.id_ejemplar
+    )
+    SELECT u.id_ejemplar, e.id_libro, e.estado,
+           e.ubicacion AS ubicacion_registrada, u.ubicacion_leida, u.leido_en,
+           p.prestamo_id, p.user_fk,
+           CASE
+               WHEN e.id_ejemplar IS NULL THEN 'desconocido'
+               WHEN NOT u.leido AND p.prestamo_id IS NOT NULL THEN 'prestado'
+               WHEN NOT u.leido THEN 'faltante'
+               WHEN p.prestamo_id IS NOT NULL THEN 'prestado_leido'
+               WHEN NOT u.en_alcance OR e.ubicacion IS DISTINCT FROM u.ubicacion_leida THEN 'mal_ubicado'
+               ELSE 'presente'
+           END AS clasificacion
+    FROM universo u
+    LEFT JOIN public.ejemplares e ON e.id_ejemplar = u.id_ejemplar
+    LEFT JOIN activos p ON p.ejemplar_fk = u.id_ejemplar
+""")
+queries.register("inventario_cerrar", """
+    UPDATE public.inventario_sesiones
+    SET estado = 'cerrada', cerrada_en = NOW(), resumen = %s
+    WHERE sesion_id = %s AND estado = 'abierta'
+    RETURNING sesion_id, alcance, estado, creada_en, cerrada_en, resumen
+""")
+queries.register("inventario_borrar_lecturas", "DELETE FROM public.inventario_lecturas WHERE sesion_fk = %s")
+
+
+def abrir(alcance: Optional[str] = None, actor: Optional[int] = None) -> Dict[str, Any]:
+    alcance = (alcance or "").strip() or None
+    with get_connection(read_only=False) as conn, conn.cursor(row_factory=dict_row) as cur:
+        queries.execute(cur, "inventario_abrir", (alcance, actor))
+        row = cur.fetchone()
+        conn.commit()
+        return row
+
+
+def sesion(sesion_id: int) -> Optional[Dict[str, Any]]:
+    with get_connection(read_only=False) as conn, conn.cursor(row_factory=dict_row) as cur:
+        queries.execute(cur, "inventario_sesion", (sesion_id,))
+        return cur.fetchone()
+
+
+def agregar_lecturas(sesion_id: int, ubicacion: Optional[str], ids: Iterable[Any]) -> int:
+    """Carga un lote de lecturas con COPY. Devuelve cuántas se cargaron."""
+    with get_connection(read_only=False) as conn, conn.cursor() as cur:
+        queries.execute(cur, "inventario_sesion_abierta", (sesion_id,))
+        if cur.fetchone() is None:
+            raise SesionNoDisponible(f"Sesión {sesion_id} inexistente o cerrada")
+        n = 0
+        with cur.copy("COPY public.inventario_lecturas (sesion_fk, id_ejemplar, ubicacion) FROM STDIN") as cp:
+            for raw in ids:
+                if n >= MAX_LOTE:
+                    raise ValueError(f"Máximo {MAX_LOTE} lecturas por lote")
+                cp.write_row((sesion_id, int(raw), ubicacion))
+                n += 1
+        conn.commit()
+        return n
+
+
+def reporte(sesion_id: int, alcance: Optional[str], solo: Optional[List[str]] = None,
+            resumen: Optional[Dict[str, int]] = None) -> Iterator[Dict[str, Any]]:
+    """Recorre la clasificación con un cursor del servidor (lotes de 5.000 filas).
+
+    Si se pasa `resumen`, se van sumando los conteos por clasificación
+    (incluidas las filas filtradas por `solo`).
+    """
+    with get_connection(read_only=False) as conn:
+        with conn.cursor(name=f"inventario_{sesion_id}", row_factory=dict_row) as cur:
+            cur.itersize = 5000
+            queries.execute(cur, "inventario_diff", {"sesion": sesion_id, "alcance": alcance})
+            for row in cur:
+                if resumen is not None:
+                    resumen[row["clasificacion"]] = resumen.get(row["clasificacion"], 0) + 1
+                if solo and row["clasificacion"] not in solo:
+                    continue
+                yield row
+        conn.commit()
+
+
+def cerrar(sesion_id: int) -> Optional[Dict[str, Any]]:
+    """Calcula el resumen final, cierra la sesión y borra sus lecturas."""
+    info = sesion(sesion_id)
+    if not info or info["estado"] != "abierta":
+        raise SesionNoDisponible(f"Sesión {sesion_id} inexistente o cerrada")
+    conteos: Dict[str, int] = {c: 0 for c in CLASIFICACIONES}
+    for _ in reporte(sesion_id, info["alcance"], resumen=conteos):
+        pass
+
+    with get_connection(read_only=False) as conn, conn.cursor(row_factory=dict_row) as cur:
+        queries.execute(cur, "inventario_cerrar", (Jsonb(conteos), sesion_id))
+        row = cur.fetchone()
+        if row:
+            queries.execute(cur, "inventario_borrar_lecturas", (sesion_id,))
+        conn.commit()
+        return row
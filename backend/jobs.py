@@ -0,0 +1,146 @@
+"""Ejecución de tareas en segundo plano (p. ej. notificación de vencidos).
+
+Los endpoints encolan la tarea y devuelven un job_id de inmediato; el
+avance (enviados / fallidos / restantes) se consulta en /api/jobs/<id>.
+Solo se permite una ejecución activa por tipo de tarea y cada tipo tiene su
+propio hilo: una notificación o matrícula larga no retrasa las tareas
+periódicas (expirar reservas, refresh de estadísticas). Un job con roles
+(p. ej. la matrícula, cuyo informe trae RUT y emails) solo lo ven usuarios
+con uno de esos roles.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import registro
+
+log = registro.get("jobs")
+
+
+class JobAlreadyRunning(Exception):
+    def __init__(self, job: "Job"):
+        super().__init__(f"Ya hay una ejecución de '{job.tipo}' en curso")
+        self.job = job
+
+
+@dataclass
+class Job:
+    job_id: str
+    tipo: str
+    estado: str = "queued"  # queued | running | done | failed
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+    resultado: Optional[Dict[str, Any]] = None  # lo que devuelve fn(job), si es un dict
+    roles: Tuple[str, ...] = ()  # vacío: cualquiera puede consultarlo
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def active(self) -> bool:
+        return self.estado in ("queued", "running")
+
+    def visible_para(self, role: Optional[str]) -> bool:
+        return not self.roles or role in self.roles
+
+    def set_total(self, total: int):
+        with self._lock:
+            self.total = total
+
+    def add(self, sent: int = 0, failed: int = 0):
+        with self._lock:
+            self.sent += sent
+            self.failed += failed
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "tipo": self.tipo,
+                "estado": self.estado,
+                "created_at": self.created_at.isoformat(),
+                "started_at": self.started_at.isoformat() if self.started_at else None,
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+                "total": self.total,
+                "sent": self.sent,
+                "failed": self.failed,
+                "remaining": max(self.total - self.sent - self.failed, 0),
+                "error": self.error,
+                "resultado": self.resultado,
+            }
+
+
+class JobRunner:
+    def __init__(self, keep: int = 100):
+        # Un executor de un hilo por tipo (se crea con el primer job del tipo)
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Dict[str, Job] = {}
+        self._keep = keep
+        self._lock = threading.Lock()
+
+    def submit(self, tipo: str, fn: Callable[[Job], Any], roles: Tuple[str, ...] = ()) -> Job:
+        """Encola fn(job). Lanza JobAlreadyRunning si ya hay uno activo del mismo tipo."""
+        with self._lock:
+            current = self._active.get(tipo)
+            if current is not None and current.active:
+                raise JobAlreadyRunning(current)
+            job = Job(job_id=uuid.uuid4().hex, tipo=tipo, roles=roles)
+            self._active[tipo] = job
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self._keep:
+                old_id, old = next(iter(self._jobs.items()))
+                if old.active:
+                    break
+                self._jobs.pop(old_id)
+            executor = self._executors.get(tipo)
+            if executor is None:
+                executor = self._executors[tipo] = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f"sisbib-job-{tipo}")
+        executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]):
+        job.estado = "running"
+        job.started_at = datetime.now()
+        try:
+            with registro.contexto_job(job.job_id):
+                log.info("Job %s iniciado", job.tipo)
+                try:
+                    salida = fn(job)
+                    if isinstance(salida, dict):
+                        job.resultado = salida
+                    job.estado = "done"
+                except Exception as e:
+                    job.error = str(e)
+                    job.estado = "failed"
+                    log.exception("Job %s falló", job.tipo)
+                finally:
+                    job.finished_at = datetime.now()
+                    log.info("Job %s terminado (%s)", job.tipo, job.estado, extra={"datos": {
+                        "dur_ms": round((job.finished_at - job.started_at).total_seconds() * 1000, 3),
+                        "total": job.total, "sent": job.sent, "failed": job.failed,
+                    }})
+        finally:
+            with self._lock:
+                if self._active.get(job.tipo) is job:
+                    del self._active[job.tipo]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def recent(self, tipo: Optional[str] = None) -> List[Job]:
+        jobs = list(self._jobs.values())
+        if tipo:
+            jobs = [j for j in jobs if j.tipo == tipo]
+        return list(reversed(jobs))
+
+
+JOBS = JobRunner()
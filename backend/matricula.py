@@ -0,0 +1,326 @@
+"""Matrícula masiva de usuarios desde una nómina (inicio de semestre).
+
+- leer_nomina(): CSV con encabezado rut, nombre, apellido1, apellido2, email
+  y opcionalmente role (por defecto cliente) y password. Separador "," o ";". Las filas con RUT o email inválidos o
+  repetidos dentro de la nómina van al informe y no se cargan.
+- sincronizar(), en una transacción:
+  1. COPY de la nómina a una tabla temporal.
+  2. Diferencia contra users por RUT y email en una sola consulta: cada fila
+     queda como nuevo, cambiado, igual o conflicto (el RUT y el email
+     pertenecen a usuarios distintos, o el email es de otro RUT).
+  3. Los nuevos sin password en la nómina reciben una contraseña temporal
+     aleatoria (clave_temporal). Las contraseñas se hashean en
+     MATRICULA_PROCESOS procesos (claves.hashear_lote) y un INSERT ... SELECT
+     crea todas las cuentas. Un UPDATE ... FROM corrige nombre, apellidos, email y RUT de
+     los cambiados y los reactiva. El rol de un usuario existente no cambia.
+  4. Con desactivar=True, los clientes activos que no están en la nómina
+     quedan con activo = FALSE.
+  Con simular=True se calcula el informe sin hashear y se hace rollback.
+- Tras el commit, entregar() recibe las contraseñas temporales (email,
+  nombre, password): la API las envía por correo a cada cuenta
+  (enviar_claves) y la consola las escribe en un CSV legible solo por el
+  dueño. No quedan en el informe ni en el job.
+
+Uso (desde backend/):
+    python matricula.py nomina.csv [--desactivar] [--simular] [--credenciales archivo.csv]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import secrets
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import claves
+import queries
+import registro
+from db import connect
+from rut import RutError, parse_rut
+from settings import get_settings
+
+log = registro.get("matricula")
+
+ROLES = ("cliente", "administrativo", "bibliotecario", "admin")
+COLUMNAS = ("rut", "nombre", "apellido1", "apellido2", "email")
+MAX_DETALLE = 200  # filas con error o conflicto listadas en el informe
+
+
+class NominaError(ValueError):
+    """Archivo de nómina ilegible o sin las columnas requeridas."""
+
+
+@dataclass(frozen=True)
+class Fila:
+    fila: int
+    rut_numero: int
+    rut_dv: str
+    nombre: str
+    apellido1: Optional[str]
+    apellido2: Optional[str]
+    email: str
+    role: str
+    password: Optional[str]
+
+
+queries.register("matricula_tabla", """
+    CREATE TEMP TABLE matricula_nomina (
+        fila        INT PRIMARY KEY,
+        rut_numero  BIGINT NOT NULL,
+        rut_dv      TEXT NOT NULL,
+        nombre      TEXT NOT NULL,
+        apellido1   TEXT,
+        apellido2   TEXT,
+        email       TEXT NOT NULL,
+        role        TEXT NOT NULL
+    ) ON COMMIT DROP
+""")
+queries.register("matricula_diff", """
+    CREATE TEMP TABLE matricula_diff ON COMMIT DROP AS
+    SELECT DISTINCT ON (n.fila)
+        n.*,
+        COALESCE(r.user_id, e.user_id) AS user_id,
+        CASE
+            WHEN r.user_id IS NOT NULL AND e.user_id IS NOT NULL AND r.user_id <> e.user_id THEN 'conflicto'
+            WHEN r.user_id IS NULL AND e.rut_numero IS NOT NULL THEN 'conflicto'
+            WHEN r.user_id IS NULL AND e.user_id IS NULL THEN 'nuevo'
+            WHEN (u.nombre, u.apellido1, u.apellido2, u.email, u.rut_numero, u.rut_dv, u.activo)
+                 IS DISTINCT FROM (n.nombre, n.apellido1, n.apellido2, n.email, n.rut_numero, n.rut_dv, TRUE)
+                THEN 'cambiado'
+            ELSE 'igual'
+        END AS accion
+    FROM matricula_nomina n
+    LEFT JOIN public.users r ON r.rut_numero = n.rut_numero AND r.rut_dv = n.rut_dv
+    LEFT JOIN public.users e ON lower(e.email) = lower(n.email)
+    LEFT JOIN public.users u ON u.user_id = COALESCE(r.user_id, e.user_id)
+    ORDER BY n.fila, e.user_id
+""")
+queries.register("matricula_resumen", "SELECT accion, count(*) AS n FROM matricula_diff GROUP BY accion")
+queries.register("matricula_conflictos", """
+    SELECT d.fila, d.rut_numero, d.rut_dv, d.email, d.user_id AS user_id_rut,
+           e.user_id AS user_id_email, e.rut_numero AS rut_email
+    FROM matricula_diff d
+    LEFT JOIN public.users e ON lower(e.email) = lower(d.email)
+    WHERE d.accion = 'conflicto'
+    ORDER BY d.fila
+    LIMIT %s
+""")
+queries.register("matricula_nuevos", "SELECT fila, rut_numero FROM matricula_diff WHERE accion = 'nuevo' ORDER BY fila")
+queries.register("matricula_claves", """
+    CREATE TEMP TABLE matricula_claves (fila INT PRIMARY KEY, password TEXT NOT NULL) ON COMMIT DROP
+""")
+queries.register("matricula_insertar", """
+    INSERT INTO public.users (nombre, apellido1, apellido2, rut_numero, rut_dv, email, password, role)
+    SELECT d.nombre, d.apellido1, d.apellido2, d.rut_numero, d.rut_dv, d.email, c.password, d.role
+    FROM matricula_diff d
+    JOIN matricula_claves c ON c.fila = d.fila
+    WHERE d.accion = 'nuevo'
+""")
+queries.register("matricula_actualizar", """
+    UPDATE public.users u
+    SET nombre = d.nombre, apellido1 = d.apellido1, apellido2 = d.apellido2,
+        email = d.email, rut_numero = d.rut_numero, rut_dv = d.rut_dv, activo = TRUE
+    FROM matricula_diff d
+    WHERE d.accion = 'cambiado' AND u.user_id = d.user_id
+""")
+queries.register("matricula_desactivar", """
+    UPDATE public.users u
+    SET activo = FALSE
+    WHERE u.role = 'cliente' AND u.activo
+      AND NOT EXISTS (SELECT 1 FROM matricula_diff d WHERE d.user_id = u.user_id)
+""")
+
+
+def clave_temporal() -> str:
+    """Contraseña inicial aleatoria de una cuenta nueva (72 bits, URL-safe)."""
+    return secrets.token_urlsafe(9)
+
+
+def _texto(valor: Optional[str]) -> Optional[str]:
+    valor = (valor or "").strip()
+    return valor or None
+
+
+def leer_nomina(texto: str) -> Tuple[List[Fila], List[Dict[str, Any]]]:
+    """(filas válidas, errores). La fila 1 es el encabezado."""
+    primera = texto.split("\n", 1)[0]
+    separador = ";" if primera.count(";") > primera.count(",") else ","
+    lector = csv.DictReader(io.StringIO(texto), delimiter=separador)
+    encabezado = [c.strip().lower() for c in (lector.fieldnames or [])]
+    faltan = [c for c in COLUMNAS if c not in encabezado]
+    if faltan:
+        raise NominaError(f"Faltan columnas en la nómina: {', '.join(faltan)}")
+    lector.fieldnames = encabezado
+
+    filas: List[Fila] = []
+    errores: List[Dict[str, Any]] = []
+    vistos_rut: Dict[Tuple[int, str], int] = {}
+    vistos_email: Dict[str, int] = {}
+    for n, row in enumerate(lector, start=2):
+        try:
+            rut_numero, rut_dv = parse_rut(row.get("rut") or "")
+        except RutError as e:
+            errores.append({"fila": n, "error": str(e)})
+            continue
+        nombre, email = _texto(row.get("nombre")), _texto(row.get("email"))
+        role = (_texto(row.get("role")) or "cliente").lower()
+        if not nombre or not email or "@" not in email:
+            errores.append({"fila": n, "error": "Falta nombre o email válido"})
+            continue
+        if role not in ROLES:
+            errores.append({"fila": n, "error": f"Rol inválido: {role}"})
+            continue
+        previa = vistos_rut.get((rut_numero, rut_dv)) or vistos_email.get(email.lower())
+        if previa:
+            errores.append({"fila": n, "error": f"RUT o email repetido (fila {previa})"})
+            continue
+        vistos_rut[(rut_numero, rut_dv)] = n
+        vistos_email[email.lower()] = n
+        filas.append(Fila(n, rut_numero, rut_dv, nombre, _texto(row.get("apellido1")),
+                          _texto(row.get("apellido2")), email, role, _texto(row.get("password"))))
+    return filas, errores
+
+
+def sincronizar(filas: List[Fila], desactivar: bool = False, simular: bool = False, job=None,
+                entregar: Optional[Callable[[List[Dict[str, str]]], Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Aplica la nómina; devuelve el informe (conteos por acción y conflictos).
+
+    entregar recibe, ya confirmada la transacción, las contraseñas temporales
+    generadas y devuelve lo que se agrega al informe.
+    """
+    por_fila = {f.fila: f for f in filas}
+    resumen: Dict[str, Any] = {"filas": len(filas), "nuevos": 0, "cambiados": 0, "iguales": 0,
+                               "conflictos": 0, "desactivados": 0, "simulado": simular}
+    with connect() as conn, conn.cursor() as cur:
+        queries.execute(cur, "matricula_tabla")
+        with cur.copy("COPY matricula_nomina (fila, rut_numero, rut_dv, nombre, apellido1, apellido2, email, role) "
+                      "FROM STDIN") as cp:
+            for f in filas:
+                cp.write_row((f.fila, f.rut_numero, f.rut_dv, f.nombre, f.apellido1, f.apellido2, f.email, f.role))
+        queries.execute(cur, "matricula_diff")
+        queries.execute(cur, "matricula_resumen")
+        claves_resumen = {"nuevo": "nuevos", "cambiado": "cambiados", "igual": "iguales", "conflicto": "conflictos"}
+        for accion, n in cur.fetchall():
+            resumen[claves_resumen[accion]] = n
+        queries.execute(cur, "matricula_conflictos", (MAX_DETALLE,))
+        cols = [c.name for c in cur.description]
+        resumen["detalle_conflictos"] = [dict(zip(cols, r)) for r in cur.fetchall()]
+
+        if simular:
+            if desactivar:
+                cur.execute("SELECT count(*) FROM public.users u WHERE u.role = 'cliente' AND u.activo "
+                            "AND NOT EXISTS (SELECT 1 FROM matricula_diff d WHERE d.user_id = u.user_id)")
+                resumen["desactivados"] = cur.fetchone()[0]
+            conn.rollback()
+            return resumen
+
+        queries.execute(cur, "matricula_nuevos")
+        nuevos = cur.fetchall()
+        if job is not None:
+            job.set_total(len(nuevos))
+        passwords: List[str] = []
+        credenciales: List[Dict[str, str]] = []
+        for fila, _ in nuevos:
+            f = por_fila[fila]
+            if f.password:
+                passwords.append(f.password)
+                continue
+            clave = clave_temporal()
+            passwords.append(clave)
+            credenciales.append({"email": f.email, "nombre": f.nombre, "password": clave})
+        hashes = claves.hashear_lote(passwords, get_settings().enroll_workers,
+                                     avance=(lambda n: job.add(sent=n)) if job is not None else None)
+        queries.execute(cur, "matricula_claves")
+        with cur.copy("COPY matricula_claves (fila, password) FROM STDIN") as cp:
+            for (fila, _), h in zip(nuevos, hashes):
+                cp.write_row((fila, h))
+        queries.execute(cur, "matricula_insertar")
+        resumen["nuevos"] = cur.rowcount
+        queries.execute(cur, "matricula_actualizar")
+        resumen["cambiados"] = cur.rowcount
+        if desactivar:
+            queries.execute(cur, "matricula_desactivar")
+            resumen["desactivados"] = cur.rowcount
+        conn.commit()
+
+    resumen["claves_generadas"] = len(credenciales)
+    if credenciales:
+        if entregar is not None:
+            resumen.update(entregar(credenciales))
+        else:
+            log.warning("%d cuentas nuevas sin entrega de contraseña temporal", len(credenciales))
+    log.info("Matrícula aplicada", extra={"datos": {k: v for k, v in resumen.items() if k != "detalle_conflictos"}})
+    return resumen
+
+
+def enviar_claves(credenciales: List[Dict[str, str]], mail) -> Dict[str, Any]:
+    """Envía a cada cuenta nueva su contraseña temporal (una conexión SMTP).
+
+    mail es el estado de flask_mailman de la app (app.get_mail()). Los
+    correos que fallan se informan para reenviar o restablecer la clave.
+    """
+    from flask_mailman import EmailMessage
+
+    enviados = 0
+    fallidos: List[str] = []
+    try:
+        with mail.get_connection() as smtp:
+            for c in credenciales:
+                body = f"""
+Hola {c['nombre']},
+
+Se creó tu cuenta en el Sistema de Biblioteca.
+Usuario: {c['email']}
+Contraseña: {c['password']}
+
+Saludos,
+Sistema de Biblioteca
+"""
+                try:
+                    EmailMessage("Tu cuenta de la biblioteca", body, to=[c["email"]], connection=smtp).send()
+                    enviados += 1
+                except Exception as e:
+                    log.warning("No se pudo enviar la contraseña temporal",
+                                extra={"datos": {"email": c["email"], "error": str(e)}})
+                    fallidos.append(c["email"])
+    except Exception:
+        log.exception("Sin conexión SMTP para las contraseñas temporales")
+        fallidos += [c["email"] for c in credenciales[enviados + len(fallidos):]]
+    return {"claves_enviadas": enviados, "claves_no_enviadas": len(fallidos),
+            "detalle_claves_no_enviadas": fallidos[:MAX_DETALLE]}
+
+
+def guardar_claves(credenciales: List[Dict[str, str]], path: str) -> Dict[str, Any]:
+    """Escribe las contraseñas temporales en un CSV con permisos 0600."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+        escritor = csv.DictWriter(f, fieldnames=["email", "nombre", "password"])
+        escritor.writeheader()
+        escritor.writerows(credenciales)
+    return {"archivo_claves": path}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Matrícula masiva desde una nómina CSV")
+    parser.add_argument("archivo")
+    parser.add_argument("--desactivar", action="store_true", help="Desactiva a los clientes que no están en la nómina")
+    parser.add_argument("--simular", action="store_true", help="Solo informa, sin aplicar cambios")
+    parser.add_argument("--credenciales", default=f"credenciales-{datetime.now():%Y%m%d-%H%M%S}.csv",
+                        help="CSV (0600) con las contraseñas temporales de las cuentas nuevas")
+    args = parser.parse_args(argv)
+
+    with open(args.archivo, encoding="utf-8-sig") as f:
+        filas, errores = leer_nomina(f.read())
+    resumen = sincronizar(filas, args.desactivar, args.simular,
+                          entregar=lambda credenciales: guardar_claves(credenciales, args.credenciales))
+    resumen["invalidas"] = len(errores)
+    resumen["detalle_invalidas"] = errores[:MAX_DETALLE]
+    print(json.dumps(resumen, ensure_ascii=False, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""Migraciones versionadas del esquema de Sisbib.
+
+Los archivos viven en migrations/NNNN_nombre.sql y se aplican en orden.
+Cada versión aplicada queda registrada en public.schema_migrations.
+
+- Por defecto un archivo se ejecuta completo dentro de una transacción.
+- Si la primera línea es "-- migrate: no-transaction" se ejecuta sentencia
+  por sentencia en autocommit (necesario para CREATE INDEX CONCURRENTLY).
+
+Uso (desde backend/):
+    python migrate.py status
+    python migrate.py upgrade
+    python migrate.py explain [--min-filas 1000]
+
+La app también puede aplicarlas al iniciar con DB_AUTO_MIGRATE=1.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import registro
+from db import connect
+
+log = registro.get("migrate")
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+NO_TRANSACTION = "-- migrate: no-transaction"
+# Evita que dos instancias de la app migren a la vez
+_ADVISORY_LOCK_ID = 0x5153_4249  # "SISB"
+
+_FILE_RE = re.compile(r"^(\d{4})_([\w\-]+)\.sql$")
+_CONCURRENT_INDEX_RE = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.I)
+
+
+@dataclass
+class Migration:
+    version: int
+    nombre: str
+    path: str
+
+    @property
+    def sql(self) -> str:
+        with open(self.path, encoding="utf-8") as f:
+            return f.read()
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.lstrip().startswith(NO_TRANSACTION)
+
+
+def discover() -> List[Migration]:
+    found = []
+    for fname in sorted(os.listdir(MIGRATIONS_DIR)):
+        m = _FILE_RE.match(fname)
+        if m:
+            found.append(Migration(int(m.group(1)), m.group(2), os.path.join(MIGRATIONS_DIR, fname)))
+    return found
+
+
+def _split_statements(sql: str) -> List[str]:
+    """Divide un script simple en sentencias (sin bloques $$ ni ';' en literales)."""
+    lines = [ln for ln in sql.splitlines() if not ln.strip().startswith("--")]
+    return [s.strip() for s in "\n".join(lines).split(";") if s.strip()]
+
+
+def _ensure_table(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS public.schema_migrations (
+            version     INT PRIMARY KEY,
+            nombre      TEXT NOT NULL,
+            checksum    TEXT NOT NULL,
+            aplicada_en TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+        """
+    )
+
+
+def applied_versions(conn) -> Dict[int, str]:
+    _ensure_table(conn)
+    rows = conn.execute("SELECT version, checksum FROM public.schema_migrations").fetchall()
+    return {v: c for v, c in rows}
+
+
+def _drop_invalid_indexes(conn, sql: str):
+    """Un CREATE INDEX CONCURRENTLY interrumpido deja el índice INVALID y
+    IF NOT EXISTS lo saltaría en el reintento: se elimina antes de aplicar."""
+    names = _CONCURRENT_INDEX_RE.findall(sql)
+    if not names:
+        return
+    rows = conn.execute(
+        """
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE NOT i.indisvalid AND c.relname = ANY(%s)
+        """,
+        (names,),
+    ).fetchall()
+    for (name,) in rows:
+        log.warning("Eliminando índice inválido %s", name)
+        conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS public."{name}"')
+
+
+def _apply(conn, mig: Migration):
+    if mig.transactional:
+        with conn.transaction():
+            conn.execute(mig.sql)
+            conn.execute(
+                "INSERT INTO public.schema_migrations (version, nombre, checksum) VALUES (%s, %s, %s)",
+                (mig.version, mig.nombre, mig.checksum),
+            )
+    else:
+        _drop_invalid_indexes(conn, mig.sql)
+        for stmt in _split_statements(mig.sql):
+            conn.execute(stmt)
+        conn.execute(
+            "INSERT INTO public.schema_migrations (version, nombre, checksum) VALUES (%s, %s, %s)",
+            (mig.version, mig.nombre, mig.checksum),
+        )
+
+
+def upgrade(target: Optional[int] = None) -> List[int]:
+    """Aplica las migraciones pendientes (hasta target, si se indica)."""
+    done: List[int] = []
+    with connect(autocommit=True) as conn:
+        conn.execute("SELECT pg_advisory_lock(%s)", (_ADVISORY_LOCK_ID,))
+        try:
+            applied = applied_versions(conn)
+            for mig in discover():
+                if target is not None and mig.version > target:
+                    break
+                if mig.version in applied:
+                    if applied[mig.version] != mig.checksum:
+                        log.warning("La migración %04d_%s cambió después de aplicarse", mig.version, mig.nombre)
+                    continue
+                log.info("Aplicando %04d_%s", mig.version, mig.nombre)
+                _apply(conn, mig)
+                done.append(mig.version)
+        finally:
+            conn.execute("SELECT pg_advisory_unlock(%s)", (_ADVISORY_LOCK_ID,))
+    return done
+
+
+def status() -> List[Tuple[Migration, bool]]:
+    with connect(autocommit=True) as conn:
+        applied = applied_versions(conn)
+    return [(m, m.version in applied) for m in discover()]
+
+
+# -------------------------
+# EXPLAIN de las consultas de las rutas
+# -------------------------
+
+# Las sentencias fijas se toman del registro (queries.py) junto con sus
+# parámetros de ejemplo; aquí solo van formas representativas de los
+# listados con WHERE dinámico: (ruta, sql, parámetros de ejemplo).
+DYNAMIC_EXPLAIN_QUERIES: List[Tuple[str, str, Sequence[Any]]] = [
+    ("list_prestamos[activos]",
+     "SELECT p.prestamo_id FROM public.prestamos p JOIN public.users u ON u.user_id = p.user_fk "
+     "JOIN public.libros l ON l.id_libro = p.libro_fk WHERE p.fecha_devolucion IS NULL "
+     "ORDER BY p.fecha_reserva DESC, p.prestamo_id DESC LIMIT %s",
+     (200,)),
+    ("list_prestamos[]",
+     "SELECT p.prestamo_id FROM public.prestamos p JOIN public.users u ON u.user_id = p.user_fk "
+     "JOIN public.libros l ON l.id_libro = p.libro_fk "
+     "ORDER BY p.fecha_reserva DESC, p.prestamo_id DESC LIMIT %s",
+     (200,)),
+    ("listar_sanciones[activas]",
+     "SELECT s.sancion_id FROM public.sanciones s JOIN public.users u ON u.user_id = s.user_fk "
+     "WHERE NOW() < s.hasta ORDER BY s.hasta DESC, s.sancion_id DESC LIMIT %s",
+     (200,)),
+    ("listar_solicitudes[estado]",
+     "SELECT c.solicitud_id FROM unnest(%s::text[]) AS e(estado) CROSS JOIN LATERAL ("
+     "SELECT s.solicitud_id, s.created_at, s.user_fk, s.total_items FROM public.solicitudes s "
+     "WHERE s.estado = e.estado ORDER BY s.created_at DESC, s.solicitud_id DESC LIMIT %s) c "
+     "ORDER BY c.created_at DESC, c.solicitud_id DESC LIMIT %s",
+     (["pending", "ready"], 200, 200)),
+]
+
+
+# Consultas que llevan la clave de partición (fecha_reserva, vía
+# prestamos_clave): con sus parámetros de ejemplo el plan debe quedar en a lo
+# más este número de particiones. Si no, la poda dejó de funcionar.
+PODA_ESPERADA: Dict[str, int] = {
+    "comprobante": 1,
+    "comprobante_lote": 1,
+    "devolucion_por_prestamo": 1,
+    "prestamo_marcar_devuelto": 1,
+    "overdue_mark": 1,
+}
+
+
+def explain_queries() -> List[Tuple[str, str, Sequence[Any]]]:
+    import queries
+
+    queries.cargar_todas()
+    fixed = [(q.name, q.sql, q.example) for q in queries.REGISTRY.fixed() if q.example is not None]
+    return fixed + DYNAMIC_EXPLAIN_QUERIES
+
+
+def _seq_scans(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append({"tabla": plan.get("Relation Name"), "filas_estimadas": plan.get("Plan Rows")})
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+def _relations(plan: Dict[str, Any]) -> List[str]:
+    found = [plan["Relation Name"]] if plan.get("Relation Name") else []
+    for child in plan.get("Plans", []):
+        found.extend(_relations(child))
+    return found
+
+
+def explain_routes(min_filas: int = 1000) -> List[Dict[str, Any]]:
+    """Ejecuta EXPLAIN sobre cada consulta y marca los Seq Scan sobre tablas
+    con más de min_filas filas (las tablas pequeñas se recorren enteras igual).
+    También cuenta cuántas particiones quedan en el plan tras la poda y marca
+    las consultas de PODA_ESPERADA que abren más de las esperadas."""
+    consultas = explain_queries()
+    faltan = set(PODA_ESPERADA) - {route for route, _, _ in consultas}
+    if faltan:
+        raise RuntimeError(f"PODA_ESPERADA sin consulta registrada con ejemplo: {', '.join(sorted(faltan))}")
+    report = []
+    with connect() as conn, conn.cursor() as cur:
+        cur.execute("SELECT relname, reltuples FROM pg_class WHERE relkind IN ('r', 'p')")
+        sizes = {name: tuples for name, tuples in cur.fetchall()}
+        cur.execute("SELECT inhrelid::regclass::text FROM pg_inherits")
+        partitions = {name.split(".")[-1] for (name,) in cur.fetchall()}
+        for route, sql, params in consultas:
+            cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            raw = cur.fetchone()[0]
+            plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+            scans = [s for s in _seq_scans(plan) if sizes.get(s["tabla"], 0) >= min_filas]
+            scanned = {r for r in _relations(plan) if r in partitions}
+            maximo = PODA_ESPERADA.get(route)
+            report.append({"ruta": route, "costo": plan.get("Total Cost"), "seq_scans": scans,
+                           "particiones": len(scanned),
+                           "sin_poda": maximo is not None and len(scanned) > maximo})
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Migraciones del esquema de Sisbib")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    up = sub.add_parser("upgrade", help="Aplica migraciones pendientes")
+    up.add_argument("--hasta", type=int, default=None)
+    sub.add_parser("status", help="Lista migraciones y su estado")
+    ex = sub.add_parser("explain", help="EXPLAIN de las consultas de las rutas; marca Seq Scan y falta de poda")
+    ex.add_argument("--min-filas", type=int, default=1000)
+    args = parser.parse_args(argv)
+    registro.configurar("INFO", formato_json=False)
+
+    if args.cmd == "upgrade":
+        done = upgrade(args.hasta)
+        print(f"{len(done)} migración(es) aplicada(s)" if done else "Esquema al día")
+        return 0
+    if args.cmd == "status":
+        for mig, applied in status():
+            print(f"{'[x]' if applied else '[ ]'} {mig.version:04d}_{mig.nombre}")
+        return 0
+
+    flagged = 0
+    for item in explain_routes(args.min_filas):
+        if item["seq_scans"]:
+            flagged += 1
+            tablas = ", ".join(f"{s['tabla']} (~{int(s['filas_estimadas'])} filas)" for s in item["seq_scans"])
+            print(f"[SEQ SCAN] {item['ruta']}: {tablas}")
+        elif item["sin_poda"]:
+            flagged += 1
+            print(f"[SIN PODA] {item['ruta']}: {item['particiones']} particiones "
+                  f"(máx. {PODA_ESPERADA[item['ruta']]})")
+        else:
+            particiones = f", {item['particiones']} particiones" if item["particiones"] else ""
+            print(f"[ok]       {item['ruta']} (costo {item['costo']}{particiones})")
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
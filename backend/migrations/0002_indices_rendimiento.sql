@@ -0,0 +1,32 @@
+-- migrate: no-transaction
+-- Índices para las consultas que ejecuta app.py. Se crean CONCURRENTLY para
+-- no bloquear escrituras en prestamos/sanciones mientras se construyen.
+
+-- registrar_devolucion por id_ejemplar: último préstamo del ejemplar
+-- (WHERE ejemplar_fk = ? ORDER BY prestamo_id DESC LIMIT 1)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_prestamos_ejemplar_reciente
+    ON public.prestamos (ejemplar_fk, prestamo_id DESC);
+
+-- historial por usuario ordenado por fecha
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_prestamos_user_reserva
+    ON public.prestamos (user_fk, fecha_reserva DESC);
+
+-- list_prestamos: orden general y préstamos activos (solo_activos=1)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_prestamos_reserva
+    ON public.prestamos (fecha_reserva DESC, prestamo_id DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_prestamos_activos
+    ON public.prestamos (fecha_reserva DESC, prestamo_id DESC)
+    WHERE fecha_devolucion IS NULL;
+
+-- send_overdue_notifications: WHERE vencido = TRUE
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_prestamos_vencidos
+    ON public.prestamos (prestamo_id)
+    WHERE vencido;
+
+-- _has_active_sanction / estado_sancion: WHERE user_fk = ? AND now() < hasta
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sanciones_user_hasta
+    ON public.sanciones (user_fk, hasta DESC);
+
+ANALYZE public.prestamos;
+ANALYZE public.sanciones;
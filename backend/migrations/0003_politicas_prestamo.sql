@@ -0,0 +1,23 @@
+-- Políticas de duración de préstamos (antes SALA_MINUTES / DOMICILIO_DAYS).
+-- role y categoria NULL significan "cualquiera"; gana la fila más específica:
+--   (role, categoria) > (role, *) > (*, categoria) > (*, *)
+
+CREATE TABLE IF NOT EXISTS public.politicas_prestamo (
+  politica_id       SERIAL PRIMARY KEY,
+  role              TEXT,
+  categoria         TEXT,
+  tipo_prestamo     TEXT NOT NULL,
+  duracion_minutos  INT NOT NULL,
+  updated_at        TIMESTAMP NOT NULL DEFAULT NOW(),
+  CONSTRAINT politicas_tipo_check CHECK (tipo_prestamo IN ('Sala','Domicilio')),
+  CONSTRAINT politicas_duracion_check CHECK (duracion_minutos > 0)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_politicas_prestamo
+    ON public.politicas_prestamo ((COALESCE(role, '')), (COALESCE(categoria, '')), tipo_prestamo);
+
+-- Valores por defecto equivalentes a los de .env
+INSERT INTO public.politicas_prestamo (role, categoria, tipo_prestamo, duracion_minutos)
+VALUES (NULL, NULL, 'Sala', 120),
+       (NULL, NULL, 'Domicilio', 7 * 24 * 60)
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,12 @@
+-- migrate: no-transaction
+-- Búsqueda exacta por RUT (/api/users/by-rut). El DV se guarda siempre en
+-- mayúscula (create_user ya lo hace; se corrigen filas antiguas) y el par
+-- (rut_numero, rut_dv) pasa a ser único. Si hay RUT duplicados la creación
+-- del índice falla: deben resolverse a mano antes de reintentar.
+
+UPDATE public.users SET rut_dv = upper(rut_dv) WHERE rut_dv <> upper(rut_dv);
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_users_rut
+    ON public.users (rut_numero, rut_dv);
+
+ANALYZE public.users;
@@ -0,0 +1,38 @@
+-- migrate: no-transaction
+-- Tablas de resumen para /api/stats/*. Se llenan de forma incremental
+-- (estadisticas.refresh) a partir de una marca de agua sobre prestamo_id y
+-- fecha_devolucion; los endpoints nunca agregan sobre prestamos.
+
+-- Préstamos y devoluciones por día, categoría y tipo
+CREATE TABLE IF NOT EXISTS public.stats_prestamos_diarios (
+  dia                 DATE NOT NULL,
+  categoria           TEXT NOT NULL,            -- '' = sin categoría
+  tipo_prestamo       TEXT NOT NULL,
+  prestamos           INT NOT NULL DEFAULT 0,   -- por fecha_reserva
+  devoluciones        INT NOT NULL DEFAULT 0,   -- por fecha_devolucion
+  devoluciones_tarde  INT NOT NULL DEFAULT 0,   -- fecha_devolucion > fecha_vencimiento
+  PRIMARY KEY (dia, categoria, tipo_prestamo)
+);
+
+-- Foto diaria de préstamos activos y vencidos (último refresh del día)
+CREATE TABLE IF NOT EXISTS public.stats_vencidos_diarios (
+  dia           DATE PRIMARY KEY,
+  activos       INT NOT NULL,
+  vencidos      INT NOT NULL,
+  calculado_en  TIMESTAMP NOT NULL
+);
+
+-- Marca de agua (una sola fila)
+CREATE TABLE IF NOT EXISTS public.stats_watermark (
+  id                  BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+  ultimo_prestamo_id  BIGINT NOT NULL DEFAULT 0,
+  ultima_devolucion   TIMESTAMP NOT NULL DEFAULT '1970-01-01',
+  actualizado_en      TIMESTAMP
+);
+
+INSERT INTO public.stats_watermark (id) VALUES (TRUE) ON CONFLICT DO NOTHING;
+
+-- Devoluciones nuevas desde la marca de agua
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_prestamos_devolucion
+    ON public.prestamos (fecha_devolucion)
+    WHERE fecha_devolucion IS NOT NULL;
@@ -0,0 +1,150 @@
+-- Particionado por rango de prestamos (mensual por fecha_reserva) y
+-- sanciones (anual por hasta). Las consultas por fecha (orden por
+-- fecha_reserva DESC, NOW() < hasta) solo recorren las particiones vigentes y
+-- el historial antiguo se archiva soltando particiones completas
+-- (particiones.py).
+--
+-- Reescribe ambas tablas dentro de una transacción con bloqueo exclusivo: el
+-- tiempo es proporcional al historial (minutos con ~10M préstamos). Aplicar en
+-- una ventana de mantenimiento.
+
+-- Crea la partición [p_inicio, p_inicio + p_intervalo) de p_padre.
+-- Si la partición DEFAULT tiene filas de ese rango se mueven antes de
+-- adjuntarla (si no, ATTACH fallaría). Devuelve false si ya existía.
+CREATE OR REPLACE FUNCTION public.crear_particion(
+    p_padre text, p_columna text, p_inicio timestamp, p_intervalo interval, p_sufijo text
+) RETURNS boolean
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_nombre text := p_padre || '_p' || p_sufijo;
+    v_fin timestamp := p_inicio + p_intervalo;
+BEGIN
+    IF to_regclass('public.' || v_nombre) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+    EXECUTE format('CREATE TABLE public.%I (LIKE public.%I INCLUDING DEFAULTS)', v_nombre, p_padre);
+    EXECUTE format(
+        'ALTER TABLE public.%I ADD CONSTRAINT %I CHECK (%I >= %L AND %I < %L)',
+        v_nombre, v_nombre || '_rango', p_columna, p_inicio, p_columna, v_fin
+    );
+    IF to_regclass('public.' || p_padre || '_pdefault') IS NOT NULL THEN
+        EXECUTE format(
+            'WITH movidas AS (DELETE FROM public.%I WHERE %I >= %L AND %I < %L RETURNING *) '
+            'INSERT INTO public.%I SELECT * FROM movidas',
+            p_padre || '_pdefault', p_columna, p_inicio, p_columna, v_fin, v_nombre
+        );
+    END IF;
+    EXECUTE format(
+        'ALTER TABLE public.%I ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)',
+        p_padre, v_nombre, p_inicio, v_fin
+    );
+    -- El CHECK solo servía para que ATTACH no recorra la tabla
+    EXECUTE format('ALTER TABLE public.%I DROP CONSTRAINT %I', v_nombre, v_nombre || '_rango');
+    RETURN true;
+END;
+$$;
+
+--------------------------- Préstamos -------------------------
+
+LOCK TABLE public.prestamos IN ACCESS EXCLUSIVE MODE;
+ALTER TABLE public.prestamos RENAME TO prestamos_legacy;
+ALTER SEQUENCE public.prestamos_prestamo_id_seq OWNED BY NONE;
+
+CREATE TABLE public.prestamos (
+  prestamo_id        INT NOT NULL DEFAULT nextval('public.prestamos_prestamo_id_seq'),
+  user_fk            INT NOT NULL,
+  ejemplar_fk        INT NOT NULL,
+  libro_fk           INT NOT NULL,
+  tipo_prestamo      TEXT NOT NULL DEFAULT 'Sala',      -- 'Sala' | 'Domicilio'
+  fecha_reserva      TIMESTAMP NOT NULL DEFAULT NOW(),
+  fecha_vencimiento  TIMESTAMP NULL,
+  fecha_devolucion   TIMESTAMP NULL,
+  vencido            BOOLEAN NOT NULL DEFAULT FALSE
+) PARTITION BY RANGE (fecha_reserva);
+
+CREATE TABLE public.prestamos_pdefault PARTITION OF public.prestamos DEFAULT;
+
+DO $$
+DECLARE
+    v_mes timestamp;
+BEGIN
+    SELECT date_trunc('month', COALESCE(min(fecha_reserva), now())) INTO v_mes FROM public.prestamos_legacy;
+    WHILE v_mes < date_trunc('month', now()) + interval '4 months' LOOP
+        PERFORM public.crear_particion('prestamos', 'fecha_reserva', v_mes, interval '1 month', to_char(v_mes, 'YYYYMM'));
+        v_mes := v_mes + interval '1 month';
+    END LOOP;
+END;
+$$;
+
+INSERT INTO public.prestamos
+    (prestamo_id, user_fk, ejemplar_fk, libro_fk, tipo_prestamo, fecha_reserva,
+     fecha_vencimiento, fecha_devolucion, vencido)
+SELECT prestamo_id, user_fk, ejemplar_fk, libro_fk, tipo_prestamo, fecha_reserva,
+       fecha_vencimiento, fecha_devolucion, vencido
+FROM public.prestamos_legacy;
+DROP TABLE public.prestamos_legacy;
+ALTER SEQUENCE public.prestamos_prestamo_id_seq OWNED BY public.prestamos.prestamo_id;
+
+-- La clave de partición debe ser parte de la PK
+ALTER TABLE public.prestamos ADD PRIMARY KEY (prestamo_id, fecha_reserva);
+ALTER TABLE public.prestamos
+  ADD FOREIGN KEY (user_fk) REFERENCES public.users(user_id) ON DELETE CASCADE,
+  ADD FOREIGN KEY (ejemplar_fk) REFERENCES public.ejemplares(id_ejemplar) ON DELETE RESTRICT,
+  ADD FOREIGN KEY (libro_fk) REFERENCES public.libros(id_libro) ON DELETE RESTRICT;
+
+-- Mismos índices de 0002/0005, ahora por partición. Se omiten idx_prestamos_user,
+-- idx_prestamos_ejemplar (prefijos de los compuestos), idx_prestamos_tipo y
+-- idx_prestamos_vencido (cubiertos por los parciales).
+CREATE INDEX idx_prestamos_ejemplar_reciente ON public.prestamos (ejemplar_fk, prestamo_id DESC);
+CREATE INDEX idx_prestamos_user_reserva      ON public.prestamos (user_fk, fecha_reserva DESC);
+CREATE INDEX idx_prestamos_reserva           ON public.prestamos (fecha_reserva DESC, prestamo_id DESC);
+CREATE INDEX idx_prestamos_activos           ON public.prestamos (fecha_reserva DESC, prestamo_id DESC)
+    WHERE fecha_devolucion IS NULL;
+CREATE INDEX idx_prestamos_vencidos          ON public.prestamos (prestamo_id) WHERE vencido;
+CREATE INDEX idx_prestamos_devolucion        ON public.prestamos (fecha_devolucion)
+    WHERE fecha_devolucion IS NOT NULL;
+
+--------------------------- Sanciones -------------------------
+
+LOCK TABLE public.sanciones IN ACCESS EXCLUSIVE MODE;
+ALTER TABLE public.sanciones RENAME TO sanciones_legacy;
+ALTER SEQUENCE public.sanciones_sancion_id_seq OWNED BY NONE;
+
+CREATE TABLE public.sanciones (
+  sancion_id  INT NOT NULL DEFAULT nextval('public.sanciones_sancion_id_seq'),
+  user_fk     INT NOT NULL,
+  motivo      TEXT,
+  desde       TIMESTAMP NOT NULL DEFAULT NOW(),
+  hasta       TIMESTAMP NOT NULL,
+  created_at  TIMESTAMP NOT NULL DEFAULT NOW()
+) PARTITION BY RANGE (hasta);
+
+CREATE TABLE public.sanciones_pdefault PARTITION OF public.sanciones DEFAULT;
+
+DO $$
+DECLARE
+    v_anio timestamp;
+BEGIN
+    SELECT date_trunc('year', COALESCE(min(hasta), now())) INTO v_anio FROM public.sanciones_legacy;
+    WHILE v_anio < date_trunc('year', now()) + interval '2 years' LOOP
+        PERFORM public.crear_particion('sanciones', 'hasta', v_anio, interval '1 year', to_char(v_anio, 'YYYY'));
+        v_anio := v_anio + interval '1 year';
+    END LOOP;
+END;
+$$;
+
+INSERT INTO public.sanciones (sancion_id, user_fk, motivo, desde, hasta, created_at)
+SELECT sancion_id, user_fk, motivo, desde, hasta, created_at
+FROM public.sanciones_legacy;
+DROP TABLE public.sanciones_legacy;
+ALTER SEQUENCE public.sanciones_sancion_id_seq OWNED BY public.sanciones.sancion_id;
+
+ALTER TABLE public.sanciones ADD PRIMARY KEY (sancion_id, hasta);
+ALTER TABLE public.sanciones
+  ADD FOREIGN KEY (user_fk) REFERENCES public.users(user_id) ON DELETE CASCADE;
+
+CREATE INDEX idx_sanciones_user_hasta ON public.sanciones (user_fk, hasta DESC);
+CREATE INDEX idx_sanciones_hasta      ON public.sanciones (hasta DESC, sancion_id DESC);
+
+ANALYZE public.prestamos;
+ANALYZE public.sanciones;
@@ -0,0 +1,36 @@
+-- Registro de cambios de estado de ejemplares (estados_ejemplar.py).
+-- Solo se agregan filas: UPDATE y DELETE se rechazan con un trigger.
+
+CREATE TABLE IF NOT EXISTS public.ejemplares_eventos (
+  evento_id        BIGSERIAL PRIMARY KEY,
+  id_ejemplar      INT NOT NULL,            -- sin FK: el historial sobrevive al borrado del ejemplar
+  estado_anterior  TEXT NOT NULL,
+  estado_nuevo     TEXT NOT NULL,
+  motivo           TEXT,
+  actor_fk         INT,                     -- user_id del token, si lo hay
+  prestamo_fk      INT,
+  creado_en        TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_ejemplares_eventos_ejemplar
+    ON public.ejemplares_eventos (id_ejemplar, evento_id DESC);
+
+CREATE OR REPLACE FUNCTION public.ejemplares_eventos_inmutable() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    RAISE EXCEPTION 'ejemplares_eventos es de solo inserción';
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_ejemplares_eventos_inmutable ON public.ejemplares_eventos;
+CREATE TRIGGER trg_ejemplares_eventos_inmutable
+    BEFORE UPDATE OR DELETE ON public.ejemplares_eventos
+    FOR EACH ROW EXECUTE FUNCTION public.ejemplares_eventos_inmutable();
+
+-- Desde ahora el motor de transiciones mantiene ejemplares_disponibles; se
+-- recalcula una vez porque préstamos y bajas nunca lo descontaban.
+UPDATE public.libros l
+SET ejemplares_disponibles = (
+    SELECT count(*) FROM public.ejemplares e
+    WHERE e.id_libro = l.id_libro AND e.estado = 'disponible'
+);
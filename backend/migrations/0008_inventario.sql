@@ -0,0 +1,29 @@
+-- Sesiones de inventario físico (inventario.py).
+-- Las lecturas de los escáneres se acumulan en una tabla UNLOGGED (sin WAL:
+-- son datos de trabajo que se borran al cerrar la sesión). Una tabla TEMP no
+-- sirve porque cada lote puede llegar por una conexión distinta del pool.
+
+CREATE TABLE IF NOT EXISTS public.inventario_sesiones (
+  sesion_id   SERIAL PRIMARY KEY,
+  alcance     TEXT,                        -- prefijo de ubicación; NULL = toda la colección
+  estado      TEXT NOT NULL DEFAULT 'abierta',
+  actor_fk    INT,
+  creada_en   TIMESTAMP NOT NULL DEFAULT NOW(),
+  cerrada_en  TIMESTAMP,
+  resumen     JSONB,                       -- conteos por clasificación al cerrar
+  CONSTRAINT inventario_estado_check CHECK (estado IN ('abierta','cerrada'))
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS public.inventario_lecturas (
+  sesion_fk    INT NOT NULL,
+  id_ejemplar  INT NOT NULL,
+  ubicacion    TEXT,
+  leido_en     TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE INDEX IF NOT EXISTS idx_inventario_lecturas_sesion
+    ON public.inventario_lecturas (sesion_fk, id_ejemplar, leido_en DESC);
+
+-- Alcance por prefijo de ubicación (LIKE 'Estante 1%')
+CREATE INDEX IF NOT EXISTS idx_ejemplares_ubicacion
+    ON public.ejemplares (ubicacion text_pattern_ops);
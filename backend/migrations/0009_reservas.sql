@@ -0,0 +1,41 @@
+-- Cola de reservas por libro (reservas.py). Cuando se libera un ejemplar
+-- (devolución, fin de reposición, reserva expirada) se asigna a la reserva
+-- en espera más antigua en la misma transacción y el ejemplar queda
+-- 'reservado' hasta que el usuario lo retira o la reserva expira.
+
+CREATE TABLE IF NOT EXISTS public.reservas (
+  reserva_id   SERIAL PRIMARY KEY,
+  user_fk      INT NOT NULL REFERENCES public.users(user_id) ON DELETE CASCADE,
+  id_libro     INT NOT NULL REFERENCES public.libros(id_libro) ON DELETE CASCADE,
+  estado       TEXT NOT NULL DEFAULT 'en_espera',
+  id_ejemplar  INT REFERENCES public.ejemplares(id_ejemplar) ON DELETE SET NULL,
+  creada_en    TIMESTAMP NOT NULL DEFAULT NOW(),
+  asignada_en  TIMESTAMP,
+  expira_en    TIMESTAMP,
+  cerrada_en   TIMESTAMP,
+  CONSTRAINT reservas_estado_check
+    CHECK (estado IN ('en_espera','asignada','retirada','expirada','cancelada'))
+);
+
+-- Una reserva activa por usuario y libro
+CREATE UNIQUE INDEX IF NOT EXISTS uq_reservas_activa
+    ON public.reservas (user_fk, id_libro)
+    WHERE estado IN ('en_espera','asignada');
+
+-- Cola FIFO por libro; también da la posición (conteo por rango de reserva_id)
+CREATE INDEX IF NOT EXISTS idx_reservas_cola
+    ON public.reservas (id_libro, reserva_id)
+    WHERE estado = 'en_espera';
+
+-- Expiración de reservas asignadas no retiradas
+CREATE INDEX IF NOT EXISTS idx_reservas_expira
+    ON public.reservas (expira_en)
+    WHERE estado = 'asignada';
+
+-- Retiro: reserva asignada a un ejemplar
+CREATE INDEX IF NOT EXISTS idx_reservas_ejemplar
+    ON public.reservas (id_ejemplar)
+    WHERE estado = 'asignada';
+
+CREATE INDEX IF NOT EXISTS idx_reservas_usuario
+    ON public.reservas (user_fk, reserva_id DESC);
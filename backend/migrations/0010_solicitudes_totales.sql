@@ -0,0 +1,76 @@
+-- Totales de la solicitud mantenidos en la cabecera. La cola del bibliotecario
+-- (GET /api/solicitudes) ya no agrupa solicitudes_detalle en cada refresco:
+-- lee total_items / n_items / primer_titulo de solicitudes. Los mantiene un
+-- trigger por sentencia sobre solicitudes_detalle, así un INSERT de varios
+-- ítems recalcula la cabecera una sola vez.
+-- primer_titulo es el título del primer ítem (por id) al momento de pedirlo,
+-- por libro o por el libro del ejemplar.
+
+ALTER TABLE public.solicitudes
+    ADD COLUMN IF NOT EXISTS total_items   INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS n_items       INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS primer_titulo TEXT;
+
+CREATE OR REPLACE FUNCTION public.solicitudes_recalcular(ids INT[]) RETURNS void
+LANGUAGE sql AS $$
+    UPDATE public.solicitudes s
+    SET total_items = t.total_items,
+        n_items = t.n_items,
+        primer_titulo = t.primer_titulo
+    FROM (
+        SELECT x.id,
+               COALESCE(sum(sd.cantidad), 0)::int AS total_items,
+               count(sd.id)::int AS n_items,
+               (SELECT l.titulo
+                FROM public.solicitudes_detalle d
+                LEFT JOIN public.ejemplares e ON e.id_ejemplar = d.id_ejemplar
+                JOIN public.libros l ON l.id_libro = COALESCE(d.id_libro, e.id_libro)
+                WHERE d.solicitud_fk = x.id
+                ORDER BY d.id
+                LIMIT 1) AS primer_titulo
+        FROM (SELECT DISTINCT unnest(ids) AS id) x
+        LEFT JOIN public.solicitudes_detalle sd ON sd.solicitud_fk = x.id
+        GROUP BY x.id
+    ) t
+    WHERE s.solicitud_id = t.id
+      AND (s.total_items, s.n_items, s.primer_titulo)
+          IS DISTINCT FROM (t.total_items, t.n_items, t.primer_titulo);
+$$;
+
+CREATE OR REPLACE FUNCTION public.solicitudes_detalle_totales() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM public.solicitudes_recalcular(ARRAY(SELECT solicitud_fk FROM nuevas));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM public.solicitudes_recalcular(ARRAY(SELECT solicitud_fk FROM viejas));
+    ELSE
+        PERFORM public.solicitudes_recalcular(ARRAY(
+            SELECT solicitud_fk FROM nuevas UNION SELECT solicitud_fk FROM viejas
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Una tabla de transición por evento: un trigger por operación
+DROP TRIGGER IF EXISTS trg_soldet_totales_ins ON public.solicitudes_detalle;
+CREATE TRIGGER trg_soldet_totales_ins
+    AFTER INSERT ON public.solicitudes_detalle
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION public.solicitudes_detalle_totales();
+
+DROP TRIGGER IF EXISTS trg_soldet_totales_upd ON public.solicitudes_detalle;
+CREATE TRIGGER trg_soldet_totales_upd
+    AFTER UPDATE ON public.solicitudes_detalle
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION public.solicitudes_detalle_totales();
+
+DROP TRIGGER IF EXISTS trg_soldet_totales_del ON public.solicitudes_detalle;
+CREATE TRIGGER trg_soldet_totales_del
+    AFTER DELETE ON public.solicitudes_detalle
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION public.solicitudes_detalle_totales();
+
+-- Solicitudes existentes
+SELECT public.solicitudes_recalcular(ARRAY(SELECT solicitud_id FROM public.solicitudes));
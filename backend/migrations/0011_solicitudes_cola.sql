@@ -0,0 +1,20 @@
+-- migrate: no-transaction
+-- Cola del bibliotecario (GET /api/solicitudes?estado=pending,ready): por cada
+-- estado se leen las más recientes en orden de este índice y, con las columnas
+-- de INCLUDE, sin visitar el heap (index-only scan). Reemplaza a
+-- idx_solicitudes_estado, que es un prefijo suyo.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_solicitudes_cola
+    ON public.solicitudes (estado, created_at DESC, solicitud_id DESC)
+    INCLUDE (user_fk, asignado_fk, total_items, n_items, primer_titulo);
+
+DROP INDEX CONCURRENTLY IF EXISTS public.idx_solicitudes_estado;
+
+-- El index-only scan depende del visibility map: solicitudes cambia de estado
+-- a menudo, así que se aspira antes que el resto de las tablas.
+ALTER TABLE public.solicitudes SET (
+    autovacuum_vacuum_scale_factor = 0.02,
+    autovacuum_vacuum_insert_scale_factor = 0.02
+);
+
+VACUUM (ANALYZE) public.solicitudes;
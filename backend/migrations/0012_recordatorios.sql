@@ -0,0 +1,20 @@
+-- Recordatorios antes del vencimiento (recordatorios.py). Una fila por aviso
+-- ya entregado al canal: al reiniciar solo se vuelve a cargar lo pendiente.
+-- Sin FK a prestamos: su PK es (prestamo_id, fecha_reserva) desde la 0006.
+
+CREATE TABLE IF NOT EXISTS public.recordatorios_enviados (
+  prestamo_fk  INT NOT NULL,
+  aviso_min    INT NOT NULL,             -- minutos antes de fecha_vencimiento
+  enviado_en   TIMESTAMP NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (prestamo_fk, aviso_min)
+);
+
+CREATE INDEX IF NOT EXISTS idx_recordatorios_enviados_en
+    ON public.recordatorios_enviados (enviado_en);
+
+-- Carga por ventanas: préstamos activos por fecha de vencimiento. Es parcial
+-- (solo los no devueltos), pero construirla recorre cada partición de
+-- prestamos y bloquea escrituras mientras tanto.
+CREATE INDEX IF NOT EXISTS idx_prestamos_activos_venc
+    ON public.prestamos (fecha_vencimiento)
+    WHERE fecha_devolucion IS NULL;
@@ -0,0 +1,6 @@
+-- Matrícula masiva (matricula.py): los clientes que ya no están en la nómina
+-- del semestre se desactivan en vez de borrarse (conservan su historial).
+-- Un usuario inactivo no puede ingresar ni pedir préstamos.
+
+ALTER TABLE public.users
+    ADD COLUMN IF NOT EXISTS activo BOOLEAN NOT NULL DEFAULT TRUE;
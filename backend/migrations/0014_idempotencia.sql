@@ -0,0 +1,20 @@
+-- Respuestas de POST con Idempotency-Key (idempotencia.py). Una fila por
+-- (ruta, clave): mientras la primera ejecución corre, status es NULL y
+-- dueno identifica al request que la tomó; al terminar queda la respuesta
+-- guardada hasta expira_en (IDEMPOTENCIA_HORAS).
+
+CREATE TABLE IF NOT EXISTS public.idempotencia (
+  ruta          TEXT NOT NULL,
+  clave         TEXT NOT NULL,
+  huella        BYTEA NOT NULL,           -- sha256 de usuario + cuerpo del request
+  dueno         UUID NOT NULL,
+  status        SMALLINT,                 -- NULL: en ejecución
+  content_type  TEXT,
+  cuerpo        BYTEA,
+  creado_en     TIMESTAMP NOT NULL DEFAULT NOW(),
+  expira_en     TIMESTAMP NOT NULL,
+  PRIMARY KEY (ruta, clave)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotencia_expira
+    ON public.idempotencia (expira_en);
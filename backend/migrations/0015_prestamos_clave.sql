@@ -0,0 +1,49 @@
+-- Búsqueda de un préstamo por prestamo_id sin recorrer todas las particiones.
+-- Desde la 0006 la PK de prestamos es (prestamo_id, fecha_reserva): un WHERE
+-- solo por prestamo_id (comprobante, devolución) sondea el índice de cada
+-- partición mensual, y prestamo_id ya no es único por sí solo.
+--
+-- prestamos_clave es una tabla sin particionar con una fila por préstamo:
+-- su PK vuelve a hacer único a prestamo_id y da la fecha_reserva para que la
+-- consulta sobre prestamos quede en una sola partición. El índice por
+-- ejemplar resuelve el último préstamo de un ejemplar (devolución por
+-- id_ejemplar). Se mantiene con triggers; archivar() borra las filas de las
+-- particiones que suelta (DROP no dispara triggers).
+--
+-- El llenado inicial recorre prestamos una vez dentro de la transacción.
+
+CREATE TABLE IF NOT EXISTS public.prestamos_clave (
+  prestamo_id    INT PRIMARY KEY,
+  fecha_reserva  TIMESTAMP NOT NULL,
+  ejemplar_fk    INT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_prestamos_clave_ejemplar
+    ON public.prestamos_clave (ejemplar_fk, prestamo_id DESC);
+
+CREATE OR REPLACE FUNCTION public.prestamos_clave_sync() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM public.prestamos_clave WHERE prestamo_id = OLD.prestamo_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO public.prestamos_clave (prestamo_id, fecha_reserva, ejemplar_fk)
+        VALUES (NEW.prestamo_id, NEW.fecha_reserva, NEW.ejemplar_fk);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+LOCK TABLE public.prestamos IN SHARE ROW EXCLUSIVE MODE;
+
+INSERT INTO public.prestamos_clave (prestamo_id, fecha_reserva, ejemplar_fk)
+SELECT prestamo_id, fecha_reserva, ejemplar_fk
+FROM public.prestamos;
+
+DROP TRIGGER IF EXISTS trg_prestamos_clave ON public.prestamos;
+CREATE TRIGGER trg_prestamos_clave
+    AFTER INSERT OR DELETE OR UPDATE OF prestamo_id, fecha_reserva, ejemplar_fk ON public.prestamos
+    FOR EACH ROW EXECUTE FUNCTION public.prestamos_clave_sync();
+
+ANALYZE public.prestamos_clave;
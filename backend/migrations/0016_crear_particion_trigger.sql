@@ -0,0 +1,57 @@
+-- crear_particion (0006) movía las filas de la partición DEFAULT con
+-- DELETE ... RETURNING + INSERT en la tabla nueva antes de adjuntarla. Desde
+-- la 0015 el DELETE dispara trg_prestamos_clave y borra la fila de
+-- prestamos_clave, pero el INSERT en una tabla aún suelta no dispara nada:
+-- el préstamo quedaba sin clave y devolución/comprobante no lo encontraban.
+--
+-- Ahora las filas pasan por una tabla temporal, la partición se adjunta vacía
+-- y se vuelven a insertar por la tabla padre, así los triggers de fila de la
+-- padre (prestamos_clave) ven el INSERT.
+--
+-- Además repone las claves que ya se hubieran perdido.
+
+CREATE OR REPLACE FUNCTION public.crear_particion(
+    p_padre text, p_columna text, p_inicio timestamp, p_intervalo interval, p_sufijo text
+) RETURNS boolean
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_nombre text := p_padre || '_p' || p_sufijo;
+    v_temporal text := '_movidas_' || p_padre || '_p' || p_sufijo;
+    v_fin timestamp := p_inicio + p_intervalo;
+    v_con_default boolean := to_regclass('public.' || p_padre || '_pdefault') IS NOT NULL;
+BEGIN
+    IF to_regclass('public.' || v_nombre) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+    EXECUTE format('CREATE TABLE public.%I (LIKE public.%I INCLUDING DEFAULTS)', v_nombre, p_padre);
+    EXECUTE format(
+        'ALTER TABLE public.%I ADD CONSTRAINT %I CHECK (%I >= %L AND %I < %L)',
+        v_nombre, v_nombre || '_rango', p_columna, p_inicio, p_columna, v_fin
+    );
+    IF v_con_default THEN
+        EXECUTE format('CREATE TEMP TABLE %I (LIKE public.%I)', v_temporal, p_padre);
+        EXECUTE format(
+            'WITH movidas AS (DELETE FROM public.%I WHERE %I >= %L AND %I < %L RETURNING *) '
+            'INSERT INTO %I SELECT * FROM movidas',
+            p_padre || '_pdefault', p_columna, p_inicio, p_columna, v_fin, v_temporal
+        );
+    END IF;
+    EXECUTE format(
+        'ALTER TABLE public.%I ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)',
+        p_padre, v_nombre, p_inicio, v_fin
+    );
+    -- El CHECK solo servía para que ATTACH no recorra la tabla
+    EXECUTE format('ALTER TABLE public.%I DROP CONSTRAINT %I', v_nombre, v_nombre || '_rango');
+    IF v_con_default THEN
+        -- Por la padre: cae en la partición recién adjuntada y dispara sus triggers de fila
+        EXECUTE format('INSERT INTO public.%I SELECT * FROM %I', p_padre, v_temporal);
+        EXECUTE format('DROP TABLE %I', v_temporal);
+    END IF;
+    RETURN true;
+END;
+$$;
+
+INSERT INTO public.prestamos_clave (prestamo_id, fecha_reserva, ejemplar_fk)
+SELECT p.prestamo_id, p.fecha_reserva, p.ejemplar_fk
+FROM public.prestamos p
+WHERE NOT EXISTS (SELECT 1 FROM public.prestamos_clave k WHERE k.prestamo_id = p.prestamo_id);
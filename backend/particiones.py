@@ -0,0 +1,261 @@
+"""Mantenimiento de las particiones de prestamos y sanciones (migración 0006).
+
+- asegurar(): crea por adelantado las particiones de los próximos
+  PARTITIONS_AHEAD_MONTHS meses (prestamos, mensual) y años (sanciones,
+  anual). Lo que caiga fuera queda en la partición DEFAULT y se mueve solo
+  cuando se crea la partición que le corresponde (public.crear_particion).
+- archivar(): los préstamos cerrados de particiones completas más antiguas que
+  ARCHIVE_YEARS se copian a ARCHIVE_DIR/<particion>.csv.gz y la partición se
+  suelta (DETACH + DROP), sin DELETE masivo ni índices inflados. Si una
+  partición antigua aún tiene préstamos abiertos, solo se archivan y borran
+  los cerrados. Las sanciones antiguas ya terminaron: se archivan completas.
+- restaurar(): vuelve a cargar un archivo .csv.gz en la tabla padre.
+
+Uso (desde backend/):
+    python particiones.py listar
+    python particiones.py asegurar
+    python particiones.py archivar [--anios 3] [--dir archivo]
+    python particiones.py restaurar archivo/prestamos_p202201.csv.gz
+"""
+import argparse
+import gzip
+import os
+import re
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import registro
+from db import connect
+
+log = registro.get("particiones")
+
+
+@dataclass(frozen=True)
+class Esquema:
+    tabla: str
+    columna: str
+    meses: int          # largo de cada partición
+    formato: str        # sufijo del nombre (strftime)
+    # Condición de fila "cerrada" (archivable); None = todas
+    cerrada: Optional[str] = None
+
+
+ESQUEMAS = {
+    "prestamos": Esquema("prestamos", "fecha_reserva", 1, "%Y%m", "fecha_devolucion IS NOT NULL"),
+    "sanciones": Esquema("sanciones", "hasta", 12, "%Y"),
+}
+
+_NOMBRE_RE = re.compile(r"^(prestamos|sanciones)_p(\d{4})(\d{2})?$")
+
+
+def _sumar_meses(d: datetime, meses: int) -> datetime:
+    total = d.year * 12 + d.month - 1 + meses
+    return d.replace(year=total // 12, month=total % 12 + 1, day=1,
+                     hour=0, minute=0, second=0, microsecond=0)
+
+
+def _inicio_periodo(esq: Esquema, d: datetime) -> datetime:
+    inicio = d.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return inicio.replace(month=1) if esq.meses == 12 else inicio
+
+
+def _rango(nombre: str):
+    """(tabla, inicio, fin) a partir del nombre de la partición."""
+    m = _NOMBRE_RE.match(nombre)
+    if not m:
+        return None
+    tabla, anio, mes = m.group(1), int(m.group(2)), int(m.group(3) or 1)
+    inicio = datetime(anio, mes, 1)
+    return tabla, inicio, _sumar_meses(inicio, ESQUEMAS[tabla].meses)
+
+
+def listar(conn=None) -> List[Dict[str, Any]]:
+    """Particiones existentes con filas estimadas y tamaño."""
+    sql = """
+        SELECT parent.relname AS tabla, child.relname AS particion,
+               pg_get_expr(child.relpartbound, child.oid) AS limites,
+               child.reltuples::bigint AS filas_estimadas,
+               pg_total_relation_size(child.oid) AS bytes
+        FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        WHERE parent.relname = ANY(%s) AND parent.relnamespace = 'public'::regnamespace
+        ORDER BY parent.relname, child.relname
+    """
+    if conn is not None:
+        rows = conn.execute(sql, (list(ESQUEMAS),)).fetchall()
+    else:
+        with connect() as c:
+            rows = c.execute(sql, (list(ESQUEMAS),)).fetchall()
+    cols = ["tabla", "particion", "limites", "filas_estimadas", "bytes"]
+    return [dict(zip(cols, r)) for r in rows]
+
+
+def crear_rango(conn, desde: datetime, hasta: datetime) -> List[str]:
+    """Crea (si faltan) las particiones de ambas tablas que cubren [desde, hasta].
+
+    conn debe estar en autocommit: cada partición se crea en su propia transacción.
+    """
+    creadas = []
+    for esq in ESQUEMAS.values():
+        inicio = _inicio_periodo(esq, desde)
+        while inicio <= hasta:
+            sufijo = inicio.strftime(esq.formato)
+            with conn.transaction():
+                nueva = conn.execute(
+                    "SELECT public.crear_particion(%s, %s, %s, %s::interval, %s)",
+                    (esq.tabla, esq.columna, inicio, f"{esq.meses} months", sufijo),
+                ).fetchone()[0]
+            if nueva:
+                creadas.append(f"{esq.tabla}_p{sufijo}")
+            inicio = _sumar_meses(inicio, esq.meses)
+    return creadas
+
+
+def asegurar(meses_adelante: int = 3, ahora: Optional[datetime] = None) -> List[str]:
+    """Crea las particiones que falten desde el periodo actual hasta meses_adelante."""
+    ahora = ahora or datetime.now()
+    with connect(autocommit=True) as conn:
+        creadas = crear_rango(conn, ahora, _sumar_meses(ahora, meses_adelante))
+    if creadas:
+        log.info("creadas: %s", ", ".join(creadas))
+    return creadas
+
+
+def _copiar_a_archivo(cur, sql: str, destino: str) -> None:
+    with open(destino, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as out:
+            with cur.copy(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)") as cp:
+                for bloque in cp:
+                    out.write(bloque)
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def archivar(anios: int, directorio: str, ahora: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Archiva particiones que terminan antes de (ahora - anios). Devuelve el detalle."""
+    if anios <= 0:
+        raise ValueError("anios debe ser mayor que 0")
+    ahora = ahora or datetime.now()
+    corte = _sumar_meses(ahora.replace(day=1), -12 * anios)
+    os.makedirs(directorio, exist_ok=True)
+    resultado = []
+
+    with connect() as conn:
+        candidatas = [p["particion"] for p in listar(conn)]
+        conn.commit()
+        for nombre in candidatas:
+            rango = _rango(nombre)
+            if not rango or rango[2] > corte:
+                continue
+            esq = ESQUEMAS[rango[0]]
+            destino = os.path.join(directorio, f"{nombre}.csv.gz")
+            if os.path.exists(destino):
+                # Pasada anterior sobre una partición con préstamos abiertos
+                destino = os.path.join(directorio, f"{nombre}-{ahora:%Y%m%d%H%M%S}.csv.gz")
+            tmp = destino + ".tmp"
+            with conn.cursor() as cur:
+                try:
+                    # Evita escrituras en la partición entre la copia y el borrado
+                    cur.execute(f'LOCK TABLE public."{nombre}" IN SHARE MODE')
+                    abiertas = 0
+                    if esq.cerrada:
+                        cur.execute(f'SELECT count(*) FROM public."{nombre}" WHERE NOT ({esq.cerrada})')
+                        abiertas = cur.fetchone()[0]
+                    filtro = f" WHERE {esq.cerrada}" if abiertas else ""
+                    _copiar_a_archivo(cur, f'SELECT * FROM public."{nombre}"{filtro}', tmp)
+                    if abiertas:
+                        cur.execute(f'DELETE FROM public."{nombre}"{filtro}')
+                        filas = cur.rowcount
+                    else:
+                        cur.execute(f'SELECT count(*) FROM public."{nombre}"')
+                        filas = cur.fetchone()[0]
+                        if esq.tabla == "prestamos":
+                            # DROP no dispara el trigger que mantiene prestamos_clave (0015)
+                            cur.execute(f'DELETE FROM public.prestamos_clave k USING public."{nombre}" p '
+                                        f'WHERE k.prestamo_id = p.prestamo_id')
+                        cur.execute(f'ALTER TABLE public."{esq.tabla}" DETACH PARTITION public."{nombre}"')
+                        cur.execute(f'DROP TABLE public."{nombre}"')
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                    raise
+            os.replace(tmp, destino)
+            detalle = {"particion": nombre, "archivo": destino, "filas": filas,
+                       "soltada": not abiertas, "abiertas": abiertas}
+            if abiertas:
+                log.warning("%s tiene %d préstamos abiertos: se conserva la partición", nombre, abiertas)
+            log.info("archivada %s", nombre, extra={"datos": detalle})
+            resultado.append(detalle)
+    return resultado
+
+
+def restaurar(path: str) -> int:
+    """Carga un archivo generado por archivar() en su tabla padre."""
+    base = os.path.basename(path).split(".")[0].split("-")[0]
+    rango = _rango(base)
+    if not rango:
+        raise ValueError(f"Nombre de archivo no reconocido: {path}")
+    esq = ESQUEMAS[rango[0]]
+    with connect() as conn, conn.cursor() as cur:
+        conn.execute(
+            "SELECT public.crear_particion(%s, %s, %s, %s::interval, %s)",
+            (esq.tabla, esq.columna, rango[1], f"{esq.meses} months", rango[1].strftime(esq.formato)),
+        )
+        with gzip.open(path, "rb") as src, cur.copy(
+            f"COPY public.{esq.tabla} FROM STDIN WITH (FORMAT csv, HEADER)"
+        ) as cp:
+            while bloque := src.read(1 << 20):
+                cp.write(bloque)
+        filas = cur.rowcount
+        conn.commit()
+    return filas
+
+
+def mantenimiento() -> Dict[str, Any]:
+    """Tarea diaria: particiones futuras y, si ARCHIVE_YEARS > 0, archivado."""
+    from settings import get_settings
+
+    s = get_settings()
+    resultado: Dict[str, Any] = {"creadas": asegurar(s.partitions_ahead_months), "archivadas": []}
+    if s.archive_years > 0:
+        resultado["archivadas"] = archivar(s.archive_years, s.archive_dir)
+    return resultado
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from settings import get_settings
+
+    s = get_settings()
+    registro.configurar(s.log_level, formato_json=False)
+    parser = argparse.ArgumentParser(description="Particiones de prestamos y sanciones")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("listar", help="Particiones existentes")
+    ase = sub.add_parser("asegurar", help="Crea particiones futuras")
+    ase.add_argument("--meses", type=int, default=s.partitions_ahead_months)
+    arc = sub.add_parser("archivar", help="Archiva y suelta particiones antiguas")
+    arc.add_argument("--anios", type=int, default=s.archive_years or 3)
+    arc.add_argument("--dir", default=s.archive_dir)
+    res = sub.add_parser("restaurar", help="Recarga un archivo .csv.gz")
+    res.add_argument("archivo")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "listar":
+        for p in listar():
+            print(f"{p['particion']:<24} {p['filas_estimadas']:>10} filas  {p['bytes'] / 1e6:>9.1f} MB  {p['limites']}")
+    elif args.cmd == "asegurar":
+        print(asegurar(args.meses))
+    elif args.cmd == "archivar":
+        for detalle in archivar(args.anios, args.dir):
+            print(detalle)
+    elif args.cmd == "restaurar":
+        print(f"{restaurar(args.archivo)} filas restauradas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
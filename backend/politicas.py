@@ -0,0 +1,91 @@
+"""Caché en memoria de public.politicas_prestamo.
+
+crear_prestamo pregunta la duración para (role, categoría, tipo) sin tocar
+la base: la tabla se carga completa (son pocas filas) y se refresca cada
+POLICY_CACHE_SECONDS o al invalidarla (PUT de políticas, recarga de config).
+Si la tabla no existe o no tiene fila aplicable se usan SALA_MINUTES /
+DOMICILIO_DAYS de settings.
+"""
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from psycopg.rows import dict_row
+
+import queries
+import registro
+from db import get_connection
+from settings import get_settings
+
+log = registro.get("politicas")
+
+_Key = Tuple[Optional[str], Optional[str], str]
+
+queries.register("politicas_all", """
+    SELECT politica_id, role, categoria, tipo_prestamo, duracion_minutos, updated_at
+    FROM public.politicas_prestamo
+    ORDER BY tipo_prestamo, role NULLS FIRST, categoria NULLS FIRST
+""", ())
+queries.register("politica_upsert", """
+    INSERT INTO public.politicas_prestamo (role, categoria, tipo_prestamo, duracion_minutos)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT ((COALESCE(role, '')), (COALESCE(categoria, '')), tipo_prestamo)
+    DO UPDATE SET duracion_minutos = EXCLUDED.duracion_minutos, updated_at = NOW()
+    RETURNING politica_id, role, categoria, tipo_prestamo, duracion_minutos, updated_at
+""")
+
+
+def _norm(value: Optional[str]) -> Optional[str]:
+    value = (value or "").strip().lower()
+    return value or None
+
+
+class PolicyCache:
+    def __init__(self):
+        self._rules: Dict[_Key, int] = {}
+        self._rows: List[dict] = []
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+
+    def _load(self):
+        try:
+            with get_connection(read_only=False) as conn, conn.cursor(row_factory=dict_row) as cur:
+                queries.execute(cur, "politicas_all")
+                rows = cur.fetchall()
+        except Exception as e:
+            # Sin tabla (migración 0003 pendiente) se trabaja con los valores de settings
+            log.warning("No se pudieron cargar políticas de préstamo: %s", e)
+            rows = []
+        self._rows = rows
+        self._rules = {
+            (_norm(r["role"]), _norm(r["categoria"]), r["tipo_prestamo"]): r["duracion_minutos"] for r in rows
+        }
+        self._loaded_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if time.monotonic() - self._loaded_at < get_settings().policy_cache_s:
+            return
+        with self._lock:
+            if time.monotonic() - self._loaded_at >= get_settings().policy_cache_s:
+                self._load()
+
+    def rows(self) -> List[dict]:
+        self._ensure_fresh()
+        return list(self._rows)
+
+    def duracion(self, tipo: str, role: Optional[str] = None, categoria: Optional[str] = None) -> timedelta:
+        self._ensure_fresh()
+        role, categoria = _norm(role), _norm(categoria)
+        for key in ((role, categoria, tipo), (role, None, tipo), (None, categoria, tipo), (None, None, tipo)):
+            minutos = self._rules.get(key)
+            if minutos is not None:
+                return timedelta(minutes=minutos)
+        s = get_settings()
+        return timedelta(minutes=s.sala_minutes) if tipo == "Sala" else timedelta(days=s.domicilio_days)
+
+
+POLICIES = PolicyCache()
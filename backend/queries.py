@@ -0,0 +1,362 @@
+"""Registro central de las sentencias SQL de la API.
+
+Cada sentencia tiene un nombre. Se ejecutan con prepare=True, de modo que
+psycopg la prepara una vez por conexión del pool y los requests siguientes
+reutilizan el plan. Los WHERE dinámicos (list_users, list_prestamos, ...)
+generan un conjunto finito de "formas": cada combinación de filtros se
+registra como una sentencia propia la primera vez que aparece.
+
+También se llevan estadísticas por sentencia (llamadas, tiempo total y
+máximo, errores), expuestas en /api/admin/query-stats, y el tiempo se suma
+al request o job en curso (db_ms en los registros, ver registro.py).
+"""
+import threading
+import time
+from datetime import datetime
+
+import psycopg
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import registro
+
+
+@dataclass
+class Query:
+    name: str
+    sql: str
+    # Parámetros de ejemplo para `python migrate.py explain`
+    example: Optional[Sequence[Any]] = None
+
+
+@dataclass
+class QueryStats:
+    calls: int = 0
+    errors: int = 0
+    total_s: float = 0.0
+    max_s: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, elapsed: float, ok: bool):
+        with self._lock:
+            self.calls += 1
+            self.total_s += elapsed
+            if elapsed > self.max_s:
+                self.max_s = elapsed
+            if not ok:
+                self.errors += 1
+
+
+class QueryRegistry:
+    def __init__(self):
+        self._queries: Dict[str, Query] = {}
+        self._stats: Dict[str, QueryStats] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, sql: str, example: Optional[Sequence[Any]] = None) -> Query:
+        with self._lock:
+            existing = self._queries.get(name)
+            if existing and existing.sql != sql:
+                raise ValueError(f"La sentencia '{name}' ya está registrada con otro SQL")
+            q = existing or Query(name, sql, example)
+            self._queries[name] = q
+            self._stats.setdefault(name, QueryStats())
+            return q
+
+    def get(self, name: str) -> Query:
+        return self._queries[name]
+
+    def fixed(self) -> List[Query]:
+        return list(self._queries.values())
+
+    def execute(self, cur, name: str, params: Optional[Sequence[Any]] = None):
+        q = self._queries[name]
+        return self._run(cur, q, params)
+
+    def execute_shape(self, cur, name: str, shape: Sequence[str], sql: str, params: Optional[Sequence[Any]] = None):
+        """Ejecuta un SQL generado dinámicamente, registrándolo bajo name[shape].
+
+        shape identifica la combinación de filtros/campos usada; dos llamadas
+        con la misma forma deben producir el mismo SQL.
+        """
+        full_name = f"{name}[{','.join(shape)}]"
+        q = self._queries.get(full_name)
+        if q is None or q.sql != sql:
+            q = self.register(full_name, sql)
+        return self._run(cur, q, params)
+
+    def _run(self, cur, q: Query, params):
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            if isinstance(cur, psycopg.ServerCursor):
+                # DECLARE de un cursor con nombre: no admite prepare
+                cur.execute(q.sql, params)
+            else:
+                cur.execute(q.sql, params, prepare=True)
+            ok = True
+            return cur
+        finally:
+            elapsed = time.perf_counter() - t0
+            self._stats[q.name].record(elapsed, ok)
+            registro.sumar_db(elapsed)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        out = []
+        for name, st in self._stats.items():
+            if not st.calls:
+                continue
+            out.append({
+                "name": name,
+                "calls": st.calls,
+                "errors": st.errors,
+                "total_ms": round(st.total_s * 1000, 3),
+                "avg_ms": round(st.total_s * 1000 / st.calls, 3),
+                "max_ms": round(st.max_s * 1000, 3),
+            })
+        out.sort(key=lambda r: r["total_ms"], reverse=True)
+        return out
+
+
+REGISTRY = QueryRegistry()
+register = REGISTRY.register
+execute = REGISTRY.execute
+execute_shape = REGISTRY.execute_shape
+
+# Módulos que registran sus propias sentencias al importarse
+MODULOS = (
+    "comprobantes", "estadisticas", "estados_ejemplar", "idempotencia", "inventario",
+    "matricula", "politicas", "recordatorios", "reservas", "sugerencias",
+)
+
+
+def cargar_todas() -> None:
+    """Importa MODULOS para que REGISTRY tenga todas las sentencias (fuera de la app: migrate explain)."""
+    import importlib
+
+    for nombre in MODULOS:
+        importlib.import_module(nombre)
+
+
+# -------------------------
+# Notificaciones
+# -------------------------
+
+register("overdue_select", """
+    SELECT p.prestamo_id, p.fecha_reserva, u.email, u.nombre, l.titulo
+    FROM public.prestamos p
+    JOIN public.users u ON p.user_fk = u.user_id
+    JOIN public.libros l ON p.libro_fk = l.id_libro
+    WHERE p.vencido = TRUE
+""", ())
+register("overdue_mark", """
+    UPDATE public.prestamos SET vencido = TRUE
+    WHERE prestamo_id = ANY(%s) AND fecha_reserva = ANY(%s)
+""", ([1], [datetime(2024, 1, 15)]))
+
+# -------------------------
+# Salud / login / usuarios
+# -------------------------
+
+register("health_ping", "SELECT 1")
+# La contraseña se compara en Python (claves.verificar): hash PBKDF2 o texto
+# plano en filas antiguas, que se rehashean en el primer login correcto.
+register(
+    "login",
+    "SELECT user_id, email, role, nombre, apellido1, apellido2, password, activo FROM public.users WHERE email = %s",
+    ("a@b.cl",),
+)
+register("user_password_update", "UPDATE public.users SET password = %s WHERE user_id = %s AND password = %s",
+         ("x", 1, "y"))
+register("user_exists", "SELECT user_id FROM public.users WHERE user_id = %s", (1,))
+register("user_role", "SELECT user_id, role, activo FROM public.users WHERE user_id = %s", (1,))
+# Identificación en mesón: usuario + préstamos activos + sanción vigente en
+# una sola ida a la base. Sirve para uno o varios RUT (arrays paralelos) y usa
+# el índice único idx_users_rut.
+register("users_by_rut", """
+    SELECT u.user_id, u.nombre, u.apellido1, u.apellido2, u.rut_numero, u.rut_dv,
+           u.email, u.role,
+           s.hasta AS sancion_hasta,
+           (s.hasta IS NOT NULL) AS bloqueado,
+           COALESCE(pa.prestamos, '[]'::json) AS prestamos_activos
+    FROM unnest(%s::bigint[], %s::text[]) AS r(numero, dv)
+    JOIN public.users u ON u.rut_numero = r.numero AND u.rut_dv = r.dv
+    LEFT JOIN LATERAL (
+        SELECT max(hasta) AS hasta
+        FROM public.sanciones
+        WHERE user_fk = u.user_id AND now() < hasta
+    ) s ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+                   'prestamo_id', p.prestamo_id,
+                   'id_ejemplar', p.ejemplar_fk,
+                   'id_libro', l.id_libro,
+                   'titulo', l.titulo,
+                   'tipo_prestamo', p.tipo_prestamo,
+                   'fecha_reserva', p.fecha_reserva,
+                   'fecha_vencimiento', p.fecha_vencimiento,
+                   'vencido', p.vencido
+               ) ORDER BY p.fecha_reserva DESC) AS prestamos
+        FROM public.prestamos p
+        JOIN public.libros l ON l.id_libro = p.libro_fk
+        WHERE p.user_fk = u.user_id AND p.fecha_devolucion IS NULL
+    ) pa ON TRUE
+""", ([12345678], ["5"]))
+register("user_insert", """
+    INSERT INTO public.users (nombre, apellido1, apellido2, rut_numero, rut_dv, email, password, role)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    RETURNING user_id, email, created_at
+""")
+
+# -------------------------
+# Libros / ejemplares
+# -------------------------
+
+register("libro_insert", """
+    INSERT INTO public.libros (titulo, autor, categoria, editorial, edicion, anio, ubicacion)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    RETURNING id_libro, titulo, autor, categoria, editorial, edicion, anio, ubicacion
+""")
+register("libro_delete", "DELETE FROM public.libros WHERE id_libro = %s RETURNING id_libro")
+register("ejemplar_insert", """
+    INSERT INTO public.ejemplares (id_libro, estado, ubicacion)
+    SELECT
+        l.id_libro,
+        'disponible' AS estado,
+        l.ubicacion   -- misma ubicación que el libro
+    FROM public.libros l
+    WHERE l.id_libro = %s
+    RETURNING id_ejemplar, id_libro, estado, ubicacion, created_at
+""")
+register("libro_inc_disponibles", """
+    UPDATE public.libros
+    SET ejemplares_disponibles = COALESCE(ejemplares_disponibles, 0) + 1
+    WHERE id_libro = %s
+""")
+register("ejemplar_get", """
+    SELECT id_ejemplar, id_libro, estado, ubicacion, created_at
+    FROM public.ejemplares
+    WHERE id_ejemplar = %s
+""", (1,))
+register("ejemplar_delete", """
+    WITH borrado AS (
+        DELETE FROM public.ejemplares WHERE id_ejemplar = %s
+        RETURNING id_ejemplar, id_libro, estado
+    ),
+    contador AS (
+        UPDATE public.libros l
+        SET ejemplares_disponibles = GREATEST(l.ejemplares_disponibles - 1, 0)
+        FROM borrado b
+        WHERE l.id_libro = b.id_libro AND b.estado = 'disponible'
+    )
+    SELECT id_ejemplar FROM borrado
+""")
+
+# -------------------------
+# Solicitudes
+# -------------------------
+
+register("solicitud_insert", """
+    INSERT INTO public.solicitudes (user_fk, estado, observaciones)
+    VALUES (%s, 'pending', %s)
+    RETURNING solicitud_id, created_at
+""")
+# Un solo INSERT por solicitud: el trigger de totales (migración 0010) se
+# ejecuta una vez por sentencia
+register("solicitud_detalle_insert", """
+    INSERT INTO public.solicitudes_detalle (solicitud_fk, id_libro, id_ejemplar, cantidad)
+    SELECT %s, i.id_libro, i.id_ejemplar, i.cantidad
+    FROM unnest(%s::int[], %s::int[], %s::int[]) AS i(id_libro, id_ejemplar, cantidad)
+""")
+register("solicitud_head", """
+    SELECT
+        s.solicitud_id, s.estado, s.created_at, s.observaciones,
+        s.asignado_fk, s.total_items, s.n_items, s.primer_titulo,
+        u.user_id, u.nombre, u.apellido1, u.apellido2, u.email
+    FROM public.solicitudes s
+    JOIN public.users u ON u.user_id = s.user_fk
+    WHERE s.solicitud_id = %s
+""", (1,))
+register("solicitud_items", """
+    SELECT id, id_libro, id_ejemplar, cantidad
+    FROM public.solicitudes_detalle
+    WHERE solicitud_fk = %s
+    ORDER BY id ASC
+""", (1,))
+register("solicitud_estado", "SELECT estado FROM public.solicitudes WHERE solicitud_id = %s", (1,))
+
+# -------------------------
+# Préstamos / devoluciones / sanciones
+# -------------------------
+
+register("sancion_activa", """
+    SELECT 1
+    FROM public.sanciones
+    WHERE user_fk = %s AND now() < hasta
+    LIMIT 1
+""", (1,))
+register("ejemplar_con_libro", """
+    SELECT e.id_ejemplar, e.id_libro, e.estado, l.titulo, l.autor, l.categoria
+    FROM public.ejemplares e
+    JOIN public.libros l ON l.id_libro = e.id_libro
+    WHERE e.id_ejemplar = %s
+""", (1,))
+register("prestamo_insert", """
+    INSERT INTO public.prestamos
+        (user_fk, ejemplar_fk, libro_fk, tipo_prestamo, fecha_reserva, fecha_vencimiento, vencido)
+    VALUES (%s, %s, %s, %s, %s, %s, FALSE)
+    RETURNING prestamo_id
+""")
+# prestamos está particionado por fecha_reserva (0006): las búsquedas por
+# prestamo_id o por ejemplar pasan primero por prestamos_clave (0015) para
+# que la consulta sobre prestamos lleve la fecha y quede en una partición.
+register("prestamo_clave", """
+    SELECT prestamo_id, fecha_reserva
+    FROM public.prestamos_clave
+    WHERE prestamo_id = %s
+""", (1,))
+register("prestamo_clave_ejemplar", """
+    SELECT prestamo_id, fecha_reserva
+    FROM public.prestamos_clave
+    WHERE ejemplar_fk = %s
+    ORDER BY prestamo_id DESC
+    LIMIT 1
+""", (1,))
+register("prestamo_claves", """
+    SELECT prestamo_id, fecha_reserva
+    FROM public.prestamos_clave
+    WHERE prestamo_id = ANY(%s)
+""", ([1],))
+register("comprobante", """
+    SELECT p.prestamo_id, p.tipo_prestamo, p.fecha_reserva, p.fecha_vencimiento, p.ejemplar_fk,
+           u.user_id, u.nombre, u.apellido1, u.apellido2, u.email, u.rut_numero, u.rut_dv,
+           l.id_libro, l.titulo, l.autor
+    FROM public.prestamos p
+    JOIN public.users u ON u.user_id = p.user_fk
+    JOIN public.libros l ON l.id_libro = p.libro_fk
+    WHERE p.prestamo_id = %s AND p.fecha_reserva = %s
+""", (1, datetime(2024, 1, 15)))
+register("devolucion_por_prestamo", """
+    SELECT p.prestamo_id, p.fecha_reserva, p.user_fk, p.ejemplar_fk,
+        p.fecha_vencimiento, p.fecha_devolucion
+    FROM public.prestamos p
+    WHERE p.prestamo_id = %s AND p.fecha_reserva = %s
+""", (1, datetime(2024, 1, 15)))
+register("prestamo_marcar_devuelto", """
+    UPDATE public.prestamos
+    SET fecha_devolucion = %s,
+        vencido = %s
+    WHERE prestamo_id = %s AND fecha_reserva = %s
+    RETURNING prestamo_id
+""", (datetime(2024, 2, 1), False, 1, datetime(2024, 1, 15)))
+register("sancion_insert", """
+    INSERT INTO public.sanciones (user_fk, motivo, desde, hasta)
+    VALUES (%s, %s, NOW(), %s)
+""")
+register("sancion_estado", """
+    SELECT hasta
+    FROM public.sanciones
+    WHERE user_fk = %s AND NOW() < hasta
+    ORDER BY hasta DESC
+    LIMIT 1
+""", (1,))
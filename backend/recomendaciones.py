@@ -0,0 +1,330 @@
+"""Recomendaciones "quienes pidieron este libro también pidieron".
+
+- Matriz usuario x libro X (scipy.sparse, binaria: el usuario pidió el libro
+  al menos una vez) desde prestamos, indexada directamente por user_id e
+  id_libro. La coocurrencia libro x libro es C = X.T @ X; su diagonal es el
+  número de lectores de cada libro. El puntaje es el coseno
+  C[i, j] / sqrt(lectores_i * lectores_j), así los libros más pedidos no
+  aparecen como vecinos de todo. Se descartan pares con menos de
+  RECOMENDACIONES_MIN_COOCURRENCIAS lectores en común.
+- Actualización incremental: los préstamos con prestamo_id mayor a la marca
+  forman D con los pares (usuario, libro) que no estaban en X, y
+  C += X.T @ D + D.T @ X + D.T @ D sin releer el historial. Solo se vuelve
+  a calcular el top-k de los libros nuevos en D y de sus vecinos. La marca
+  queda antes de los préstamos de los últimos GRACIA (como en
+  estadisticas.py): ese tramo se relee en la pasada siguiente, así un
+  préstamo que confirma tarde (id menor que otro ya visible) no se salta. Los
+  pares releídos ya están en X y no cuentan dos veces.
+- El top-k por libro se calcula por bloques de filas con lexsort (sin
+  bucles por libro) y se guarda en RECOMENDACIONES_DIR/relacionados.npz:
+  ids int32, puntajes float16 y un indptr por libro (~6 bytes por vecino).
+  X, C y la marca van en estado.npz para la siguiente actualización.
+- La API carga relacionados.npz en memoria (y lo recarga si cambia en
+  disco); /api/libros/<id>/relacionados es un searchsorted y un slice.
+
+Uso (desde backend/):
+    python recomendaciones.py construir      # desde cero
+    python recomendaciones.py actualizar     # préstamos nuevos desde la marca
+    python recomendaciones.py ver 123
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+import registro
+from db import connect
+from settings import get_settings
+
+log = registro.get("recomendaciones")
+
+ARCHIVO = "relacionados.npz"
+ESTADO = "estado.npz"
+BLOQUE_FILAS = 4096
+# Cada cuánto se revisa si relacionados.npz cambió en disco (otro proceso)
+REVISAR_S = 30.0
+# Tramo final que se relee en la pasada siguiente (transacciones sin confirmar)
+GRACIA = timedelta(minutes=5)
+
+
+def _pares(cur, desde_id: int) -> Tuple[np.ndarray, int]:
+    """Pares (user_fk, libro_fk) distintos de préstamos con prestamo_id > desde_id,
+    y la nueva marca: antes del primer préstamo reservado en los últimos GRACIA.
+    COPY en texto: más rápido que fetchall de tuplas."""
+    cur.execute(
+        "SELECT COALESCE(max(prestamo_id), 0), "
+        "(SELECT min(prestamo_id) - 1 FROM public.prestamos WHERE prestamo_id > %s AND fecha_reserva > %s) "
+        "FROM public.prestamos",
+        (desde_id, datetime.now() - GRACIA),
+    )
+    hasta_id, antes_gracia = cur.fetchone()
+    if hasta_id <= desde_id:
+        return np.empty((0, 2), dtype=np.int64), desde_id
+    buf = bytearray()
+    with cur.copy(
+        "COPY (SELECT DISTINCT user_fk, libro_fk FROM public.prestamos "
+        f"WHERE prestamo_id > {int(desde_id)} AND prestamo_id <= {int(hasta_id)} "
+        "AND libro_fk IS NOT NULL) TO STDOUT"
+    ) as cp:
+        for chunk in cp:
+            buf += chunk
+    pares = np.array(bytes(buf).split(), dtype=np.int64).reshape(-1, 2)
+    marca = hasta_id if antes_gracia is None else max(antes_gracia, desde_id)
+    return pares, marca
+
+
+def _binaria(pares: np.ndarray, forma: Tuple[int, int]) -> sp.csr_array:
+    datos = np.ones(len(pares), dtype=np.int32)
+    m = sp.csr_array((datos, (pares[:, 0], pares[:, 1])), shape=forma)
+    m.sum_duplicates()
+    m.data[:] = 1
+    return m
+
+
+def _redimensionar(m: sp.csr_array, forma: Tuple[int, int]) -> sp.csr_array:
+    if m.shape != forma:
+        m = m.copy()
+        m.resize(forma)
+    return m
+
+
+def _top_k(C: sp.csr_array, filas: np.ndarray, k: int, minimo: int) -> sp.csr_array:
+    """Top-k por coseno de las filas indicadas, como CSR (libro x libro) de puntajes."""
+    lectores = C.diagonal().astype(np.float64)
+    partes_f, partes_c, partes_p = [], [], []
+    for a in range(0, len(filas), BLOQUE_FILAS):
+        bloque = filas[a:a + BLOQUE_FILAS]
+        sub = C[bloque]
+        f = np.repeat(bloque, np.diff(sub.indptr))
+        c = sub.indices
+        co = sub.data
+        vale = (f != c) & (co >= minimo)
+        f, c, co = f[vale], c[vale], co[vale]
+        if not len(f):
+            continue
+        p = co / np.sqrt(lectores[f] * lectores[c])
+        # Por fila, puntaje descendente; a igual puntaje, el id menor
+        orden = np.lexsort((c, -p, f))
+        f, c, p = f[orden], c[orden], p[orden]
+        inicios = np.flatnonzero(np.r_[True, f[1:] != f[:-1]])
+        rango = np.arange(len(f)) - np.repeat(inicios, np.diff(np.r_[inicios, len(f)]))
+        queda = rango < k
+        partes_f.append(f[queda])
+        partes_c.append(c[queda])
+        partes_p.append(p[queda].astype(np.float32))
+    n = C.shape[0]
+    if not partes_f:
+        return sp.csr_array((n, n), dtype=np.float32)
+    return sp.csr_array(
+        (np.concatenate(partes_p), (np.concatenate(partes_f), np.concatenate(partes_c))), shape=(n, n)
+    )
+
+
+def _compactar(T: sp.csr_array) -> Dict[str, np.ndarray]:
+    """CSR de puntajes -> arrays de relacionados.npz (vecinos ordenados por puntaje)."""
+    T = T.tocsr()
+    T.eliminate_zeros()
+    cuenta = np.diff(T.indptr)
+    libros = np.flatnonzero(cuenta).astype(np.int32)
+    f = np.repeat(np.arange(T.shape[0]), cuenta)
+    orden = np.lexsort((T.indices, -T.data, f))
+    return {
+        "libros": libros,
+        "indptr": np.r_[0, np.cumsum(cuenta[libros])].astype(np.int32),
+        "vecinos": T.indices[orden].astype(np.int32),
+        "puntajes": T.data[orden].astype(np.float16),
+        "n": np.int64(T.shape[0]),
+        "generado": np.int64(time.time()),
+    }
+
+
+def _expandir(d: Dict[str, np.ndarray], n: int) -> sp.csr_array:
+    """Inversa de _compactar (para combinar con filas recalculadas)."""
+    cuenta = np.diff(d["indptr"])
+    f = np.repeat(d["libros"].astype(np.int64), cuenta)
+    return sp.csr_array((d["puntajes"].astype(np.float32), (f, d["vecinos"])), shape=(n, n))
+
+
+def _guardar(directorio: str, nombre: str, **arrays) -> str:
+    os.makedirs(directorio, exist_ok=True)
+    path = os.path.join(directorio, nombre)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+    return path
+
+
+def _guardar_estado(directorio: str, X: sp.csr_array, C: sp.csr_array, marca: int) -> None:
+    _guardar(
+        directorio, ESTADO,
+        x_indptr=X.indptr, x_indices=X.indices, x_forma=np.array(X.shape),
+        c_indptr=C.indptr, c_indices=C.indices, c_datos=C.data, c_forma=np.array(C.shape),
+        marca=np.int64(marca),
+    )
+
+
+def _cargar_estado(directorio: str) -> Optional[Tuple[sp.csr_array, sp.csr_array, int]]:
+    path = os.path.join(directorio, ESTADO)
+    if not os.path.isfile(path):
+        return None
+    with np.load(path) as e:
+        X = sp.csr_array((np.ones(len(e["x_indices"]), dtype=np.int32), e["x_indices"], e["x_indptr"]),
+                         shape=tuple(e["x_forma"]))
+        C = sp.csr_array((e["c_datos"], e["c_indices"], e["c_indptr"]), shape=tuple(e["c_forma"]))
+        return X, C, int(e["marca"])
+
+
+def construir(directorio: Optional[str] = None) -> Dict[str, Any]:
+    """Matriz y top-k desde todo el historial."""
+    s = get_settings()
+    directorio = directorio or s.recs_dir
+    t0 = time.perf_counter()
+    with connect() as conn, conn.cursor() as cur:
+        pares, marca = _pares(cur, 0)
+    forma = (int(pares[:, 0].max(initial=0)) + 1, int(pares[:, 1].max(initial=0)) + 1)
+    X = _binaria(pares, forma)
+    C = (X.T @ X).tocsr()
+    T = _top_k(C, np.arange(C.shape[0]), s.recs_top_k, s.recs_min_co)
+    _guardar(directorio, ARCHIVO, **_compactar(T))
+    _guardar_estado(directorio, X, C, marca)
+    resumen = {"pares": len(pares), "libros": C.shape[0], "coocurrencias": C.nnz,
+               "vecinos": T.nnz, "marca": marca, "segundos": round(time.perf_counter() - t0, 2)}
+    log.info("Recomendaciones construidas", extra={"datos": resumen})
+    return resumen
+
+
+def actualizar(directorio: Optional[str] = None) -> Dict[str, Any]:
+    """Aplica los préstamos nuevos desde la marca; sin estado previo, construye."""
+    s = get_settings()
+    directorio = directorio or s.recs_dir
+    estado = _cargar_estado(directorio)
+    relacionados = os.path.join(directorio, ARCHIVO)
+    if estado is None or not os.path.isfile(relacionados):
+        return construir(directorio)
+    X, C, marca = estado
+    t0 = time.perf_counter()
+    with connect() as conn, conn.cursor() as cur:
+        pares, nueva_marca = _pares(cur, marca)
+    if not len(pares):
+        return {"pares": 0, "marca": marca}
+
+    forma = (max(X.shape[0], int(pares[:, 0].max()) + 1), max(X.shape[1], int(pares[:, 1].max()) + 1))
+    X = _redimensionar(X, forma)
+    C = _redimensionar(C, (forma[1], forma[1]))
+    D = _binaria(pares, forma)
+    D = (D - D.multiply(X)).tocsr()  # solo pares que no estaban
+    D.eliminate_zeros()
+    cambiados = np.unique(D.indices)
+    if len(cambiados):
+        XtD = (X.T @ D).tocsr()
+        C = (C + XtD + XtD.T + D.T @ D).tocsr()
+        X = (X + D).tocsr()
+        # Filas a recalcular: los libros con lectores nuevos y todos sus vecinos
+        # (su puntaje depende de los lectores de ambos)
+        afectados = np.unique(np.r_[cambiados, C[cambiados].indices])
+        with np.load(relacionados) as d:
+            T = _expandir(dict(d), forma[1])
+        mascara = np.ones(forma[1], dtype=np.float32)
+        mascara[afectados] = 0
+        T = (sp.diags_array(mascara) @ T + _top_k(C, afectados, s.recs_top_k, s.recs_min_co)).tocsr()
+        _guardar(directorio, ARCHIVO, **_compactar(T))
+    else:
+        afectados = cambiados
+    _guardar_estado(directorio, X, C, nueva_marca)
+    resumen = {"pares": len(pares), "pares_nuevos": int(D.nnz), "libros_recalculados": len(afectados),
+               "marca": nueva_marca, "segundos": round(time.perf_counter() - t0, 2)}
+    log.info("Recomendaciones actualizadas", extra={"datos": resumen})
+    return resumen
+
+
+class Relacionados:
+    """relacionados.npz en memoria; se recarga si el archivo cambia."""
+
+    def __init__(self):
+        self._datos: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None
+        self._mtime: Optional[float] = None
+        self._revisado = 0.0
+        self.generado: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def _path(self) -> str:
+        return os.path.join(get_settings().recs_dir, ARCHIVO)
+
+    def cargar(self) -> bool:
+        path = self._path()
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return False
+        with np.load(path) as d:
+            datos = (d["libros"], d["indptr"], d["vecinos"], d["puntajes"].astype(np.float32))
+            generado = datetime.fromtimestamp(int(d["generado"]))
+        with self._lock:
+            self._datos, self._mtime, self.generado = datos, mtime, generado
+        return True
+
+    def _vigente(self) -> None:
+        ahora = time.monotonic()
+        if self._datos is not None and ahora - self._revisado < REVISAR_S:
+            return
+        self._revisado = ahora
+        try:
+            mtime = os.stat(self._path()).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            try:
+                self.cargar()
+            except Exception:
+                log.exception("No se pudo cargar %s", self._path())
+
+    def vecinos(self, id_libro: int, k: int) -> Optional[List[Tuple[int, float]]]:
+        """[(id_libro, puntaje)] de mayor a menor; None si no hay modelo."""
+        self._vigente()
+        datos = self._datos
+        if datos is None:
+            return None
+        libros, indptr, vecinos, puntajes = datos
+        i = int(np.searchsorted(libros, id_libro))
+        if i == len(libros) or libros[i] != id_libro:
+            return []
+        a = int(indptr[i])
+        b = min(int(indptr[i + 1]), a + k)
+        return list(zip(vecinos[a:b].tolist(), puntajes[a:b].tolist()))
+
+
+RELACIONADOS = Relacionados()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Recomendaciones por coocurrencia de préstamos")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("construir", help="Desde todo el historial")
+    sub.add_parser("actualizar", help="Solo los préstamos nuevos desde la última marca")
+    ver = sub.add_parser("ver", help="Vecinos de un libro")
+    ver.add_argument("id_libro", type=int)
+    ver.add_argument("-k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "construir":
+        print(construir())
+    elif args.cmd == "actualizar":
+        print(actualizar())
+    else:
+        vecinos = RELACIONADOS.vecinos(args.id_libro, args.k)
+        if vecinos is None:
+            print("No hay recomendaciones generadas: ejecute 'python recomendaciones.py construir'")
+            return 1
+        for id_libro, puntaje in vecinos:
+            print(f"{id_libro}\t{puntaje:.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
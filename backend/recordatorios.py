@@ -0,0 +1,370 @@
+"""Recordatorios antes del vencimiento de un préstamo ("vence en 15 minutos").
+
+- Avisos por tipo en minutos antes de fecha_vencimiento
+  (RECORDATORIO_SALA_MINUTOS, 15; RECORDATORIO_DOMICILIO_MINUTOS, 1440;
+  listas separadas por coma, vacía = sin aviso).
+- En vez de un job de APScheduler por préstamo (como _schedule_make_available),
+  los avisos se cargan desde la base por ventanas de RECORDATORIO_VENTANA_HORAS
+  en una rueda de tiempo jerárquica (Rueda): 60 ranuras de un minuto y 24 de
+  una hora. Cada ranura es un array de enteros de 8 bytes (prestamo_id y
+  minutos del aviso), sin objetos por préstamo.
+- tick(), una vez por minuto: avanza la rueda, carga la ventana siguiente y
+  los préstamos creados desde el tick anterior, y entrega los avisos que
+  tocan en lotes al canal (RECORDATORIO_CANAL: correo | registro, u otro
+  agregado con registrar_canal).
+- recordatorios_enviados (migración 0012) registra cada aviso entregado. Al
+  reiniciar la rueda se vuelve a llenar desde la base y sale solo lo
+  pendiente, incluidos los avisos que tocaban con el proceso detenido si el
+  préstamo aún no vence. El aviso se marca antes de enviarlo: un correo que
+  falla no se reintenta.
+- Una devolución no saca nada de la rueda: al disparar se descartan los
+  préstamos ya devueltos o vencidos.
+"""
+import threading
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from psycopg.rows import dict_row
+
+import queries
+import registro
+from db import get_connection
+from settings import get_settings
+
+log = registro.get("recordatorios")
+
+LOTE = 500
+# Los préstamos de los últimos minutos se vuelven a leer en cada tick: un
+# préstamo puede confirmarse después de su fecha_reserva
+MARGEN_NUEVOS = timedelta(minutes=2)
+RETENCION_DIAS = 30
+_BITS_AVISO = 20  # minutos de aviso < 2**20 (~2 años)
+_MASCARA_AVISO = (1 << _BITS_AVISO) - 1
+
+_FILTRO = """
+    WHERE p.fecha_devolucion IS NULL
+      AND p.fecha_vencimiento > %(ahora)s
+      AND NOT EXISTS (
+          SELECT 1 FROM public.recordatorios_enviados r
+          WHERE r.prestamo_fk = p.prestamo_id AND r.aviso_min = a.aviso_min
+      )
+"""
+queries.register("recordatorios_ventana", """
+    SELECT p.prestamo_id, a.aviso_min, p.fecha_vencimiento
+    FROM unnest(%(tipos)s::text[], %(avisos)s::int[]) AS a(tipo, aviso_min)
+    JOIN public.prestamos p
+      ON p.tipo_prestamo = a.tipo
+     AND p.fecha_vencimiento >= %(desde)s + make_interval(mins => a.aviso_min)
+     AND p.fecha_vencimiento < %(hasta)s + make_interval(mins => a.aviso_min)
+""" + _FILTRO, {"tipos": ["Sala"], "avisos": [15], "desde": datetime(2025, 1, 1),
+                "hasta": datetime(2025, 1, 1, 6), "ahora": datetime(2025, 1, 1)})
+queries.register("recordatorios_nuevos", """
+    SELECT p.prestamo_id, a.aviso_min, p.fecha_vencimiento
+    FROM unnest(%(tipos)s::text[], %(avisos)s::int[]) AS a(tipo, aviso_min)
+    JOIN public.prestamos p
+      ON p.tipo_prestamo = a.tipo
+     AND p.fecha_reserva >= %(reserva_desde)s
+     AND p.fecha_vencimiento < %(hasta)s + make_interval(mins => a.aviso_min)
+""" + _FILTRO, {"tipos": ["Sala"], "avisos": [15], "reserva_desde": datetime(2025, 1, 1),
+                "hasta": datetime(2025, 1, 1, 6), "ahora": datetime(2025, 1, 1)})
+# Marca y devuelve, en una sentencia, los avisos que todavía corresponde enviar
+queries.register("recordatorios_marcar", """
+    WITH candidatos AS (
+        SELECT p.prestamo_id, a.aviso_min, p.user_fk, p.libro_fk, p.tipo_prestamo, p.fecha_vencimiento
+        FROM unnest(%(prestamos)s::int[], %(avisos)s::int[]) AS a(prestamo_id, aviso_min)
+        JOIN public.prestamos p ON p.prestamo_id = a.prestamo_id
+        WHERE p.fecha_devolucion IS NULL AND p.fecha_vencimiento > %(ahora)s
+    ), marcados AS (
+        INSERT INTO public.recordatorios_enviados (prestamo_fk, aviso_min, enviado_en)
+        SELECT prestamo_id, aviso_min, %(ahora)s FROM candidatos
+        ON CONFLICT DO NOTHING
+        RETURNING prestamo_fk, aviso_min
+    )
+    SELECT c.prestamo_id, c.aviso_min, c.tipo_prestamo, c.fecha_vencimiento,
+           u.email, u.nombre, l.titulo
+    FROM marcados m
+    JOIN candidatos c ON c.prestamo_id = m.prestamo_fk AND c.aviso_min = m.aviso_min
+    JOIN public.users u ON u.user_id = c.user_fk
+    JOIN public.libros l ON l.id_libro = c.libro_fk
+""")
+queries.register("recordatorios_purgar",
+                 "DELETE FROM public.recordatorios_enviados WHERE enviado_en < %s")
+
+
+def _minuto(t: datetime) -> int:
+    return int(t.timestamp() // 60)
+
+
+def _clave(prestamo_id: int, aviso_min: int) -> int:
+    return (prestamo_id << _BITS_AVISO) | aviso_min
+
+
+# -------------------------
+# Rueda de tiempo
+# -------------------------
+
+class Rueda:
+    """Rueda jerárquica con resolución de un minuto.
+
+    Nivel 0: 60 ranuras de un minuto (la próxima hora). Nivel 1: 24 ranuras
+    de una hora; al empezar cada hora su ranura se reparte en el nivel 0.
+    Admite entradas hasta 24 horas adelante de `actual`; las que ya pasaron
+    salen en el próximo avanzar().
+    """
+
+    N0 = 60
+    N1 = 24
+
+    def __init__(self, minuto: int):
+        self.actual = minuto
+        self._n0 = [array("q") for _ in range(self.N0)]
+        self._n1 = [(array("q"), array("q")) for _ in range(self.N1)]
+        self._vencidas = array("q")
+        self.total = 0
+
+    def agregar(self, clave: int, minuto: int) -> None:
+        if minuto <= self.actual:
+            self._vencidas.append(clave)
+        elif minuto - self.actual < self.N0:
+            self._n0[minuto % self.N0].append(clave)
+        elif minuto // self.N0 - self.actual // self.N0 <= self.N1:
+            claves, minutos = self._n1[(minuto // self.N0) % self.N1]
+            claves.append(clave)
+            minutos.append(minuto)
+        else:
+            raise ValueError(f"Minuto {minuto} fuera del alcance de la rueda (actual {self.actual})")
+        self.total += 1
+
+    def avanzar(self, minuto: int) -> array:
+        """Mueve la rueda hasta `minuto` y devuelve las claves que vencieron."""
+        salida, self._vencidas = self._vencidas, array("q")
+        while self.actual < minuto:
+            self.actual += 1
+            if self.actual % self.N0 == 0:
+                hora = (self.actual // self.N0) % self.N1
+                claves, minutos = self._n1[hora]
+                self._n1[hora] = (array("q"), array("q"))
+                for clave, m in zip(claves, minutos):
+                    self._n0[m % self.N0].append(clave)
+            ranura = self.actual % self.N0
+            if self._n0[ranura]:
+                salida.extend(self._n0[ranura])
+                self._n0[ranura] = array("q")
+        self.total -= len(salida)
+        return salida
+
+    def describe(self) -> Dict[str, int]:
+        n0 = sum(len(r) for r in self._n0)
+        n1 = sum(len(c) for c, _ in self._n1)
+        return {
+            "actual": self.actual,
+            "nivel0": n0,
+            "nivel1": n1,
+            "bytes": (n0 + len(self._vencidas)) * 8 + n1 * 16,
+        }
+
+
+# -------------------------
+# Canales
+# -------------------------
+
+@dataclass(frozen=True)
+class Aviso:
+    prestamo_id: int
+    aviso_min: int
+    tipo: str
+    fecha_vencimiento: datetime
+    email: Optional[str]
+    nombre: str
+    titulo: str
+
+    def plazo(self, ahora: Optional[datetime] = None) -> str:
+        """'15 minutos', '3 horas', '1 día' hasta el vencimiento."""
+        minutos = max(1, round((self.fecha_vencimiento - (ahora or datetime.now())).total_seconds() / 60))
+        if minutos < 120:
+            n, unidad = minutos, "minuto"
+        elif minutos < 48 * 60:
+            n, unidad = round(minutos / 60), "hora"
+        else:
+            n, unidad = round(minutos / 1440), "día"
+        return f"{n} {unidad}{'' if n == 1 else 's'}"
+
+
+class Canal:
+    """Entrega un lote de avisos. Devuelve (enviados, fallidos)."""
+
+    def enviar(self, avisos: Sequence[Aviso]) -> Tuple[int, int]:
+        raise NotImplementedError
+
+
+class CanalRegistro(Canal):
+    """Solo registra los avisos (desarrollo, o sin servidor de correo)."""
+
+    def enviar(self, avisos: Sequence[Aviso]) -> Tuple[int, int]:
+        for a in avisos:
+            log.info("Recordatorio", extra={"datos": {
+                "prestamo_id": a.prestamo_id, "email": a.email, "vence_en": a.plazo()}})
+        return len(avisos), 0
+
+
+class CanalCorreo(Canal):
+    """Un correo por aviso, reutilizando una conexión SMTP por lote.
+    Necesita contexto de aplicación (flask_mailman)."""
+
+    def __init__(self, mail):
+        self.mail = mail
+
+    def enviar(self, avisos: Sequence[Aviso]) -> Tuple[int, int]:
+        from flask_mailman import EmailMessage
+
+        enviados = fallidos = 0
+        log_correo = registro.limitar("correo", get_settings().log_email_per_min)
+        with self.mail.get_connection() as smtp:
+            for a in avisos:
+                if not a.email:
+                    fallidos += 1
+                    continue
+                plazo = a.plazo()
+                body = f"""
+Hola {a.nombre},
+
+Tu préstamo del libro "{a.titulo}" vence en {plazo} ({a.fecha_vencimiento:%d-%m-%Y %H:%M}).
+Recuerda devolverlo a tiempo para evitar sanciones.
+
+Saludos,
+Sistema de Biblioteca
+"""
+                try:
+                    EmailMessage(f"Tu préstamo vence en {plazo}", body, to=[a.email], connection=smtp).send()
+                    enviados += 1
+                except Exception as e:
+                    log_correo.warning("Error al enviar recordatorio", extra={"datos": {
+                        "email": a.email, "prestamo_id": a.prestamo_id, "error": str(e)}})
+                    fallidos += 1
+        return enviados, fallidos
+
+
+CANALES: Dict[str, Callable[[], Canal]] = {"registro": CanalRegistro}
+
+
+def registrar_canal(nombre: str, fabrica: Callable[[], Canal]) -> None:
+    CANALES[nombre] = fabrica
+
+
+# -------------------------
+# Motor
+# -------------------------
+
+class Recordatorios:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rueda: Optional[Rueda] = None
+        self._cargado_hasta: Optional[datetime] = None
+        self._nuevos_desde: Optional[datetime] = None
+        self.enviados = 0
+        self.fallidos = 0
+
+    @staticmethod
+    def _avisos() -> Tuple[List[str], List[int]]:
+        s = get_settings()
+        pares = [("Sala", m) for m in s.remind_sala_minutes] + [("Domicilio", m) for m in s.remind_domicilio_minutes]
+        return [t for t, _ in pares], [m for _, m in pares]
+
+    def _agregar(self, filas) -> int:
+        for prestamo_id, aviso_min, vence in filas:
+            self._rueda.agregar(_clave(prestamo_id, aviso_min), _minuto(vence - timedelta(minutes=aviso_min)))
+        return len(filas)
+
+    def _cargar(self, ahora: datetime, tipos: List[str], avisos: List[int]) -> Dict[str, int]:
+        """Llena la rueda: ventana inicial o siguiente, y préstamos nuevos."""
+        ventana = timedelta(hours=get_settings().remind_window_hours)
+        base = {"tipos": tipos, "avisos": avisos, "ahora": ahora}
+        cargados = {"ventana": 0, "nuevos": 0}
+        with get_connection() as conn, conn.cursor() as cur:
+            if self._cargado_hasta is None:
+                # Desde el aviso más anticipado de un préstamo que aún no vence
+                desde = ahora - timedelta(minutes=max(avisos))
+            elif ahora + ventana - self._cargado_hasta >= timedelta(hours=1):
+                desde = self._cargado_hasta
+            else:
+                desde = None
+            if desde is not None:
+                hasta = ahora + ventana
+                queries.execute(cur, "recordatorios_ventana", {**base, "desde": desde, "hasta": hasta})
+                cargados["ventana"] = self._agregar(cur.fetchall())
+                if self._cargado_hasta is not None:
+                    queries.execute(cur, "recordatorios_purgar", (ahora - timedelta(days=RETENCION_DIAS),))
+                self._cargado_hasta = hasta
+            if self._nuevos_desde is not None:
+                queries.execute(cur, "recordatorios_nuevos",
+                                {**base, "reserva_desde": self._nuevos_desde, "hasta": self._cargado_hasta})
+                cargados["nuevos"] = self._agregar(cur.fetchall())
+            self._nuevos_desde = ahora - MARGEN_NUEVOS
+            conn.commit()
+        return cargados
+
+    def _disparar(self, claves: Sequence[int], ahora: datetime, job=None) -> Tuple[int, int]:
+        pares = sorted({(c >> _BITS_AVISO, c & _MASCARA_AVISO) for c in claves})
+        if job is not None:
+            job.set_total(len(pares))
+        nombre = get_settings().remind_channel
+        fabrica = CANALES.get(nombre)
+        if fabrica is None:
+            log.error("Canal de recordatorios desconocido: %s", nombre)
+            return 0, len(pares)
+        canal = fabrica()
+        enviados = fallidos = 0
+        for i in range(0, len(pares), LOTE):
+            lote = pares[i:i + LOTE]
+            with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+                queries.execute(cur, "recordatorios_marcar", {
+                    "prestamos": [p for p, _ in lote], "avisos": [a for _, a in lote], "ahora": ahora,
+                })
+                filas = cur.fetchall()
+                conn.commit()
+            avisos = [Aviso(f["prestamo_id"], f["aviso_min"], f["tipo_prestamo"], f["fecha_vencimiento"],
+                            f["email"], f["nombre"], f["titulo"]) for f in filas]
+            ok, error = canal.enviar(avisos) if avisos else (0, 0)
+            enviados += ok
+            fallidos += error
+            if job is not None:
+                # Los descartados (devueltos, ya enviados) cuentan como procesados
+                job.add(sent=len(lote) - error, failed=error)
+        return enviados, fallidos
+
+    def tick(self, ahora: Optional[datetime] = None, job=None) -> Dict[str, Any]:
+        """Avanza la rueda hasta ahora y envía lo que corresponde."""
+        ahora = ahora or datetime.now()
+        tipos, avisos = self._avisos()
+        if not avisos:
+            return {"vencidos": 0, "enviados": 0, "fallidos": 0}
+        with self._lock:
+            minuto = _minuto(ahora)
+            if self._rueda is None:
+                self._rueda = Rueda(minuto)
+            vencidas = self._rueda.avanzar(minuto)
+            cargados = self._cargar(ahora, tipos, avisos)
+            vencidas.extend(self._rueda.avanzar(minuto))
+            enviados, fallidos = self._disparar(vencidas, ahora, job) if vencidas else (0, 0)
+            self.enviados += enviados
+            self.fallidos += fallidos
+        resumen = {"vencidos": len(vencidas), "enviados": enviados, "fallidos": fallidos, **cargados}
+        if vencidas or cargados["ventana"]:
+            log.info("Recordatorios", extra={"datos": resumen})
+        return resumen
+
+    def estado(self) -> Dict[str, Any]:
+        rueda = self._rueda
+        return {
+            "activo": rueda is not None,
+            "rueda": rueda.describe() if rueda else None,
+            "pendientes": rueda.total if rueda else 0,
+            "cargado_hasta": self._cargado_hasta.isoformat() if self._cargado_hasta else None,
+            "enviados": self.enviados,
+            "fallidos": self.fallidos,
+        }
+
+
+MOTOR = Recordatorios()
@@ -0,0 +1,252 @@
+"""Registro estructurado (JSON por línea) sin E/S en los hilos de la API.
+
+- Los módulos usan logging.getLogger("sisbib.<modulo>").
+- configurar() instala un QueueHandler en el logger "sisbib": el hilo que
+  registra solo encola el registro (si la cola está llena se descarta y se
+  cuenta, nunca se bloquea). Un QueueListener escribe a stdout en su hilo.
+- Cada línea lleva el contexto del hilo que la emitió: request_id, ruta,
+  job_id y el tiempo acumulado en la base (db_ms, db_n) del request o job.
+- init_logging(app) asigna el request_id (o respeta X-Request-ID), lo
+  devuelve en la respuesta y registra una línea de acceso por request.
+- LimiteFrecuencia deja pasar N registros por ventana y mensaje; el resto se
+  cuenta y se informa como "suprimidos" en el siguiente que pase.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+RAIZ = "sisbib"
+NIVELES = ("DEBUG", "INFO", "WARNING", "ERROR")
+MAX_COLA = 10_000
+
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+ruta: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("ruta", default=None)
+job_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("job_id", default=None)
+# [segundos, sentencias] acumulados en el request/job actual
+_db: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar("db", default=None)
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+log = logging.getLogger(f"{RAIZ}.http")
+
+
+def get(nombre: str) -> logging.Logger:
+    return logging.getLogger(f"{RAIZ}.{nombre}")
+
+
+def sumar_db(segundos: float) -> None:
+    """Llamado por queries.py después de cada sentencia."""
+    acc = _db.get()
+    if acc is not None:
+        acc[0] += segundos
+        acc[1] += 1
+
+
+def _contexto() -> Dict[str, Any]:
+    ctx: Dict[str, Any] = {}
+    for clave, var in (("request_id", request_id), ("ruta", ruta), ("job_id", job_id)):
+        valor = var.get()
+        if valor is not None:
+            ctx[clave] = valor
+    acc = _db.get()
+    if acc is not None:
+        ctx["db_ms"] = round(acc[0] * 1000, 3)
+        ctx["db_n"] = int(acc[1])
+    return ctx
+
+
+class contexto_job:
+    """with contexto_job(job.job_id): ... — contexto de una tarea en segundo plano."""
+
+    def __init__(self, id_job: str):
+        self.id_job = id_job
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens = [(job_id, job_id.set(self.id_job)), (_db, _db.set([0.0, 0]))]
+        return self
+
+    def __exit__(self, *exc):
+        for var, token in reversed(self._tokens):
+            var.reset(token)
+        return False
+
+
+# -------------------------
+# Handlers y formato
+# -------------------------
+
+class _ColaHandler(logging.handlers.QueueHandler):
+    """Captura mensaje, excepción y contexto en el hilo emisor; nunca bloquea."""
+
+    descartados = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        record.contexto = _contexto()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _ColaHandler.descartados += 1
+
+
+class FormatoJSON(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        data.update(getattr(record, "contexto", None) or {})
+        datos = getattr(record, "datos", None)
+        if datos:
+            data.update(datos)
+        suprimidos = getattr(record, "suprimidos", 0)
+        if suprimidos:
+            data["suprimidos"] = suprimidos
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class FormatoTexto(logging.Formatter):
+    """Para la consola en desarrollo y los CLI (LOG_JSON=false)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        linea = f"{datetime.fromtimestamp(record.created):%H:%M:%S} {record.levelname:<7} {record.name} {record.getMessage()}"
+        extra = {**(getattr(record, "contexto", None) or {}), **(getattr(record, "datos", None) or {})}
+        if getattr(record, "suprimidos", 0):
+            extra["suprimidos"] = record.suprimidos
+        if extra:
+            linea += " " + " ".join(f"{k}={v}" for k, v in extra.items())
+        if record.exc_text:
+            linea += "\n" + record.exc_text
+        return linea
+
+
+class LimiteFrecuencia(logging.Filter):
+    """Máximo `por_ventana` registros por mensaje (plantilla) cada `ventana_s` segundos."""
+
+    def __init__(self, por_ventana: int, ventana_s: float = 60.0):
+        super().__init__()
+        self.por_ventana = por_ventana
+        self.ventana_s = ventana_s
+        self._estado: Dict[str, List[float]] = {}   # msg -> [inicio, emitidos, suprimidos]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.por_ventana <= 0:
+            return True
+        ahora = time.monotonic()
+        with self._lock:
+            est = self._estado.setdefault(str(record.msg), [ahora, 0, 0])
+            if ahora - est[0] >= self.ventana_s:
+                est[0], est[1] = ahora, 0
+            if est[1] >= self.por_ventana:
+                est[2] += 1
+                return False
+            est[1] += 1
+            record.suprimidos, est[2] = int(est[2]), 0
+            return True
+
+
+# -------------------------
+# Configuración
+# -------------------------
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_conf_lock = threading.Lock()
+
+
+def configurar(nivel: str = "INFO", formato_json: bool = True) -> None:
+    """Instala la cola y el hilo escritor (una vez por proceso); luego solo ajusta el nivel."""
+    global _listener
+    raiz = logging.getLogger(RAIZ)
+    raiz.setLevel(nivel)
+    with _conf_lock:
+        if _listener is not None:
+            return
+        salida = logging.StreamHandler()
+        salida.setFormatter(FormatoJSON() if formato_json else FormatoTexto())
+        cola: "queue.Queue[logging.LogRecord]" = queue.Queue(MAX_COLA)
+        raiz.addHandler(_ColaHandler(cola))
+        raiz.propagate = False
+        _listener = logging.handlers.QueueListener(cola, salida, respect_handler_level=False)
+        _listener.start()
+        atexit.register(detener)
+
+
+def detener() -> None:
+    """Vacía la cola y detiene el hilo escritor."""
+    global _listener
+    if _ColaHandler.descartados:
+        # Antes de detener: sale por la misma cola y el stop() la vacía
+        get("registro").warning("%d registro(s) descartados por cola llena", _ColaHandler.descartados)
+    with _conf_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def limitar(nombre: str, por_minuto: int) -> logging.Logger:
+    """Logger con LimiteFrecuencia (p. ej. una línea por correo enviado)."""
+    logger = get(nombre)
+    for f in list(logger.filters):
+        if isinstance(f, LimiteFrecuencia):
+            logger.removeFilter(f)
+    logger.addFilter(LimiteFrecuencia(por_minuto))
+    return logger
+
+
+def init_logging(app) -> None:
+    """request_id, ruta y tiempo en base por request, más una línea de acceso."""
+    from flask import g, request
+
+    @app.before_request
+    def _abrir_contexto():
+        entrante = request.headers.get("X-Request-ID", "")
+        rid = entrante if _REQUEST_ID_RE.match(entrante) else uuid.uuid4().hex
+        g._log_inicio = time.perf_counter()
+        g._log_tokens = [
+            (request_id, request_id.set(rid)),
+            (ruta, ruta.set(request.url_rule.rule if request.url_rule else request.path)),
+            (_db, _db.set([0.0, 0])),
+        ]
+
+    @app.after_request
+    def _registrar_acceso(response):
+        rid = request_id.get()
+        if rid:
+            response.headers["X-Request-ID"] = rid
+        inicio = g.get("_log_inicio")
+        if inicio is not None:
+            nivel = logging.ERROR if response.status_code >= 500 else logging.INFO
+            log.log(nivel, "%s %s %s", request.method, request.path, response.status_code, extra={"datos": {
+                "metodo": request.method,
+                "estado": response.status_code,
+                "dur_ms": round((time.perf_counter() - inicio) * 1000, 3),
+            }})
+        return response
+
+    @app.teardown_request
+    def _cerrar_contexto(exc):
+        for var, token in reversed(g.pop("_log_tokens", [])):
+            var.reset(token)
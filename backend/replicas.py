@@ -0,0 +1,173 @@
+"""Enrutamiento de lecturas hacia réplicas de PostgreSQL.
+
+- Los requests GET/HEAD se marcan como "solo lectura" y db.get_connection
+  les entrega una conexión de una réplica sana (round-robin).
+- Lectura de las propias escrituras: tras un request de escritura exitoso,
+  la respuesta lleva la cookie sisbib_primario (y el header X-Sisbib-Pin)
+  con el instante, en segundos epoch, hasta el que ese cliente lee del
+  primario (DB_REPLICA_PIN_SECONDS). El pin viaja con el cliente, así vale
+  en cualquier worker o instancia. Un valor más allá de ahora +
+  DB_REPLICA_PIN_SECONDS se ignora.
+- Un hilo de fondo sondea cada réplica cada DB_REPLICA_CHECK_SECONDS (el
+  request nunca espera el sondeo); si su retraso supera
+  DB_REPLICA_MAX_LAG_SECONDS o falla la conexión, se usa el primario.
+"""
+import contextvars
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional
+
+from flask import g, request
+from psycopg_pool import ConnectionPool
+
+import registro
+
+log = registro.get("replicas")
+
+# True mientras se atiende un request que puede ir a réplica
+read_only_intent: contextvars.ContextVar[bool] = contextvars.ContextVar("read_only_intent", default=False)
+
+_READ_METHODS = ("GET", "HEAD")
+PIN_COOKIE = "sisbib_primario"
+PIN_HEADER = "X-Sisbib-Pin"
+
+_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class Replica:
+    def __init__(self, name: str, conninfo: str, pool_max: int, timeout: float):
+        self.name = name
+        self.pool = ConnectionPool(
+            conninfo, min_size=0, max_size=pool_max, timeout=timeout, name=f"sisbib-{name}", open=True
+        )
+        self.lag_s: Optional[float] = None
+        self.healthy = False  # hasta el primer sondeo
+        self.checked_at = 0.0
+        self.last_error: Optional[str] = None
+
+    def mark_down(self, error: Exception):
+        self.healthy = False
+        self.last_error = str(error)
+        self.checked_at = time.monotonic()
+
+    def describe(self) -> Dict[str, object]:
+        return {"name": self.name, "healthy": self.healthy, "lag_s": self.lag_s, "error": self.last_error}
+
+
+class ReplicaRouter:
+    def __init__(self, conninfos: List[str], pool_max: int, timeout: float, max_lag_s: float,
+                 check_interval_s: float, pin_s: float):
+        self.replicas = [Replica(f"replica{i}", ci, pool_max, timeout) for i, ci in enumerate(conninfos)]
+        self.max_lag_s = max_lag_s
+        self.check_interval_s = check_interval_s
+        self.pin_s = pin_s
+        self._rr = itertools.count()
+        self._detener = threading.Event()
+        self._sondeo = threading.Thread(target=self._sondear, name="sisbib-replicas", daemon=True)
+        self._sondeo.start()
+
+    # --- salud / retraso ---
+
+    def _refresh(self, replica: Replica):
+        try:
+            with replica.pool.connection() as conn:
+                lag = conn.execute(_LAG_SQL).fetchone()[0]
+            replica.lag_s = float(lag)
+            replica.healthy = replica.lag_s <= self.max_lag_s
+            replica.last_error = None if replica.healthy else f"retraso {replica.lag_s:.1f}s"
+        except Exception as e:
+            replica.mark_down(e)
+        replica.checked_at = time.monotonic()
+
+    def _sondear(self):
+        """Hilo de fondo: sondea todas las réplicas cada check_interval_s."""
+        while not self._detener.is_set():
+            for r in self.replicas:
+                try:
+                    self._refresh(r)
+                except Exception:
+                    log.exception("Sondeo de %s", r.name)
+            self._detener.wait(self.check_interval_s)
+
+    def pick(self) -> Optional[Replica]:
+        if not self.replicas:
+            return None
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._rr) % len(healthy)]
+
+    # --- ventana fijada al primario (el instante viaja con el cliente) ---
+
+    def pin_hasta(self) -> float:
+        return time.time() + self.pin_s
+
+    def is_pinned(self, hasta: Optional[str]) -> bool:
+        try:
+            until = float(hasta or 0)
+        except ValueError:
+            return False
+        now = time.time()
+        # +1 s por redondeo y desfase de reloj entre instancias
+        return now < until <= now + self.pin_s + 1
+
+    def close(self):
+        self._detener.set()
+        for r in self.replicas:
+            r.pool.close()
+
+
+ROUTER: Optional[ReplicaRouter] = None
+
+
+def configure(cfg) -> Optional[ReplicaRouter]:
+    """Crea el router a partir de DBConfig (sin réplicas configuradas no hace nada)."""
+    global ROUTER
+    if ROUTER is not None:
+        ROUTER.close()
+        ROUTER = None
+    if cfg.replicas:
+        ROUTER = ReplicaRouter(
+            cfg.replicas, cfg.pool_max, cfg.replica_timeout, cfg.replica_max_lag_s,
+            cfg.replica_check_s, cfg.replica_pin_s,
+        )
+    return ROUTER
+
+
+def _pin_del_request() -> Optional[str]:
+    return request.headers.get(PIN_HEADER) or request.cookies.get(PIN_COOKIE)
+
+
+def init_replica_routing(app) -> None:
+    """Marca los GET/HEAD como lecturas enrutables y fija al primario a quien escribe."""
+
+    @app.before_request
+    def _route_reads():
+        use_replica = (
+            ROUTER is not None
+            and request.method in _READ_METHODS
+            and not ROUTER.is_pinned(_pin_del_request())
+        )
+        g._read_only_token = read_only_intent.set(use_replica)
+
+    @app.after_request
+    def _pin_writers(response):
+        if ROUTER is not None and request.method not in _READ_METHODS and response.status_code < 400:
+            hasta = f"{ROUTER.pin_hasta():.3f}"
+            response.headers[PIN_HEADER] = hasta
+            response.set_cookie(PIN_COOKIE, hasta, max_age=max(1, int(ROUTER.pin_s) + 1),
+                                httponly=True, samesite="Lax")
+        return response
+
+    @app.teardown_request
+    def _reset_route(exc):
+        token = g.pop("_read_only_token", None)
+        if token is not None:
+            read_only_intent.reset(token)
@@ -0,0 +1,266 @@
+"""Reservas (cola de espera) para libros sin ejemplares disponibles.
+
+- crear(): agrega al usuario al final de la cola del libro.
+- liberar_ejemplar(): punto único por donde vuelve un ejemplar al estante
+  (devolución, fin de reposición, reserva expirada o cancelada). Si hay
+  reservas en espera, asigna el ejemplar a la más antigua y lo deja
+  'reservado' por RESERVA_HORAS; si no, queda 'disponible'. Corre dentro de
+  la transacción del llamador.
+- expirar() / cancelar(): cierran la reserva y liberan su ejemplar solo si
+  sigue 'reservado' y sin otra reserva asignada; si alguien ya lo movió
+  (préstamo, reparación) solo se cierra la reserva.
+- cambiar_estado(): cambios manuales (PUT, transición masiva). Un ejemplar
+  'reservado' que se mueve a mano devuelve su reserva a la cola (conserva el
+  turno); los que quedan 'disponible' pasan por liberar_ejemplar().
+- La posición en la cola es un conteo sobre el índice parcial
+  (id_libro, reserva_id) WHERE estado = 'en_espera'.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import psycopg
+from psycopg.rows import dict_row
+
+import estados_ejemplar
+import queries
+import registro
+from db import get_connection
+from settings import get_settings
+
+log = registro.get("reservas")
+
+
+class ReservaError(Exception):
+    """Reserva no permitida (libro con ejemplares disponibles, duplicada, etc.)."""
+
+
+queries.register("reserva_insert", """
+    INSERT INTO public.reservas (user_fk, id_libro)
+    SELECT %(user)s, l.id_libro
+    FROM public.libros l
+    WHERE l.id_libro = %(libro)s
+      AND NOT EXISTS (
+          SELECT 1 FROM public.ejemplares e
+          WHERE e.id_libro = l.id_libro AND e.estado = 'disponible'
+      )
+    RETURNING reserva_id, user_fk, id_libro, estado, creada_en
+""")
+queries.register("reserva_asignar_siguiente", """
+    WITH siguiente AS (
+        SELECT r.reserva_id
+        FROM public.reservas r
+        WHERE r.id_libro = (SELECT id_libro FROM public.ejemplares WHERE id_ejemplar = %(ejemplar)s)
+          AND r.estado = 'en_espera'
+        ORDER BY r.reserva_id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE public.reservas r
+    SET estado = 'asignada', id_ejemplar = %(ejemplar)s, asignada_en = %(ahora)s, expira_en = %(expira)s
+    FROM siguiente
+    WHERE r.reserva_id = siguiente.reserva_id
+    RETURNING r.reserva_id, r.user_fk, r.id_libro, r.id_ejemplar, r.expira_en
+""")
+queries.register("reserva_de_ejemplar", """
+    SELECT reserva_id, user_fk
+    FROM public.reservas
+    WHERE id_ejemplar = %s AND estado = 'asignada'
+    FOR UPDATE
+""", (1,))
+queries.register("reserva_ejemplar_retenido", """
+    SELECT e.id_ejemplar
+    FROM public.ejemplares e
+    WHERE e.id_ejemplar = %s AND e.estado = 'reservado'
+      AND NOT EXISTS (
+          SELECT 1 FROM public.reservas r WHERE r.id_ejemplar = e.id_ejemplar AND r.estado = 'asignada'
+      )
+    FOR UPDATE
+""", (1,))
+queries.register("reservas_reencolar", """
+    UPDATE public.reservas
+    SET estado = 'en_espera', id_ejemplar = NULL, asignada_en = NULL, expira_en = NULL
+    WHERE estado = 'asignada' AND id_ejemplar = ANY(%s::int[])
+    RETURNING reserva_id, id_ejemplar
+""")
+queries.register("reservas_libros_en_espera", """
+    SELECT DISTINCT id_libro FROM public.reservas
+    WHERE estado = 'en_espera' AND id_libro = ANY(%s::int[])
+""")
+queries.register("reserva_retirar", """
+    UPDATE public.reservas
+    SET estado = 'retirada', cerrada_en = %s
+    WHERE reserva_id = %s AND estado = 'asignada'
+""")
+queries.register("reserva_cancelar", """
+    UPDATE public.reservas
+    SET estado = 'cancelada', cerrada_en = %s
+    WHERE reserva_id = %s AND user_fk = %s AND estado IN ('en_espera', 'asignada')
+    RETURNING reserva_id, estado, id_ejemplar
+""")
+queries.register("reservas_expirar", """
+    UPDATE public.reservas
+    SET estado = 'expirada', cerrada_en = %(ahora)s
+    WHERE reserva_id IN (
+        SELECT reserva_id FROM public.reservas
+        WHERE estado = 'asignada' AND expira_en < %(ahora)s
+        ORDER BY expira_en
+        LIMIT %(lote)s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING reserva_id, id_ejemplar
+""")
+queries.register("reservas_usuario", """
+    SELECT r.reserva_id, r.id_libro, l.titulo, l.autor, r.estado, r.id_ejemplar,
+           r.creada_en, r.expira_en,
+           CASE WHEN r.estado = 'en_espera' THEN (
+               SELECT count(*) FROM public.reservas q
+               WHERE q.id_libro = r.id_libro AND q.estado = 'en_espera' AND q.reserva_id <= r.reserva_id
+           ) END AS posicion
+    FROM public.reservas r
+    JOIN public.libros l ON l.id_libro = r.id_libro
+    WHERE r.user_fk = %s AND r.estado IN ('en_espera', 'asignada')
+    ORDER BY r.reserva_id
+""", (1,))
+queries.register("reservas_libro", """
+    SELECT r.reserva_id, r.user_fk, u.nombre, u.apellido1, u.email, r.estado,
+           r.id_ejemplar, r.creada_en, r.expira_en
+    FROM public.reservas r
+    JOIN public.users u ON u.user_id = r.user_fk
+    WHERE r.id_libro = %s AND r.estado IN ('en_espera', 'asignada')
+    ORDER BY r.estado = 'asignada' DESC, r.reserva_id
+""", (1,))
+
+
+def crear(user_id: int, id_libro: int) -> Dict[str, Any]:
+    with get_connection(read_only=False) as conn, conn.cursor(row_factory=dict_row) as cur:
+        try:
+            queries.execute(cur, "reserva_insert", {"user": user_id, "libro": id_libro})
+        except psycopg.errors.UniqueViolation:
+            raise ReservaError("Ya tiene una reserva activa para este libro")
+        except psycopg.errors.ForeignKeyViolation:
+            raise ReservaError("Usuario no existe")
+        row = cur.fetchone()
+        if not row:
+            raise ReservaError("Libro inexistente o con ejemplares disponibles: puede pedirlo en préstamo")
+        conn.commit()
+    row["posicion"] = next(
+        (r["posicion"] for r in de_usuario(user_id) if r["reserva_id"] == row["reserva_id"]), None
+    )
+    return row
+
+
+def liberar_ejemplar(conn, id_ejemplar: int, motivo: str, actor: Optional[int] = None,
+                     prestamo: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Asigna el ejemplar a la siguiente reserva o lo deja disponible (sin commit).
+
+    Devuelve la reserva asignada, o None si quedó disponible.
+    """
+    ahora = datetime.now()
+    with conn.cursor(row_factory=dict_row) as cur:
+        queries.execute(cur, "reserva_asignar_siguiente", {
+            "ejemplar": id_ejemplar, "ahora": ahora,
+            "expira": ahora + timedelta(hours=get_settings().hold_hours),
+        })
+        asignada = cur.fetchone()
+
+    if asignada:
+        res = estados_ejemplar.transicionar(
+            conn, [id_ejemplar], "reservado", motivo=f"{motivo}:reserva {asignada['reserva_id']}",
+            actor=actor, prestamo=prestamo,
+        )
+        # Un ejemplar que ya estaba 'reservado' (reserva expirada) pasa directo a la siguiente
+        if res["rechazados"] and res["rechazados"][0]["estado"] != "reservado":
+            raise estados_ejemplar.TransicionInvalida("reservado", res["rechazados"])
+        return asignada
+
+    estados_ejemplar.transicionar(conn, [id_ejemplar], "disponible", motivo=motivo, actor=actor, prestamo=prestamo)
+    return None
+
+
+def _liberar_si_retenido(conn, id_ejemplar: int, motivo: str, actor: Optional[int] = None) -> None:
+    """Tras cerrar una reserva: libera el ejemplar solo si sigue 'reservado' y sin dueño."""
+    with conn.cursor() as cur:
+        queries.execute(cur, "reserva_ejemplar_retenido", (id_ejemplar,))
+        if cur.fetchone() is None:
+            return
+    liberar_ejemplar(conn, id_ejemplar, motivo, actor=actor)
+
+
+def cambiar_estado(conn, ids, nuevo: str, motivo: Optional[str] = None, actor: Optional[int] = None,
+                   estricto: bool = False) -> Dict[str, Any]:
+    """estados_ejemplar.transicionar() para cambios manuales, coherente con las reservas (sin commit).
+
+    Agrega a la respuesta "reencoladas" (reservas devueltas a la cola) y
+    "asignadas" (reservas que recibieron un ejemplar que quedó disponible).
+    """
+    res = estados_ejemplar.transicionar(conn, ids, nuevo, motivo=motivo, actor=actor, estricto=estricto)
+    res["reencoladas"], res["asignadas"] = [], []
+    cambiados = res["cambiados"]
+    with conn.cursor(row_factory=dict_row) as cur:
+        retenidos = [c["id_ejemplar"] for c in cambiados if c["anterior"] == "reservado"]
+        if retenidos:
+            queries.execute(cur, "reservas_reencolar", (retenidos,))
+            res["reencoladas"] = cur.fetchall()
+        if nuevo != "disponible" or not cambiados:
+            return res
+        queries.execute(cur, "reservas_libros_en_espera", (list({c["id_libro"] for c in cambiados}),))
+        con_cola = {r["id_libro"] for r in cur.fetchall()}
+    for c in cambiados:
+        if c["id_libro"] in con_cola:
+            asignada = liberar_ejemplar(conn, c["id_ejemplar"], motivo or "edicion", actor=actor)
+            if asignada:
+                res["asignadas"].append(asignada)
+    return res
+
+
+def retirar_si_reservado(conn, id_ejemplar: int, user_id: int) -> bool:
+    """En crear_prestamo: el ejemplar 'reservado' solo se presta al titular de la reserva."""
+    with conn.cursor(row_factory=dict_row) as cur:
+        queries.execute(cur, "reserva_de_ejemplar", (id_ejemplar,))
+        row = cur.fetchone()
+        if not row or row["user_fk"] != int(user_id):
+            return False
+        queries.execute(cur, "reserva_retirar", (datetime.now(), row["reserva_id"]))
+        return True
+
+
+def cancelar(reserva_id: int, user_id: int, actor: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    with get_connection(read_only=False) as conn, conn.cursor(row_factory=dict_row) as cur:
+        queries.execute(cur, "reserva_cancelar", (datetime.now(), reserva_id, user_id))
+        row = cur.fetchone()
+        if row and row["id_ejemplar"]:
+            # Estaba asignada: el ejemplar pasa a la siguiente de la cola
+            _liberar_si_retenido(conn, row["id_ejemplar"], "reserva cancelada", actor=actor)
+        conn.commit()
+        return row
+
+
+def expirar(lote: int = 500) -> int:
+    """Cierra reservas asignadas vencidas y reasigna sus ejemplares. Devuelve cuántas expiraron."""
+    total = 0
+    while True:
+        with get_connection(read_only=False) as conn, conn.cursor(row_factory=dict_row) as cur:
+            queries.execute(cur, "reservas_expirar", {"ahora": datetime.now(), "lote": lote})
+            vencidas = cur.fetchall()
+            for r in vencidas:
+                if r["id_ejemplar"]:
+                    _liberar_si_retenido(conn, r["id_ejemplar"], "reserva expirada")
+            conn.commit()
+        total += len(vencidas)
+        if len(vencidas) < lote:
+            break
+    if total:
+        log.info("%d reserva(s) expirada(s)", total)
+    return total
+
+
+def de_usuario(user_id: int) -> List[Dict[str, Any]]:
+    with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        queries.execute(cur, "reservas_usuario", (user_id,))
+        return cur.fetchall()
+
+
+def de_libro(id_libro: int) -> List[Dict[str, Any]]:
+    with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        queries.execute(cur, "reservas_libro", (id_libro,))
+        return cur.fetchall()
@@ -0,0 +1,41 @@
+"""Validación y normalización de RUT chileno (número + dígito verificador).
+
+Acepta las formas que llegan desde el mesón o un lector: "12.345.678-5",
+"12345678-5", "123456785", con o sin espacios y con 'k' minúscula.
+"""
+import re
+from typing import Tuple
+
+_LIMPIAR = re.compile(r"[\s.\-]")
+
+
+class RutError(ValueError):
+    """RUT mal formado o con dígito verificador incorrecto."""
+
+
+def calcular_dv(numero: int) -> str:
+    """Dígito verificador (módulo 11) de un RUT chileno."""
+    total, factor = 0, 2
+    while numero:
+        total += (numero % 10) * factor
+        numero //= 10
+        factor = 2 if factor == 7 else factor + 1
+    resto = 11 - total % 11
+    return {11: "0", 10: "K"}.get(resto, str(resto))
+
+
+def parse_rut(texto: str) -> Tuple[int, str]:
+    """Devuelve (rut_numero, rut_dv) normalizados o lanza RutError."""
+    limpio = _LIMPIAR.sub("", str(texto or "")).upper()
+    if len(limpio) < 2 or not limpio[:-1].isdigit() or not (limpio[-1].isdigit() or limpio[-1] == "K"):
+        raise RutError(f"RUT mal formado: {texto!r}")
+    numero, dv = int(limpio[:-1]), limpio[-1]
+    if numero <= 0 or numero > 99_999_999:
+        raise RutError(f"RUT fuera de rango: {texto!r}")
+    if calcular_dv(numero) != dv:
+        raise RutError(f"Dígito verificador incorrecto: {texto!r}")
+    return numero, dv
+
+
+def format_rut(numero: int, dv: str) -> str:
+    return f"{numero}-{dv}"
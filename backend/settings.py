@@ -0,0 +1,294 @@
+"""Configuración tipada de la API, leída una sola vez.
+
+create_app() construye un Settings a partir del entorno (.env) y lo valida.
+Los handlers leen get_settings() en vez de os.getenv. reload_settings()
+vuelve a leer el .env y reemplaza el snapshot de forma atómica; se invoca
+con SIGHUP o desde POST /api/admin/config/reload.
+
+Los parámetros de conexión a la base (DB_*) se leen igual en cada recarga,
+pero el pool ya creado no cambia: requieren reiniciar el proceso.
+"""
+import os
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from db import DBConfig
+
+
+class SettingsError(ValueError):
+    """Uno o más valores de configuración son inválidos."""
+
+
+@dataclass(frozen=True)
+class MailSettings:
+    server: Optional[str]
+    port: int
+    username: Optional[str]
+    password: Optional[str] = field(repr=False)
+    use_tls: bool
+    use_ssl: bool
+    default_sender: Optional[str]
+    test_to: Optional[str]
+
+
+@dataclass(frozen=True)
+class Settings:
+    db: DBConfig
+    mail: MailSettings
+    port: int
+    auto_migrate: bool
+    auth_secret: Optional[str] = field(repr=False)
+    auth_token_ttl_s: int
+    # Duraciones por defecto si no hay fila aplicable en politicas_prestamo
+    sala_minutes: int
+    domicilio_days: int
+    sanction_min_days: int
+    policy_cache_s: float
+    suggest_rebuild_s: float
+    stats_refresh_minutes: int
+    partitions_ahead_months: int
+    # 0 = archivado desactivado
+    archive_years: int
+    archive_dir: str
+    # Horas que un ejemplar asignado queda reservado antes de pasar al siguiente
+    hold_hours: int
+    log_level: str
+    log_json: bool
+    # Líneas por minuto y mensaje en registros masivos (correos); 0 = sin límite
+    log_email_per_min: int
+    # Respuestas de al menos N bytes se comprimen al vuelo; 0 = desactivado
+    compress_min_bytes: int
+    compress_level: int
+    serve_frontend: bool
+    frontend_dist: str
+    # Control de admisión por clase de ruta (admision.py)
+    admit_circulation: int
+    admit_general: int
+    admit_reports: int
+    admit_wait_circulation_ms: int
+    admit_wait_general_ms: int
+    admit_wait_reports_ms: int
+    timeout_circulation_ms: int
+    timeout_general_ms: int
+    timeout_reports_ms: int
+    # 0 = sin límite por cliente
+    rate_limit_rps: float
+    rate_limit_burst: float
+    ready_max_waiting: int
+    # Comprobantes (comprobantes.py); 0 procesos = render en el proceso de la API
+    receipt_workers: int
+    receipt_cache_entries: int
+    # Recordatorios antes del vencimiento (recordatorios.py), minutos por tipo
+    remind_sala_minutes: Tuple[int, ...]
+    remind_domicilio_minutes: Tuple[int, ...]
+    remind_window_hours: int
+    remind_channel: str
+    # Recomendaciones por coocurrencia de préstamos (recomendaciones.py)
+    recs_dir: str
+    recs_top_k: int
+    recs_min_co: int
+    recs_refresh_minutes: int
+    # Contraseñas y matrícula masiva (claves.py, matricula.py)
+    password_iterations: int
+    enroll_workers: int
+    # Idempotency-Key en POST de circulación (idempotencia.py)
+    idempotency_ttl_hours: int
+    idempotency_wait_ms: int
+    # Calentamiento al iniciar (calentamiento.py)
+    warmup: bool
+    warmup_connections: int
+
+    def public(self) -> Dict[str, Any]:
+        """Vista sin secretos, para el endpoint de administración."""
+        data = asdict(self)
+        data["db"].pop("password", None)
+        data["db"]["replicas"] = len(self.db.replicas)
+        data["mail"].pop("password", None)
+        data.pop("auth_secret", None)
+        return data
+
+
+def _bool(raw: str) -> bool:
+    return raw.strip().lower() in ("true", "1", "t", "yes")
+
+
+class _Reader:
+    """Lee variables de entorno acumulando errores en vez de fallar al primero."""
+
+    def __init__(self):
+        self.errors: List[str] = []
+
+    def str(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return os.getenv(name, default)
+
+    def int(self, name: str, default: int, minimum: Optional[int] = None, maximum: Optional[int] = None) -> int:
+        raw = os.getenv(name)
+        if raw is None or raw.strip() == "":
+            return default
+        try:
+            value = int(raw)
+        except ValueError:
+            self.errors.append(f"{name}: '{raw}' no es un entero")
+            return default
+        if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+            self.errors.append(f"{name}: {value} fuera de rango [{minimum}, {maximum}]")
+        return value
+
+    def float(self, name: str, default: float, minimum: float = 0.0) -> float:
+        raw = os.getenv(name)
+        if raw is None or raw.strip() == "":
+            return default
+        try:
+            value = float(raw)
+        except ValueError:
+            self.errors.append(f"{name}: '{raw}' no es un número")
+            return default
+        if value < minimum:
+            self.errors.append(f"{name}: {value} debe ser >= {minimum}")
+        return value
+
+    def bool(self, name: str, default: bool) -> bool:
+        raw = os.getenv(name)
+        return default if raw is None else _bool(raw)
+
+    def ints(self, name: str, default: Tuple[int, ...], minimum: int = 0, maximum: Optional[int] = None) -> Tuple[int, ...]:
+        """Lista de enteros separados por coma ("" = lista vacía)."""
+        raw = os.getenv(name)
+        if raw is None:
+            return default
+        values = []
+        for part in (p.strip() for p in raw.split(",")):
+            if not part:
+                continue
+            try:
+                value = int(part)
+            except ValueError:
+                self.errors.append(f"{name}: '{part}' no es un entero")
+                continue
+            if value < minimum or (maximum is not None and value > maximum):
+                self.errors.append(f"{name}: {value} fuera de rango [{minimum}, {maximum}]")
+                continue
+            values.append(value)
+        return tuple(sorted(set(values), reverse=True))
+
+
+def load_settings() -> Settings:
+    r = _Reader()
+    db = DBConfig(
+        host=r.str("DB_HOST", "127.0.0.1"),
+        port=r.int("DB_PORT", 5432, 1, 65535),
+        dbname=r.str("DB_NAME", "sisbib"),
+        user=r.str("DB_USER", "postgres"),
+        password=r.str("DB_PASSWORD", ""),
+        pool_min=r.int("DB_POOL_MIN", 1, 0),
+        pool_max=r.int("DB_POOL_MAX", 10, 1),
+        pool_timeout=r.float("DB_POOL_TIMEOUT", 30.0),
+        # Separadas por ';' (un conninfo puede contener espacios)
+        replicas=[d.strip() for d in (r.str("DB_REPLICA_DSNS", "") or "").split(";") if d.strip()],
+        replica_timeout=r.float("DB_REPLICA_TIMEOUT", 2.0),
+        replica_max_lag_s=r.float("DB_REPLICA_MAX_LAG_SECONDS", 10.0),
+        replica_check_s=r.float("DB_REPLICA_CHECK_SECONDS", 5.0, 0.5),
+        replica_pin_s=r.float("DB_REPLICA_PIN_SECONDS", 5.0),
+    )
+    if db.pool_min > db.pool_max:
+        r.errors.append(f"DB_POOL_MIN ({db.pool_min}) mayor que DB_POOL_MAX ({db.pool_max})")
+
+    mail = MailSettings(
+        server=r.str("MAIL_SERVER"),
+        port=r.int("MAIL_PORT", 587, 1, 65535),
+        username=r.str("MAIL_USERNAME"),
+        password=r.str("MAIL_PASSWORD"),
+        use_tls=r.bool("MAIL_USE_TLS", True),
+        use_ssl=r.bool("MAIL_USE_SSL", False),
+        default_sender=r.str("MAIL_DEFAULT_SENDER"),
+        test_to=r.str("MAIL_TEST_TO"),
+    )
+    if mail.use_tls and mail.use_ssl:
+        r.errors.append("MAIL_USE_TLS y MAIL_USE_SSL no pueden estar activos a la vez")
+
+    settings = Settings(
+        db=db,
+        mail=mail,
+        port=r.int("PORT", 5000, 1, 65535),
+        auto_migrate=r.bool("DB_AUTO_MIGRATE", False),
+        auth_secret=r.str("AUTH_SECRET") or None,
+        auth_token_ttl_s=r.int("AUTH_TOKEN_TTL_MIN", 480, 1) * 60,
+        sala_minutes=r.int("SALA_MINUTES", 120, 1),
+        domicilio_days=r.int("DOMICILIO_DAYS", 7, 1),
+        sanction_min_days=r.int("SANCTION_MIN_DAYS", 1, 0),
+        policy_cache_s=r.float("POLICY_CACHE_SECONDS", 300.0),
+        suggest_rebuild_s=r.float("SUGGEST_REBUILD_SECONDS", 600.0),
+        stats_refresh_minutes=r.int("STATS_REFRESH_MINUTES", 15, 1),
+        partitions_ahead_months=r.int("PARTITIONS_AHEAD_MONTHS", 3, 1, 24),
+        archive_years=r.int("ARCHIVE_YEARS", 0, 0),
+        archive_dir=r.str("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archivo")),
+        hold_hours=r.int("RESERVA_HORAS", 48, 1),
+        log_level=(r.str("LOG_LEVEL", "INFO") or "INFO").strip().upper(),
+        log_json=r.bool("LOG_JSON", True),
+        log_email_per_min=r.int("LOG_CORREOS_POR_MINUTO", 20, 0),
+        compress_min_bytes=r.int("COMPRESS_MIN_BYTES", 1024, 0),
+        compress_level=r.int("COMPRESS_LEVEL", 5, 1, 9),
+        serve_frontend=r.bool("SERVE_FRONTEND", False),
+        frontend_dist=r.str("FRONTEND_DIST", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "dist")),
+        admit_circulation=r.int("ADMISION_CIRCULACION", 8, 1),
+        admit_general=r.int("ADMISION_GENERAL", 6, 1),
+        admit_reports=r.int("ADMISION_REPORTES", 2, 1),
+        admit_wait_circulation_ms=r.int("ADMISION_ESPERA_CIRCULACION_MS", 5000, 0),
+        admit_wait_general_ms=r.int("ADMISION_ESPERA_GENERAL_MS", 2000, 0),
+        admit_wait_reports_ms=r.int("ADMISION_ESPERA_REPORTES_MS", 500, 0),
+        timeout_circulation_ms=r.int("TIMEOUT_CIRCULACION_MS", 5000, 0),
+        timeout_general_ms=r.int("TIMEOUT_GENERAL_MS", 15000, 0),
+        timeout_reports_ms=r.int("TIMEOUT_REPORTES_MS", 60000, 0),
+        rate_limit_rps=r.float("RATE_LIMIT_RPS", 20.0),
+        rate_limit_burst=r.float("RATE_LIMIT_BURST", 60.0, 1.0),
+        ready_max_waiting=r.int("READY_MAX_WAITING", 2, 0),
+        receipt_workers=r.int("RECEIPT_WORKERS", 2, 0, 32),
+        receipt_cache_entries=r.int("RECEIPT_CACHE_ENTRIES", 2000, 1),
+        remind_sala_minutes=r.ints("RECORDATORIO_SALA_MINUTOS", (15,), 1, 43_200),
+        remind_domicilio_minutes=r.ints("RECORDATORIO_DOMICILIO_MINUTOS", (1440,), 1, 43_200),
+        remind_window_hours=r.int("RECORDATORIO_VENTANA_HORAS", 6, 1, 23),
+        remind_channel=(r.str("RECORDATORIO_CANAL", "correo") or "correo").strip().lower(),
+        recs_dir=r.str("RECOMENDACIONES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "recomendaciones")),
+        recs_top_k=r.int("RECOMENDACIONES_K", 20, 1, 200),
+        recs_min_co=r.int("RECOMENDACIONES_MIN_COOCURRENCIAS", 2, 1),
+        recs_refresh_minutes=r.int("RECOMENDACIONES_MINUTOS", 60, 1),
+        password_iterations=r.int("PASSWORD_ITERACIONES", 600_000, 100_000, 10_000_000),
+        enroll_workers=r.int("MATRICULA_PROCESOS", 0, 0, 64),
+        idempotency_ttl_hours=r.int("IDEMPOTENCIA_HORAS", 24, 1, 24 * 30),
+        idempotency_wait_ms=r.int("IDEMPOTENCIA_ESPERA_MS", 3000, 0, 60_000),
+        warmup=r.bool("CALENTAR", True),
+        warmup_connections=r.int("CALENTAR_CONEXIONES", 0, 0, 200),
+    )
+    if settings.log_level not in ("DEBUG", "INFO", "WARNING", "ERROR"):
+        r.errors.append(f"LOG_LEVEL: '{settings.log_level}' no es DEBUG, INFO, WARNING ni ERROR")
+    if r.errors:
+        raise SettingsError("; ".join(r.errors))
+    return settings
+
+
+_current: Optional[Settings] = None
+_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    global _current
+    if _current is None:
+        with _lock:
+            if _current is None:
+                load_dotenv()
+                _current = load_settings()
+    return _current
+
+
+def reload_settings() -> Settings:
+    """Relee .env y el entorno. Si la nueva configuración es inválida se
+    conserva la anterior y se propaga SettingsError."""
+    global _current
+    load_dotenv(override=True)
+    new = load_settings()
+    with _lock:
+        _current = new
+    return new
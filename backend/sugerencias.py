@@ -0,0 +1,188 @@
+"""Índice de prefijos en memoria para autocompletar usuarios y títulos.
+
+Cada entidad aporta varias claves normalizadas (minúsculas, sin tildes):
+palabras del nombre, nombre completo, email, RUT; palabras del título,
+título completo y autor. Las claves se guardan en una lista ordenada de
+(clave, id) y una búsqueda por prefijo es un bisect más un recorrido
+acotado, sin tocar la base.
+
+El índice se construye al primer uso y se mantiene con eventos de cambio
+(alta/edición/baja desde los handlers). Como otros procesos también
+escriben, se reconstruye completo cada SUGGEST_REBUILD_SECONDS.
+"""
+import bisect
+import threading
+import time
+import unicodedata
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from psycopg.rows import dict_row
+
+import queries
+import registro
+from db import get_connection
+from settings import get_settings
+
+log = registro.get("sugerencias")
+
+queries.register("suggest_users", """
+    SELECT user_id, nombre, apellido1, apellido2, rut_numero, rut_dv, email
+    FROM public.users
+""", ())
+queries.register("suggest_libros", "SELECT id_libro, titulo, autor FROM public.libros", ())
+
+# Tope de claves recorridas por búsqueda: prefijos muy cortos ("a") no
+# recorren todo el índice.
+_SCAN_FACTOR = 20
+
+
+def normalize(text: Any) -> str:
+    text = unicodedata.normalize("NFKD", str(text or "")).encode("ascii", "ignore").decode("ascii")
+    return " ".join(text.lower().split())
+
+
+def _word_keys(*parts: Any) -> List[str]:
+    full = normalize(" ".join(str(p) for p in parts if p))
+    keys = set(full.split())
+    if full:
+        keys.add(full)
+    return list(keys)
+
+
+def _user_keys(u: Dict[str, Any]) -> List[str]:
+    keys = _word_keys(u.get("nombre"), u.get("apellido1"), u.get("apellido2"))
+    keys += _word_keys(u.get("apellido1"), u.get("apellido2"))
+    if u.get("email"):
+        keys.append(normalize(u["email"]))
+    if u.get("rut_numero") is not None:
+        rut = str(u["rut_numero"])
+        keys.append(rut)
+        if u.get("rut_dv"):
+            keys.append(normalize(f"{rut}-{u['rut_dv']}"))
+    return list(set(k for k in keys if k))
+
+
+def _libro_keys(l: Dict[str, Any]) -> List[str]:
+    return list(set(_word_keys(l.get("titulo")) + _word_keys(l.get("autor"))))
+
+
+class PrefixIndex:
+    def __init__(self, keys_fn: Callable[[Dict[str, Any]], List[str]], id_field: str):
+        self._keys_fn = keys_fn
+        self._id_field = id_field
+        self._entries: List[Tuple[str, int]] = []
+        self._docs: Dict[int, Tuple[Dict[str, Any], List[str]]] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def rebuild(self, rows: Iterable[Dict[str, Any]]):
+        docs, entries = {}, []
+        for row in rows:
+            keys = self._keys_fn(row)
+            docs[row[self._id_field]] = (row, keys)
+            entries.extend((k, row[self._id_field]) for k in keys)
+        entries.sort()
+        with self._lock:
+            self._docs, self._entries = docs, entries
+
+    def get(self, doc_id: int) -> Optional[Dict[str, Any]]:
+        doc = self._docs.get(doc_id)
+        return doc[0] if doc else None
+
+    def upsert(self, row: Dict[str, Any]):
+        with self._lock:
+            self.remove(row[self._id_field])
+            keys = self._keys_fn(row)
+            self._docs[row[self._id_field]] = (row, keys)
+            for k in keys:
+                bisect.insort(self._entries, (k, row[self._id_field]))
+
+    def remove(self, doc_id: int):
+        with self._lock:
+            doc = self._docs.pop(doc_id, None)
+            if not doc:
+                return
+            for k in doc[1]:
+                i = bisect.bisect_left(self._entries, (k, doc_id))
+                if i < len(self._entries) and self._entries[i] == (k, doc_id):
+                    del self._entries[i]
+
+    def search(self, prefix: str, k: int) -> List[Dict[str, Any]]:
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            entries, docs = self._entries, self._docs
+            i = bisect.bisect_left(entries, (prefix, -1))
+            # (largo de la clave, clave) => coincidencias exactas y cortas primero
+            best: Dict[int, Tuple[int, str]] = {}
+            for key, doc_id in entries[i:i + k * _SCAN_FACTOR]:
+                if not key.startswith(prefix):
+                    break
+                rank = (len(key), key)
+                if doc_id not in best or rank < best[doc_id]:
+                    best[doc_id] = rank
+            ranked = sorted(best.items(), key=lambda item: item[1])[:k]
+            return [docs[doc_id][0] for doc_id, _ in ranked]
+
+
+class Suggester:
+    def __init__(self):
+        self.users = PrefixIndex(_user_keys, "user_id")
+        self.libros = PrefixIndex(_libro_keys, "id_libro")
+        self._built_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    def rebuild(self):
+        with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            queries.execute(cur, "suggest_users")
+            users = cur.fetchall()
+            queries.execute(cur, "suggest_libros")
+            libros = cur.fetchall()
+        self.users.rebuild(users)
+        self.libros.rebuild(libros)
+        self._built_at = time.monotonic()
+
+    def _rebuild_in_background(self):
+        def run():
+            try:
+                self.rebuild()
+            except Exception as e:
+                log.warning("No se pudo reconstruir el índice de sugerencias: %s", e)
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=run, name="sisbib-suggest-rebuild", daemon=True).start()
+
+    def ensure_ready(self):
+        """Primer uso: construye en línea. Luego: reconstrucción periódica en segundo plano."""
+        if self._built_at is None:
+            with self._lock:
+                if self._built_at is None:
+                    self.rebuild()
+            return
+        if time.monotonic() - self._built_at >= get_settings().suggest_rebuild_s and not self._rebuilding:
+            with self._lock:
+                if not self._rebuilding:
+                    self._rebuilding = True
+                    self._rebuild_in_background()
+
+    # --- eventos de cambio (no hacen nada si el índice aún no existe) ---
+
+    def user_changed(self, row: Dict[str, Any]):
+        if self._built_at is not None:
+            self.users.upsert(row)
+
+    def libro_changed(self, row: Dict[str, Any]):
+        if self._built_at is not None:
+            self.libros.upsert(row)
+
+    def libro_removed(self, id_libro: int):
+        if self._built_at is not None:
+            self.libros.remove(id_libro)
+
+
+SUGGEST = Suggester()
@@ -0,0 +1,31 @@
+"""Fixtures comunes de las pruebas (pytest, desde backend/: python -m pytest -q tests).
+
+Las pruebas con base de datos solo corren con SISBIB_TEST_DB=1 y DB_*
+apuntando a una base desechable: se aplican las migraciones y cada prueba
+trabaja dentro de una transacción que se deshace al final.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+
+@pytest.fixture(scope="session")
+def base_migrada():
+    if os.getenv("SISBIB_TEST_DB") != "1":
+        pytest.skip("Requiere SISBIB_TEST_DB=1 y DB_* apuntando a una base desechable")
+    import migrate
+
+    migrate.upgrade()
+
+
+@pytest.fixture
+def conn(base_migrada):
+    from db import connect
+
+    with connect() as c:
+        yield c
+        c.rollback()
@@ -0,0 +1,58 @@
+"""admision.py: cupos por clase, también en respuestas en streaming."""
+from flask import Flask, Response, jsonify
+
+import admision
+
+
+def _app():
+    app = Flask(__name__)
+    admision.init_admision(app)
+    admision.ADMISION.limitador = None
+
+    @app.get("/reporte")
+    def reporte_inventario():
+        def generar():
+            yield "uno\n"
+            yield "dos\n"
+        return Response(generar(), mimetype="application/x-ndjson")
+
+    @app.get("/listado")
+    def list_users():
+        return jsonify({"ok": True, "en_uso": admision.ADMISION.cupos[admision.REPORTES].describe()["en_uso"]})
+
+    return app
+
+
+def _en_uso():
+    return admision.ADMISION.cupos[admision.REPORTES].describe()["en_uso"]
+
+
+def test_cupo_se_suelta_al_terminar_el_request():
+    cliente = _app().test_client()
+    assert cliente.get("/listado").json["en_uso"] == 1
+    assert _en_uso() == 0
+
+
+def test_streaming_retiene_el_cupo_hasta_cerrar_la_respuesta():
+    cliente = _app().test_client()
+    resp = cliente.get("/reporte", buffered=False)
+    assert resp.is_streamed
+    assert next(resp.response) == b"uno\n"
+    assert _en_uso() == 1
+    assert b"".join(resp.response) == b"dos\n"
+    resp.close()
+    assert _en_uso() == 0
+
+
+def test_streaming_sin_cupo_da_503():
+    app = _app()
+    cupos = admision.ADMISION.cupos[admision.REPORTES]
+    admision.ADMISION.limites[admision.REPORTES] = admision.Limites(cupos.limite, 0, 1000)
+    cliente = app.test_client()
+    abiertas = [cliente.get("/reporte", buffered=False) for _ in range(cupos.limite)]
+    rechazo = cliente.get("/reporte")
+    assert rechazo.status_code == 503 and rechazo.headers["Retry-After"] == "1"
+    for resp in abiertas:
+        resp.close()
+    assert _en_uso() == 0
+    assert cliente.get("/reporte").status_code == 200
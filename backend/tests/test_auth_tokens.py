@@ -0,0 +1,63 @@
+"""auth_tokens.py: tokens inválidos en rutas públicas y protegidas."""
+import time
+
+import pytest
+from flask import Flask, g, jsonify
+
+import auth_tokens
+
+
+@pytest.fixture
+def cliente():
+    app = Flask(__name__)
+    auth_tokens.init_auth(app)
+
+    @app.get("/publica")
+    def publica():
+        return jsonify({"anonimo": g.auth is None})
+
+    @app.get("/admin")
+    @auth_tokens.require_auth("admin")
+    def solo_admin():
+        return jsonify({"ok": True})
+
+    return app.test_client()
+
+
+def _bearer(token: str):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_token_valido(cliente):
+    token = auth_tokens.issue_token(1, "admin")["token"]
+    assert cliente.get("/publica", headers=_bearer(token)).json == {"anonimo": False}
+    assert cliente.get("/admin", headers=_bearer(token)).status_code == 200
+
+
+def test_token_invalido_en_ruta_publica_es_anonimo(cliente):
+    resp = cliente.get("/publica", headers=_bearer("basura"))
+    assert resp.status_code == 200 and resp.json == {"anonimo": True}
+
+
+def test_token_invalido_en_ruta_protegida_da_401_con_motivo(cliente):
+    resp = cliente.get("/admin", headers=_bearer("basura"))
+    assert resp.status_code == 401
+    assert resp.json["error"] == "Token mal formado"
+
+
+def test_token_expirado_o_revocado(cliente, monkeypatch):
+    token = auth_tokens.issue_token(2, "admin")["token"]
+    monkeypatch.setattr(time, "time", lambda: 4_000_000_000.0)
+    assert cliente.get("/publica", headers=_bearer(token)).json == {"anonimo": True}
+    assert cliente.get("/admin", headers=_bearer(token)).json["error"] == "Token expirado"
+    monkeypatch.undo()
+
+    claims = auth_tokens.verify_token(token)
+    auth_tokens.revocations.revoke_jti(claims["jti"], claims["exp"])
+    assert cliente.get("/publica", headers=_bearer(token)).status_code == 200
+    assert cliente.get("/admin", headers=_bearer(token)).json["error"] == "Token revocado"
+
+
+def test_rol_insuficiente_da_403(cliente):
+    token = auth_tokens.issue_token(3, "cliente")["token"]
+    assert cliente.get("/admin", headers=_bearer(token)).status_code == 403
@@ -0,0 +1,40 @@
+"""estadisticas.py: la marca de agua no pasa sobre los préstamos del último minuto."""
+from datetime import datetime, timedelta
+
+import estadisticas
+import queries
+
+
+def _prestamos(conn, *fechas):
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO public.users (nombre, email, password)
+        VALUES ('Prueba', 'stats-prueba@sisbib.test', 'x') RETURNING user_id
+    """)
+    user_id = cur.fetchone()[0]
+    cur.execute("INSERT INTO public.libros (titulo, autor) VALUES ('T', 'A') RETURNING id_libro")
+    id_libro = cur.fetchone()[0]
+    cur.execute("INSERT INTO public.ejemplares (id_libro) VALUES (%s) RETURNING id_ejemplar", (id_libro,))
+    id_ejemplar = cur.fetchone()[0]
+    ids = []
+    for fecha in fechas:
+        cur.execute("""
+            INSERT INTO public.prestamos (user_fk, ejemplar_fk, libro_fk, fecha_reserva)
+            VALUES (%s, %s, %s, %s) RETURNING prestamo_id
+        """, (user_id, id_ejemplar, id_libro, fecha))
+        ids.append(cur.fetchone()[0])
+    return ids
+
+
+def _hasta_id(conn, desde, corte):
+    with conn.cursor() as cur:
+        queries.execute(cur, "stats_hasta_id", {"desde": desde, "corte": corte})
+        return cur.fetchone()[0]
+
+
+def test_hasta_id_se_detiene_antes_de_la_gracia(conn):
+    ahora = datetime.now()
+    viejo, reciente = _prestamos(conn, ahora - timedelta(days=1), ahora)
+    assert _hasta_id(conn, viejo - 1, ahora - estadisticas._GRACIA) == reciente - 1
+    assert _hasta_id(conn, viejo - 1, ahora + timedelta(minutes=1)) >= reciente
+
@@ -0,0 +1,104 @@
+"""estados_ejemplar.py: tabla de transiciones y transicionar() con una base simulada."""
+import pytest
+
+import estados_ejemplar
+import queries
+from estados_ejemplar import TRANSICIONES, TransicionInvalida, origenes, transicionar
+
+
+class _Cursor:
+    def __init__(self, respuestas):
+        self.respuestas = respuestas
+        self.filas = []
+
+    def fetchall(self):
+        return self.filas
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Conn:
+    """Ejemplares en memoria; ejecutar la transición cambia su estado."""
+
+    def __init__(self, estados):
+        self.estados = dict(estados)
+        self.llamadas = []
+
+    def cursor(self, row_factory=None):
+        return _Cursor(self)
+
+    def execute(self, cur, nombre, params=None):
+        self.llamadas.append((nombre, params))
+        if nombre == "ejemplar_transicion":
+            cur.filas = []
+            for i in params["ids"]:
+                anterior = self.estados.get(i)
+                if anterior in params["desde"]:
+                    self.estados[i] = params["nuevo"]
+                    cur.filas.append({"id_ejemplar": i, "id_libro": 1, "anterior": anterior})
+        elif nombre == "ejemplar_estados":
+            cur.filas = [{"id_ejemplar": i, "estado": self.estados.get(i)} for i in params[0]]
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    c = _Conn({1: "disponible", 2: "prestado", 3: "reservado", 4: "en_reparacion"})
+    monkeypatch.setattr(queries, "execute", c.execute)
+    return c
+
+
+def test_tabla_de_transiciones_cerrada():
+    assert set(TRANSICIONES) == set(estados_ejemplar.ESTADOS)
+    for desde, destinos in TRANSICIONES.items():
+        assert destinos <= set(estados_ejemplar.ESTADOS)
+        assert desde not in destinos
+
+
+def test_reservado_solo_sale_a_disponible_o_prestado():
+    assert TRANSICIONES["reservado"] == {"disponible", "prestado"}
+    assert sorted(origenes("prestado")) == ["disponible", "reservado"]
+    assert "reservado" not in origenes("en_reparacion")
+
+
+def test_transicion_valida(conn):
+    res = transicionar(conn, [1, 1, 2], "en_reparacion", motivo="daño", actor=7)
+    assert [c["id_ejemplar"] for c in res["cambiados"]] == [1, 2]
+    assert res["rechazados"] == []
+    nombre, params = conn.llamadas[0]
+    assert nombre == "ejemplar_transicion"
+    assert params["ids"] == [1, 2]
+    assert set(params["desde"]) == set(origenes("en_reparacion"))
+    assert (params["motivo"], params["actor"]) == ("daño", 7)
+    assert len(conn.llamadas) == 1
+
+
+def test_rechazados_se_informan_sin_tocar(conn):
+    res = transicionar(conn, [1, 3, 99], "en_reparacion")
+    assert [c["id_ejemplar"] for c in res["cambiados"]] == [1]
+    assert res["rechazados"] == [{"id_ejemplar": 3, "estado": "reservado"},
+                                 {"id_ejemplar": 99, "estado": None}]
+    assert conn.estados[3] == "reservado"
+
+
+def test_estricto_lanza_con_los_rechazados(conn):
+    with pytest.raises(TransicionInvalida) as e:
+        transicionar(conn, [3, 99], "en_reparacion", estricto=True)
+    assert e.value.nuevo == "en_reparacion"
+    assert "3 (reservado)" in str(e.value) and "99 (no existe)" in str(e.value)
+
+
+def test_sin_ids_no_consulta(conn):
+    assert transicionar(conn, [], "disponible") == {"cambiados": [], "rechazados": []}
+    assert conn.llamadas == []
+
+
+def test_estado_o_lote_invalido(conn):
+    with pytest.raises(ValueError):
+        transicionar(conn, [1], "perdido")
+    with pytest.raises(ValueError):
+        transicionar(conn, range(estados_ejemplar.MAX_LOTE + 1), "disponible")
+    assert conn.llamadas == []
@@ -0,0 +1,199 @@
+"""idempotencia.py: repetición, huella, liberación en 5xx y espera del duplicado simultáneo.
+
+public.idempotencia se reemplaza por un dict; queries.execute responde según
+el nombre de la consulta como lo haría la tabla.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+from flask import Flask, jsonify, request
+
+import idempotencia
+import queries
+
+
+class _Cursor:
+    def __init__(self):
+        self.fila = None
+        self.rowcount = 0
+
+    def fetchone(self):
+        return self.fila
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Conn:
+    def cursor(self):
+        return _Cursor()
+
+
+class _Tabla:
+    """Filas (ruta, clave) -> [huella, status, content_type, cuerpo, dueno]."""
+
+    def __init__(self):
+        self.filas = {}
+        self.lock = threading.Lock()
+
+    def execute(self, cur, nombre, params=None):
+        with self.lock:
+            if nombre == "idempotencia_tomar":
+                llave = (params["ruta"], params["clave"])
+                if llave in self.filas:
+                    cur.fila = None
+                else:
+                    self.filas[llave] = [params["huella"], None, None, None, params["dueno"]]
+                    cur.fila = (params["dueno"],)
+            elif nombre == "idempotencia_leer":
+                fila = self.filas.get(tuple(params))
+                cur.fila = tuple(fila[:4]) if fila else None
+            elif nombre == "idempotencia_guardar":
+                status, content_type, cuerpo, ruta, clave, dueno = params
+                fila = self.filas.get((ruta, clave))
+                cur.rowcount = 0
+                if fila and fila[4] == dueno:
+                    fila[1:4] = [status, content_type, cuerpo]
+                    cur.rowcount = 1
+            elif nombre == "idempotencia_soltar":
+                ruta, clave, dueno = params
+                fila = self.filas.get((ruta, clave))
+                if fila and fila[4] == dueno and fila[1] is None:
+                    del self.filas[(ruta, clave)]
+            else:
+                raise AssertionError(nombre)
+
+
+@pytest.fixture
+def tabla(monkeypatch):
+    t = _Tabla()
+
+    @contextmanager
+    def get_connection(read_only=True):
+        yield _Conn()
+
+    monkeypatch.setattr(idempotencia, "get_connection", get_connection)
+    monkeypatch.setattr(queries, "execute", t.execute)
+    monkeypatch.setattr(idempotencia, "COALESCEDOR", idempotencia.Coalescedor())
+    return t
+
+
+@pytest.fixture
+def app(tabla):
+    app = Flask(__name__)
+    app.llamadas = []
+    app.status = 201
+    app.soltar = threading.Event()
+    app.soltar.set()
+    app.dentro = threading.Event()
+
+    @app.post("/prestamos")
+    @idempotencia.idempotente
+    def crear_prestamo():
+        app.llamadas.append(request.get_json())
+        app.dentro.set()
+        app.soltar.wait(5)
+        return jsonify({"ok": app.status < 500, "n": len(app.llamadas)}), app.status
+
+    return app
+
+
+def _post(cliente, clave, cuerpo=None):
+    headers = {idempotencia.HEADER: clave} if clave is not None else {}
+    return cliente.post("/prestamos", json=cuerpo or {"ejemplar": 1}, headers=headers)
+
+
+def test_sin_clave_no_toca_la_tabla(app, tabla):
+    cliente = app.test_client()
+    assert _post(cliente, None).status_code == 201
+    assert _post(cliente, None).status_code == 201
+    assert len(app.llamadas) == 2 and tabla.filas == {}
+
+
+def test_clave_invalida(app):
+    assert _post(app.test_client(), "x" * (idempotencia.MAX_CLAVE + 1)).status_code == 400
+    assert app.llamadas == []
+
+
+def test_reintento_repite_la_respuesta_guardada(app):
+    cliente = app.test_client()
+    primera = _post(cliente, "k1")
+    segunda = _post(cliente, "k1")
+    assert primera.status_code == segunda.status_code == 201
+    assert segunda.headers["Idempotent-Replayed"] == "true"
+    assert segunda.json == primera.json == {"ok": True, "n": 1}
+    assert len(app.llamadas) == 1
+    assert idempotencia.COALESCEDOR.describe()["repetidas"] == 1
+
+
+def test_misma_clave_con_otro_cuerpo_da_422(app):
+    cliente = app.test_client()
+    _post(cliente, "k2", {"ejemplar": 1})
+    resp = _post(cliente, "k2", {"ejemplar": 2})
+    assert resp.status_code == 422
+    assert len(app.llamadas) == 1
+
+
+def test_5xx_libera_la_clave(app, tabla):
+    cliente = app.test_client()
+    app.status = 500
+    assert _post(cliente, "k3").status_code == 500
+    assert tabla.filas == {}
+
+    app.status = 201
+    resp = _post(cliente, "k3")
+    assert resp.status_code == 201 and "Idempotent-Replayed" not in resp.headers
+    assert len(app.llamadas) == 2
+
+
+def test_duplicado_simultaneo_espera_al_primero(app):
+    app.soltar.clear()
+    respuestas = {}
+
+    def enviar(nombre):
+        respuestas[nombre] = _post(app.test_client(), "k4")
+
+    primero = threading.Thread(target=enviar, args=("primero",))
+    primero.start()
+    assert app.dentro.wait(5)
+    segundo = threading.Thread(target=enviar, args=("segundo",))
+    segundo.start()
+    time.sleep(0.1)
+    assert "segundo" not in respuestas
+    app.soltar.set()
+    primero.join(5)
+    segundo.join(5)
+
+    assert len(app.llamadas) == 1
+    assert respuestas["primero"].status_code == respuestas["segundo"].status_code == 201
+    assert respuestas["segundo"].headers["Idempotent-Replayed"] == "true"
+    assert idempotencia.COALESCEDOR.describe()["en_curso"] == 0
+
+
+def test_confirmar_en_el_handler_no_guarda_dos_veces(tabla, monkeypatch):
+    guardadas = []
+    execute = tabla.execute
+
+    def contar(cur, nombre, params=None):
+        if nombre == "idempotencia_guardar":
+            guardadas.append(params[0])
+        execute(cur, nombre, params)
+
+    monkeypatch.setattr(queries, "execute", contar)
+    app = Flask(__name__)
+
+    @app.post("/devoluciones")
+    @idempotencia.idempotente
+    def registrar_devolucion():
+        return idempotencia.confirmar(_Conn(), jsonify({"ok": True}))
+
+    cliente = app.test_client()
+    assert cliente.post("/devoluciones", data=b"{}", headers={idempotencia.HEADER: "k5"}).status_code == 200
+    repetida = cliente.post("/devoluciones", data=b"{}", headers={idempotencia.HEADER: "k5"})
+    assert repetida.headers["Idempotent-Replayed"] == "true"
+    assert guardadas == [200]
@@ -0,0 +1,60 @@
+"""jobs.py: una ejecución activa por tipo, sin bloquear a los demás tipos."""
+import threading
+import time
+
+import pytest
+
+from jobs import JobAlreadyRunning, JobRunner
+
+
+def _esperar(job, timeout=2.0):
+    limite = time.monotonic() + timeout
+    while job.active:
+        assert time.monotonic() < limite, f"{job.tipo} no terminó"
+        time.sleep(0.01)
+
+
+def test_jobs_largos_no_bloquean_otros_tipos():
+    runner = JobRunner()
+    soltar = threading.Event()
+    largos = [runner.submit(t, lambda job: soltar.wait(5)) for t in ("notify-overdue", "matricula")]
+    corto = runner.submit("reservas-expirar", lambda job: {"expiradas": 0})
+    try:
+        _esperar(corto)
+        assert corto.estado == "done" and corto.resultado == {"expiradas": 0}
+        assert all(j.active for j in largos)
+    finally:
+        soltar.set()
+    for j in largos:
+        _esperar(j)
+
+
+def test_un_activo_por_tipo():
+    runner = JobRunner()
+    soltar = threading.Event()
+    job = runner.submit("stats-refresh", lambda j: soltar.wait(5))
+    with pytest.raises(JobAlreadyRunning) as e:
+        runner.submit("stats-refresh", lambda j: None)
+    assert e.value.job is job
+    soltar.set()
+    _esperar(job)
+    runner.submit("stats-refresh", lambda j: None)
+
+
+def test_fallo_queda_en_el_job():
+    runner = JobRunner()
+
+    def falla(job):
+        raise ValueError("sin base")
+
+    job = runner.submit("particiones", falla)
+    _esperar(job)
+    assert job.estado == "failed" and job.error == "sin base"
+
+
+def test_roles_restringen_la_visibilidad():
+    runner = JobRunner()
+    job = runner.submit("matricula", lambda j: None, roles=("admin",))
+    assert job.visible_para("admin")
+    assert not job.visible_para("cliente") and not job.visible_para(None)
+    _esperar(job)
@@ -0,0 +1,27 @@
+"""migrate.py: archivos de migración y cobertura de migrate explain (sin base)."""
+import migrate
+import queries
+
+
+def test_versiones_correlativas_y_sin_repetir():
+    versiones = [m.version for m in migrate.discover()]
+    assert versiones == list(range(1, len(versiones) + 1))
+
+
+def test_explain_incluye_las_consultas_de_todos_los_modulos():
+    rutas = {ruta for ruta, _, _ in migrate.explain_queries()}
+    assert "comprobante_lote" in rutas  # comprobantes.py
+    assert "idempotencia_leer" in rutas  # idempotencia.py
+
+
+def test_poda_esperada_tiene_consulta_con_ejemplo():
+    rutas = {ruta for ruta, _, _ in migrate.explain_queries()}
+    assert set(migrate.PODA_ESPERADA) <= rutas
+
+
+def test_calentamiento_solo_usa_consultas_registradas():
+    import calentamiento
+
+    queries.cargar_todas()
+    for nombre in calentamiento.CALIENTES:
+        assert queries.REGISTRY.get(nombre) is not None
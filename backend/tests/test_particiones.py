@@ -0,0 +1,67 @@
+"""Mantenimiento de particiones de prestamos (0006, 0015, 0016)."""
+from datetime import datetime
+
+MES = datetime(2091, 3, 1)
+SUFIJO = "209103"
+
+
+def _prestamo_en_default(conn) -> int:
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO public.users (nombre, email, password)
+        VALUES ('Prueba', 'particion-prueba@sisbib.test', 'x') RETURNING user_id
+    """)
+    user_id = cur.fetchone()[0]
+    cur.execute("INSERT INTO public.libros (titulo, autor) VALUES ('T', 'A') RETURNING id_libro")
+    id_libro = cur.fetchone()[0]
+    cur.execute("INSERT INTO public.ejemplares (id_libro) VALUES (%s) RETURNING id_ejemplar", (id_libro,))
+    id_ejemplar = cur.fetchone()[0]
+    cur.execute("""
+        INSERT INTO public.prestamos (user_fk, ejemplar_fk, libro_fk, fecha_reserva)
+        VALUES (%s, %s, %s, %s) RETURNING prestamo_id, tableoid::regclass::text
+    """, (user_id, id_ejemplar, id_libro, MES.replace(day=10)))
+    prestamo_id, particion = cur.fetchone()
+    assert particion.endswith("prestamos_pdefault")
+    return prestamo_id
+
+
+def _clave(conn, prestamo_id: int):
+    return conn.execute(
+        "SELECT fecha_reserva FROM public.prestamos_clave WHERE prestamo_id = %s", (prestamo_id,)
+    ).fetchone()
+
+
+def test_crear_particion_sobre_filas_de_default_conserva_la_clave(conn):
+    assert conn.execute("SELECT to_regclass(%s)", (f"public.prestamos_p{SUFIJO}",)).fetchone()[0] is None
+    prestamo_id = _prestamo_en_default(conn)
+    assert _clave(conn, prestamo_id) is not None
+
+    creada = conn.execute(
+        "SELECT public.crear_particion('prestamos', 'fecha_reserva', %s, '1 month'::interval, %s)",
+        (MES, SUFIJO),
+    ).fetchone()[0]
+
+    assert creada is True
+    particion = conn.execute(
+        "SELECT tableoid::regclass::text FROM public.prestamos WHERE prestamo_id = %s", (prestamo_id,)
+    ).fetchone()[0]
+    assert particion.endswith(f"prestamos_p{SUFIJO}")
+    assert _clave(conn, prestamo_id) == (MES.replace(day=10),)
+
+
+def test_crear_particion_existente_no_hace_nada(conn):
+    conn.execute(
+        "SELECT public.crear_particion('prestamos', 'fecha_reserva', %s, '1 month'::interval, %s)", (MES, SUFIJO)
+    )
+    repetida = conn.execute(
+        "SELECT public.crear_particion('prestamos', 'fecha_reserva', %s, '1 month'::interval, %s)", (MES, SUFIJO)
+    ).fetchone()[0]
+    assert repetida is False
+
+
+def test_rango_desde_el_nombre():
+    import particiones
+
+    assert particiones._rango("prestamos_p202412") == ("prestamos", datetime(2024, 12, 1), datetime(2025, 1, 1))
+    assert particiones._rango("sanciones_p2024") == ("sanciones", datetime(2024, 1, 1), datetime(2025, 1, 1))
+    assert particiones._rango("prestamos_pdefault") is None
@@ -0,0 +1,53 @@
+"""recomendaciones.py: marca de agua incremental de _pares()."""
+from contextlib import contextmanager
+
+import numpy as np
+
+import recomendaciones
+
+
+class _Cursor:
+    """max(prestamo_id), primer id dentro de GRACIA menos 1, y el texto del COPY."""
+
+    def __init__(self, hasta_id, antes_gracia, copy=b""):
+        self.fila = (hasta_id, antes_gracia)
+        self.copy_texto = copy
+        self.copias = []
+
+    def execute(self, sql, params=None):
+        self.params = params
+
+    def fetchone(self):
+        return self.fila
+
+    @contextmanager
+    def copy(self, sql):
+        self.copias.append(sql)
+        yield [self.copy_texto[:5], self.copy_texto[5:]]
+
+
+def test_sin_prestamos_nuevos_no_copia():
+    cur = _Cursor(40, None)
+    pares, marca = recomendaciones._pares(cur, 40)
+    assert pares.shape == (0, 2) and marca == 40
+    assert cur.copias == []
+
+
+def test_sin_prestamos_recientes_la_marca_llega_al_maximo():
+    cur = _Cursor(50, None, b"1\t7\n2\t7\n3\t8\n")
+    pares, marca = recomendaciones._pares(cur, 40)
+    assert marca == 50
+    assert pares.tolist() == [[1, 7], [2, 7], [3, 8]]
+    assert "prestamo_id > 40 AND prestamo_id <= 50" in cur.copias[0]
+
+
+def test_la_marca_queda_antes_de_la_gracia():
+    # 45 se reservó hace menos de GRACIA: se relee en la pasada siguiente
+    pares, marca = recomendaciones._pares(_Cursor(50, 44, b"1\t7\n"), 40)
+    assert marca == 44
+    assert pares.dtype == np.int64
+
+
+def test_la_marca_no_retrocede():
+    _, marca = recomendaciones._pares(_Cursor(50, 30, b"1\t7\n"), 40)
+    assert marca == 40
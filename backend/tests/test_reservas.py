@@ -0,0 +1,137 @@
+"""reservas.py: liberar_ejemplar() y cambiar_estado() frente a la cola de reservas.
+
+Las consultas se simulan por nombre y transicionar() se reemplaza por un
+registro de llamadas: se prueba qué decide reservas.py, no el SQL.
+"""
+import pytest
+
+import estados_ejemplar
+import queries
+import reservas
+
+
+class _Cursor:
+    def __init__(self, base):
+        self.base = base
+        self.filas = []
+
+    def fetchone(self):
+        return self.filas[0] if self.filas else None
+
+    def fetchall(self):
+        return self.filas
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Base:
+    def __init__(self):
+        self.en_espera = {}        # id_libro -> [reserva_id, ...]
+        self.asignadas = {}        # id_ejemplar -> reserva_id
+        self.libro = {}            # id_ejemplar -> id_libro
+        self.anterior = {}         # id_ejemplar -> estado antes de transicionar
+        self.transiciones = []
+        self.rechazar = {}         # id_ejemplar -> estado que informa transicionar como rechazado
+
+    def cursor(self, row_factory=None):
+        return _Cursor(self)
+
+    def execute(self, cur, nombre, params=None):
+        if nombre == "reserva_asignar_siguiente":
+            ej = params["ejemplar"]
+            cola = self.en_espera.get(self.libro[ej], [])
+            cur.filas = []
+            if cola:
+                rid = cola.pop(0)
+                self.asignadas[ej] = rid
+                cur.filas = [{"reserva_id": rid, "user_fk": 1, "id_libro": self.libro[ej],
+                              "id_ejemplar": ej, "expira_en": params["expira"]}]
+        elif nombre == "reservas_reencolar":
+            cur.filas = []
+            for ej in params[0]:
+                rid = self.asignadas.pop(ej, None)
+                if rid is not None:
+                    self.en_espera.setdefault(self.libro[ej], []).insert(0, rid)
+                    cur.filas.append({"reserva_id": rid, "id_ejemplar": ej})
+        elif nombre == "reservas_libros_en_espera":
+            cur.filas = [{"id_libro": l} for l in params[0] if self.en_espera.get(l)]
+        else:
+            raise AssertionError(nombre)
+
+    def transicionar(self, conn, ids, nuevo, motivo=None, actor=None, prestamo=None, estricto=False):
+        self.transiciones.append((list(ids), nuevo, motivo))
+        cambiados, rechazados = [], []
+        for i in ids:
+            if i in self.rechazar:
+                rechazados.append({"id_ejemplar": i, "estado": self.rechazar[i]})
+            else:
+                cambiados.append({"id_ejemplar": i, "id_libro": self.libro[i], "anterior": self.anterior.get(i)})
+        return {"cambiados": cambiados, "rechazados": rechazados}
+
+
+@pytest.fixture
+def base(monkeypatch):
+    b = _Base()
+    b.libro = {10: 1, 11: 1, 20: 2}
+    monkeypatch.setattr(queries, "execute", b.execute)
+    monkeypatch.setattr(estados_ejemplar, "transicionar", b.transicionar)
+    return b
+
+
+def test_liberar_sin_cola_queda_disponible(base):
+    assert reservas.liberar_ejemplar(base, 10, "devolucion", prestamo=5) is None
+    assert base.transiciones == [([10], "disponible", "devolucion")]
+
+
+def test_liberar_con_cola_asigna_a_la_mas_antigua(base):
+    base.en_espera[1] = [100, 101]
+    asignada = reservas.liberar_ejemplar(base, 10, "devolucion")
+    assert asignada["reserva_id"] == 100
+    assert base.transiciones == [([10], "reservado", "devolucion:reserva 100")]
+    assert base.en_espera[1] == [101]
+
+
+def test_liberar_ejemplar_ya_reservado_pasa_a_la_siguiente(base):
+    base.en_espera[1] = [101]
+    base.rechazar[10] = "reservado"
+    assert reservas.liberar_ejemplar(base, 10, "reserva expirada")["reserva_id"] == 101
+
+
+def test_liberar_ejemplar_movido_por_otro_falla(base):
+    base.en_espera[1] = [101]
+    base.rechazar[10] = "prestado"
+    with pytest.raises(estados_ejemplar.TransicionInvalida):
+        reservas.liberar_ejemplar(base, 10, "devolucion")
+
+
+def test_cambiar_estado_reencola_la_reserva_del_ejemplar_movido(base):
+    base.asignadas[10] = 100
+    base.en_espera[1] = [101]
+    base.anterior[10] = "reservado"
+    res = reservas.cambiar_estado(base, [10], "en_reparacion")
+    assert res["reencoladas"] == [{"reserva_id": 100, "id_ejemplar": 10}]
+    assert res["asignadas"] == []
+    # Conserva el turno: vuelve al frente de la cola
+    assert base.en_espera[1] == [100, 101]
+    assert base.transiciones == [([10], "en_reparacion", None)]
+
+
+def test_cambiar_a_disponible_asigna_solo_libros_con_cola(base):
+    base.en_espera[1] = [100]
+    base.anterior.update({11: "en_reparacion", 20: "en_reparacion"})
+    res = reservas.cambiar_estado(base, [11, 20], "disponible", motivo="reparado")
+    assert [a["reserva_id"] for a in res["asignadas"]] == [100]
+    assert base.transiciones == [
+        ([11, 20], "disponible", "reparado"),
+        ([11], "reservado", "reparado:reserva 100"),
+    ]
+
+
+def test_cambiar_estado_sin_cambios_no_consulta_colas(base):
+    base.rechazar[10] = "prestado"
+    res = reservas.cambiar_estado(base, [10], "disponible")
+    assert res["cambiados"] == [] and res["asignadas"] == [] and res["reencoladas"] == []
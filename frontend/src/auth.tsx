@@ -13,6 +13,9 @@ export interface UserInfo {
 export interface AuthState {
   role: Role
   user: UserInfo
+  // token firmado emitido por /api/login (Authorization: Bearer ...)
+  token?: string
+  expiresAt?: number
 }
 
 interface AuthContextValue {
@@ -36,7 +39,11 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
   useEffect(() => {
     try {
       const raw = localStorage.getItem(STORAGE_KEY)
-      if (raw) setAuth(JSON.parse(raw))
+      if (raw) {
+        const stored: AuthState = JSON.parse(raw)
+        // descarta sesiones con token expirado
+        if (!stored.expiresAt || stored.expiresAt * 1000 > Date.now()) setAuth(stored)
+      }
     } catch {}
     setLoading(false)
   }, [])
@@ -48,7 +55,13 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
   }, [auth])
 
   const login = (next: AuthState) => setAuth(next)
-  const logout = () => setAuth(null)
+  const logout = () => {
+    if (auth?.token) {
+      // revoca el token en el backend; la sesión local se cierra igual si falla
+      fetch('/api/logout', { method: 'POST', headers: { Authorization: `Bearer ${auth.token}` } }).catch(() => {})
+    }
+    setAuth(null)
+  }
 
   const roleHome = useMemo(() => {
     if (!auth) return '/'
@@ -76,6 +89,10 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
   )
 }
 
+export function authHeaders(auth: AuthState | null): Record<string, string> {
+  return auth?.token ? { Authorization: `Bearer ${auth.token}` } : {}
+}
+
 export function useAuth() {
   const ctx = useContext(AuthContext)
   if (!ctx) throw new Error('useAuth must be used within AuthProvider')
@@ -28,7 +28,9 @@ export default function SiteLogin() {
       const finalRole = (data.role || role) as Role
       const nextAuth: AuthState = {
         role: finalRole,
-        user: data.user
+        user: data.user,
+        token: data.token,
+        expiresAt: data.expires_at
       }
   login(nextAuth)
   const dest = finalRole === 'admin' ? '/admin/dashboard' : finalRole === 'bibliotecario' ? '/bibliotecario/home' : '/cliente/home'
@@ -75,14 +75,33 @@ export default function Prestamos() {
     fetchItems(ctrl.signal)
   }
 
+  // Consulta el avance del job de notificación hasta que termina
+  const pollJob = async (jobId: string) => {
+    for (;;) {
+      await new Promise(r => setTimeout(r, 1000))
+      const res = await fetch(`/api/jobs/${jobId}`)
+      const data = await res.json()
+      if (!data.ok) throw new Error(data.error || 'Error al consultar el estado de la notificación')
+      const job = data.job
+      if (job.estado === 'failed') throw new Error(job.error || 'La notificación falló')
+      if (job.estado === 'done') {
+        return `Notificaciones enviadas: ${job.sent}${job.failed ? `, fallidas: ${job.failed}` : ''}.`
+      }
+      setNotificationMessage(`Notificando… ${job.sent + job.failed}/${job.total} (restantes: ${job.remaining})`)
+    }
+  }
+
   const handleNotifyOverdue = async () => {
     setNotifying(true)
     setNotificationMessage(null)
     try {
       const res = await fetch('/api/notify-overdue', { method: 'POST' })
       const data = await res.json()
-      if (!data.ok) throw new Error(data.error || 'Error al enviar notificaciones')
-      setNotificationMessage(data.message || 'Notificaciones enviadas con éxito.')
+      // 409: ya hay una ejecución en curso, se sigue su avance
+      if (!data.ok && !data.job_id) throw new Error(data.error || 'Error al enviar notificaciones')
+      setNotificationMessage(data.message || data.error)
+      const summary = await pollJob(data.job_id)
+      setNotificationMessage(summary)
       // Re-fetch items to update vencido status
       fetchItems()
     } catch (e: any) {
@@ -17,6 +17,7 @@ export default function Usuarios() {
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
   const [items, setItems] = useState<User[]>([])
+  const [suggestions, setSuggestions] = useState<User[]>([])
 
   const fetchUsers = async (signal?: AbortSignal) => {
     setLoading(true)
@@ -42,6 +43,21 @@ export default function Usuarios() {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [])
 
+  // Autocompletado: consulta el índice en memoria (/api/suggest), no la tabla
+  useEffect(() => {
+    const term = q.trim()
+    if (term.length < 2) {
+      setSuggestions([])
+      return
+    }
+    const ctrl = new AbortController()
+    fetch(`/api/suggest?${new URLSearchParams({ q: term, tipo: 'users', k: '8' })}`, { signal: ctrl.signal })
+      .then(res => res.json())
+      .then(data => { if (data.ok) setSuggestions(data.items as User[]) })
+      .catch(() => {})
+    return () => ctrl.abort()
+  }, [q])
+
   const onSubmit = (ev: React.FormEvent) => {
     ev.preventDefault()
     const ctrl = new AbortController()
@@ -54,7 +70,12 @@ export default function Usuarios() {
     <main className="container">
       <h2>Usuarios</h2>
       <form className="filterbar" onSubmit={onSubmit}>
-        <input value={q} onChange={e => setQ(e.target.value)} placeholder="Buscar por nombre, email o RUT" />
+        <input value={q} onChange={e => setQ(e.target.value)} placeholder="Buscar por nombre, email o RUT" list="usuarios-sugerencias" />
+        <datalist id="usuarios-sugerencias">
+          {suggestions.map(u => (
+            <option key={u.user_id} value={u.email}>{u.nombre} {u.apellido1} · {u.rut_numero}-{u.rut_dv}</option>
+          ))}
+        </datalist>
         <button className="btn" type="submit" disabled={loading}>Buscar</button>
       </form>
       {error && <p className="error">{error}</p>}
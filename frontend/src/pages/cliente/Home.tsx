@@ -1,4 +1,5 @@
 import React, { useState, useEffect, CSSProperties } from 'react';
+import { useAuth, authHeaders } from '../../auth';
 
 interface Libro {
   id_libro: number;
@@ -8,6 +9,21 @@ interface Libro {
   ejemplares_disponibles: number;
 }
 
+interface Reserva {
+  reserva_id: number;
+  id_libro: number;
+  estado: 'en_espera' | 'asignada';
+  posicion: number | null;
+  expira_en: string | null;
+}
+
+interface Relacionado {
+  id_libro: number;
+  titulo: string;
+  autor: string;
+  puntaje: number;
+}
+
 const filtroLabels = ['Género', 'Longitud', 'Disponibilidad', 'Idioma', 'Año'];
 
 const styles = {
@@ -197,6 +213,27 @@ const styles = {
     width: '90%',
   } as CSSProperties,
 
+  tarjetaTituloLink: {
+    fontWeight: 'bold',
+    marginBottom: '5px',
+    fontSize: '1.1em',
+    cursor: 'pointer',
+  } as CSSProperties,
+
+  relacionadosPanel: {
+    gridColumn: '1 / -1',
+    backgroundColor: 'white',
+    borderRadius: '4px',
+    padding: '10px 15px',
+    boxShadow: '0 2px 4px rgba(0, 0, 0, 0.1)',
+  } as CSSProperties,
+
+  relacionadoItem: {
+    cursor: 'pointer',
+    padding: '4px 0',
+    color: '#357ABD',
+  } as CSSProperties,
+
   errorMessage: {
     color: 'red',
     fontWeight: 'bold',
@@ -206,10 +243,18 @@ const styles = {
   } as CSSProperties,
 };
 
+const textoReserva = (reserva: Reserva) =>
+  reserva.estado === 'asignada'
+    ? `Reservado para ti${reserva.expira_en ? ` hasta ${new Date(reserva.expira_en).toLocaleString()}` : ''}`
+    : `En cola: posición ${reserva.posicion}`;
+
 const TarjetaLibro: React.FC<{
   libro: Libro;
+  reserva?: Reserva;
   onAgregar: (libro: Libro) => void;
-}> = ({ libro, onAgregar }) => {
+  onReservar: (libro: Libro) => void;
+  onVerRelacionados: (libro: Libro) => void;
+}> = ({ libro, reserva, onAgregar, onReservar, onVerRelacionados }) => {
   const isAvailable = libro.ejemplares_disponibles > 0;
 
   return (
@@ -218,19 +263,28 @@ const TarjetaLibro: React.FC<{
 
       <div style={styles.tarjetaInfo}>
         <div>
-          <div style={styles.tarjetaTitulo}>{libro.titulo.toUpperCase()}</div>
+          <div
+            style={styles.tarjetaTituloLink}
+            title="Ver libros que también pidieron sus lectores"
+            onClick={() => onVerRelacionados(libro)}
+          >
+            {libro.titulo.toUpperCase()}
+          </div>
           <div style={styles.tarjetaAutor}>{libro.autor}</div>
           <div style={styles.disponibilidadTexto(isAvailable)}>
             {isAvailable ? `Disponible (${libro.ejemplares_disponibles})` : 'Agotado'}
           </div>
+          {reserva && <div style={styles.tarjetaAutor}>{textoReserva(reserva)}</div>}
         </div>
-        <button
-          style={styles.botonAgregar}
-          disabled={!isAvailable}
-          onClick={() => onAgregar(libro)}
-        >
-          AGREGAR
-        </button>
+        {isAvailable ? (
+          <button style={styles.botonAgregar} onClick={() => onAgregar(libro)}>
+            AGREGAR
+          </button>
+        ) : (
+          <button style={styles.botonAgregar} disabled={!!reserva} onClick={() => onReservar(libro)}>
+            RESERVAR
+          </button>
+        )}
       </div>
     </div>
   );
@@ -242,6 +296,9 @@ export default function ClienteHome() {
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const [filtroActivo, setFiltroActivo] = useState<string | null>(null); 
+  const [reservas, setReservas] = useState<Record<number, Reserva>>({});
+  const [relacionados, setRelacionados] = useState<{ libro: Libro; items: Relacionado[] } | null>(null);
+  const { auth } = useAuth();
 
   const API_BASE_URL = "http://127.0.0.1:5000/api";
 
@@ -249,6 +306,28 @@ export default function ClienteHome() {
     fetchLibros();
   }, []);
 
+  useEffect(() => {
+    fetchReservas();
+  }, [auth?.user.user_id]);
+
+  // Reservas activas del usuario con su posición en la cola (una sola consulta)
+  const fetchReservas = async () => {
+    if (!auth) return;
+    try {
+      const response = await fetch(`${API_BASE_URL}/reservas?user_id=${auth.user.user_id}`, {
+        headers: authHeaders(auth),
+      });
+      const data = await response.json();
+      if (data.ok) {
+        const porLibro: Record<number, Reserva> = {};
+        (data.reservas as Reserva[]).forEach(r => { porLibro[r.id_libro] = r; });
+        setReservas(porLibro);
+      }
+    } catch (err) {
+      console.error("Error fetching reservas:", err);
+    }
+  };
+
   const fetchLibros = async (queryString = '') => {
     setIsLoading(true);
     setError(null);
@@ -290,6 +369,46 @@ export default function ClienteHome() {
     }
   };
 
+  const handleReservarClick = async (libro: Libro) => {
+    if (!auth) {
+      alert('Debes iniciar sesión para reservar.');
+      return;
+    }
+    try {
+      const response = await fetch(`${API_BASE_URL}/reservas`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', ...authHeaders(auth) },
+        body: JSON.stringify({ id_libro: libro.id_libro, user_id: auth.user.user_id }),
+      });
+      const data = await response.json();
+      if (!data.ok) throw new Error(data.error);
+      alert(`✅ Reserva de "${libro.titulo}" registrada. Posición en la cola: ${data.reserva.posicion}`);
+      fetchReservas();
+    } catch (err) {
+      alert(`⚠️ No se pudo reservar "${libro.titulo}": ${(err as Error).message}`);
+      fetchLibros(busqueda);
+    }
+  };
+
+  // "Quienes pidieron este libro también pidieron" (coocurrencia de préstamos)
+  const handleVerRelacionados = async (libro: Libro) => {
+    try {
+      const response = await fetch(`${API_BASE_URL}/libros/${libro.id_libro}/relacionados?limit=8`);
+      const data = await response.json();
+      if (!data.ok) throw new Error(data.error);
+      setRelacionados({ libro, items: data.items as Relacionado[] });
+    } catch (err) {
+      console.error("Error fetching relacionados:", err);
+      setRelacionados(null);
+    }
+  };
+
+  const handleBuscarRelacionado = (item: Relacionado) => {
+    setBusqueda(item.titulo);
+    setRelacionados(null);
+    fetchLibros(item.titulo);
+  };
+
   const handleFiltrarBuscar = () => {
     if (filtroActivo === 'Género' && busqueda.trim() !== '') {
         fetchLibros(`?categoria=${encodeURIComponent(busqueda)}`);
@@ -358,6 +477,21 @@ export default function ClienteHome() {
 
         {/* GRID DEL CATÁLOGO */}
         <section style={styles.catalogoGrid}>
+          {relacionados && (
+            <div style={styles.relacionadosPanel}>
+              <strong>Quienes pidieron "{relacionados.libro.titulo}" también pidieron:</strong>{' '}
+              <span style={{ cursor: 'pointer', float: 'right' }} onClick={() => setRelacionados(null)}>✖</span>
+              {relacionados.items.length > 0 ? (
+                relacionados.items.map(item => (
+                  <div key={item.id_libro} style={styles.relacionadoItem} onClick={() => handleBuscarRelacionado(item)}>
+                    {item.titulo} — {item.autor}
+                  </div>
+                ))
+              ) : (
+                <div>Aún no hay suficientes préstamos para recomendar.</div>
+              )}
+            </div>
+          )}
           {isLoading ? (
             <p style={{ gridColumn: '1 / -1', textAlign: 'center' }}>Cargando libros...</p>
           ) : error ? (
@@ -367,7 +501,10 @@ export default function ClienteHome() {
               <TarjetaLibro
                 key={libro.id_libro}
                 libro={libro}
+                reserva={reservas[libro.id_libro]}
                 onAgregar={handleAgregarClick}
+                onReservar={handleReservarClick}
+                onVerRelacionados={handleVerRelacionados}
               />
             ))
           ) : (